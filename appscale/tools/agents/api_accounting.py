@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+""" Keeps count of the API calls that the infrastructure agents make, and
+limits how quickly they make them, so that deployments stay clear of the
+throttles that clouds apply to each account. """
+
+
+import inspect
+import threading
+import time
+
+
+class TokenBucket():
+  """TokenBucket limits how often something can happen. It holds up to
+  'burst' tokens, which refill at 'rate' tokens per second, and each call to
+  acquire takes one, waiting for it if none are left.
+  """
+
+
+  def __init__(self, rate, burst):
+    """Creates a new, full, TokenBucket.
+
+    Args:
+      rate: A number indicating how many tokens are added each second.
+      burst: A number indicating the most tokens the bucket can hold.
+    """
+    self.rate = float(rate)
+    self.burst = float(burst)
+    self.tokens = float(burst)
+    self.updated_at = time.time()
+    self.lock = threading.Lock()
+
+
+  def acquire(self):
+    """Takes a token from this bucket, sleeping until one is available.
+
+    Returns:
+      The number of seconds spent waiting for the token.
+    """
+    with self.lock:
+      now = time.time()
+      self.tokens = min(self.burst,
+        self.tokens + max(now - self.updated_at, 0) * self.rate)
+      self.updated_at = now
+
+      # The token is taken right away, even if we have to wait for it, so
+      # that callers waiting at the same time line up behind each other.
+      self.tokens -= 1
+      wait = max(-self.tokens / self.rate, 0)
+
+    if wait > 0:
+      time.sleep(wait)
+    return wait
+
+
+class APICallStats():
+  """APICallStats counts the calls made to each method of a cloud's API, how
+  long they took, and how many of them the cloud throttled.
+  """
+
+
+  def __init__(self):
+    """Creates a new APICallStats that hasn't seen any calls."""
+    self.calls = {}
+    self.lock = threading.Lock()
+
+
+  def record(self, name, seconds, throttled=False):
+    """Counts a call to an API method.
+
+    Args:
+      name: A str naming the API method that was called.
+      seconds: A number indicating how long the call took.
+      throttled: A bool indicating if the cloud refused the call because we
+        made too many.
+    """
+    with self.lock:
+      count, total_seconds, throttled_count = self.calls.get(name, (0, 0, 0))
+      self.calls[name] = (count + 1, total_seconds + seconds,
+        throttled_count + int(throttled))
+
+
+  def snapshot(self):
+    """Returns a copy of the calls counted so far, for use with since.
+
+    Returns:
+      A dict that maps the name of each API method called to a tuple with
+      the number of calls, the seconds they took, and how many were
+      throttled.
+    """
+    with self.lock:
+      return dict(self.calls)
+
+
+  def since(self, snapshot):
+    """Finds the calls made after the given snapshot was taken.
+
+    Args:
+      snapshot: A dict, as returned by snapshot.
+    Returns:
+      A dict in the same form as snapshot, holding only the calls made since.
+    """
+    calls = {}
+    for name, totals in self.snapshot().iteritems():
+      before = snapshot.get(name, (0, 0, 0))
+      if totals[0] > before[0]:
+        calls[name] = tuple(total - earlier
+          for total, earlier in zip(totals, before))
+    return calls
+
+
+  @classmethod
+  def summarize(cls, calls):
+    """Describes the given calls in a single line, most frequent first.
+
+    Args:
+      calls: A dict, as returned by snapshot or since.
+    Returns:
+      A str describing how many calls were made to each method, how long they
+      took on average, and how many were throttled.
+    """
+    if not calls:
+      return "Made no API calls."
+
+    total_calls = sum(count for count, _, _ in calls.values())
+    total_seconds = sum(seconds for _, seconds, _ in calls.values())
+    total_throttled = sum(throttled for _, _, throttled in calls.values())
+    methods = []
+    for name in sorted(calls, key=lambda name: (-calls[name][0], name)):
+      count, seconds, _ = calls[name]
+      methods.append("{0} x{1} ({2:.2f}s avg)".format(name, count,
+        seconds / count))
+
+    return "Made {0} API calls ({1} throttled) taking {2:.1f} seconds: " \
+      "{3}".format(total_calls, total_throttled, total_seconds,
+      ", ".join(methods))
+
+
+class MeteredClient(object):
+  """MeteredClient wraps a cloud API client so that every method called on it
+  goes through an agent's call_api, which counts it, rate limits it and
+  retries it if the cloud throttles it.
+
+  Azure's clients group their methods into operations objects (e.g.,
+  virtual_machines), so those are wrapped too, and their methods are named
+  after the group they belong to.
+  """
+
+
+  def __init__(self, agent, client, prefix=''):
+    """Creates a new MeteredClient.
+
+    Args:
+      agent: The BaseAgent whose call_api each call goes through.
+      client: The API client to wrap.
+      prefix: A str to put before the name of each method called.
+    """
+    self._agent = agent
+    self._client = client
+    self._prefix = prefix
+
+
+  def __getattr__(self, name):
+    value = getattr(self._client, name)
+    if inspect.isroutine(value):
+      return lambda *args, **kwargs: self._agent.call_api(self._prefix + name,
+        value, *args, **kwargs)
+    if type(value).__name__.endswith('Operations'):
+      return MeteredClient(self._agent, value, self._prefix + name + '.')
+    return value
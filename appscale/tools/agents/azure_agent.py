@@ -6,7 +6,9 @@ interact with Microsoft Azure.
 
 # General-purpose Python library imports
 import adal
+import math
 import os.path
+import Queue
 import threading
 import time
 
@@ -27,6 +29,7 @@ from azure.mgmt.compute.models import SshPublicKey
 from azure.mgmt.compute.models import StorageProfile
 from azure.mgmt.compute.models import VirtualHardDisk
 from azure.mgmt.compute.models import VirtualMachine
+from azure.mgmt.compute.models import VirtualMachineCaptureParameters
 from azure.mgmt.compute.models import VirtualMachineSizeTypes
 
 from azure.mgmt.network import NetworkManagementClient
@@ -51,9 +54,11 @@ from haikunator import Haikunator
 # AppScale-specific imports
 from appscale.tools.appscale_logger import AppScaleLogger
 from appscale.tools.local_state import LocalState
+from api_accounting import MeteredClient
 from base_agent import AgentConfigurationException
 from base_agent import AgentRuntimeException
 from base_agent import BaseAgent
+from base_agent import reports_api_calls
 
 class AzureAgent(BaseAgent):
   """ AzureAgent defines a specialized BaseAgent that allows for interaction
@@ -118,9 +123,10 @@ class AzureAgent(BaseAgent):
   # The admin username needed to create an Azure VM instance.
   ADMIN_USERNAME = 'azureuser'
 
-  # The number of seconds to sleep while polling for
+  # The longest number of seconds to sleep while polling for
   # Azure resources to get created/updated.
   SLEEP_TIME = 10
+  POLL_MAX_DELAY = SLEEP_TIME
 
   # The maximum number of seconds to wait for Azure resources
   # to get created/updated.
@@ -130,6 +136,11 @@ class AzureAgent(BaseAgent):
   # (Takes longer than the creation time for other resources.)
   MAX_VM_CREATION_TIME = 240
 
+  # The maximum number of Azure VMs that run_instances creates at the same
+  # time. Azure throttles the write requests each subscription makes, so
+  # creating more VMs at once only leads to throttled requests.
+  MAX_CONCURRENT_VMS = 10
+
   # The Virtual Network and Subnet name to use while creating an Azure
   # Virtual machine.
   VIRTUAL_NETWORK = 'appscaleazure'
@@ -143,6 +154,9 @@ class AzureAgent(BaseAgent):
   # The Storage Azure Resource provider namespace.
   MICROSOFT_STORAGE_RESOURCE = 'Microsoft.Storage'
 
+  # The storage container that captured images are copied to.
+  IMAGE_CONTAINER = 'appscale-images'
+
   def assert_credentials_are_valid(self, parameters):
     """ Contacts Azure with the given credentials to ensure that they are
     valid. Gets an access token and a Credentials instance in order to be
@@ -160,7 +174,8 @@ class AzureAgent(BaseAgent):
     credentials = self.open_connection(parameters)
     subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
     try:
-      resource_client = ResourceManagementClient(credentials, subscription_id)
+      resource_client = self.get_client(ResourceManagementClient, credentials,
+                                        subscription_id)
       resource_groups = resource_client.resource_groups.list()
       rg_names = []
       for rg in resource_groups:
@@ -207,7 +222,8 @@ class AzureAgent(BaseAgent):
     # Create a resource group and an associated storage account to access resources.
     self.create_resource_group(parameters, credentials)
 
-    resource_client = ResourceManagementClient(credentials, subscription_id)
+    resource_client = self.get_client(ResourceManagementClient, credentials,
+                                      subscription_id)
     resource_client.providers.register(self.MICROSOFT_COMPUTE_RESOURCE)
     resource_client.providers.register(self.MICROSOFT_NETWORK_RESOURCE)
 
@@ -226,8 +242,10 @@ class AzureAgent(BaseAgent):
     credentials = self.open_connection(parameters)
     subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
     resource_group = parameters[self.PARAM_RESOURCE_GROUP]
-    network_client = NetworkManagementClient(credentials, subscription_id)
-    compute_client = ComputeManagementClient(credentials, subscription_id)
+    network_client = self.get_client(NetworkManagementClient, credentials,
+                                     subscription_id)
+    compute_client = self.get_client(ComputeManagementClient, credentials,
+                                     subscription_id)
     public_ips = []
     private_ips = []
     instance_ids = []
@@ -246,11 +264,13 @@ class AzureAgent(BaseAgent):
       instance_ids.append(vm.name)
     return public_ips, private_ips, instance_ids
 
+  @reports_api_calls
   def run_instances(self, count, parameters, security_configured):
     """ Starts 'count' instances in Microsoft Azure, and returns once they
     have been started. Callers should create a network and attach a firewall
     to it before using this method, or the newly created instances will not
     have a network and firewall to attach to (and thus this method will fail).
+    Up to MAX_CONCURRENT_VMS instances are created at the same time.
     Args:
       count: An int, that specifies how many virtual machines should be started.
       parameters: A dict, containing all the parameters necessary to
@@ -261,28 +281,101 @@ class AzureAgent(BaseAgent):
       instance_ids: A list of unique Azure VM names.
       public_ips: A list of public IP addresses.
       private_ips: A list of private IP addresses.
+    Raises:
+      AgentRuntimeException: If any of the instances could not be started, in
+        which case every VM this call created is deleted.
     """
     credentials = self.open_connection(parameters)
-    resource_group = parameters[self.PARAM_RESOURCE_GROUP]
     subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
-    network_client = NetworkManagementClient(credentials, subscription_id)
+    network_client = self.get_client(NetworkManagementClient, credentials,
+                                     subscription_id)
     virtual_network = parameters[self.PARAM_GROUP]
     subnet = self.create_virtual_network(network_client, parameters,
                                          virtual_network, virtual_network)
-    for _ in range(count):
-      vm_network_name = Haikunator().haikunate()
-      self.create_network_interface(network_client, vm_network_name,
-        vm_network_name, subnet, parameters)
-      network_interface = network_client.network_interfaces.get(
-        resource_group, vm_network_name)
-      self.create_virtual_machine(credentials, network_client,
-        network_interface.id, parameters, vm_network_name)
+
+    # Each VM goes through NIC creation, VM creation and IP acquisition on
+    # its own worker, so the slow steps of different VMs overlap.
+    vm_names = [Haikunator().haikunate() for _ in range(count)]
+    vm_queue = Queue.Queue()
+    for vm_name in vm_names:
+      vm_queue.put(vm_name)
+
+    num_workers = min(count, self.MAX_CONCURRENT_VMS)
+    rounds = int(math.ceil(float(count) / self.MAX_CONCURRENT_VMS))
+    deadline = time.time() + rounds * self.MAX_VM_CREATION_TIME
+
+    failures = {}
+    threads = []
+    for _ in range(num_workers):
+      thread = threading.Thread(target=self.create_virtual_machines,
+                                args=(credentials, subnet, parameters,
+                                      vm_queue, deadline, failures))
+      thread.start()
+      threads.append(thread)
+
+    for thread in threads:
+      thread.join()
+
+    if failures:
+      for vm_name in sorted(failures):
+        AppScaleLogger.warn("Could not start Azure VM '{0}': {1}".format(
+          vm_name, failures[vm_name]))
+
+      # Don't leave the VMs that did start, or the network resources of any
+      # VM, behind for the user to find and pay for.
+      self.delete_virtual_machines(credentials, parameters, vm_names)
+      raise AgentRuntimeException("{0} of {1} Azure VMs could not be "
+        "started, so the rest were deleted.".format(len(failures), count))
 
     public_ips, private_ips, instance_ids = self.describe_instances(parameters)
     return instance_ids, public_ips, private_ips
 
+  def create_virtual_machines(self, credentials, subnet, parameters, vm_queue,
+                              deadline, failures):
+    """ Creates a network interface and virtual machine for each name taken
+    from vm_queue, until the queue is empty. run_instances runs this on each
+    of its worker threads.
+    Args:
+      credentials: A ServicePrincipalCredentials instance, that can be used to
+        access or create any resources.
+      subnet: The Subnet resource from the Virtual Network created.
+      parameters: A dict, containing all the parameters necessary to
+        authenticate this user with Azure.
+      vm_queue: A Queue of the names of the VMs that still need to be created.
+      deadline: The time, in seconds since the epoch, by which every VM must
+        have a public IP address.
+      failures: A dict that maps the name of each VM that could not be
+        created to a str describing why. This method adds to it.
+    """
+    resource_group = parameters[self.PARAM_RESOURCE_GROUP]
+    subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
+    # Clients hold on to an HTTP session, so don't share them across threads.
+    network_client = MeteredClient(self,
+      NetworkManagementClient(credentials, subscription_id))
+    while True:
+      try:
+        vm_network_name = vm_queue.get_nowait()
+      except Queue.Empty:
+        return
+
+      if time.time() >= deadline:
+        failures[vm_network_name] = "Timed out before it could be created."
+        continue
+
+      # Catch everything so that one bad VM is reported along with the rest,
+      # instead of silently killing this worker.
+      try:
+        self.create_network_interface(network_client, vm_network_name,
+          vm_network_name, subnet, parameters)
+        network_interface = network_client.network_interfaces.get(
+          resource_group, vm_network_name)
+        self.create_virtual_machine(credentials, network_client,
+          network_interface.id, parameters, vm_network_name, deadline)
+      except Exception as error:
+        failures[vm_network_name] = str(error)
+
   def create_virtual_machine(self, credentials, network_client, network_id,
-                             parameters, vm_network_name):
+                             parameters, vm_network_name, deadline=None):
     """ Creates an Azure virtual machine using the network interface created.
     Args:
       credentials: A ServicePrincipalCredentials instance, that can be used to
@@ -292,7 +385,15 @@ class AzureAgent(BaseAgent):
       parameters: A dict, containing all the parameters necessary to
         authenticate this user with Azure.
       vm_network_name: The name of the virtual machine to use.
+      deadline: The time, in seconds since the epoch, by which the VM must
+        have a public IP address. Defaults to MAX_VM_CREATION_TIME from now.
+    Raises:
+      AgentRuntimeException: If the VM does not get a public IP address by
+        the deadline.
     """
+    if deadline is None:
+      deadline = time.time() + self.MAX_VM_CREATION_TIME
+
     resource_group = parameters[self.PARAM_RESOURCE_GROUP]
     storage_account = parameters[self.PARAM_STORAGE_ACCOUNT]
     zone = parameters[self.PARAM_ZONE]
@@ -301,7 +402,9 @@ class AzureAgent(BaseAgent):
                            format(vm_network_name), verbose)
     subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
     azure_instance_type = parameters[self.PARAM_INSTANCE_TYPE]
-    compute_client = ComputeManagementClient(credentials, subscription_id)
+    # This runs on run_instances' worker threads, so don't share the client.
+    compute_client = MeteredClient(self,
+      ComputeManagementClient(credentials, subscription_id))
 
     keyname = parameters[self.PARAM_KEYNAME]
     private_key_path = LocalState.LOCAL_APPSCALE_PATH + keyname
@@ -343,16 +446,16 @@ class AzureAgent(BaseAgent):
                                                         os_disk=os_disk)))
 
     # Sleep until an IP address gets associated with the VM.
-    while True:
-      public_ip_address = network_client.public_ip_addresses.get(resource_group,
-                                                                 vm_network_name)
-      if public_ip_address.ip_address:
-        AppScaleLogger.log('Azure VM is available at {}'.
-                           format(public_ip_address.ip_address))
-        break
-      AppScaleLogger.verbose("Waiting {} second(s) for IP address to be "
-        "available".format(self.SLEEP_TIME), verbose)
-      time.sleep(self.SLEEP_TIME)
+    def get_ip_address():
+      AppScaleLogger.verbose("Waiting for IP address to be available", verbose)
+      return network_client.public_ip_addresses.get(resource_group,
+                                                    vm_network_name).ip_address
+
+    has_ip, ip_address = self.poll(get_ip_address, deadline - time.time())
+    if not has_ip:
+      raise AgentRuntimeException("Azure VM '{0}' did not get a public IP "
+        "address in time.".format(vm_network_name))
+    AppScaleLogger.log('Azure VM is available at {}'.format(ip_address))
 
   def associate_static_ip(self, instance_id, static_ip):
     """ Associates the given static IP address with the given instance ID.
@@ -363,20 +466,27 @@ class AzureAgent(BaseAgent):
       static_ip: A str naming the static IP to bind to the given instance.
     """
 
+  @reports_api_calls
   def terminate_instances(self, parameters):
     """ Deletes the instances specified in 'parameters' running in Azure.
     Args:
       parameters: A dict, containing all the parameters necessary to
-        authenticate this user with Azure.
+        authenticate this user with Azure, and optionally a list of the
+        names of the VMs to delete. Every VM in the resource group is deleted
+        if no names are given.
     """
     credentials = self.open_connection(parameters)
     resource_group = parameters[self.PARAM_RESOURCE_GROUP]
     subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
     verbose = parameters[self.PARAM_VERBOSE]
     public_ips, private_ips, instance_ids = self.describe_instances(parameters)
+    if parameters.get(self.PARAM_INSTANCE_IDS) is not None:
+      instance_ids = [instance_id for instance_id in instance_ids
+        if instance_id in parameters[self.PARAM_INSTANCE_IDS]]
     AppScaleLogger.verbose("Terminating the vm instance/s '{}'".
                            format(instance_ids), verbose)
-    compute_client = ComputeManagementClient(credentials, subscription_id)
+    compute_client = self.get_client(ComputeManagementClient, credentials,
+                                     subscription_id)
     threads = []
     for vm_name in instance_ids:
       thread = threading.Thread(target=self.delete_virtual_machine,
@@ -388,6 +498,84 @@ class AzureAgent(BaseAgent):
     for x in threads:
       x.join()
 
+  def create_image(self, instance_id, name, parameters):
+    """ Captures the OS disk of the given virtual machine as a new image in the
+    deployment's storage account. The machine has to be deprovisioned (with
+    'waagent -deprovision') first, and it is deallocated and generalized
+    here, so it can't be started again.
+
+    Args:
+      instance_id: A str naming the virtual machine to capture.
+      name: A str used as the prefix of the new image's VHD.
+      parameters: A dict, containing all the parameters necessary to
+        authenticate this user with Azure.
+    Returns:
+      A str containing the URL of the new image's VHD.
+    Raises:
+      AgentRuntimeException: If the virtual machine could not be captured.
+    """
+    credentials = self.open_connection(parameters)
+    resource_group = parameters[self.PARAM_RESOURCE_GROUP]
+    compute_client = self.get_client(ComputeManagementClient, credentials,
+                                     parameters[self.PARAM_SUBSCRIBER_ID])
+    AppScaleLogger.log("Creating image {0} from virtual machine {1}".format(
+      name, instance_id))
+    try:
+      compute_client.virtual_machines.deallocate(resource_group,
+                                                 instance_id).result()
+      compute_client.virtual_machines.generalize(resource_group, instance_id)
+      capture = compute_client.virtual_machines.capture(resource_group,
+        instance_id, VirtualMachineCaptureParameters(
+          vhd_prefix=name, destination_container_name=self.IMAGE_CONTAINER,
+          overwrite_vhds=True)).result()
+    except CloudError as error:
+      raise AgentRuntimeException("Unable to capture virtual machine {0}: {1}"
+                                  .format(instance_id, error.message))
+
+    template = capture.resources[0]
+    return template['properties']['storageProfile']['osDisk']['image']['uri']
+
+  def delete_virtual_machines(self, credentials, parameters, vm_names):
+    """ Deletes the given virtual machines, along with the network interfaces
+    and public IP addresses that run_instances creates for each of them under
+    the same name. Anything that can't be deleted is only logged.
+    Args:
+      credentials: A ServicePrincipalCredentials instance, that can be used to
+        access or create any resources.
+      parameters: A dict, containing all the parameters necessary to
+        authenticate this user with Azure.
+      vm_names: A list of the names of the virtual machines to delete.
+    """
+    resource_group = parameters[self.PARAM_RESOURCE_GROUP]
+    subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
+    verbose = parameters[self.PARAM_VERBOSE]
+    compute_client = self.get_client(ComputeManagementClient, credentials,
+                                     subscription_id)
+    network_client = self.get_client(NetworkManagementClient, credentials,
+                                     subscription_id)
+    try:
+      existing_vms = [vm.name for vm in
+        compute_client.virtual_machines.list(resource_group)
+        if vm.name in vm_names]
+      threads = []
+      for vm_name in existing_vms:
+        thread = threading.Thread(target=self.delete_virtual_machine,
+                                  args=(compute_client, resource_group,
+                                        verbose, vm_name))
+        thread.start()
+        threads.append(thread)
+
+      for thread in threads:
+        thread.join()
+
+      self.delete_resources('Network Interface',
+        network_client.network_interfaces, resource_group, verbose, vm_names)
+      self.delete_resources('Public IP Address',
+        network_client.public_ip_addresses, resource_group, verbose, vm_names)
+    except CloudError as error:
+      AppScaleLogger.warn("Could not delete Azure VMs {0}, so please delete "
+        "them yourself: {1}".format(', '.join(vm_names), error.message))
+
   def delete_virtual_machine(self, compute_client, resource_group, verbose,
                              vm_name):
     """ Deletes the virtual machine from the resource_group specified.
@@ -414,16 +602,16 @@ class AzureAgent(BaseAgent):
         be deleted.
       verbose: A boolean indicating whether or not in verbose mode.
     """
-    time_start = time.time()
-    while not result.done():
-      AppScaleLogger.verbose("Waiting {0} second(s) for {1} to be deleted.".
-                             format(self.SLEEP_TIME, resource_name), verbose)
-      time.sleep(self.SLEEP_TIME)
-      total_sleep_time = time.time() - time_start
-      if total_sleep_time > max_sleep:
-        AppScaleLogger.log("Waited {0} second(s) for {1} to be deleted. "
-          "Operation has timed out.".format(total_sleep_time, resource_name))
-        break
+    def is_deleted():
+      if result.done():
+        return True
+      AppScaleLogger.verbose("Waiting for {0} to be deleted.".
+                             format(resource_name), verbose)
+      return False
+
+    if not self.poll(is_deleted, max_sleep)[0]:
+      AppScaleLogger.log("Waited {0} second(s) for {1} to be deleted. "
+        "Operation has timed out.".format(max_sleep, resource_name))
 
   def does_address_exist(self, parameters):
     """ Verifies that the specified static IP address has been allocated, and
@@ -474,7 +662,8 @@ class AzureAgent(BaseAgent):
     credentials = self.open_connection(parameters)
     subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
     zone = parameters[self.PARAM_ZONE]
-    resource_client = ResourceManagementClient(credentials, subscription_id)
+    resource_client = self.get_client(ResourceManagementClient, credentials,
+                                      subscription_id)
     resource_providers = resource_client.providers.list()
     for provider in resource_providers:
       for resource_type in provider.resource_types:
@@ -492,31 +681,56 @@ class AzureAgent(BaseAgent):
     subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
     resource_group = parameters[self.PARAM_RESOURCE_GROUP]
     credentials = self.open_connection(parameters)
-    network_client = NetworkManagementClient(credentials, subscription_id)
+    network_client = self.get_client(NetworkManagementClient, credentials,
+                                     subscription_id)
     verbose = parameters[self.PARAM_VERBOSE]
 
     AppScaleLogger.log("Deleting the Virtual Network, Public IP Address "
       "and Network Interface created for this deployment.")
-    network_interfaces = network_client.network_interfaces.list(resource_group)
-    for interface in network_interfaces:
-      result = network_client.network_interfaces.delete(resource_group, interface.name)
-      resource_name = 'Network Interface' + ':' + interface.name
-      self.sleep_until_delete_operation_done(result, resource_name,
-                                             self.MAX_SLEEP_TIME, verbose)
 
-    public_ip_addresses = network_client.public_ip_addresses.list(resource_group)
-    for public_ip in public_ip_addresses:
-      result = network_client.public_ip_addresses.delete(resource_group, public_ip.name)
-      resource_name = 'Public IP Address' + ':' + public_ip.name
-      self.sleep_until_delete_operation_done(result, resource_name,
-                                             self.MAX_SLEEP_TIME, verbose)
-
-    virtual_networks = network_client.virtual_networks.list(resource_group)
-    for network in virtual_networks:
-      result = network_client.virtual_networks.delete(resource_group, network.name)
-      resource_name = 'Virtual Network' + ':' + network.name
-      self.sleep_until_delete_operation_done(result, resource_name,
-                                             self.MAX_SLEEP_TIME, verbose)
+    # Network interfaces use the public IP addresses and virtual network, so
+    # they go first, but every resource of one kind is deleted at once.
+    self.delete_resources('Network Interface',
+                          network_client.network_interfaces, resource_group, verbose)
+    self.delete_resources('Public IP Address',
+                          network_client.public_ip_addresses, resource_group, verbose)
+    self.delete_resources('Virtual Network',
+                          network_client.virtual_networks, resource_group, verbose)
+
+  def delete_resources(self, resource_type, operations, resource_group,
+                       verbose, names=None):
+    """ Deletes every resource of one kind in the given resource group, waiting
+    on all of the deletions together.
+    Args:
+      resource_type: A str describing the kind of resource being deleted.
+      operations: The operations group of the Network Management client for
+        this kind of resource (e.g., network_interfaces).
+      resource_group: The resource group name to use for this deployment.
+      verbose: A boolean indicating whether or not in verbose mode.
+      names: A list of the names of the resources to delete, or None to
+        delete all of them.
+    """
+    pollers = {}
+    for resource in operations.list(resource_group):
+      if names is not None and resource.name not in names:
+        continue
+      resource_name = resource_type + ':' + resource.name
+      pollers[resource_name] = operations.delete(resource_group, resource.name)
+
+    def check_deletions(pending):
+      finished = {}
+      for resource_name, poller in pending.iteritems():
+        if poller.done():
+          finished[resource_name] = True
+        else:
+          AppScaleLogger.verbose("Waiting for {0} to be deleted.".
+                                 format(resource_name), verbose)
+      return finished
+
+    _, pending = self.poll_all(pollers, check_deletions, self.MAX_SLEEP_TIME)
+    for resource_name in sorted(pending):
+      AppScaleLogger.log("Waited {0} second(s) for {1} to be deleted. "
+        "Operation has timed out.".format(self.MAX_SLEEP_TIME, resource_name))
 
   def get_params_from_args(self, args):
     """ Constructs a dict with only the parameters necessary to interact with
@@ -621,12 +835,26 @@ class AzureAgent(BaseAgent):
         with the appropriate (Contributor) role.
     Returns:
       A ServicePrincipalCredentials instance, that can be used to access or
-        create any resources.
+        create any resources. It is built once per process for each set of
+        credentials, and ADAL only fetches a new token once the old one
+        expires.
     """
     app_id = parameters[self.PARAM_APP_ID]
     app_secret_key = parameters[self.PARAM_APP_SECRET]
     tenant_id = parameters[self.PARAM_TENANT_ID]
+    return self.get_cached_client((app_id, app_secret_key, tenant_id),
+      lambda: self.build_credentials(app_id, app_secret_key, tenant_id))
 
+  def build_credentials(self, app_id, app_secret_key, tenant_id):
+    """ Authenticates with Microsoft Azure as the given Service Principal.
+    Args:
+      app_id: The application ID of the Service Principal.
+      app_secret_key: The secret key of the Service Principal.
+      tenant_id: The ID of the Azure Active Directory tenant it belongs to.
+    Returns:
+      A ServicePrincipalCredentials instance, that can be used to access or
+        create any resources.
+    """
     # Get an Authentication token using ADAL.
     context = adal.AuthenticationContext(self.AZURE_AUTH_ENDPOINT + tenant_id)
     token_response = context.acquire_token_with_client_credentials(
@@ -641,6 +869,41 @@ class AzureAgent(BaseAgent):
     return credentials
 
 
+  def is_throttled(self, exception):
+    """ Decides if Azure refused an API call because we made too many. (Also
+    see documentation for the BaseAgent class)
+    """
+    return isinstance(exception, CloudError) and \
+      exception.response is not None and exception.response.status_code == 429
+
+
+  def get_retry_after(self, exception):
+    """ Reads how long Azure asked us to wait before retrying a throttled
+    call. (Also see documentation for the BaseAgent class)
+    """
+    try:
+      return float(exception.response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+      return None
+
+
+  def get_client(self, client_class, credentials, subscription_id):
+    """ Returns a management client for the given subscription, building it
+    the first time it is needed. Clients hold on to an HTTP session, so
+    callers that use them from several threads should build their own.
+    Args:
+      client_class: The class of the management client to return, such as
+        ComputeManagementClient.
+      credentials: A ServicePrincipalCredentials instance, as returned by
+        open_connection.
+      subscription_id: A str naming the Azure subscription to manage.
+    Returns:
+      A MeteredClient wrapping an instance of client_class.
+    """
+    return self.get_cached_client(
+      (client_class.__name__, id(credentials), subscription_id),
+      lambda: MeteredClient(self, client_class(credentials, subscription_id)))
+
   def create_virtual_network(self, network_client, parameters, network_name,
                              subnet_name):
     """ Creates the network resources, such as Virtual network and Subnet.
@@ -711,16 +974,16 @@ class AzureAgent(BaseAgent):
           of the operation being performed.
         resource_name: The name of the resource being updated.
     """
-    time_start = time.time()
-    while not result.done():
-      AppScaleLogger.verbose("Waiting {0} second(s) for {1} to be created/updated.".
-                             format(self.SLEEP_TIME, resource_name), verbose)
-      time.sleep(self.SLEEP_TIME)
-      total_sleep_time = time.time() - time_start
-      if total_sleep_time > self.MAX_SLEEP_TIME:
-        AppScaleLogger.log("Waited {0} second(s) for {1} to be created/updated. "
-          "Operation has timed out.".format(total_sleep_time, resource_name))
-        break
+    def is_updated():
+      if result.done():
+        return True
+      AppScaleLogger.verbose("Waiting for {0} to be created/updated.".
+                             format(resource_name), verbose)
+      return False
+
+    if not self.poll(is_updated, self.MAX_SLEEP_TIME)[0]:
+      AppScaleLogger.log("Waited {0} second(s) for {1} to be created/updated. "
+        "Operation has timed out.".format(self.MAX_SLEEP_TIME, resource_name))
 
   def create_resource_group(self, parameters, credentials):
     """ Creates a Resource Group for the application using the Service Principal
@@ -736,14 +999,16 @@ class AzureAgent(BaseAgent):
         a resource group with the given subscription.
     """
     subscription_id = parameters[self.PARAM_SUBSCRIBER_ID]
-    resource_client = ResourceManagementClient(credentials, subscription_id)
+    resource_client = self.get_client(ResourceManagementClient, credentials,
+                                      subscription_id)
     rg_name = parameters[self.PARAM_RESOURCE_GROUP]
 
     tag_name = 'default-tag'
     if parameters[self.PARAM_TAG]:
       tag_name = parameters[self.PARAM_TAG]
 
-    storage_client = StorageManagementClient(credentials, subscription_id)
+    storage_client = self.get_client(StorageManagementClient, credentials,
+                                     subscription_id)
     resource_client.providers.register(self.MICROSOFT_STORAGE_RESOURCE)
     try:
       # If the resource group does not already exist, create a new one with the
@@ -1,6 +1,38 @@
 #!/usr/bin/env python
 
 
+import functools
+import Queue
+import random
+import threading
+import time
+
+
+from appscale.tools.appscale_logger import AppScaleLogger
+from api_accounting import APICallStats
+from api_accounting import TokenBucket
+
+
+def reports_api_calls(method):
+  """Decorates an agent's method so that it logs a summary of the API calls
+  made while it ran, whether it returns or fails.
+
+  Args:
+    method: The BaseAgent method to decorate.
+  Returns:
+    The decorated method.
+  """
+  @functools.wraps(method)
+  def report_api_calls(agent, *args, **kwargs):
+    snapshot = agent.get_api_call_stats().snapshot()
+    try:
+      return method(agent, *args, **kwargs)
+    finally:
+      AppScaleLogger.log("{0}: {1}".format(method.__name__,
+        agent.get_api_call_summary(snapshot)))
+  return report_api_calls
+
+
 class BaseAgent:
   """BaseAgent class defines the interface that must be implemented by
   each cloud agent."""
@@ -14,6 +46,66 @@ class BaseAgent:
   OPERATION_TERMINATE = 'terminate'
 
 
+  # The number of seconds that poll waits after its first check. Most
+  # operations finish quickly, so we start out checking often.
+  POLL_INITIAL_DELAY = 1
+
+
+  # The largest number of seconds that poll waits between two checks.
+  POLL_MAX_DELAY = 20
+
+
+  # How much longer poll waits after each check that finds the operation
+  # still running.
+  POLL_BACKOFF_FACTOR = 2
+
+
+  # The fraction of each delay that poll randomizes, so that callers waiting
+  # on many operations at once don't all hit the cloud at the same moment.
+  POLL_JITTER = 0.2
+
+
+  # The cloud API clients built so far in this process, keyed by the agent
+  # that built them and the credentials they use. Building a client can mean
+  # fetching tokens or API descriptions over the network, so every agent
+  # reuses them instead.
+  client_cache = {}
+
+
+  # A lock that keeps two threads from building the same client at once.
+  client_cache_lock = threading.Lock()
+
+
+  # The most API calls per second that agents of each kind make, and how many
+  # they can make at once after being idle. Clouds throttle each account, so
+  # every agent of a kind in this process shares one limit.
+  API_CALLS_PER_SECOND = 20
+  API_CALL_BURST = 40
+
+
+  # How many times we retry an API call that the cloud throttled, and how
+  # many seconds we wait before the first retry when the cloud doesn't say.
+  MAX_THROTTLED_RETRIES = 5
+  THROTTLED_RETRY_DELAY = 1
+
+
+  # The APICallStats and TokenBucket of each kind of agent, and a lock that
+  # keeps two threads from creating them at once.
+  api_call_stats = {}
+  api_rate_limiters = {}
+  api_accounting_lock = threading.Lock()
+
+
+  # The largest number of existence checks that preflight makes at the same
+  # time. Each one is a single API call that mostly waits on the network.
+  MAX_CONCURRENT_CHECKS = 10
+
+
+  # Whether this cloud can stop instances and start them again later with
+  # their disks intact, which is what the warm pool relies on.
+  CAN_STOP_INSTANCES = False
+
+
   def assert_credentials_are_valid(self, parameters):
     """Checks with the given cloud to ensure that the given credentials can be
     used to interact with it.
@@ -108,6 +200,51 @@ class BaseAgent:
     raise NotImplementedError
 
 
+  def stop_instances(self, parameters):
+    """Stops a set of virtual machines without deleting their disks, so that
+    they can be started again later. Only needed if CAN_STOP_INSTANCES is set.
+
+    Args:
+      parameters: A dict containing values necessary to authenticate with the
+        underlying cloud, and the IDs of the instances to stop.
+    """
+    raise NotImplementedError
+
+
+  def start_instances(self, parameters):
+    """Starts a set of virtual machines that were previously stopped. Only
+    needed if CAN_STOP_INSTANCES is set.
+
+    Args:
+      parameters: A dict containing values necessary to authenticate with the
+        underlying cloud, and the IDs of the instances to start.
+    Returns:
+      A tuple of the form (instance_ids, public_ips, private_ips), in the same
+      form that run_instances returns.
+    Raises:
+      AgentRuntimeException: If the instances could not be started.
+    """
+    raise NotImplementedError
+
+
+  def create_image(self, instance_id, name, parameters):
+    """Makes a machine image from the boot disk of the given instance, and
+    waits until new instances can be started from it.
+
+    Args:
+      instance_id: A str naming the instance to make the image from.
+      name: A str naming the new image.
+      parameters: A dict containing values necessary to authenticate with the
+        underlying cloud.
+    Returns:
+      A str identifying the new image, in the form that the 'machine' option
+      of an AppScalefile takes.
+    Raises:
+      AgentRuntimeException: If the image could not be made.
+    """
+    raise NotImplementedError
+
+
   def does_address_exist(self, parameters):
     """Verifies that the specified static IP address has been allocated, and
     belongs to the user with the given credentials.
@@ -162,6 +299,85 @@ class BaseAgent:
     raise NotImplementedError
 
 
+  def preflight(self, parameters, check_address=False, disks=()):
+    """Checks that everything a new deployment refers to exists in this
+    cloud, making all of the checks at once over one connection.
+
+    Args:
+      parameters: A dict containing values necessary to authenticate with the
+        underlying cloud, as well as the machine image and zone to check.
+      check_address: A bool that indicates if the static IP address in
+        parameters should be checked too.
+      disks: A list of strs naming the persistent disks to check.
+    Returns:
+      A list of strs describing each problem found, which is empty if the
+      deployment can go ahead.
+    """
+    # Connect (and authorize, which can prompt the user) before the checks
+    # start, so that they all share the cached connection.
+    self.open_connection(parameters)
+
+    checks = [
+      (self.does_image_exist, (parameters,),
+        "Couldn't find the given machine image."),
+      (self.does_zone_exist, (parameters,), "Couldn't find the given zone.")
+    ]
+
+    # Make sure that if the user gives us an Elastic IP / static IP, that they
+    # actually own it.
+    if check_address:
+      checks.append((self.does_address_exist, (parameters,),
+        "Couldn't find the given static IP."))
+
+    for disk in sorted(set(disks)):
+      checks.append((self.does_disk_exist, (parameters, disk),
+        "Couldn't find disk {0}".format(disk)))
+
+    return self.run_checks(checks)
+
+
+  def run_checks(self, checks):
+    """Runs the given checks concurrently, waiting for all of them to finish.
+
+    Args:
+      checks: A list of tuples, each holding a function that returns True if
+        the check passes, a tuple of arguments to call it with, and a str
+        describing the problem if it doesn't.
+    Returns:
+      A list of strs describing each check that failed or raised an exception,
+      in the order that the checks were given.
+    """
+    problems = [None] * len(checks)
+    pending = Queue.Queue()
+    for index in range(len(checks)):
+      pending.put(index)
+
+    def run_pending():
+      while True:
+        try:
+          index = pending.get_nowait()
+        except Queue.Empty:
+          return
+
+        check, args, problem = checks[index]
+        try:
+          if not check(*args):
+            problems[index] = problem
+        except Exception as exception:
+          problems[index] = "{0} ({1})".format(problem, exception)
+
+    threads = []
+    for _ in range(min(len(checks), self.MAX_CONCURRENT_CHECKS)):
+      thread = threading.Thread(target=run_pending)
+      thread.start()
+      threads.append(thread)
+
+    for thread in threads:
+      thread.join()
+
+    return [problem for problem in problems if problem]
+
+
   def cleanup_state(self, parameters):
     """Removes any remote state that was created to run AppScale instances
     during this deployment.
@@ -221,6 +437,222 @@ class BaseAgent:
     return params.get(param) != None
 
 
+  def get_cached_client(self, key, build):
+    """Returns the client that this kind of agent built for the given key,
+    building it the first time it is needed.
+
+    Args:
+      key: A tuple that identifies the client, which should include every
+        credential and setting that the client was built with.
+      build: A function that takes no arguments and returns a new client.
+
+    Returns:
+      The client cached for this agent and key.
+    """
+    cache_key = (self.__class__.__name__,) + tuple(key)
+    with BaseAgent.client_cache_lock:
+      if cache_key not in BaseAgent.client_cache:
+        BaseAgent.client_cache[cache_key] = build()
+      return BaseAgent.client_cache[cache_key]
+
+
+  @classmethod
+  def clear_client_cache(cls):
+    """Forgets every client that agents have built in this process."""
+    with BaseAgent.client_cache_lock:
+      BaseAgent.client_cache.clear()
+
+
+  def get_api_call_stats(self):
+    """Returns the APICallStats that counts the calls made by this kind of
+    agent, creating it (and the rate limiter) the first time.
+    """
+    key = self.__class__.__name__
+    with BaseAgent.api_accounting_lock:
+      if key not in BaseAgent.api_call_stats:
+        BaseAgent.api_call_stats[key] = APICallStats()
+        BaseAgent.api_rate_limiters[key] = TokenBucket(
+          self.API_CALLS_PER_SECOND, self.API_CALL_BURST)
+      return BaseAgent.api_call_stats[key]
+
+
+  def call_api(self, name, function, *args, **kwargs):
+    """Makes a call to the cloud's API, counting it and how long it took.
+
+    Calls wait their turn under this kind of agent's rate limit. Calls that
+    the cloud throttles are retried after as long as it asks us to wait, or
+    exponentially longer (with jitter) each time if it doesn't say.
+
+    Args:
+      name: A str naming the API method, for the call's accounting.
+      function: The function that makes the call.
+      *args: The positional arguments to call the function with.
+      **kwargs: The keyword arguments to call the function with.
+    Returns:
+      Whatever the function returns.
+    Raises:
+      Whatever the function raises, once the call is not throttled or has
+      been retried MAX_THROTTLED_RETRIES times.
+    """
+    stats = self.get_api_call_stats()
+    rate_limiter = BaseAgent.api_rate_limiters[self.__class__.__name__]
+    delay = self.THROTTLED_RETRY_DELAY
+    retries_left = self.MAX_THROTTLED_RETRIES
+    while True:
+      rate_limiter.acquire()
+      start = time.time()
+      try:
+        result = function(*args, **kwargs)
+      except Exception as exception:
+        throttled = self.is_throttled(exception)
+        stats.record(name, time.time() - start, throttled=throttled)
+        if not throttled or not retries_left:
+          raise
+
+        wait = self.get_retry_after(exception)
+        if wait is None:
+          wait = delay * random.uniform(1 - self.POLL_JITTER,
+            1 + self.POLL_JITTER)
+          delay = min(delay * self.POLL_BACKOFF_FACTOR, self.POLL_MAX_DELAY)
+        time.sleep(wait)
+        retries_left -= 1
+        continue
+
+      stats.record(name, time.time() - start)
+      return result
+
+
+  def is_throttled(self, exception):
+    """Decides if an exception raised by an API call means that the cloud
+    refused it because we made too many calls.
+
+    Args:
+      exception: The Exception that the API call raised.
+    Returns:
+      True if the call was throttled, and False otherwise.
+    """
+    return False
+
+
+  def get_retry_after(self, exception):
+    """Finds how long the cloud asked us to wait before retrying a call that
+    it throttled.
+
+    Args:
+      exception: The Exception that the throttled API call raised.
+    Returns:
+      The number of seconds to wait, or None if the cloud didn't say.
+    """
+    return None
+
+
+  def get_api_call_summary(self, snapshot):
+    """Describes the API calls that this kind of agent made since the given
+    snapshot was taken.
+
+    Args:
+      snapshot: A dict, as returned by get_api_call_stats().snapshot().
+    Returns:
+      A str that summarizes the calls made since then.
+    """
+    stats = self.get_api_call_stats()
+    return APICallStats.summarize(stats.since(snapshot))
+
+
+  def poll(self, check, timeout, done=bool, wait_first=False):
+    """Calls 'check' until its result is done or 'timeout' seconds pass,
+    waiting exponentially longer (with jitter) between each call.
+
+    Args:
+      check: A function that takes no arguments and returns the latest state
+        of whatever we are waiting on.
+      timeout: The maximum number of seconds to wait, or None to wait forever.
+      done: A function that takes a result of 'check' and returns True if
+        we can stop waiting. By default, any truthy result is done.
+      wait_first: A bool that indicates if we should wait before the first
+        call to 'check', for callers that just started the operation.
+
+    Returns:
+      A tuple whose first item is True if 'check' finished before the
+      timeout and False otherwise, and whose second item is the last value
+      that 'check' returned.
+    """
+    if timeout is None:
+      deadline = None
+    else:
+      deadline = time.time() + timeout
+
+    delay = self.POLL_INITIAL_DELAY
+    result = None
+    if wait_first:
+      delay = self.sleep_before_poll(delay, deadline)
+
+    while True:
+      result = check()
+      if done(result):
+        return True, result
+
+      if deadline is not None and time.time() >= deadline:
+        return False, result
+
+      delay = self.sleep_before_poll(delay, deadline)
+
+
+  def poll_all(self, operations, check, timeout, wait_first=False,
+    stop=None):
+    """Waits for a group of operations to finish, checking on all of the
+    unfinished ones together each time.
+
+    Args:
+      operations: A dict that maps an ID to each operation to wait on.
+      check: A function that takes a dict of the unfinished operations and
+        returns a dict that maps the ID of each one that has finished to its
+        final state.
+      timeout: The maximum number of seconds to wait, or None to wait forever.
+      wait_first: A bool that indicates if we should wait before the first
+        check, for callers that just started the operations.
+      stop: A function that takes the dict of finished operations and returns
+        True if we should stop waiting on the rest, or None to wait on all of
+        them.
+
+    Returns:
+      A tuple of two dicts. The first maps the ID of each finished operation
+      to its final state, and the second holds the operations that had not
+      finished before the timeout (or before 'stop' said to stop).
+    """
+    finished = {}
+    pending = dict(operations)
+
+    def check_pending():
+      for operation_id, result in check(pending).iteritems():
+        finished[operation_id] = result
+        pending.pop(operation_id, None)
+      return not pending or (stop is not None and stop(finished))
+
+    self.poll(check_pending, timeout, wait_first=wait_first)
+    return finished, pending
+
+
+  def sleep_before_poll(self, delay, deadline):
+    """Sleeps for about 'delay' seconds, without going past the deadline.
+
+    Args:
+      delay: The number of seconds that poll wants to wait.
+      deadline: The time (in seconds since the epoch) after which poll stops
+        waiting, or None if it never does.
+
+    Returns:
+      The number of seconds to wait the next time poll sleeps.
+    """
+    sleep_time = delay * random.uniform(1 - self.POLL_JITTER,
+      1 + self.POLL_JITTER)
+    if deadline is not None:
+      sleep_time = min(sleep_time, deadline - time.time())
+    if sleep_time > 0:
+      time.sleep(sleep_time)
+    return min(delay * self.POLL_BACKOFF_FACTOR, self.POLL_MAX_DELAY)
+
+
   def diff(self, list1, list2):
     """
     Returns the list of entries that are present in list1 but not
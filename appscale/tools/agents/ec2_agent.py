@@ -3,15 +3,21 @@ Helper library for EC2 interaction
 """
 import boto
 import boto.ec2
+import calendar
 import datetime
+import json
+import math
 import os
+import tempfile
 import time
 
 from appscale.tools.appscale_logger import AppScaleLogger
 from appscale.tools.local_state import LocalState
+from api_accounting import MeteredClient
 from base_agent import AgentConfigurationException
 from base_agent import AgentRuntimeException
 from base_agent import BaseAgent
+from base_agent import reports_api_calls
 from boto.exception import EC2ResponseError
 
 
@@ -20,6 +26,190 @@ from boto.exception import EC2ResponseError
 
 
 
+class EC2Instance(object):
+  """ EC2Instance holds the fields of an EC2 instance that AppScale uses, so
+  that callers don't depend on boto's much larger Instance class. """
+
+  __slots__ = ['instance_id', 'state', 'key_name', 'public_ip', 'private_ip']
+
+  def __init__(self, instance_id, state, key_name, public_ip, private_ip):
+    """ Creates a new EC2Instance.
+
+    Args:
+      instance_id: A str naming the instance (e.g., i-ABCDEFG).
+      state: A str with the state the instance is in (e.g., running).
+      key_name: A str naming the SSH keypair the instance was started with.
+      public_ip: A str with the instance's public IP address.
+      private_ip: A str with the instance's private IP address.
+    """
+    self.instance_id = instance_id
+    self.state = state
+    self.key_name = key_name
+    self.public_ip = public_ip
+    self.private_ip = private_ip
+
+  @classmethod
+  def from_boto(cls, instance):
+    """ Creates an EC2Instance from an instance returned by boto.
+
+    Args:
+      instance: A boto.ec2.instance.Instance.
+    Returns:
+      An EC2Instance with the same ID, state, keyname, and IP addresses.
+    """
+    return cls(instance.id, instance.state, instance.key_name,
+      instance.ip_address, instance.private_ip_address)
+
+
+class SpotPriceCache(object):
+  """ SpotPriceCache keeps the last week of EC2 spot prices for each zone and
+  instance type on the local filesystem, so that each deployment only has to
+  fetch the prices that changed since the last one.
+  """
+
+  # The number of days of price history that bids are based on.
+  HISTORY_DAYS = 7
+
+  # The number of seconds that we use cached prices for before asking EC2 for
+  # the prices that changed since then.
+  REFRESH_INTERVAL = 300
+
+  # The format EC2 uses for spot price timestamps.
+  TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
+
+  def __init__(self, location):
+    """ Creates a new SpotPriceCache.
+
+    Args:
+      location: A str naming the JSON file that the price history is kept in.
+    """
+    self.location = location
+    self.histories = self.read_histories()
+
+  def read_histories(self):
+    """ Reads every cached price history from the local filesystem.
+
+    Returns:
+      A dict that maps each zone and instance type to a dict with the
+      'prices' seen and the time they were 'fetched_until'. The dict is empty
+      if nothing has been cached yet, or if the cache can't be read.
+    """
+    try:
+      with open(self.location, 'r') as file_handle:
+        return json.loads(file_handle.read())
+    except (IOError, ValueError):
+      return {}
+
+  def write_histories(self):
+    """ Writes every price history to the local filesystem.
+
+    Failing to write the cache is not an error, since it only means that the
+    next deployment fetches the whole history again.
+    """
+    try:
+      file_descriptor, temp_location = tempfile.mkstemp(
+        dir=os.path.dirname(self.location))
+      with os.fdopen(file_descriptor, 'w') as file_handle:
+        file_handle.write(json.dumps(self.histories))
+      # Renaming is atomic, so concurrent readers never see a partial file.
+      os.rename(temp_location, self.location)
+    except (IOError, OSError):
+      pass
+
+  def get_prices(self, conn, instance_type, zone):
+    """ Looks up the spot prices that an instance type has had in a zone over
+    the last HISTORY_DAYS, asking EC2 for any that aren't cached yet.
+
+    Args:
+      conn: A boto.EC2Connection that can be used to communicate with AWS.
+      instance_type: A str naming the instance type to look up.
+      zone: A str naming the availability zone to look up.
+    Returns:
+      A list of floats, one per price change, oldest first. The list is
+      empty if EC2 has no price history for the instance type in the zone.
+    """
+    key = '{0}/{1}'.format(zone, instance_type)
+    now = time.time()
+    oldest = now - self.HISTORY_DAYS * 24 * 60 * 60
+    history = self.histories.get(key)
+
+    if not history or now - history['fetched_until'] > self.REFRESH_INTERVAL:
+      prices = []
+      start_time = oldest
+      if history:
+        prices = history['prices']
+        start_time = max(history['fetched_until'], oldest)
+
+      prices = sorted(set(tuple(price) for price in
+        prices + self.fetch_prices(conn, instance_type, zone, start_time, now)))
+
+      history = {'fetched_until' : now,
+        'prices' : self.prune(prices, oldest)}
+      self.histories[key] = history
+
+      # Histories that no deployment has refreshed in a week are of no use
+      # to any bid.
+      for stale_key in [stale_key for stale_key, stale_history
+          in self.histories.iteritems()
+          if stale_history['fetched_until'] < oldest]:
+        del self.histories[stale_key]
+      self.write_histories()
+
+    return [price for _, price in self.prune(history['prices'], oldest)]
+
+  def prune(self, prices, oldest):
+    """ Drops the prices that stopped being in effect before the given time.
+
+    Args:
+      prices: A list of [timestamp, price] lists, oldest first.
+      oldest: A float with the seconds since the epoch to keep prices from.
+    Returns:
+      A list of the [timestamp, price] lists to keep.
+    """
+    # The newest price is still in effect, no matter how old it is.
+    return [price for index, price in enumerate(prices)
+      if price[0] >= oldest or index == len(prices) - 1]
+
+  def fetch_prices(self, conn, instance_type, zone, start_time, end_time):
+    """ Asks EC2 for every Linux spot price change in the given time range,
+    following every page of results.
+
+    Args:
+      conn: A boto.EC2Connection that can be used to communicate with AWS.
+      instance_type: A str naming the instance type to look up.
+      zone: A str naming the availability zone to look up.
+      start_time: A float with the seconds since the epoch to start at.
+      end_time: A float with the seconds since the epoch to end at.
+    Returns:
+      A list of [timestamp, price] lists.
+    """
+    prices = []
+    next_token = None
+    while True:
+      history = conn.get_spot_price_history(
+        start_time=self.format_timestamp(start_time),
+        end_time=self.format_timestamp(end_time),
+        product_description='Linux/UNIX', instance_type=instance_type,
+        availability_zone=zone, next_token=next_token)
+      for entry in history:
+        prices.append([self.parse_timestamp(entry.timestamp),
+          float(entry.price)])
+
+      next_token = getattr(history, 'next_token', None)
+      if not next_token:
+        return prices
+
+  def format_timestamp(self, timestamp):
+    """ Converts seconds since the epoch to a timestamp EC2 accepts. """
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime(
+      self.TIMESTAMP_FORMAT)
+
+  def parse_timestamp(self, timestamp):
+    """ Converts a timestamp returned by EC2 to seconds since the epoch. """
+    return calendar.timegm(datetime.datetime.strptime(timestamp,
+      self.TIMESTAMP_FORMAT).utctimetuple())
+
+
 class EC2Agent(BaseAgent):
   """
   EC2 infrastructure agent class which can be used to spawn and terminate
@@ -39,6 +229,41 @@ class EC2Agent(BaseAgent):
   # requests as replay attacks.
   SLEEP_TIME = 20
 
+  # poll starts out checking on instances every few seconds, backing off to
+  # SLEEP_TIME so that we stay clear of Eucalyptus' replay attack detection.
+  POLL_INITIAL_DELAY = 5
+  POLL_MAX_DELAY = SLEEP_TIME
+
+  # The maximum amount of time, in seconds, that we are willing to wait to
+  # delete a security group. EC2 refuses to delete it until every instance in
+  # it has terminated.
+  MAX_SECURITY_GROUP_DELETION_TIME = 600
+
+  # The percentile of the last week's spot prices that we bid. Higher bids
+  # are outbid (and lose their instances) less often.
+  SPOT_BID_PERCENTILE = 90
+
+  # How much spot prices in a zone may vary, as the ratio between the bid and
+  # the median price, for a single-machine deployment. Larger deployments
+  # lose more machines when outbid, so they get less leeway.
+  SPOT_MAX_VOLATILITY = 0.5
+
+  # The number of instances we ask for in each page of a describe-instances
+  # request. EC2 doesn't allow paging when specific instance IDs are given.
+  DESCRIBE_INSTANCES_PAGE_SIZE = 1000
+
+  # Stopped EC2 instances keep their EBS volumes, so they can be pooled.
+  CAN_STOP_INSTANCES = True
+
+  # The maximum amount of time, in seconds, that we are willing to wait for
+  # stopped instances to start again. They don't need to copy their image, so
+  # this is much shorter than MAX_VM_CREATION_TIME.
+  MAX_VM_RESTART_TIME = 600
+
+  # The maximum amount of time, in seconds, that we are willing to wait for a
+  # new machine image to become available. EC2 copies the whole root volume.
+  MAX_IMAGE_CREATION_TIME = 3600
+
   PARAM_CREDENTIALS = 'credentials'
   PARAM_GROUP = 'group'
   PARAM_IMAGE_ID = 'image_id'
@@ -46,6 +271,7 @@ class EC2Agent(BaseAgent):
   PARAM_KEYNAME = 'keyname'
   PARAM_INSTANCE_IDS = 'instance_ids'
   PARAM_REGION = 'region'
+  PARAM_REUSE_KEYNAME = 'reuse_keyname'
   PARAM_SPOT = 'use_spot_instances'
   PARAM_SPOT_PRICE = 'max_spot_price'
   PARAM_STATIC_IP = 'static_ip'
@@ -77,9 +303,25 @@ class EC2Agent(BaseAgent):
   REQUIRED_CREDENTIALS = REQUIRED_EC2_CREDENTIALS
 
 
-  # An int that indicates how many times we should try to create a security
-  # group and authorize it for TCP, UDP, or ICMP traffic.
-  SECURITY_GROUP_RETRY_COUNT = 3
+  # The error codes EC2 uses when it throttles an API call. It doesn't say how
+  # long to wait before trying again.
+  THROTTLING_ERROR_CODES = ('RequestLimitExceeded', 'Throttling')
+
+
+  # The maximum amount of time, in seconds, that we are willing to wait for a
+  # new security group to exist with all of its rules. EC2 may not know about
+  # a group for a few seconds after creating it.
+  MAX_SECURITY_GROUP_CREATION_TIME = 60
+
+
+  # The rules that each AppScale security group needs, as tuples of the IP
+  # protocol, the first and last ports, and the CIDR IP range traffic is
+  # allowed from.
+  SECURITY_GROUP_RULES = (
+    ('udp', 1, 65535, '0.0.0.0/0'),
+    ('tcp', 1, 65535, '0.0.0.0/0'),
+    ('icmp', -1, -1, '0.0.0.0/0')
+  )
 
 
   DESCRIBE_INSTANCES_RETRY_COUNT = 3
@@ -109,7 +351,9 @@ class EC2Agent(BaseAgent):
     """
     conn = self.open_connection(parameters)
     try:
-      conn.get_all_instances()
+      # Any request proves the credentials work, so only ask for the smallest
+      # page of instances that EC2 allows.
+      conn.get_all_reservations(max_results=5)
     except EC2ResponseError:
       raise AgentConfigurationException("We couldn't validate your EC2 " + \
         "access key and EC2 secret key. Are your credentials valid?")
@@ -140,102 +384,126 @@ class EC2Agent(BaseAgent):
         "value, or erase it to have one automatically generated for you." \
         .format(keyname))
 
-    security_groups = conn.get_all_security_groups()
-    for security_group in security_groups:
-      if security_group.name == group:
-        self.handle_failure("Security group {0} is already registered. Please" \
-          " change the 'group' specified in your AppScalefile to a different " \
-          "value, or erase it to have one automatically generated for you." \
-          .format(group))
+    # Only ask for the group we want, instead of listing every group.
+    if conn.get_all_security_groups(filters={'group-name' : group}):
+      self.handle_failure("Security group {0} is already registered. Please" \
+        " change the 'group' specified in your AppScalefile to a different " \
+        "value, or erase it to have one automatically generated for you." \
+        .format(group))
 
     AppScaleLogger.log("Creating key pair: {0}".format(keyname))
     key_pair = conn.create_key_pair(keyname)
     ssh_key = '{0}{1}.key'.format(LocalState.LOCAL_APPSCALE_PATH, keyname)
     LocalState.write_key_file(ssh_key, key_pair.material)
 
-    self.create_security_group(parameters, group)
-    self.authorize_security_group(parameters, group, from_port=1, to_port=65535,
-      ip_protocol='udp', cidr_ip='0.0.0.0/0')
-    self.authorize_security_group(parameters, group, from_port=1, to_port=65535,
-      ip_protocol='tcp', cidr_ip='0.0.0.0/0')
-    self.authorize_security_group(parameters, group, from_port=-1, to_port=-1,
-      ip_protocol='icmp', cidr_ip='0.0.0.0/0')
+    self.ensure_security_group(parameters, group, self.SECURITY_GROUP_RULES)
     return True
 
 
-  def create_security_group(self, parameters, group):
-    """Creates a new security group in AWS with the given name.
+  def ensure_security_group(self, parameters, group, rules):
+    """Makes sure that the named security group exists and allows all of the
+    given rules, creating the group and adding whichever rules it lacks.
+
+    When EC2 already knows about a new group, this takes two calls: one that
+    creates it, and one that adds every rule. Otherwise, the group is looked up
+    to see which rules still need to be added, and we try again.
 
     Args:
       parameters: A dict that contains the credentials necessary to authenticate
         with AWS.
-      group: A str that names the group that should be created.
+      group: A str that names the security group.
+      rules: A list of tuples, each holding the IP protocol, first port, last
+        port and CIDR IP range of a rule the group should have.
     Raises:
-      AgentRuntimeException: If the security group could not be created.
+      AgentRuntimeException: If the security group could not be created, or
+        its rules could not be added.
     """
-    AppScaleLogger.log('Creating security group: {0}'.format(group))
     conn = self.open_connection(parameters)
-    retries_left = self.SECURITY_GROUP_RETRY_COUNT
-    while retries_left:
+    state = {'created' : False, 'missing' : list(rules)}
+
+    def apply_rules():
+      if not state['created']:
+        AppScaleLogger.log('Creating security group: {0}'.format(group))
+        try:
+          conn.create_security_group(group, 'AppScale security group')
+        except EC2ResponseError as exception:
+          if exception.error_code != 'InvalidGroup.Duplicate':
+            AppScaleLogger.log("Couldn't create security group {0}: {1}" \
+              .format(group, exception.error_message))
+            return False
+        state['created'] = True
+
+      AppScaleLogger.log('Authorizing security group {0} for {1}'.format(
+        group, ', '.join('{0} traffic from port {1} to port {2}'.format(
+          ip_protocol, from_port, to_port)
+          for ip_protocol, from_port, to_port, _ in state['missing'])))
       try:
-        conn.create_security_group(group, 'AppScale security group')
-      except EC2ResponseError:
-        pass
+        self.authorize_security_rules(conn, group, state['missing'])
+        state['missing'] = []
+        return True
+      except EC2ResponseError as exception:
+        AppScaleLogger.log("Couldn't authorize security group {0}: {1}" \
+          .format(group, exception.error_message))
+
+      # The group may not be visible yet, or may already have some of the
+      # rules, so only ask for the ones it lacks next time.
       try:
-        conn.get_all_security_groups(group)
-        return
+        groups = conn.get_all_security_groups(filters={'group-name' : group})
       except EC2ResponseError:
-        pass
-      time.sleep(self.SLEEP_TIME)
-      retries_left -= 1
+        return False
+      if groups:
+        state['missing'] = self.get_missing_rules(groups[0], rules)
+      return not state['missing']
 
-    raise AgentRuntimeException("Couldn't create security group with " \
-      "name {0}".format(group))
+    finished, _ = self.poll(apply_rules, self.MAX_SECURITY_GROUP_CREATION_TIME)
+    if not finished:
+      if not state['created']:
+        raise AgentRuntimeException("Couldn't create security group with " \
+          "name {0}".format(group))
+      raise AgentRuntimeException("Couldn't authorize {0} on security group " \
+        "{1}".format(', '.join('{0} traffic from port {1} to port {2} on ' \
+        'CIDR IP {3}'.format(*rule) for rule in state['missing']), group))
 
 
-  def authorize_security_group(self, parameters, group, from_port, to_port,
-    ip_protocol, cidr_ip):
-    """Opens up traffic on the given port range for traffic of the named type.
+  def get_missing_rules(self, security_group, rules):
+    """Finds the rules that a security group doesn't allow yet.
 
     Args:
-      parameters: A dict that contains the credentials necessary to authenticate
-        with AWS.
+      security_group: A boto SecurityGroup, as returned by EC2.
+      rules: A list of tuples, each holding the IP protocol, first port, last
+        port and CIDR IP range of a rule the group should have.
+    Returns:
+      A list of the rules that the group lacks.
+    """
+    existing = set((rule.ip_protocol, int(rule.from_port), int(rule.to_port))
+      for rule in security_group.rules)
+    return [rule for rule in rules if rule[:3] not in existing]
+
+
+  def authorize_security_rules(self, conn, group, rules):
+    """Opens up traffic for all of the given rules on a security group in a
+    single request.
+
+    boto only sends one rule each time it authorizes a security group, so we
+    build the request that carries all of them ourselves.
+
+    Args:
+      conn: A boto connection to EC2.
       group: A str that names the group whose ports should be opened.
-      from_port: An int that names the first port that access should be allowed
-        on.
-      to_port: An int that names the last port that access should be allowed on.
-      ip_protocol: A str that indicates if TCP, UDP, or ICMP traffic should be
-        allowed.
-      cidr_ip: A str that names the IP range that traffic should be allowed
-        from.
+      rules: A list of tuples, each holding the IP protocol, first port, last
+        port and CIDR IP range of a rule to add.
     Raises:
-      AgentRuntimeException: If the ports could not be opened on the security
-      group.
+      EC2ResponseError: If EC2 refused to add the rules.
     """
-    AppScaleLogger.log('Authorizing security group {0} for {1} traffic from ' \
-      'port {2} to port {3}'.format(group, ip_protocol, from_port, to_port))
-    conn = self.open_connection(parameters)
-    retries_left = self.SECURITY_GROUP_RETRY_COUNT
-    while retries_left:
-      try:
-        conn.authorize_security_group(group, from_port=from_port,
-          to_port=to_port, ip_protocol=ip_protocol, cidr_ip=cidr_ip)
-      except EC2ResponseError:
-        pass
-      try:
-        group_info = conn.get_all_security_groups(group)[0]
-        for rule in group_info.rules:
-          if int(rule.from_port) == from_port and int(rule.to_port) == to_port \
-            and rule.ip_protocol == ip_protocol:
-            return
-      except EC2ResponseError:
-        pass
-      time.sleep(self.SLEEP_TIME)
-      retries_left -= 1
-
-    raise AgentRuntimeException("Couldn't authorize {0} traffic from port " \
-      "{1} to port {2} on CIDR IP {3}".format(ip_protocol, from_port, to_port,
-      cidr_ip))
+    params = {'GroupName' : group}
+    for index, rule in enumerate(rules, 1):
+      ip_protocol, from_port, to_port, cidr_ip = rule
+      prefix = 'IpPermissions.{0}.'.format(index)
+      params[prefix + 'IpProtocol'] = ip_protocol
+      params[prefix + 'FromPort'] = from_port
+      params[prefix + 'ToPort'] = to_port
+      params[prefix + 'IpRanges.1.CidrIp'] = cidr_ip
+    conn.get_status('AuthorizeSecurityGroupIngress', params, verb='POST')
 
 
   def get_params_from_args(self, args):
@@ -284,10 +552,13 @@ class EC2Agent(BaseAgent):
     if params[self.PARAM_SPOT]:
       if args.get('max_spot_price'):
         params[self.PARAM_SPOT_PRICE] = args['max_spot_price']
-      else:
+      elif params[self.PARAM_ZONE]:
         params[self.PARAM_SPOT_PRICE] = self.get_optimal_spot_price(
           self.open_connection(params), params[self.PARAM_INSTANCE_TYPE],
           params[self.PARAM_ZONE])
+      else:
+        # The bid depends on the zone, which choose_spot_zone picks later.
+        params[self.PARAM_SPOT_PRICE] = None
 
     return params
 
@@ -354,27 +625,77 @@ class EC2Agent(BaseAgent):
     map. (Also see documentation for the BaseAgent class).
 
     Args:
-      parameters: A dictionary containing the 'keyname' parameter.
+      parameters: A dictionary containing the 'keyname' parameter, and
+        optionally the 'group' parameter.
       pending: Indicates we also want the pending instances.
     Returns:
       A tuple of the form (public_ips, private_ips, instances) where each
       member is a list.
     """
-    instance_ids = []
-    public_ips = []
-    private_ips = []
+    states = ['running']
+    if pending:
+      states.append('pending')
 
     conn = self.open_connection(parameters)
-    reservations = conn.get_all_instances()
-    instances = [i for r in reservations for i in r.instances]
-    for i in instances:
-      if (i.state == 'running' or (pending and i.state == 'pending'))\
-           and i.key_name == parameters[self.PARAM_KEYNAME]:
-        instance_ids.append(i.id)
-        public_ips.append(i.ip_address)
-        private_ips.append(i.private_ip_address)
-    return public_ips, private_ips, instance_ids
+    instances = self.find_instances(conn, parameters[self.PARAM_KEYNAME],
+      states, group=parameters.get(self.PARAM_GROUP))
+    return self.get_instance_info(instances)
+
+  def find_instances(self, conn, keyname, states, group=None,
+    instance_ids=None):
+    """ Asks EC2 for the instances started with the given keyname that are in
+    one of the given states, following every page of results.
+
+    The keyname, state, and security group filters are applied by EC2, and
+    again here, since some EC2-compatible clouds ignore the filters that they
+    don't support.
+
+    Args:
+      conn: A connection object returned from self.open_connection().
+      keyname: A str naming the SSH keypair the instances were started with.
+      states: A list of the instance states (e.g., running) to look for.
+      group: A str naming the security group the instances must be in, or
+        None to search every security group.
+      instance_ids: A list of instance IDs to limit the search to, or None to
+        search every instance.
+    Returns:
+      A list of EC2Instances.
+    """
+    filters = {'key-name' : keyname, 'instance-state-name' : states}
+    if group:
+      filters['instance.group-name'] = group
 
+    max_results = None
+    if not instance_ids:
+      max_results = self.DESCRIBE_INSTANCES_PAGE_SIZE
+
+    instances = []
+    next_token = None
+    while True:
+      reservations = conn.get_all_reservations(instance_ids=instance_ids,
+        filters=filters, max_results=max_results, next_token=next_token)
+      for reservation in reservations:
+        for instance in reservation.instances:
+          if instance.state in states and instance.key_name == keyname:
+            instances.append(EC2Instance.from_boto(instance))
+
+      next_token = getattr(reservations, 'next_token', None)
+      if not next_token:
+        return instances
+
+  def get_instance_info(self, instances):
+    """ Splits the given instances into lists of their IP addresses and IDs.
+
+    Args:
+      instances: A list of EC2Instances.
+    Returns:
+      A tuple of the form (public ips, private ips, instance ids).
+    """
+    return ([instance.public_ip for instance in instances],
+      [instance.private_ip for instance in instances],
+      [instance.instance_id for instance in instances])
+
+  @reports_api_calls
   def run_instances(self, count, parameters, security_configured):
     """
     Spawns the specified number of EC2 instances using the parameters
@@ -413,11 +734,12 @@ class EC2Agent(BaseAgent):
     active_private_ips = []
     active_instances = []
 
-    # Make sure we do not have terminated instances using the same keyname.
-    instances = self.__describe_instances(parameters)
-    term_instance_info = self.__get_instance_info(instances,
-       'terminated', keyname)
-    if len(term_instance_info[2]):
+    # Make sure we do not have terminated instances using the same keyname,
+    # unless the caller knows the keyname is this deployment's own (e.g., it
+    # kept instances in a warm pool).
+    conn = self.open_connection(parameters)
+    if not parameters.get(self.PARAM_REUSE_KEYNAME) and \
+      self.find_instances(conn, keyname, ['terminated']):
       self.handle_failure('SSH keyname {0} is already registered to a '\
                           'terminated instance. Please change the "keyname" '\
                           'you specified in your AppScalefile to a different '\
@@ -441,36 +763,44 @@ class EC2Agent(BaseAgent):
           self.handle_failure('Failed to invoke describe_instances')
         attempts += 1
 
-      conn = self.open_connection(parameters)
       if spot:
         price = parameters[self.PARAM_SPOT_PRICE] or \
           self.get_optimal_spot_price(conn, instance_type, zone)
 
+        # Spot requests don't name their instances until they are fulfilled,
+        # so we have to look for instances that weren't running before.
         conn.request_spot_instances(str(price), image_id, key_name=keyname,
           security_groups=[group], instance_type=instance_type, count=count,
           placement=zone)
+        launched_ids = None
       else:
-        conn.run_instances(image_id, count, count, key_name=keyname,
-          security_groups=[group], instance_type=instance_type, placement=zone)
+        reservation = conn.run_instances(image_id, count, count,
+          key_name=keyname, security_groups=[group],
+          instance_type=instance_type, placement=zone)
+        launched_ids = [instance.id for instance in reservation.instances]
 
-      instance_ids = []
-      public_ips = []
-      private_ips = []
-      end_time = datetime.datetime.now() + datetime.timedelta(0,
-        self.MAX_VM_CREATION_TIME)
-      now = datetime.datetime.now()
-
-      while now < end_time:
+      def describe_new_instances():
         AppScaleLogger.log("Waiting for your instances to start...")
+        if launched_ids:
+          try:
+            return self.get_instance_info(self.find_instances(conn, keyname,
+              ['running'], instance_ids=launched_ids))
+          except EC2ResponseError as exception:
+            # EC2 may not know about instances it just started yet.
+            if exception.error_code != 'InvalidInstanceID.NotFound':
+              raise
+            return [], [], []
+
         public_ips, private_ips, instance_ids = self.describe_instances(
           parameters)
-        public_ips = self.diff(public_ips, active_public_ips)
-        private_ips = self.diff(private_ips, active_private_ips)
-        instance_ids = self.diff(instance_ids, active_instances)
-        if count == len(public_ips):
-          break
-        time.sleep(self.SLEEP_TIME)
-        now = datetime.datetime.now()
+        return (self.diff(public_ips, active_public_ips),
+          self.diff(private_ips, active_private_ips),
+          self.diff(instance_ids, active_instances))
+
+      _, (public_ips, private_ips, instance_ids) = self.poll(
+        describe_new_instances, self.MAX_VM_CREATION_TIME,
+        done=lambda new_instances: len(new_instances[0]) == count,
+        wait_first=True)
 
       if not public_ips:
         self.handle_failure('No public IPs were able to be procured '
@@ -541,6 +871,42 @@ class EC2Agent(BaseAgent):
             ' '.join(instance_ids))
 
 
+  def start_instances(self, parameters):
+    """
+    Start one or more stopped EC2 instances. The input instance IDs are
+    fetched from the 'instance_ids' parameters in the input map. (Also
+    see documentation for the BaseAgent class)
+
+    Args:
+      parameters: A dictionary of parameters.
+    Returns:
+      A tuple of the form (instance_ids, public_ips, private_ips) for the
+      instances that were started.
+    Raises:
+      AgentRuntimeException: If the instances did not start in time.
+    """
+    instance_ids = parameters[self.PARAM_INSTANCE_IDS]
+    conn = self.open_connection(parameters)
+    AppScaleLogger.log('Starting stopped instances: ' + ' '.join(instance_ids))
+    try:
+      conn.start_instances(instance_ids)
+    except EC2ResponseError as exception:
+      self.handle_failure('Unable to start instances {0} because: {1}'.format(
+        ' '.join(instance_ids), exception.error_message))
+
+    if not self.wait_for_status_change(parameters, conn, 'running',
+      max_wait_time=self.MAX_VM_RESTART_TIME):
+      self.handle_failure("ERROR: could not start instances: " + \
+        ' '.join(instance_ids))
+
+    # Stopped instances get new public IPs when they start again.
+    instances = self.find_instances(conn, parameters[self.PARAM_KEYNAME],
+      ['running'], instance_ids=instance_ids)
+    public_ips, private_ips, started_ids = self.get_instance_info(instances)
+    return started_ids, public_ips, private_ips
+
+
+  @reports_api_calls
   def terminate_instances(self, parameters):
     """
     Terminate one of more EC2 instances. The input instance IDs are
@@ -571,7 +937,7 @@ class EC2Agent(BaseAgent):
 
 
   def wait_for_status_change(self, parameters, conn, state_requested, \
-                              max_wait_time=60,poll_interval=10):
+                              max_wait_time=60):
     """ After we have sent a signal to the cloud infrastructure to change the state
       of the instances (unsually from runnning to either stoppped or 
       terminated), wait for the status to change.  If all the instances change
@@ -583,41 +949,68 @@ class EC2Agent(BaseAgent):
       state_requrested: String of the requested final state of the instances.
       max_wait_time: int of maximum amount of time (in seconds)  to wait for the
         state change.
-      poll_interval: int of the number of seconds to wait between checking of
-        the state.
     """
-    time_start = time.time()
     instance_ids = parameters[self.PARAM_INSTANCE_IDS]
-    instances_in_state = {}
-    while True:
-      time.sleep(poll_interval)
-      reservations = conn.get_all_instances(instance_ids)
-      instances = [i for r in reservations for i in r.instances]
-      for i in instances:
-        # instance i.id reports status = i.state
-        if i.state == state_requested and \
-           i.key_name == parameters[self.PARAM_KEYNAME]:
-          if i.id not in instances_in_state.keys():
-            instances_in_state[i.id] = 1 # mark instance done
-      if len(instances_in_state.keys()) >= len(instance_ids):
-        return True
-      if time.time() - time_start > max_wait_time:
-        return False
+    instances_in_state = set()
+
+    def count_instances_in_state():
+      for instance in self.find_instances(conn, parameters[self.PARAM_KEYNAME],
+        [state_requested], instance_ids=instance_ids):
+        instances_in_state.add(instance.instance_id)
+      return len(instances_in_state)
+
+    changed, _ = self.poll(count_instances_in_state, max_wait_time,
+      done=lambda num_changed: num_changed >= len(instance_ids),
+      wait_first=True)
+    return changed
 
 
   def create_image(self, instance_id, name, parameters):
-    """ Creates a new cloud image from the given instance id.
-    
+    """ Creates a new cloud image from the given instance id. EC2 restarts the
+    instance while it copies its root volume, so that the image is consistent.
+    (Also see documentation for the BaseAgent class)
+
     Args:
-      instance_id: id of the (stopped) instance to create an image of.
+      instance_id: id of the instance to create an image of.
       name: A str containing the human-readable name for the image.
       parameters: A dict that contains the credentials needed to authenticate
         with AWS.
     Returns:
       A str containing the ami of the new image.
-     """
+    Raises:
+      AgentRuntimeException: If the image could not be created, or did not
+        become available in time.
+    """
     conn = self.open_connection(parameters)
-    return conn.create_image(instance_id, name)
+    AppScaleLogger.log("Creating image {0} from instance {1}".format(name,
+      instance_id))
+    try:
+      image_id = conn.create_image(instance_id, name)
+    except EC2ResponseError as exception:
+      self.handle_failure('Unable to create an image from instance {0} ' \
+        'because: {1}'.format(instance_id, exception.error_message))
+
+    def get_image_state():
+      AppScaleLogger.log("Waiting for image {0} to become available...".format(
+        image_id))
+      try:
+        return conn.get_image(image_id).state
+      except EC2ResponseError as exception:
+        # EC2 may not know about the image it just started creating yet.
+        if exception.error_code != 'InvalidAMIID.NotFound':
+          raise
+        return 'pending'
+
+    finished, state = self.poll(get_image_state, self.MAX_IMAGE_CREATION_TIME,
+      done=lambda image_state: image_state != 'pending', wait_first=True)
+    if not finished:
+      self.handle_failure('Image {0} did not become available within {1} ' \
+        'seconds.'.format(image_id, self.MAX_IMAGE_CREATION_TIME))
+    if state != 'available':
+      self.handle_failure('Image {0} could not be created: it is {1}.'.format(
+        image_id, state))
+
+    return image_id
 
 
   def does_address_exist(self, parameters):
@@ -735,20 +1128,25 @@ class EC2Agent(BaseAgent):
 
     AppScaleLogger.log("Deleting security group {0}".format(
       parameters[self.PARAM_GROUP]))
-    while True:
+
+    def delete_security_group():
       try:
         conn.delete_security_group(parameters[self.PARAM_GROUP])
-        return
+        return True
       except EC2ResponseError:
-        time.sleep(5)
+        return False
+
+    deleted, _ = self.poll(delete_security_group,
+      self.MAX_SECURITY_GROUP_DELETION_TIME)
+    if not deleted:
+      self.handle_failure("Couldn't delete security group {0}".format(
+        parameters[self.PARAM_GROUP]))
 
 
   def get_optimal_spot_price(self, conn, instance_type, zone):
     """
-    Returns the spot price for an EC2 instance of the specified instance type.
-    The returned value is computed by averaging all the spot price history
-    values returned by the back-end EC2 APIs and incrementing the average by
-    extra 10%.
+    Returns the spot price to bid for an EC2 instance of the specified
+    instance type, which is the SPOT_BID_PERCENTILE of the last week's prices.
 
     Args:
       conn: A boto.EC2Connection that can be used to communicate with AWS.
@@ -759,21 +1157,109 @@ class EC2Agent(BaseAgent):
     Returns:
       The estimated spot price for the specified instance type, in the
         specified availability zone.
+    Raises:
+      AgentRuntimeException: If EC2 has no price history for the instance
+        type in the zone.
     """
-    end_time = datetime.datetime.now()
-    start_time = end_time - datetime.timedelta(days=7)
-    history = conn.get_spot_price_history(start_time=start_time.isoformat(),
-      end_time=end_time.isoformat(), product_description='Linux/UNIX',
-      instance_type=instance_type, availability_zone=zone)
-    var_sum = 0.0
-    for entry in history:
-      var_sum += entry.price
-    average = var_sum / len(history)
-    bid_price = average * 1.10
-    AppScaleLogger.log('The average spot instance price for a {0} machine is'\
-        ' {1}, and 10% more is {2}'.format(instance_type, average, bid_price))
+    prices = self.get_spot_price_cache().get_prices(conn, instance_type, zone)
+    if not prices:
+      self.handle_failure('No spot price history was found for {0} machines ' \
+        'in {1}. Please specify a max_spot_price in your AppScalefile.'.format(
+        instance_type, zone))
+
+    bid_price = self.percentile(prices, self.SPOT_BID_PERCENTILE)
+    AppScaleLogger.log('The {0}th percentile spot instance price for a {1} ' \
+      'machine is {2}'.format(self.SPOT_BID_PERCENTILE, instance_type,
+      bid_price))
     return bid_price
 
+  def recommend_spot_placement(self, conn, instance_types, zones, count):
+    """ Scores every combination of the given instance types and zones by
+    their spot price history, and picks the cheapest one whose prices are
+    stable enough for a deployment of the given size.
+
+    Args:
+      conn: A boto.EC2Connection that can be used to communicate with AWS.
+      instance_types: A list of the instance types that could be used.
+      zones: A list of the availability zones that could be used.
+      count: The number of machines in the deployment.
+    Returns:
+      A tuple of the form (zone, instance_type, bid_price).
+    Raises:
+      AgentRuntimeException: If EC2 has no price history for any of the
+        combinations.
+    """
+    max_volatility = self.SPOT_MAX_VOLATILITY / (1 + math.log10(count))
+    cache = self.get_spot_price_cache()
+
+    candidates = []
+    for zone in zones:
+      for instance_type in instance_types:
+        prices = cache.get_prices(conn, instance_type, zone)
+        if not prices:
+          continue
+
+        bid_price = self.percentile(prices, self.SPOT_BID_PERCENTILE)
+        median = self.percentile(prices, 50)
+        volatility = (bid_price - median) / median if median else 0.0
+        candidates.append((volatility, bid_price, zone, instance_type))
+
+    if not candidates:
+      self.handle_failure('No spot price history was found for {0} machines ' \
+        'in {1}.'.format(', '.join(instance_types), ', '.join(zones)))
+
+    stable = [candidate for candidate in candidates
+      if candidate[0] <= max_volatility]
+    if stable:
+      _, bid_price, zone, instance_type = min(stable,
+        key=lambda candidate: (candidate[1], candidate[2], candidate[3]))
+    else:
+      AppScaleLogger.warn('Spot prices vary too much everywhere for {0} ' \
+        'machines, so using the most stable zone.'.format(count))
+      _, bid_price, zone, instance_type = min(candidates)
+
+    AppScaleLogger.log('Recommending {0} machines in {1} at a bid of {2}' \
+      .format(instance_type, zone, bid_price))
+    return zone, instance_type, bid_price
+
+  def choose_spot_zone(self, parameters, count):
+    """ Picks the availability zone in the deployment's region that
+    recommend_spot_placement finds best for its instance type and size.
+
+    Args:
+      parameters: A dict that contains the credentials, region and instance
+        type of the deployment.
+      count: The number of machines in the deployment.
+    Returns:
+      A str naming the availability zone to start spot instances in.
+    Raises:
+      AgentRuntimeException: If EC2 has no spot price history for the
+        instance type in any of the region's zones.
+    """
+    conn = self.open_connection(parameters)
+    zones = [zone.name for zone in conn.get_all_zones()]
+    zone, _, _ = self.recommend_spot_placement(conn,
+      [parameters[self.PARAM_INSTANCE_TYPE]], zones, count)
+    return zone
+
+  def get_spot_price_cache(self):
+    """ Returns the SpotPriceCache kept in the local AppScale directory. """
+    return SpotPriceCache(LocalState.get_spot_price_cache_location())
+
+  @staticmethod
+  def percentile(values, percent):
+    """ Finds the given percentile of the values, using the nearest rank.
+
+    Args:
+      values: A non-empty list of numbers.
+      percent: A number between 0 and 100.
+    Returns:
+      The smallest value that is at least as large as percent% of the values.
+    """
+    ordered = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
   def open_connection(self, parameters):
     """
     Initialize a connection to the back-end EC2 APIs.
@@ -781,12 +1267,23 @@ class EC2Agent(BaseAgent):
     Args:
       parameters: A dictionary containing the 'credentials' parameter.
     Returns:
-      An instance of Boto EC2Connection
+      An instance of Boto EC2Connection, shared with every other caller that
+      uses the same region and credentials.
     """
     credentials = parameters[self.PARAM_CREDENTIALS]
-    return boto.ec2.connect_to_region(parameters[self.PARAM_REGION],
-      aws_access_key_id=credentials['EC2_ACCESS_KEY'],
-      aws_secret_access_key=credentials['EC2_SECRET_KEY'])
+    region = parameters[self.PARAM_REGION]
+    access_key = credentials['EC2_ACCESS_KEY']
+    secret_key = credentials['EC2_SECRET_KEY']
+    return self.get_cached_client((region, access_key, secret_key),
+      lambda: MeteredClient(self, boto.ec2.connect_to_region(region,
+        aws_access_key_id=access_key, aws_secret_access_key=secret_key)))
+
+  def is_throttled(self, exception):
+    """ Decides if EC2 refused an API call because we made too many. (Also see
+    documentation for the BaseAgent class)
+    """
+    return isinstance(exception, EC2ResponseError) and \
+      exception.error_code in self.THROTTLING_ERROR_CODES
 
   def handle_failure(self, msg):
     """ Log the specified error message and raise an AgentRuntimeException
@@ -798,40 +1295,3 @@ class EC2Agent(BaseAgent):
     """
     AppScaleLogger.log(msg)
     raise AgentRuntimeException(msg)
-
-  def __describe_instances(self, parameters):
-    """ Query the back-end EC2 services for instance details and return
-    a list of instances. This is equivalent to running the standard
-    ec2-describe-instances command. The returned list of instances
-    will contain all the running and pending instances and it might
-    also contain some recently terminated instances.
-
-    Args:
-      parameters: A dictionary of parameters.
-    Returns:
-      A list of instances (element type definition in boto.ec2 package).
-    """
-    conn = self.open_connection(parameters)
-    reservations = conn.get_all_instances()
-    instances = [i for r in reservations for i in r.instances]
-    return instances
-
-  def __get_instance_info(self, instances, status, keyname):
-    """ Filter out a list of instances by instance status and keyname.
-
-    Args:
-      instances: A list of instances as returned by describe_instances.
-      status: Status of the VMs (eg: running, terminated).
-      keyname: Keyname used to spawn instances.
-    Returns:
-      A tuple of the form (public ips, private ips, instance ids).
-    """
-    instance_ids = []
-    public_ips = []
-    private_ips = []
-    for i in instances:
-      if i.state == status and i.key_name == keyname:
-        instance_ids.append(i.id)
-        public_ips.append(i.ip_address)
-        private_ips.append(i.private_ip_address)
-    return public_ips, private_ips, instance_ids
@@ -1,6 +1,7 @@
 import boto
 
 from appscale.tools.appscale_logger import AppScaleLogger
+from api_accounting import MeteredClient
 from ec2_agent import EC2Agent
 from urlparse import urlparse
 
@@ -59,13 +60,15 @@ class EucalyptusAgent(EC2Agent):
     else:
       debug_level = 0  # the silent treatment
 
-    return boto.connect_euca(host=result.hostname,
+    return self.get_cached_client((ec2_url, access_key, secret_key,
+      debug_level), lambda: MeteredClient(self, boto.connect_euca(
+      host=result.hostname,
       aws_access_key_id=access_key,
       aws_secret_access_key=secret_key,
       port=port,
       path=result.path,
       is_secure=(result.scheme == 'https'),
-      api_version=self.EUCA_API_VERSION, debug=debug_level)
+      api_version=self.EUCA_API_VERSION, debug=debug_level)))
 
 
   def does_zone_exist(self, parameters):
@@ -20,6 +20,7 @@ from apiclient import errors
 # Don't bother us about the discovery.Resource not having certain
 # methods, since it gets built dynamically.
 # pylint: disable-msg=E1101
+from googleapiclient.discovery_cache.base import Cache
 import httplib2
 import oauth2client.client
 import oauth2client.file
@@ -33,6 +34,7 @@ from appscale.tools.local_state import LocalState
 from base_agent import AgentConfigurationException
 from base_agent import AgentRuntimeException
 from base_agent import BaseAgent
+from base_agent import reports_api_calls
 
 
 class CredentialJSONKeys(object):
@@ -51,6 +53,81 @@ class CredentialTypes(object):
   OAUTH = 'oauth_client'
 
 
+class DiscoveryDocumentCache(Cache):
+  """ DiscoveryDocumentCache keeps the documents that describe Google's APIs on
+  the local filesystem, so that connecting to Google Compute Engine doesn't
+  fetch and parse them from Google every time.
+
+  The Google Client Library ships a file cache of its own, but it is disabled
+  for the oauth2client version that we depend on.
+  """
+
+
+  # The number of seconds that we use a cached document for before fetching
+  # it again, which picks up any changes Google makes to the API.
+  MAX_AGE = 60 * 60 * 24
+
+
+  def __init__(self, location):
+    """ Creates a new DiscoveryDocumentCache.
+
+    Args:
+      location: A str naming the JSON file that the documents are kept in.
+    """
+    self.location = location
+
+
+  def read_documents(self):
+    """ Reads every cached document from the local filesystem.
+
+    Returns:
+      A dict that maps each document's URL to a dict with the document's
+      'content' and the 'timestamp' it was fetched at. The dict is empty if
+      nothing has been cached yet, or if the cache can't be read.
+    """
+    try:
+      with open(self.location, 'r') as file_handle:
+        return json.loads(file_handle.read())
+    except (IOError, ValueError):
+      return {}
+
+
+  def get(self, url):
+    """ Looks up the document fetched from the given URL.
+
+    Args:
+      url: A str naming where the document is fetched from.
+    Returns:
+      The document as a str, or None if it isn't cached or has expired.
+    """
+    document = self.read_documents().get(url)
+    if not document or time.time() - document['timestamp'] > self.MAX_AGE:
+      return None
+    return document['content']
+
+
+  def set(self, url, content):
+    """ Caches the document fetched from the given URL.
+
+    Failing to write the cache is not an error, since it only means that the
+    next connection fetches the document again.
+
+    Args:
+      url: A str naming where the document was fetched from.
+      content: A str containing the document.
+    """
+    documents = self.read_documents()
+    documents[url] = {'timestamp' : time.time(), 'content' : content}
+    temp_location = '{0}.{1}'.format(self.location, uuid.uuid4().hex)
+    try:
+      with open(temp_location, 'w') as file_handle:
+        file_handle.write(json.dumps(documents))
+      # Renaming is atomic, so concurrent readers never see a partial file.
+      os.rename(temp_location, self.location)
+    except (IOError, OSError):
+      pass
+
+
 class GCEAgent(BaseAgent):
   """ GCEAgent defines a specialized BaseAgent that allows for interaction with
   Google Compute Engine.
@@ -73,6 +150,17 @@ class GCEAgent(BaseAgent):
   SLEEP_TIME = 20
 
 
+  # The largest number of requests that we send to Google Compute Engine in a
+  # single batch request. GCE accepts up to 1000, but smaller batches keep
+  # each HTTP response to a manageable size.
+  MAX_BATCH_SIZE = 100
+
+
+  # The reasons that GCE gives when it refuses an API call because we made
+  # too many.
+  THROTTLING_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
   # The following constants are string literals that can be used by callers to
   # index into the parameters the user passes in, as opposed to having to type
   # out the strings each time we need them.
@@ -181,7 +269,7 @@ class GCEAgent(BaseAgent):
       auth_http = credentials.authorize(http)
       request = gce_service.instances().list(project=parameters
         [self.PARAM_PROJECT], zone=parameters[self.PARAM_ZONE])
-      response = request.execute(http=auth_http)
+      response = self.execute_request(request, auth_http)
       AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
       return True
     except errors.HttpError as e:
@@ -198,6 +286,9 @@ class GCEAgent(BaseAgent):
     in the same network and firewall (thus enabling them to see each other's web
     traffic).
 
+    Everything is looked up in one batch request. The SSH key and the network
+    are then created together, and the firewall once the network exists.
+
     Args:
       parameters: A dict with keys for each parameter needed to connect to
         Google Compute Engine, and an additional key indicating the name of the
@@ -206,7 +297,7 @@ class GCEAgent(BaseAgent):
       True, if the named network and firewall was created successfully.
     Raises:
       AgentRuntimeException: If the named network or firewall already exist in
-      GCE.
+      GCE, or could not be created.
     """
     AppScaleLogger.log("Verifying that SSH key exists locally")
     keyname = parameters[self.PARAM_KEYNAME]
@@ -219,20 +310,75 @@ class GCEAgent(BaseAgent):
 
     LocalState.generate_rsa_key(keyname, parameters[self.PARAM_VERBOSE])
 
-    ssh_key_exists, all_ssh_keys = self.does_ssh_key_exist(parameters)
-    if not ssh_key_exists:
-      self.create_ssh_key(parameters, all_ssh_keys)
-
-    if self.does_network_exist(parameters):
+    gce_service, credentials = self.open_connection(parameters)
+    http = httplib2.Http()
+    auth_http = credentials.authorize(http)
+    project = parameters[self.PARAM_PROJECT]
+    group = parameters[self.PARAM_GROUP]
+    found, _ = self.execute_batch(gce_service, auth_http, {
+      'project' : gce_service.projects().get(project=project),
+      'network' : gce_service.networks().get(project=project, network=group),
+      'firewall' : gce_service.firewalls().get(project=project,
+        firewall=group)
+    })
+
+    if 'network' in found:
       raise AgentRuntimeException("Network already exists - please use a " + \
         "different group name.")
 
-    if self.does_firewall_exist(parameters):
+    if 'firewall' in found:
       raise AgentRuntimeException("Firewall already exists - please use a " + \
         "different group name.")
 
-    network_url = self.create_network(parameters)
-    self.create_firewall(parameters, network_url)
+    requests = {'network' : self.get_network_request(gce_service, parameters)}
+    ssh_key_exists, all_ssh_keys = self.find_ssh_key(parameters,
+      found.get('project'))
+    if not ssh_key_exists:
+      requests['ssh key'] = self.get_ssh_key_request(gce_service, parameters,
+        all_ssh_keys)
+    operations = self.execute_security_requests(gce_service, auth_http,
+      requests, parameters)
+
+    self.execute_security_requests(gce_service, auth_http, {
+      'firewall' : self.get_firewall_request(gce_service, parameters,
+        operations['network']['targetLink'])
+    }, parameters)
+    return True
+
+
+  def execute_security_requests(self, gce_service, auth_http, requests,
+    parameters):
+    """ Sends the given requests to Google Compute Engine in one batch, and
+    waits for all of the operations they start to finish.
+
+    Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
+      auth_http: A HTTP connection that has been signed with the given user's
+        Credentials, and is authorized with the GCE scope.
+      requests: A dict that maps a str naming what each request sets up to the
+        HttpRequest that starts it.
+      parameters: A dict with keys for each parameter needed to connect to
+        Google Compute Engine.
+    Returns:
+      A dict that maps the name of each request to the operation it started.
+    Raises:
+      AgentRuntimeException: If any request or operation failed, listing
+        every failure.
+    """
+    operations, failures = self.execute_batch(gce_service, auth_http,
+      requests)
+    for request_id in sorted(operations):
+      AppScaleLogger.verbose(str(operations[request_id]),
+        parameters[self.PARAM_VERBOSE])
+
+    failures.update(self.wait_for_operations(gce_service, auth_http,
+      operations, parameters[self.PARAM_PROJECT], stop_on_failure=True))
+    if failures:
+      raise AgentRuntimeException("\n".join("Couldn't create the {0}: {1}" \
+        .format(request_id, failures[request_id])
+        for request_id in sorted(failures)))
+    return operations
 
 
   def does_ssh_key_exist(self, parameters):
@@ -247,44 +393,58 @@ class GCEAgent(BaseAgent):
         our public key's contents are in GCE, and False otherwise, while
         the second item is the contents of all SSH keys stored in GCE.
     """
-    our_public_ssh_key = None
-    public_ssh_key_location = LocalState.LOCAL_APPSCALE_PATH + \
-      parameters[self.PARAM_KEYNAME] + ".pub"
-    with open(public_ssh_key_location) as file_handle:
-      system_user = os.getenv('LOGNAME', default=pwd.getpwuid(os.getuid())[0])
-      our_public_ssh_key = system_user + ":" + file_handle.read().rstrip()
-
     gce_service, credentials = self.open_connection(parameters)
     try:
       http = httplib2.Http()
       auth_http = credentials.authorize(http)
       request = gce_service.projects().get(
         project=parameters[self.PARAM_PROJECT])
-      response = request.execute(http=auth_http)
-      AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
+      response = self.execute_request(request, auth_http)
+    except errors.HttpError:
+      response = None
+    return self.find_ssh_key(parameters, response)
 
-      if not 'items' in response['commonInstanceMetadata']:
-        return False, ""
 
-      metadata = response['commonInstanceMetadata']['items']
-      if not metadata:
-        return False, ""
+  def find_ssh_key(self, parameters, project_info):
+    """ Looks for our public SSH key in a GCE project's metadata.
 
-      all_ssh_keys = ""
-      for item in metadata:
-        if item['key'] != 'sshKeys':
-          continue
+    Args:
+      parameters: A dict with keys for each parameter needed to connect to
+        Google Compute Engine.
+      project_info: A dict describing the GCE project, or None if it couldn't
+        be fetched.
+    Returns:
+      A tuple of two items. The first item is a bool that is True if
+        our public key's contents are in GCE, and False otherwise, while
+        the second item is the contents of all SSH keys stored in GCE.
+    """
+    if not project_info:
+      return False, ""
 
-        # Now that we know there's one or more SSH keys, just make sure that
-        # ours is in this list.
-        all_ssh_keys = item['value']
-        if our_public_ssh_key in all_ssh_keys:
-          return True, all_ssh_keys
+    AppScaleLogger.verbose(str(project_info), parameters[self.PARAM_VERBOSE])
+    public_ssh_key_location = LocalState.LOCAL_APPSCALE_PATH + \
+      parameters[self.PARAM_KEYNAME] + ".pub"
+    with open(public_ssh_key_location) as file_handle:
+      system_user = os.getenv('LOGNAME', default=pwd.getpwuid(os.getuid())[0])
+      our_public_ssh_key = system_user + ":" + file_handle.read().rstrip()
 
-      return False, all_ssh_keys
-    except errors.HttpError:
+    metadata = project_info.get('commonInstanceMetadata', {}).get('items')
+    if not metadata:
       return False, ""
 
+    all_ssh_keys = ""
+    for item in metadata:
+      if item['key'] != 'sshKeys':
+        continue
+
+      # Now that we know there's one or more SSH keys, just make sure that
+      # ours is in this list.
+      all_ssh_keys = item['value']
+      if our_public_ssh_key in all_ssh_keys:
+        return True, all_ssh_keys
+
+    return False, all_ssh_keys
+
 
   def does_network_exist(self, parameters):
     """ Queries Google Compute Engine to see if the specified network exists.
@@ -303,7 +463,7 @@ class GCEAgent(BaseAgent):
       request = gce_service.networks().get(
         project=parameters[self.PARAM_PROJECT],
         network=parameters[self.PARAM_GROUP])
-      response = request.execute(http=auth_http)
+      response = self.execute_request(request, auth_http)
       AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
       return True
     except errors.HttpError:
@@ -327,24 +487,27 @@ class GCEAgent(BaseAgent):
       request = gce_service.firewalls().get(
         project=parameters[self.PARAM_PROJECT],
         firewall=parameters[self.PARAM_GROUP])
-      response = request.execute(http=auth_http)
+      response = self.execute_request(request, auth_http)
       AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
       return True
     except errors.HttpError:
       return False
 
-  
-  def create_ssh_key(self, parameters, all_ssh_keys):
-    """ Creates a new SSH key in Google Compute Engine with the contents of
-    our newly generated public key.
+
+  def get_ssh_key_request(self, gce_service, parameters, all_ssh_keys):
+    """ Constructs a request that adds our newly generated public key to the
+    SSH keys that GCE passes in to instances.
 
     Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
       parameters: A dict with keys for each parameter needed to connect to
         Google Compute Engine.
       all_ssh_keys: A str that contains all of the SSH keys that are
         currently passed in to GCE instances.
+    Returns:
+      An HttpRequest that starts the operation setting the project's SSH keys.
     """
-    our_public_ssh_key = None
     public_ssh_key_location = LocalState.LOCAL_APPSCALE_PATH + \
       parameters[self.PARAM_KEYNAME] + ".pub"
     with open(public_ssh_key_location) as file_handle:
@@ -356,12 +519,9 @@ class GCEAgent(BaseAgent):
     if all_ssh_keys:
       new_all_ssh_keys = our_public_ssh_keys + "\n" + all_ssh_keys
     else:
-      new_all_ssh_keys = our_public_ssh_key
+      new_all_ssh_keys = our_public_ssh_keys
 
-    gce_service, credentials = self.open_connection(parameters)
-    http = httplib2.Http()
-    auth_http = credentials.authorize(http)
-    request = gce_service.projects().setCommonInstanceMetadata(
+    return gce_service.projects().setCommonInstanceMetadata(
       project=parameters[self.PARAM_PROJECT],
       body={
         "kind": "compute#metadata",
@@ -371,27 +531,24 @@ class GCEAgent(BaseAgent):
         }]
       }
     )
-    response = request.execute(http=auth_http)
-    AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
-    self.ensure_operation_succeeds(gce_service, auth_http, response,
-      parameters[self.PARAM_PROJECT])
 
 
-  def create_network(self, parameters):
-    """ Creates a new network in Google Compute Engine with the specified name.
+  def get_network_request(self, gce_service, parameters):
+    """ Constructs a request that creates a new network in Google Compute
+    Engine with the specified name.
 
     Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
       parameters: A dict with keys for each parameter needed to connect to
         Google Compute Engine, and an additional key indicating the name of the
         network that we should create in GCE.
     Returns:
-      The URL corresponding to the name of the network that was created, for use
-      with binding this network to one or more firewalls.
+      An HttpRequest that starts the operation creating the network. The
+      operation's targetLink is the network's URL, for use with binding this
+      network to one or more firewalls.
     """
-    gce_service, credentials = self.open_connection(parameters)
-    http = httplib2.Http()
-    auth_http = credentials.authorize(http)
-    request = gce_service.networks().insert(
+    return gce_service.networks().insert(
       project=parameters[self.PARAM_PROJECT],
       body={
         "name" : parameters[self.PARAM_GROUP],
@@ -399,11 +556,6 @@ class GCEAgent(BaseAgent):
         "IPv4Range" : "10.240.0.0/16"
       }
     )
-    response = request.execute(http=auth_http)
-    AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
-    self.ensure_operation_succeeds(gce_service, auth_http, response,
-      parameters[self.PARAM_PROJECT])
-    return response['targetLink']
 
 
   def delete_network(self, parameters):
@@ -425,26 +577,27 @@ class GCEAgent(BaseAgent):
       project=parameters[self.PARAM_PROJECT],
       network=parameters[self.PARAM_GROUP]
     )
-    response = request.execute(http=auth_http)
+    response = self.execute_request(request, auth_http)
     AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
     self.ensure_operation_succeeds(gce_service, auth_http, response,
       parameters[self.PARAM_PROJECT])
 
-  def create_firewall(self, parameters, network_url):
-    """ Creates a new firewall in Google Compute Engine with the specified name,
-    bound to the specified network.
+  def get_firewall_request(self, gce_service, parameters, network_url):
+    """ Constructs a request that creates a new firewall in Google Compute
+    Engine with the specified name, bound to the specified network.
 
     Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
       parameters: A dict with keys for each parameter needed to connect to
         Google Compute Engine, and an additional key indicating the name of the
         firewall that we should create.
       network_url: A str containing the URL of the network that this new
         firewall should be applied to.
+    Returns:
+      An HttpRequest that starts the operation creating the firewall.
     """
-    gce_service, credentials = self.open_connection(parameters)
-    http = httplib2.Http()
-    auth_http = credentials.authorize(http)
-    request = gce_service.firewalls().insert(
+    return gce_service.firewalls().insert(
       project=parameters[self.PARAM_PROJECT],
       body={
         "name" : parameters[self.PARAM_GROUP],
@@ -458,10 +611,6 @@ class GCEAgent(BaseAgent):
         ]
       }
     )
-    response = request.execute(http=auth_http)
-    AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
-    self.ensure_operation_succeeds(gce_service, auth_http, response,
-      parameters[self.PARAM_PROJECT])
 
 
   def delete_firewall(self, parameters):
@@ -482,7 +631,7 @@ class GCEAgent(BaseAgent):
       project=parameters[self.PARAM_PROJECT],
       firewall=parameters[self.PARAM_GROUP]
     )
-    response = request.execute(http=auth_http)
+    response = self.execute_request(request, auth_http)
     AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
     self.ensure_operation_succeeds(gce_service, auth_http, response,
       parameters[self.PARAM_PROJECT])
@@ -657,7 +806,7 @@ class GCEAgent(BaseAgent):
       filter="name eq {group}-.*".format(group=parameters[self.PARAM_GROUP]),
       zone=parameters[self.PARAM_ZONE]
     )
-    response = request.execute(http=auth_http)
+    response = self.execute_request(request, auth_http)
     AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
 
     instance_ids = []
@@ -676,7 +825,7 @@ class GCEAgent(BaseAgent):
     return public_ips, private_ips, instance_ids
 
   def generate_disk_name(self, parameters):
-    """ Creates a temporary name for a disk.
+    """ Creates a unique name for a disk.
 
     Args:
       parameters: A dict with keys for each parameter needed to connect to
@@ -684,47 +833,11 @@ class GCEAgent(BaseAgent):
     Returns:
       A str, a disk name associated with the root disk of AppScale on GCE.
     """
-    return '{group}-{time}'.format(group=parameters[self.PARAM_GROUP],
-                                   time=int(time.time() * 1000))[:60]
-
-  def create_scratch_disk(self, parameters):
-    """ Creates a disk from a given machine image.
-
-    GCE does not support scratch disks on API version v1 and higher. We create
-    a persistent disk upon creation to act like one to keep the abstraction used
-    in other infrastructures.
-
-    Args:
-      parameters: A dict with keys for each parameter needed to connect to
-        Google Compute Engine.
-    Returns:
-      A str, the url to the disk to use.
-    """
-    gce_service, credentials = self.open_connection(parameters)
-    http = httplib2.Http()
-    auth_http = credentials.authorize(http)
-    disk_name = self.generate_disk_name(parameters)
-    project_url = '{0}{1}'.format(self.GCE_URL, 
-      parameters[self.PARAM_PROJECT])
-    source_image_url = '{0}{1}/global/images/{2}'.format(self.GCE_URL,
-      parameters[self.PARAM_PROJECT], parameters[self.PARAM_IMAGE_ID])
-    request = gce_service.disks().insert(
-      project=parameters[self.PARAM_PROJECT],
-      zone=parameters[self.PARAM_ZONE],
-      body={
-        'name':disk_name 
-      },
-      sourceImage=source_image_url
-    )
-    response = request.execute(http=auth_http)
-    AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
-    self.ensure_operation_succeeds(gce_service, auth_http, response,
-      parameters[self.PARAM_PROJECT])
-
-    disk_url = "{0}/zones/{1}/disks/{2}".format(
-      project_url, parameters[self.PARAM_ZONE], disk_name)
-    return disk_url
+    # Disks are created in batches, so a timestamp alone would not be unique.
+    return '{group}-{uuid}'.format(group=parameters[self.PARAM_GROUP],
+                                   uuid=uuid.uuid4().hex)[:60]
 
+  @reports_api_calls
   def run_instances(self, count, parameters, security_configured):
     """ Starts 'count' instances in Google Compute Engine, and returns once they
     have been started.
@@ -733,12 +846,19 @@ class GCEAgent(BaseAgent):
     this method, or the newly created instances will not have a network and
     firewall to attach to (and thus this method will fail).
 
+    The boot disks for every instance are created in one batch of requests,
+    and the instances themselves in another, so starting many instances takes
+    about as long as starting the slowest one.
+
     Args:
       count: An int that specifies how many virtual machines should be started.
       parameters: A dict with keys for each parameter needed to connect to
         Google Compute Engine.
       security_configured: Unused, as we assume that the network and firewall
         has already been set up.
+    Raises:
+      AgentRuntimeException: If any of the instances could not be created, in
+        which case the instances and disks that were created are deleted.
     """
     project_id = parameters[self.PARAM_PROJECT]
     image_id = parameters[self.PARAM_IMAGE_ID]
@@ -764,64 +884,97 @@ class GCEAgent(BaseAgent):
       zone, instance_type)
     network_url = '{0}/global/networks/{1}'.format(project_url, group)
 
-    # Construct the request body
-    for index in range(count):
-      disk_url = self.create_scratch_disk(parameters)
-      instances = {
-        # Truncate the name down to the first 62 characters, since GCE doesn't
-        # let us use arbitrarily long instance names.
-        'name': '{group}-{uuid}'.format(group=group, uuid=uuid.uuid4())[:62],
-        'machineType': machine_type_url,
-        'disks':[{
-          'source': disk_url,
-          'boot': 'true',
-          'type': 'PERSISTENT'
-        }],
-        'image': image_url,
-        'networkInterfaces': [{
-          'accessConfigs': [{
-            'type': 'ONE_TO_ONE_NAT',
-            'name': 'External NAT'
-           }],
-          'network': network_url
-        }],
-        'serviceAccounts': [{
-             'email': self.DEFAULT_SERVICE_EMAIL,
-             'scopes': [self.GCE_SCOPE]
-        }]
-      }
+    gce_service, credentials = self.open_connection(parameters)
+    http = httplib2.Http()
+    auth_http = credentials.authorize(http)
 
-      # Create the instance
-      gce_service, credentials = self.open_connection(parameters)
-      http = httplib2.Http()
-      auth_http = credentials.authorize(http)
-      request = gce_service.instances().insert(
-           project=project_id, body=instances, zone=zone)
-      response = request.execute(http=auth_http)
-      AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
-      self.ensure_operation_succeeds(gce_service, auth_http, response,
-        parameters[self.PARAM_PROJECT])
-    
-    instance_ids = []
-    public_ips = []
-    private_ips = []
-    end_time = datetime.datetime.now() + datetime.timedelta(0,
-      self.MAX_VM_CREATION_TIME)
-    now = datetime.datetime.now()
+    # GCE does not support scratch disks on API version v1 and higher, so each
+    # instance boots from a persistent disk that acts like one.
+    instance_names = {}
+    disk_names = {}
+    disk_requests = {}
+    for index in range(count):
+      request_id = str(index)
+      # Truncate the name down to the first 62 characters, since GCE doesn't
+      # let us use arbitrarily long instance names.
+      instance_names[request_id] = '{group}-{uuid}'.format(group=group,
+        uuid=uuid.uuid4())[:62]
+      disk_names[request_id] = self.generate_disk_name(parameters)
+      disk_requests[request_id] = gce_service.disks().insert(
+        project=project_id,
+        zone=zone,
+        body={
+          'name': disk_names[request_id]
+        },
+        sourceImage=image_url
+      )
 
-    while now < end_time:
+    disk_failures = self.execute_operations(gce_service, auth_http,
+      disk_requests, parameters)
+    failures = dict(disk_failures)
+
+    # The deployment can't start without every disk, so only start instances
+    # once all of them are ready.
+    instance_requests = {}
+    if not disk_failures:
+      for request_id, disk_name in disk_names.iteritems():
+        instances = {
+          'name': instance_names[request_id],
+          'machineType': machine_type_url,
+          'disks':[{
+            'source': '{0}/zones/{1}/disks/{2}'.format(project_url, zone,
+              disk_name),
+            'boot': 'true',
+            'type': 'PERSISTENT'
+          }],
+          'image': image_url,
+          'networkInterfaces': [{
+            'accessConfigs': [{
+              'type': 'ONE_TO_ONE_NAT',
+              'name': 'External NAT'
+             }],
+            'network': network_url
+          }],
+          'serviceAccounts': [{
+               'email': self.DEFAULT_SERVICE_EMAIL,
+               'scopes': [self.GCE_SCOPE]
+          }]
+        }
+        instance_requests[request_id] = gce_service.instances().insert(
+          project=project_id, body=instances, zone=zone)
+
+      failures.update(self.execute_operations(gce_service, auth_http,
+        instance_requests, parameters))
+
+    if failures:
+      for request_id in sorted(failures, key=int):
+        AppScaleLogger.warn("Could not start instance {0}: {1}".format(
+          instance_names[request_id], failures[request_id]))
+
+      # Don't leave the instances that did start, or the disks of any
+      # instance, behind for the user to find and pay for.
+      started_instances = [instance_names[request_id]
+        for request_id in sorted(instance_requests, key=int)
+        if request_id not in failures]
+      created_disks = [disk_names[request_id]
+        for request_id in sorted(disk_names, key=int)
+        if request_id not in disk_failures]
+      self.delete_instances_and_disks(gce_service, auth_http, parameters,
+        started_instances, created_disks)
+      raise AgentRuntimeException("{0} of {1} instances could not be " \
+        "started, so the rest were deleted.".format(len(failures), count))
+
+    def describe_new_instances():
       AppScaleLogger.log("Waiting for your instances to start...")
-      instance_info = self.describe_instances(parameters)
-      public_ips = instance_info[0]
-      private_ips = instance_info[1]
-      instance_ids = instance_info[2]
-      public_ips = self.diff(public_ips, active_public_ips)
-      private_ips = self.diff(private_ips, active_private_ips)
-      instance_ids = self.diff(instance_ids, active_instances)
-      if count == len(public_ips):
-        break
-      time.sleep(self.SLEEP_TIME)
-      now = datetime.datetime.now()
+      public_ips, private_ips, instance_ids = self.describe_instances(
+        parameters)
+      return (self.diff(public_ips, active_public_ips),
+        self.diff(private_ips, active_private_ips),
+        self.diff(instance_ids, active_instances))
+
+    _, (public_ips, private_ips, instance_ids) = self.poll(
+      describe_new_instances, self.MAX_VM_CREATION_TIME,
+      done=lambda new_instances: len(new_instances[0]) == count)
 
     if not public_ips:
       self.handle_failure('No public IPs were able to be procured '
@@ -842,6 +995,246 @@ class GCEAgent(BaseAgent):
     return instance_ids, public_ips, private_ips
 
 
+  def delete_instances_and_disks(self, gce_service, auth_http, parameters,
+    instance_names, disk_names):
+    """ Deletes the given instances, and then the given disks, waiting for
+    each to be gone. Disks go last, since GCE won't delete a disk that an
+    instance still uses. Anything that can't be deleted is only logged.
+
+    Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
+      auth_http: A HTTP connection that has been signed with the given user's
+        Credentials, and is authorized with the GCE scope.
+      parameters: A dict with keys for each parameter needed to connect to
+        Google Compute Engine.
+      instance_names: A list of the names of the instances to delete.
+      disk_names: A list of the names of the disks to delete.
+    """
+    project_id = parameters[self.PARAM_PROJECT]
+    zone = parameters[self.PARAM_ZONE]
+
+    requests = {}
+    for instance_name in instance_names:
+      requests[instance_name] = gce_service.instances().delete(
+        project=project_id, zone=zone, instance=instance_name)
+    failures = self.execute_operations(gce_service, auth_http, requests,
+      parameters)
+
+    requests = {}
+    for disk_name in disk_names:
+      requests[disk_name] = gce_service.disks().delete(project=project_id,
+        zone=zone, disk=disk_name)
+    failures.update(self.execute_operations(gce_service, auth_http, requests,
+      parameters))
+
+    for name in sorted(failures):
+      AppScaleLogger.warn("Could not delete {0}, so please delete it " \
+        "yourself: {1}".format(name, failures[name]))
+
+
+  def execute_request(self, request, auth_http):
+    """ Sends a single request to Google Compute Engine, counting it against
+    our API calls and retrying it if GCE throttles it.
+
+    Args:
+      request: The HttpRequest to send.
+      auth_http: A HTTP connection that has been signed with the given user's
+        Credentials, and is authorized with the GCE scope.
+    Returns:
+      A dict with GCE's response to the request.
+    """
+    return self.call_api(getattr(request, 'methodId', 'request'),
+      request.execute, http=auth_http)
+
+
+  def is_throttled(self, exception):
+    """ Decides if GCE refused an API call because we made too many. (Also see
+    documentation for the BaseAgent class)
+    """
+    if not isinstance(exception, errors.HttpError):
+      return False
+    if exception.resp.status == 429:
+      return True
+    return exception.resp.status == 403 and any(reason in exception.content
+      for reason in self.THROTTLING_REASONS)
+
+
+  def get_retry_after(self, exception):
+    """ Reads how long GCE asked us to wait before retrying a throttled call.
+    (Also see documentation for the BaseAgent class)
+    """
+    try:
+      return float(exception.resp.get('retry-after'))
+    except (TypeError, ValueError):
+      return None
+
+
+  def execute_batch(self, gce_service, auth_http, requests):
+    """ Sends the given requests to Google Compute Engine, grouping them into
+    as few HTTP round trips as possible. Requests that GCE throttles are sent
+    again, waiting exponentially longer each time.
+
+    Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
+      auth_http: A HTTP connection that has been signed with the given user's
+        Credentials, and is authorized with the GCE scope.
+      requests: A dict that maps a str ID to the HttpRequest to send for it.
+    Returns:
+      A tuple of two dicts. The first maps the ID of each request that
+      succeeded to its response, and the second maps the ID of each request
+      that failed to a str describing why.
+    """
+    responses = {}
+    failures = {}
+    throttled = []
+
+    def store_response(request_id, response, exception):
+      if exception is None:
+        responses[request_id] = response
+      else:
+        failures[request_id] = str(exception)
+        if self.is_throttled(exception):
+          throttled.append(request_id)
+
+    request_ids = sorted(requests.keys())
+    delay = self.THROTTLED_RETRY_DELAY
+    for retries_left in range(self.MAX_THROTTLED_RETRIES, -1, -1):
+      for start in range(0, len(request_ids), self.MAX_BATCH_SIZE):
+        batch = gce_service.new_batch_http_request(callback=store_response)
+        for request_id in request_ids[start:start + self.MAX_BATCH_SIZE]:
+          batch.add(requests[request_id], request_id=request_id)
+        self.call_api('batch', batch.execute, http=auth_http)
+
+      # GCE throttles each request in a batch on its own, so only the ones it
+      # refused are sent again.
+      stats = self.get_api_call_stats()
+      for request_id in throttled:
+        stats.record(getattr(requests[request_id], 'methodId', 'request'), 0,
+          throttled=True)
+      if not throttled or not retries_left:
+        break
+
+      request_ids = sorted(throttled)
+      del throttled[:]
+      for request_id in request_ids:
+        del failures[request_id]
+      time.sleep(delay)
+      delay = min(delay * self.POLL_BACKOFF_FACTOR, self.POLL_MAX_DELAY)
+
+    return responses, failures
+
+
+  def execute_operations(self, gce_service, auth_http, requests, parameters):
+    """ Sends the given requests to Google Compute Engine and waits for every
+    operation they start to finish.
+
+    Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
+      auth_http: A HTTP connection that has been signed with the given user's
+        Credentials, and is authorized with the GCE scope.
+      requests: A dict that maps a str ID to an HttpRequest that starts a GCE
+        operation.
+      parameters: A dict with keys for each parameter needed to connect to
+        Google Compute Engine.
+    Returns:
+      A dict that maps the ID of each request that failed, or whose operation
+      failed, to a str describing why.
+    """
+    if not requests:
+      return {}
+
+    operations, failures = self.execute_batch(gce_service, auth_http,
+      requests)
+    for request_id in sorted(operations):
+      AppScaleLogger.verbose(str(operations[request_id]),
+        parameters[self.PARAM_VERBOSE])
+
+    failures.update(self.wait_for_operations(gce_service, auth_http,
+      operations, parameters[self.PARAM_PROJECT]))
+    return failures
+
+
+  def wait_for_operations(self, gce_service, auth_http, operations,
+    project_id, stop_on_failure=False):
+    """ Waits for each of the given GCE operations to finish, checking on all
+    of the unfinished ones in a single batch request each time.
+
+    Zone and global operations can be waited on together.
+
+    Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
+      auth_http: A HTTP connection that has been signed with the given user's
+        Credentials, and is authorized with the GCE scope.
+      operations: A dict that maps a str ID to the operation we are waiting
+        on.
+      project_id: A str that identifies the GCE project that requests should
+        be billed to.
+      stop_on_failure: A bool that indicates if we should stop waiting as soon
+        as any operation fails, for callers that can't go on without all of
+        them.
+    Returns:
+      A dict that maps the ID of each operation that failed or did not finish
+      within MAX_VM_CREATION_TIME to a str describing why. When we stopped
+      waiting because of a failure, the operations still running are included
+      too.
+    """
+    failures = {}
+
+    def check_operations(pending):
+      requests = {}
+      for request_id, operation in pending.iteritems():
+        requests[request_id] = self.get_operation_request(gce_service,
+          operation, project_id)
+      responses, poll_failures = self.execute_batch(gce_service, auth_http,
+        requests)
+      failures.update(poll_failures)
+
+      finished = dict((request_id, None) for request_id in poll_failures)
+      for request_id, response in responses.iteritems():
+        if response['status'] == 'DONE':
+          finished[request_id] = response
+      return finished
+
+    def has_failed(finished):
+      return any(operation is None or 'error' in operation
+        for operation in finished.itervalues())
+
+    pending = {}
+    finished = {}
+    for request_id, operation in operations.iteritems():
+      if operation['status'] == 'DONE':
+        finished[request_id] = operation
+      else:
+        pending[request_id] = operation
+
+    stop = None
+    if stop_on_failure:
+      stop = has_failed
+
+    if pending and not (stop_on_failure and has_failed(finished)):
+      # The operations were just started, so don't check on them right away.
+      polled, pending = self.poll_all(pending, check_operations,
+        self.MAX_VM_CREATION_TIME, wait_first=True, stop=stop)
+      finished.update(polled)
+
+    for request_id, operation in finished.iteritems():
+      if operation and 'error' in operation:
+        failures[request_id] = self.get_operation_error(operation)
+
+    for request_id, operation in pending.iteritems():
+      if failures:
+        failures[request_id] = "Stopped waiting on operation {0} after " \
+          "another operation failed.".format(operation['name'])
+      else:
+        failures[request_id] = "Operation {0} did not finish within {1} " \
+          "seconds.".format(operation['name'], self.MAX_VM_CREATION_TIME)
+    return failures
+
+
   def associate_static_ip(self, parameters, instance_id, static_ip):
     """ Associates the given static IP address with the given instance ID.
 
@@ -882,8 +1275,10 @@ class GCEAgent(BaseAgent):
       networkInterface="nic0",
       zone=parameters[self.PARAM_ZONE]
     )
-    response = request.execute(http=auth_http)
+    response = self.execute_request(request, auth_http)
     AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
+    self.ensure_operation_succeeds(gce_service, auth_http, response,
+      parameters[self.PARAM_PROJECT])
 
 
   def add_access_config(self, parameters, instance_id, static_ip):
@@ -918,10 +1313,13 @@ class GCEAgent(BaseAgent):
         "natIP" : static_ip
       }
     )
-    response = request.execute(http=auth_http)
+    response = self.execute_request(request, auth_http)
     AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
+    self.ensure_operation_succeeds(gce_service, auth_http, response,
+      parameters[self.PARAM_PROJECT])
 
 
+  @reports_api_calls
   def terminate_instances(self, parameters):
     """ Deletes the instances specified in 'parameters' running in Google
     Compute Engine.
@@ -932,26 +1330,26 @@ class GCEAgent(BaseAgent):
         instance names that should be deleted.
     """
     instance_ids = parameters[self.PARAM_INSTANCE_IDS]
-    responses = []
+    gce_service, credentials = self.open_connection(parameters)
+    http = httplib2.Http()
+    auth_http = credentials.authorize(http)
+
+    requests = {}
     for instance_id in instance_ids:
-      gce_service, credentials = self.open_connection(parameters)
-      http = httplib2.Http()
-      auth_http = credentials.authorize(http)
-      request = gce_service.instances().delete(
+      requests[instance_id] = gce_service.instances().delete(
         project=parameters[self.PARAM_PROJECT],
         zone=parameters[self.PARAM_ZONE],
         instance=instance_id
       )
-      response = request.execute(http=auth_http)
-      AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
-      responses.append(response)
 
-    for response in responses:
-      gce_service, credentials = self.open_connection(parameters)
-      http = httplib2.Http()
-      auth_http = credentials.authorize(http)
-      self.ensure_operation_succeeds(gce_service, auth_http, response,
-        parameters[self.PARAM_PROJECT])
+    failures = self.execute_operations(gce_service, auth_http, requests,
+      parameters)
+    if failures:
+      for instance_id in sorted(failures):
+        AppScaleLogger.warn("Could not delete instance {0}: {1}".format(
+          instance_id, failures[instance_id]))
+      raise AgentRuntimeException("{0} of {1} instances could not be " \
+        "deleted.".format(len(failures), len(instance_ids)))
 
 
   def does_address_exist(self, parameters):
@@ -973,7 +1371,7 @@ class GCEAgent(BaseAgent):
       filter="address eq {0}".format(parameters[self.PARAM_STATIC_IP]),
       region=parameters[self.PARAM_REGION]
     )
-    response = request.execute(http=auth_http)
+    response = self.execute_request(request, auth_http)
     AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
 
     if 'items' in response:
@@ -999,7 +1397,7 @@ class GCEAgent(BaseAgent):
       auth_http = credentials.authorize(http)
       request = gce_service.images().get(project=parameters[self.PARAM_PROJECT],
         image=parameters[self.PARAM_IMAGE_ID])
-      response = request.execute(http=auth_http)
+      response = self.execute_request(request, auth_http)
       AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
       return True
     except errors.HttpError:
@@ -1023,7 +1421,7 @@ class GCEAgent(BaseAgent):
       auth_http = credentials.authorize(http)
       request = gce_service.zones().get(project=parameters[self.PARAM_PROJECT],
         zone=parameters[self.PARAM_ZONE])
-      response = request.execute(http=auth_http)
+      response = self.execute_request(request, auth_http)
       AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
       return True
     except errors.HttpError:
@@ -1048,13 +1446,53 @@ class GCEAgent(BaseAgent):
       auth_http = credentials.authorize(http)
       request = gce_service.disks().get(project=parameters[self.PARAM_PROJECT],
         disk=disk, zone=parameters[self.PARAM_ZONE])
-      response = request.execute(http=auth_http)
+      response = self.execute_request(request, auth_http)
       AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
       return True
     except errors.HttpError:
       return False
 
 
+  def create_image(self, instance_id, name, parameters):
+    """ Creates a new image from the boot disk of the named instance. GCE
+    copies the disk while the instance keeps running.
+
+    Args:
+      instance_id: A str naming the instance to create an image of.
+      name: A str naming the new image. GCE only allows lowercase letters,
+        digits, and dashes.
+      parameters: A dict with keys for each parameter needed to connect to
+        Google Compute Engine.
+    Returns:
+      A str naming the new image.
+    Raises:
+      AgentRuntimeException: If the image could not be created.
+    """
+    gce_service, credentials = self.open_connection(parameters)
+    http = httplib2.Http()
+    auth_http = credentials.authorize(http)
+    project_id = parameters[self.PARAM_PROJECT]
+
+    request = gce_service.instances().get(project=project_id,
+      zone=parameters[self.PARAM_ZONE], instance=instance_id)
+    instance = self.execute_request(request, auth_http)
+    boot_disks = [disk['source'] for disk in instance['disks']
+      if disk.get('boot')]
+    if not boot_disks:
+      raise AgentRuntimeException("Instance {0} has no boot disk to make an " \
+        "image from.".format(instance_id))
+
+    AppScaleLogger.log("Creating image {0} from instance {1}".format(name,
+      instance_id))
+    request = gce_service.images().insert(project=project_id,
+      body={'name' : name, 'sourceDisk' : boot_disks[0]}, forceCreate=True)
+    response = self.execute_request(request, auth_http)
+    AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
+    self.ensure_operation_succeeds(gce_service, auth_http, response,
+      project_id)
+    return name
+
+
   def detach_disk(self, parameters, disk_name, instance_id):
     """ Detaches the persistent disk specified in 'disk_name' from the named
     instance.
@@ -1075,7 +1513,7 @@ class GCEAgent(BaseAgent):
       zone=parameters[self.PARAM_ZONE],
       instance=instance_id,
       deviceName='sdb')
-    response = request.execute(http=auth_http)
+    response = self.execute_request(request, auth_http)
     AppScaleLogger.verbose(str(response), parameters[self.PARAM_VERBOSE])
     self.ensure_operation_succeeds(gce_service, auth_http, response,
       parameters[self.PARAM_PROJECT])
@@ -1115,6 +1553,9 @@ class GCEAgent(BaseAgent):
   def open_connection(self, parameters):
     """ Connects to Google Compute Engine with the given credentials.
 
+    The connection is built once per process for each set of credentials, and
+    its access token is only refreshed once it expires.
+
     Args:
       parameters: A dict that contains all the parameters necessary to
         authenticate this user with Google Compute Engine. We assume that the
@@ -1126,22 +1567,55 @@ class GCEAgent(BaseAgent):
     Raises:
       AppScaleException if the user wants to abort.
     """
-    # Perform OAuth 2.0 authorization.
-    flow = None
+    secrets_location = None
     if self.PARAM_SECRETS in parameters:
       secrets_location = os.path.expanduser(parameters[self.PARAM_SECRETS])
+    storage_location = LocalState.get_oauth2_storage_location(
+      parameters[self.PARAM_KEYNAME])
+
+    gce_service, credentials = self.get_cached_client(
+      (secrets_location, storage_location, self.API_VERSION),
+      lambda: self.build_connection(secrets_location, storage_location))
+
+    # Authorized requests only refresh the token after GCE rejects it, so
+    # refresh expired tokens here instead of wasting a request.
+    if credentials.access_token and credentials.access_token_expired:
+      credentials.refresh(httplib2.Http())
+
+    return gce_service, credentials
+
+
+  def build_connection(self, secrets_location, storage_location):
+    """ Authorizes this user with Google Compute Engine, and builds a
+    connection to it from the cached API description when possible.
+
+    Args:
+      secrets_location: A str naming the JSON credentials file downloaded from
+        GCP, or None to use the credentials kept in storage_location.
+      storage_location: A str naming where OAuth 2.0 credentials are kept.
+    Returns:
+      An apiclient.discovery.Resource that is a connection valid for requests
+      to Google Compute Engine for the given user, and a Credentials object that
+      can be used to sign requests performed with that connection.
+    """
+    discovery_cache = DiscoveryDocumentCache(
+      LocalState.get_gce_discovery_cache_location())
+
+    # Perform OAuth 2.0 authorization.
+    flow = None
+    if secrets_location:
       secrets_type = GCEAgent.get_secrets_type(secrets_location)
       if secrets_type == CredentialTypes.SERVICE:
         scopes = [GCPScopes.COMPUTE]
         credentials = ServiceAccountCredentials\
           .from_json_keyfile_name(secrets_location, scopes=scopes)
-        return discovery.build('compute', self.API_VERSION), credentials
+        return discovery.build('compute', self.API_VERSION,
+          cache=discovery_cache), credentials
       else:
         flow = oauth2client.client.flow_from_clientsecrets(secrets_location,
           scope=self.GCE_SCOPE)
 
-    storage = oauth2client.file.Storage(LocalState.get_oauth2_storage_location(
-      parameters[self.PARAM_KEYNAME]))
+    storage = oauth2client.file.Storage(storage_location)
     credentials = storage.get()
 
     if credentials is None or credentials.invalid:
@@ -1149,7 +1623,8 @@ class GCEAgent(BaseAgent):
       credentials = oauth2client.tools.run_flow(flow, storage, flags)
 
     # Build the service
-    return discovery.build('compute', self.API_VERSION), credentials
+    return discovery.build('compute', self.API_VERSION,
+      cache=discovery_cache), credentials
 
 
   def ensure_operation_succeeds(self, gce_service, auth_http, response,
@@ -1174,27 +1649,50 @@ class GCEAgent(BaseAgent):
         succeeded, referenced by a unique ID (the 'name' field).
       project_id: A str that identifies the GCE project that requests should
         be billed to.
+    Raises:
+      AgentRuntimeException: If the operation failed or did not finish within
+        MAX_VM_CREATION_TIME.
     """
-    status = response['status']
-    while status != 'DONE' and response:
-      operation_id = response['name']
-
-      # Identify if this is a per-zone resource
-      if 'zone' in response:
-        zone_name = response['zone'].split('/')[-1]
-        request = gce_service.zoneOperations().get(
-            project=project_id,
-            operation=operation_id,
-            zone=zone_name)
-      else:
-        request = gce_service.globalOperations().get(
-             project=project_id, operation=operation_id)
+    failures = self.wait_for_operations(gce_service, auth_http,
+      {response['name'] : response}, project_id)
+    if failures:
+      raise AgentRuntimeException(failures[response['name']])
+
+
+  def get_operation_request(self, gce_service, operation, project_id):
+    """ Constructs a request that checks on the status of a GCE operation.
+
+    Args:
+      gce_service: An apiclient.discovery.Resource that is a connection valid
+        for requests to Google Compute Engine for the given user.
+      operation: A dict that contains the operation to check on, referenced by
+        a unique ID (the 'name' field).
+      project_id: A str that identifies the GCE project that requests should
+        be billed to.
+    Returns:
+      An HttpRequest that fetches the latest state of the operation.
+    """
+    operation_id = operation['name']
+
+    # Identify if this is a per-zone resource
+    if 'zone' in operation:
+      zone_name = operation['zone'].split('/')[-1]
+      return gce_service.zoneOperations().get(
+          project=project_id,
+          operation=operation_id,
+          zone=zone_name)
+    else:
+      return gce_service.globalOperations().get(
+           project=project_id, operation=operation_id)
 
-      response = request.execute(http=auth_http)
-      if response:
-        status = response['status']
 
-        if 'error' in response:
-          message = "\n".join([errors['message'] for errors in
-            response['error']['errors']])
-          raise AgentRuntimeException(str(message))
+  def get_operation_error(self, operation):
+    """ Collects the error messages from a failed GCE operation.
+
+    Args:
+      operation: A dict that contains a finished operation with an 'error'.
+    Returns:
+      A str with each of the operation's error messages on its own line.
+    """
+    return str("\n".join([error['message'] for error in
+      operation['error']['errors']]))
@@ -1,7 +1,7 @@
 """ The Openstack Agent. """
 import boto
-import time
 
+from api_accounting import MeteredClient
 from ec2_agent import EC2Agent
 from urlparse import urlparse
 
@@ -88,15 +88,17 @@ class OpenStackAgent(EC2Agent):
 
     region = boto.ec2.regioninfo.RegionInfo(name=region_str,
       endpoint=result.hostname)
-    return boto.connect_ec2(aws_access_key_id=access_key,
+    return self.get_cached_client((ec2_url, access_key, secret_key),
+      lambda: MeteredClient(self, boto.connect_ec2(
+      aws_access_key_id=access_key,
       aws_secret_access_key=secret_key,
       is_secure=(result.scheme == 'https'),
       region=region,
       port=result.port,
-      path=result.path, debug=2)
+      path=result.path, debug=2)))
 
   def wait_for_status_change(self, parameters, conn, state_requested, 
-    max_wait_time=60, poll_interval=10):
+    max_wait_time=60):
     """ 
     After we have sent a signal to the cloud infrastructure to change the state
     of the instances (unsually from runnning to either stoppped or 
@@ -108,26 +110,24 @@ class OpenStackAgent(EC2Agent):
     state_requrested: String of the requested final state of the instances.
     max_wait_time: int of maximum amount of time (in seconds)  to wait for the
       state change.
-    poll_interval: int of the number of seconds to wait between checking of
-      the state.
 
     Returns:
       If all the instances change successfully, return True, if not return False.
     """
-    time_start = time.time()
     instance_ids = parameters[self.PARAM_INSTANCE_IDS]
-    instances_in_state = {}
-    while True:
-      time.sleep(poll_interval)
+    instances_in_state = set()
+
+    def count_instances_in_state():
       reservations = conn.get_all_instances(instance_ids)
-      instances = [i for r in reservations for i in r.instances]
-      for i in instances:
-        if i.state == state_requested and \
-         i.key_name.startswith(parameters[self.PARAM_KEYNAME]):
-          if i.id not in instances_in_state.keys():
-            instances_in_state[i.id] = 1 # mark instance done
-    if len(instances_in_state.keys()) >= len(instance_ids):
-      return True
-    if time.time() - time_start > max_wait_time:
-      return False
+      for reservation in reservations:
+        for instance in reservation.instances:
+          if instance.state == state_requested and \
+           instance.key_name.startswith(parameters[self.PARAM_KEYNAME]):
+            instances_in_state.add(instance.id)
+      return len(instances_in_state)
+
+    changed, _ = self.poll(count_instances_in_state, max_wait_time,
+      done=lambda num_changed: num_changed >= len(instance_ids),
+      wait_first=True)
+    return changed
 
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import posixpath
+import tarfile
+import zipfile
+
+
+# AppScale-specific imports
+from appengine_helper import AppEngineHelper
+from custom_exceptions import AppEngineConfigException
+from ignore_rules import IgnoreRules
+
+
+class AppArchive():
+  """AppArchive reads an App Engine application that was packaged as a .tar.gz
+  or .zip file, without extracting it to the local filesystem.
+
+  It finds the application the same way LocalState.extract_app_to_dir does:
+  if everything in the archive (besides hidden entries) is in one directory,
+  the application is in that directory, and otherwise it is at the top of the
+  archive.
+  """
+
+
+  def __init__(self, location, names, reader, regular_files, dirs=()):
+    """Creates a new AppArchive. Use AppArchive.open instead.
+
+    Args:
+      location: A str naming the archive on the local filesystem.
+      names: A list of strs naming every entry in the archive.
+      reader: A function that takes an entry's name and returns its contents.
+      regular_files: A bool that indicates if the archive only holds regular
+        files and directories, with relative paths that stay inside it.
+      dirs: A list of strs naming the entries that are directories.
+    """
+    self.location = location
+    self.names = names
+    self.reader = reader
+    self.regular_files = regular_files
+    self.dirs = set(dirs)
+    self.root = self.find_root()
+
+
+  @classmethod
+  def open(cls, location):
+    """Reads the list of entries in the given archive.
+
+    Args:
+      location: A str naming the .tar.gz or .zip file on the local filesystem.
+    Returns:
+      An AppArchive, or None if the file isn't an archive we can read.
+    """
+    try:
+      if zipfile.is_zipfile(location):
+        archive = zipfile.ZipFile(location)
+        names = [cls.normalize(name) for name in archive.namelist()]
+        return cls(location, names, archive.read, False)
+
+      archive = tarfile.open(location, 'r:gz')
+      members = archive.getmembers()
+    except (IOError, tarfile.TarError, zipfile.BadZipfile):
+      return None
+
+    regular_files = all((member.isfile() or member.isdir()) and
+      not posixpath.isabs(member.name) and
+      '..' not in member.name.split('/') for member in members)
+    names = [cls.normalize(member.name) for member in members]
+    by_name = dict(zip(names, members))
+    dirs = [name for name, member in by_name.iteritems() if member.isdir()]
+    return cls(location, names,
+      lambda name: archive.extractfile(by_name[name]).read(), regular_files,
+      dirs)
+
+
+  @classmethod
+  def normalize(cls, name):
+    """Returns the given entry's name without a leading './' or trailing '/'.
+    """
+    name = name.rstrip('/')
+    while name.startswith('./'):
+      name = name[2:]
+    return name
+
+
+  def find_root(self):
+    """Finds where the application is within this archive.
+
+    Returns:
+      A str with the prefix of every entry in the application's directory,
+      which is empty if the application is at the top of the archive.
+    """
+    top_level = set(name.split('/')[0] for name in self.names
+      if name and not name.startswith('.'))
+    if len(top_level) != 1:
+      return ''
+
+    directory = top_level.pop()
+    if any(name.startswith(directory + '/') for name in self.names):
+      return directory + '/'
+    return ''
+
+
+  def get_config_file(self):
+    """Finds the application's app.yaml or appengine-web.xml file.
+
+    Returns:
+      A str naming the configuration file's entry in this archive.
+    Raises:
+      AppEngineConfigException: If there is no configuration file for this
+        application.
+    """
+    app_yaml = self.root + 'app.yaml'
+    if app_yaml in self.names:
+      return app_yaml
+
+    for name in sorted(self.names):
+      if name.startswith(self.root) and \
+        posixpath.basename(name) == AppEngineHelper.APPENGINE_WEB_XML:
+        return name
+
+    raise AppEngineConfigException("Couldn't find an app.yaml or " +
+      "appengine-web.xml file in {0}".format(self.location))
+
+
+  def get_app_id(self):
+    """Returns a str with the application ID set in the configuration file.
+    (Also see AppEngineHelper.get_app_id_from_config_contents)
+    """
+    config_file = self.get_config_file()
+    return AppEngineHelper.get_app_id_from_config_contents(config_file,
+      self.reader(config_file))
+
+
+  def get_app_runtime(self):
+    """Returns a str with the runtime set in the configuration file. (Also see
+    AppEngineHelper.get_app_runtime_from_config_contents)
+    """
+    config_file = self.get_config_file()
+    if not AppEngineHelper.FILE_IS_YAML.search(config_file):
+      return 'java'
+    return AppEngineHelper.get_app_runtime_from_config_contents(config_file,
+      self.reader(config_file))
+
+
+  def is_sdk_mismatch(self):
+    """Returns if the application doesn't have the App Engine SDK jar that
+    AppScale supports in one of its lib directories. (Also see
+    AppEngineHelper.is_sdk_mismatch)
+    """
+    target_jar = AppEngineHelper.JAVA_SDK_JAR_PREFIX + '-' + \
+      AppEngineHelper.SUPPORTED_SDK_VERSION + '.jar'
+    for name in self.names:
+      directory, file_name = posixpath.split(name)
+      if posixpath.basename(directory) == AppEngineHelper.LIB and \
+        target_jar in file_name:
+        return False
+    return True
+
+
+  def get_ignore_rules(self):
+    """Returns the IgnoreRules for the application in this archive, read from
+    its app.yaml and .appscaleignore files."""
+    contents = []
+    for name in ('app.yaml', IgnoreRules.IGNORE_FILE):
+      if self.root + name in self.names:
+        contents.append(self.reader(self.root + name))
+      else:
+        contents.append(None)
+    return IgnoreRules.from_contents(*contents)
+
+
+  def can_send_as_is(self):
+    """Decides if this archive is already in the form that the AppController
+    expects uploaded applications to be in: a gzipped tarball with the
+    application at its top, holding only regular files and nothing that the
+    application's IgnoreRules leave out.
+
+    Returns:
+      True if the archive can be sent to the login node as is, and False if
+      it has to be extracted and packed again.
+    """
+    if not self.regular_files or self.root:
+      return False
+    rules = self.get_ignore_rules()
+    return not any(rules.is_ignored(name, name in self.dirs)
+      for name in self.names if name)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+from distutils.spawn import find_executable
+import os
+import zlib
+
+
+# AppScale-specific imports
+from custom_exceptions import BadConfigurationException
+from ignore_rules import IgnoreRules
+
+
+class AppCompression():
+  """AppCompression decides how an application's archive is compressed on its
+  way to the login node.
+
+  The AppController only accepts gzipped tarballs, so the login node turns
+  whatever arrives back into one. Archives compressed with gzip or pigz
+  (parallel gzip) are written as is. zstd archives are decompressed there, and
+  uncompressed ones are gzipped, at a fast level in both cases. Those two
+  spend some of the login node's CPU to save this machine's CPU, or to send
+  fewer bytes over the network.
+  """
+
+
+  # The name of the compression that is chosen from a sample of the
+  # application's contents.
+  AUTO = 'auto'
+
+
+  # The level each codec compresses at when none is given, and the levels it
+  # accepts. 'none' doesn't take a level.
+  DEFAULT_LEVELS = {'gzip' : 6, 'pigz' : 6, 'zstd' : 3, 'none' : None}
+  LEVELS = {'gzip' : (1, 9), 'pigz' : (1, 9), 'zstd' : (1, 19)}
+
+
+  # The level that the login node gzips archives at when they arrive with
+  # another codec.
+  REMOTE_GZIP_LEVEL = 1
+
+
+  # The most files, and the most bytes from each one, that we compress to
+  # estimate how well an application compresses.
+  SAMPLE_FILES = 100
+  SAMPLE_BYTES = 64 * 1024
+
+
+  # Applications that a sample suggests won't get smaller than this fraction
+  # of their size (e.g., ones that are mostly jars or images) are sent
+  # uncompressed.
+  INCOMPRESSIBLE_RATIO = 0.9
+
+
+  def __init__(self, codec, level=None):
+    """Creates a new AppCompression.
+
+    Args:
+      codec: A str naming the codec: 'gzip', 'pigz', 'zstd' or 'none'.
+      level: An int with the level to compress at, or None to use the codec's
+        default.
+    """
+    self.codec = codec
+    self.level = level if level is not None else self.DEFAULT_LEVELS[codec]
+
+
+  def __str__(self):
+    if self.level is None:
+      return self.codec
+    return "{0}:{1}".format(self.codec, self.level)
+
+
+  @classmethod
+  def parse(cls, spec):
+    """Reads a compression given by the user.
+
+    Args:
+      spec: A str with a codec's name, optionally followed by a colon and the
+        level to compress at (e.g., 'zstd:19').
+    Returns:
+      An AppCompression.
+    Raises:
+      BadConfigurationException: If the codec or level is not valid.
+    """
+    codec, _, level = spec.partition(':')
+    if codec not in cls.DEFAULT_LEVELS:
+      raise BadConfigurationException("Compression must be one of {0}, not " \
+        "{1}.".format(", ".join([cls.AUTO] + sorted(cls.DEFAULT_LEVELS)),
+        codec))
+    if not level:
+      return cls(codec)
+
+    if codec not in cls.LEVELS or not level.isdigit() or \
+      not cls.LEVELS[codec][0] <= int(level) <= cls.LEVELS[codec][1]:
+      raise BadConfigurationException("{0} is not a valid level for {1} " \
+        "compression.".format(level, codec))
+    return cls(codec, int(level))
+
+
+  @classmethod
+  def choose(cls, app_location, spec=AUTO, files=None):
+    """Decides how to compress the given application.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+      spec: A str naming the compression to use, as accepted by parse, or AUTO
+        to choose from a sample of the application's contents.
+      files: A list of the paths, relative to the application, of the files
+        that will be sent, or None to find them from its ignore rules.
+    Returns:
+      An AppCompression.
+    Raises:
+      BadConfigurationException: If the compression is not valid, or its
+        program isn't installed on this machine.
+    """
+    if spec == cls.AUTO:
+      if cls.estimate_ratio(app_location, files) >= cls.INCOMPRESSIBLE_RATIO:
+        return cls('none')
+      if find_executable('pigz'):
+        return cls('pigz')
+      return cls('gzip')
+
+    compression = cls.parse(spec)
+    if compression.codec != 'none' and not find_executable(compression.codec):
+      raise BadConfigurationException("{0} compression needs {0} to be " \
+        "installed.".format(compression.codec))
+    return compression
+
+
+  @classmethod
+  def estimate_ratio(cls, app_location, files=None):
+    """Estimates how much gzip shrinks the given application, by compressing
+    the start of files spread across the part of it that will be sent.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+      files: A list of the paths, relative to the application, of the files
+        that will be sent, or None to find them from its ignore rules.
+    Returns:
+      A float with the estimated compressed size as a fraction of the
+      original, weighted by the size of each file sampled.
+    """
+    if files is None:
+      files, _ = IgnoreRules.from_app(app_location).find_files(app_location)
+    paths = [os.path.join(app_location, path) for path in files]
+    step = max(len(paths) / cls.SAMPLE_FILES, 1)
+
+    total_size = 0
+    compressed_size = 0.0
+    for path in paths[::step]:
+      try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file_handle:
+          sample = file_handle.read(cls.SAMPLE_BYTES)
+      except (IOError, OSError):
+        continue
+      if not sample:
+        continue
+      ratio = len(zlib.compress(sample, 1)) / float(len(sample))
+      total_size += size
+      compressed_size += size * ratio
+
+    if not total_size:
+      return 0.0
+    return compressed_size / total_size
+
+
+  def get_tar_flags(self):
+    """Returns a str with the flags that make tar write an archive compressed
+    with this codec to stdout."""
+    if self.codec == 'none':
+      return "-chf -"
+    if self.codec == 'gzip' and self.level == self.DEFAULT_LEVELS['gzip']:
+      return "-czhf -"
+    if self.codec == 'zstd':
+      program = "zstd -{0} -T0".format(self.level)
+    else:
+      program = "{0} -{1}".format(self.codec, self.level)
+    return "-chf - --use-compress-program='{0}'".format(program)
+
+
+  def get_remote_filter(self):
+    """Returns a str with the command that the login node pipes an archive
+    compressed with this codec through to gzip it, or None if it already is.
+    """
+    if self.codec == 'zstd':
+      return "zstd -dc | gzip -{0}".format(self.REMOTE_GZIP_LEVEL)
+    if self.codec == 'none':
+      return "gzip -{0}".format(self.REMOTE_GZIP_LEVEL)
+    return None
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import hashlib
+import json
+import os
+
+
+# AppScale-specific imports
+from ignore_rules import IgnoreRules
+
+
+class AppManifest():
+  """AppManifest records the contents of every file in an App Engine
+  application, so that we can tell which files changed since the last time
+  the application was uploaded and only send those.
+
+  Files are identified by their path relative to the application's directory
+  and a hash of their contents. Only the files that a full upload would tar
+  up are included: the ones that the application's IgnoreRules leave out are
+  skipped, and symlinks are followed.
+  """
+
+
+  # The name of the file that the manifest is stored in.
+  FILE_NAME = "manifest.json"
+
+
+  # The number of bytes that we read from a file at a time while hashing it.
+  HASH_CHUNK_SIZE = 1024 * 1024
+
+
+  def __init__(self, files=None):
+    """Creates a new AppManifest.
+
+    Args:
+      files: A dict that maps the relative path of each file in the
+        application to a dict with its 'hash' and 'size'.
+    """
+    self.files = files or {}
+
+
+  @classmethod
+  def from_directory(cls, app_location):
+    """Builds a manifest of the application in the given directory.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+    Returns:
+      An AppManifest describing every file in the application.
+    """
+    files = {}
+    included, _ = IgnoreRules.from_app(app_location).find_files(app_location)
+    for relative_path in included:
+      full_path = os.path.join(app_location, relative_path)
+      files[relative_path] = {
+        'hash' : cls.hash_file(full_path),
+        'size' : os.path.getsize(full_path)
+      }
+    return cls(files)
+
+
+  @classmethod
+  def from_json(cls, contents):
+    """Reads a manifest that was written with to_json.
+
+    Args:
+      contents: A str with the manifest's JSON, which may be empty if no
+        manifest was found.
+    Returns:
+      An AppManifest. It has no files if contents was not a valid manifest.
+    """
+    try:
+      return cls(json.loads(contents).get('files', {}))
+    except (ValueError, AttributeError):
+      return cls()
+
+
+  @classmethod
+  def hash_file(cls, path):
+    """Hashes the contents of the given file.
+
+    Args:
+      path: A str naming the file on the local filesystem.
+    Returns:
+      A str with the SHA-1 hex digest of the file's contents.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file_handle:
+      for chunk in iter(lambda: file_handle.read(cls.HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+  def to_json(self):
+    """Returns a str with this manifest's JSON."""
+    return json.dumps({'files' : self.files}, sort_keys=True)
+
+
+  def diff(self, previous):
+    """Finds the files that changed since the given manifest was taken.
+
+    Args:
+      previous: The AppManifest of the last version of the application.
+    Returns:
+      A tuple of two lists of strs, both sorted. The first names the files
+      that were added or changed, and the second names the files that were
+      removed.
+    """
+    changed = [path for path, info in self.files.iteritems()
+      if previous.files.get(path, {}).get('hash') != info['hash']]
+    removed = [path for path in previous.files if path not in self.files]
+    return sorted(changed), sorted(removed)
+
+
+  def get_size(self, paths=None):
+    """Adds up the size of the given files.
+
+    Args:
+      paths: A list of strs naming files in this manifest, or None to add up
+        every file.
+    Returns:
+      An int with the total number of bytes in the files.
+    """
+    if paths is None:
+      paths = self.files.keys()
+    return sum(self.files[path]['size'] for path in paths)
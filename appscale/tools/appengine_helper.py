@@ -170,16 +170,33 @@ class AppEngineHelper(object):
         application.
     """
     app_config_file = cls.get_config_file_from_dir(app_dir)
+    return cls.get_app_id_from_config_contents(app_config_file,
+      cls.read_file(app_config_file))
+
+
+  @classmethod
+  def get_app_id_from_config_contents(cls, app_config_file, contents):
+    """Finds the application ID set in an App Engine app's configuration file.
+
+    Args:
+      app_config_file: A str naming the configuration file, which tells us
+        if it is an app.yaml or appengine-web.xml file.
+      contents: A str with the contents of the configuration file.
+    Returns:
+      A str indicating the application ID for this application.
+    Raises:
+      AppEngineConfigException: If there is no application ID set for this
+        application.
+    """
     if cls.FILE_IS_YAML.search(app_config_file):
-      yaml_contents = yaml.safe_load(cls.read_file(app_config_file))
+      yaml_contents = yaml.safe_load(contents)
       if 'application' in yaml_contents and yaml_contents['application'] != '':
         return yaml_contents['application']
       else:
         raise AppEngineConfigException("No valid application ID found in " +
           "your app.yaml. " + cls.REGEX_MESSAGE)
     else:
-      xml_contents = cls.read_file(app_config_file)
-      app_id_matchdata = cls.JAVA_APP_ID_REGEX.search(xml_contents)
+      app_id_matchdata = cls.JAVA_APP_ID_REGEX.search(contents)
       if app_id_matchdata:
         return app_id_matchdata.group(1)
       else:
@@ -204,8 +221,29 @@ class AppEngineHelper(object):
       AppEngineConfigException: If there is no runtime set for this application.
     """
     app_config_file = cls.get_config_file_from_dir(app_dir)
+    if not cls.FILE_IS_YAML.search(app_config_file):
+      return 'java'
+    return cls.get_app_runtime_from_config_contents(app_config_file,
+      cls.read_file(app_config_file))
+
+
+  @classmethod
+  def get_app_runtime_from_config_contents(cls, app_config_file, contents):
+    """Finds the language runtime set in an App Engine app's configuration
+    file.
+
+    Args:
+      app_config_file: A str naming the configuration file, which tells us
+        if it is an app.yaml or appengine-web.xml file.
+      contents: A str with the contents of the configuration file. It isn't
+        read for appengine-web.xml files, since those are always Java apps.
+    Returns:
+      A str indicating which runtime should be used to run this application.
+    Raises:
+      AppEngineConfigException: If there is no runtime set for this application.
+    """
     if cls.FILE_IS_YAML.search(app_config_file):
-      yaml_contents = yaml.safe_load(cls.read_file(app_config_file))
+      yaml_contents = yaml.safe_load(contents)
       if 'runtime' in yaml_contents and yaml_contents['runtime'] in \
         cls.ALLOWED_RUNTIMES:
         return yaml_contents['runtime']
@@ -5,6 +5,7 @@
 import base64
 import json
 import os
+import re
 import shutil
 import subprocess
 import sys
@@ -73,15 +74,25 @@ class AppScale():
   USAGE = """Usage: appscale command [<args>]
 
 Available commands:
+  bake [#]                          Makes a machine image from the #th node
+                                    of the current cloud deployment (default
+                                    is the first node without data), and
+                                    sets it as the AppScalefile's machine so
+                                    that later deployments start from it.
   deploy <app>                      Deploys a Google App Engine app to AppScale:
                                     <app> can be the top level directory with the
                                     code or a tar.gz of the source tree.
+                                    Several apps can be given to upload them
+                                    together.
   down [--clean][--terminate]       Gracefully terminates the currently
-                                    running AppScale deployments. If
+       [--drain-pool]               running AppScale deployments. If
                                     instances were created, they will NOT
                                     be terminated, unless --terminate is
                                     specified. If --clean option is
                                     specified, ALL DATA WILL BE DELETED.
+                                    --drain-pool also terminates the
+                                    stopped instances kept for the next
+                                    'up'.
   get <regex>                       Gets all AppController properties matching
                                     the provided regex: for developers only.
   help                              Displays this message.
@@ -97,6 +108,10 @@ Available commands:
   relocate <appid> <http> <https>   Moves the application <appid> to
                                     different <http> and <https> ports.
   remove                            An alias for 'undeploy'.
+  reshape                           Changes the placement strategy of the
+                                    running deployment to match the
+                                    AppScalefile, only adding the nodes and
+                                    roles that are new.
   set <property> <value>            Sets an AppController <property> to the
                                     provided <value>. For developers only.
   ssh [#]                           Logs into the #th node of the current AppScale
@@ -147,6 +162,30 @@ Available commands:
         "again.")
 
 
+  def update_appscalefile(self, option, value):
+    """ Sets the given option in the AppScalefile found in the current working
+    directory, leaving the rest of the file (including its comments) as it
+    is.
+
+    Args:
+      option: A str naming the option to set.
+      value: A str with the option's new value.
+    Raises:
+      AppScalefileException: If there is no AppScalefile in the current working
+        directory.
+    """
+    contents = self.read_appscalefile()
+    line = "{0} : '{1}'".format(option, value)
+    pattern = re.compile(r'^{0}\s*:.*$'.format(re.escape(option)), re.MULTILINE)
+    if pattern.search(contents):
+      contents = pattern.sub(lambda _: line, contents, count=1)
+    else:
+      contents = contents.rstrip('\n') + '\n' + line + '\n'
+
+    with open(self.get_appscalefile_location(), 'w') as file_handle:
+      file_handle.write(contents)
+
+
   def get_locations_json_file(self, keyname):
     """ Returns the location where the AppScale tools writes JSON data
     about where each virtual machine is located in the currently running
@@ -282,6 +321,9 @@ Available commands:
         elif key == "disks":
           command.append("--disks")
           command.append(base64.b64encode(yaml.dump(value)))
+        elif key == "capacities":
+          command.append("--capacities")
+          command.append(base64.b64encode(yaml.dump(value)))
         elif key == "user_commands":
           command.append("--user_commands")
           command.append(base64.b64encode(yaml.dump(value)))
@@ -292,6 +334,13 @@ Available commands:
     run_instances_opts = ParseArgs(command, "appscale-run-instances").args
 
     if 'infrastructure' not in contents_as_yaml:
+      # Clusters that only give their nodes' capacities still need a placement
+      # strategy to know which machines get the keypair.
+      if 'ips_layout' not in contents_as_yaml and \
+        'capacities' in contents_as_yaml:
+        contents_as_yaml['ips_layout'] = NodeLayout(
+          run_instances_opts).input_yaml
+
       # Generate a new keypair if necessary.
       if not self.valid_ssh_key(contents_as_yaml, run_instances_opts):
         add_keypair_command = []
@@ -338,7 +387,7 @@ Available commands:
     all_ips = LocalState.get_all_public_ips(keyname)
 
     # If a login node is defined, use that to communicate with other nodes.
-    node_layout = NodeLayout(run_instances_opts)
+    node_layout = NodeLayout.from_options(run_instances_opts)
     head_node = node_layout.head_node()
     if head_node is not None:
       remote_key = '{}/ssh.key'.format(RemoteHelper.CONFIG_DIR)
@@ -455,7 +504,7 @@ Available commands:
     AppScaleTools.describe_instances(options)
 
 
-  def deploy(self, app):
+  def deploy(self, app, *more_apps):
     """ 'deploy' is a more accessible way to tell an AppScale deployment to run a
     Google App Engine application than 'appscale-upload-app'. It calls that
     command with the configuration options found in the AppScalefile in the
@@ -464,9 +513,13 @@ Available commands:
     Args:
       app: The path (absolute or relative) to the Google App Engine application
         that should be uploaded.
+      more_apps: The paths to other applications that should be uploaded
+        along with the first one.
     Returns:
       A tuple containing the host and port where the application is serving
-        traffic from.
+        traffic from. If more than one application was given, a dict that maps
+        each path to that tuple, or to the exception that kept its
+        application from being uploaded.
     Raises:
       AppScalefileException: If there is no AppScalefile in the current working
       directory.
@@ -486,12 +539,26 @@ Available commands:
     if 'verbose' in contents_as_yaml and contents_as_yaml['verbose'] == True:
       command.append("--verbose")
 
-    command.append("--file")
-    command.append(app)
+    if contents_as_yaml.get('incremental_upload') == True:
+      command.append("--incremental")
+
+    if 'compression' in contents_as_yaml:
+      command.append("--compression")
+      command.append(str(contents_as_yaml['compression']))
+
+    if more_apps:
+      command.append("--files")
+      command.append(app)
+      command.extend(more_apps)
+    else:
+      command.append("--file")
+      command.append(app)
 
     # Finally, exec the command. Don't worry about validating it -
     # appscale-upload-app will do that for us.
     options = ParseArgs(command, "appscale-upload-app").args
+    if more_apps:
+      return AppScaleTools.upload_apps(options)
     return AppScaleTools.upload_app(options)
 
 
@@ -715,7 +782,7 @@ Available commands:
     AppScaleTools.relocate_app(options)
 
 
-  def down(self, clean=False, terminate=False):
+  def down(self, clean=False, terminate=False, drain_pool=False):
     """ 'down' provides a nicer experience for users than the
     appscale-terminate-instances command, by using the configuration options
     present in the AppScalefile found in the current working directory.
@@ -725,6 +792,8 @@ Available commands:
         needs to be clean. This will clear the datastore.
       terminate: A boolean to indicate if instances needs to be terminated
         (valid only if we spawn instances at start).
+      drain_pool: A boolean to indicate if the stopped instances kept for the
+        next start should be terminated too (valid only with terminate).
 
     Raises:
       AppScalefileException: If there is no AppScalefile in the current working
@@ -773,6 +842,18 @@ Available commands:
         LocalState.confirm_or_abort("Terminate will delete instances and the data on them.")
       command.append("--terminate")
 
+      # Stopped instances are kept for the next 'appscale up' with this
+      # keyname, if the AppScalefile asks for it and they aren't being drained.
+      if drain_pool:
+        command.append("--drain_pool")
+      elif 'warm_pool_size' in contents_as_yaml:
+        command.append("--warm_pool_size")
+        command.append(str(contents_as_yaml['warm_pool_size']))
+
+      if 'warm_pool_expiry' in contents_as_yaml:
+        command.append("--warm_pool_expiry")
+        command.append(str(contents_as_yaml['warm_pool_expiry']))
+
     if 'test' in contents_as_yaml and contents_as_yaml['test'] == True:
       command.append("--test")
 
@@ -820,6 +901,98 @@ Available commands:
       'Registration complete for AppScale deployment {0}.'
       .format(deployment['name']))
 
+  def reshape(self):
+    """ 'reshape' applies the ips_layout from the AppScalefile to the running
+    AppScale deployment, adding only the machines and roles that are new.
+
+    Raises:
+      AppScalefileException: If there is no AppScalefile in the current working
+        directory.
+      BadConfigurationException: If the AppScalefile has no ips_layout.
+    """
+    contents_as_yaml = yaml.safe_load(self.read_appscalefile())
+    if 'ips_layout' not in contents_as_yaml:
+      raise BadConfigurationException("Your AppScalefile needs an ips_layout " +
+        "to reshape the deployment.")
+
+    # Construct the appscale-update-layout command from the contents of the
+    # AppScalefile.
+    command = []
+    if 'keyname' in contents_as_yaml:
+      command.append("--keyname")
+      command.append(contents_as_yaml['keyname'])
+
+    if 'verbose' in contents_as_yaml and contents_as_yaml['verbose'] == True:
+      command.append("--verbose")
+
+    if 'test' in contents_as_yaml and contents_as_yaml['test'] == True:
+      command.append('--test')
+
+    command.append('--ips_layout')
+    command.append(base64.b64encode(yaml.dump(contents_as_yaml['ips_layout'])))
+
+    # The rest of the deployment's layout stays as 'appscale up' set it.
+    if 'disks' in contents_as_yaml:
+      command.append('--disks')
+      command.append(base64.b64encode(yaml.dump(contents_as_yaml['disks'])))
+
+    for key in ['table', 'n', 'replication', 'login_host']:
+      if key in contents_as_yaml:
+        command.append(str("--%s" % key))
+        command.append(str("%s" % contents_as_yaml[key]))
+
+    if contents_as_yaml.get('zookeeper_quorum_zone') is True:
+      command.append('--zookeeper_quorum_zone')
+
+    options = ParseArgs(command, 'appscale-update-layout').args
+    AppScaleTools.update_layout(options)
+
+  def bake(self, node=None):
+    """ 'bake' makes a machine image from a node of the running cloud
+    deployment, and records it as the machine in the AppScalefile found in the
+    current working directory, so that the next 'appscale up' starts every
+    node from it instead of building AppScale on each one.
+
+    Args:
+      node: An int, the index of the node to make the image from, or None to
+        use the first node that holds none of the deployment's data.
+    Returns:
+      A str identifying the new image.
+    Raises:
+      AppScalefileException: If there is no AppScalefile in the current working
+        directory.
+    """
+    contents_as_yaml = yaml.safe_load(self.read_appscalefile())
+
+    # Construct the appscale-create-image command from argv and the contents
+    # of the AppScalefile.
+    command = []
+    if 'keyname' in contents_as_yaml:
+      command.append("--keyname")
+      command.append(contents_as_yaml['keyname'])
+
+    if 'verbose' in contents_as_yaml and contents_as_yaml['verbose'] == True:
+      command.append("--verbose")
+
+    if 'test' in contents_as_yaml and contents_as_yaml['test'] == True:
+      command.append('--test')
+
+    for credential in ["EC2_ACCESS_KEY", "EC2_SECRET_KEY", "EC2_URL"]:
+      if credential in contents_as_yaml:
+        os.environ[credential] = contents_as_yaml[credential]
+
+    if node is not None:
+      command.append("--node")
+      command.append(str(node))
+
+    options = ParseArgs(command, "appscale-create-image").args
+    image_id = AppScaleTools.create_image(options)
+    self.update_appscalefile('machine', image_id)
+    AppScaleLogger.success("Updated your AppScalefile to start new " \
+      "deployments from {0}.".format(image_id))
+    return image_id
+
+
   def upgrade(self):
     """ Allows users to upgrade to the latest version of AppScale."""
     contents_as_yaml = yaml.safe_load(self.read_appscalefile())
@@ -20,6 +20,8 @@ import uuid
 
 # AppScale-specific imports
 from agents.factory import InfrastructureAgentFactory
+from app_archive import AppArchive
+from app_compression import AppCompression
 from appcontroller_client import AppControllerClient
 from appengine_helper import AppEngineHelper
 from appscale_logger import AppScaleLogger
@@ -28,6 +30,8 @@ from custom_exceptions import AppEngineConfigException
 from custom_exceptions import AppScaleException
 from custom_exceptions import BadConfigurationException
 from custom_exceptions import ShellException
+from ignore_rules import IgnoreRules
+from layout_diff import LayoutDiff
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
 from node_layout import NodeLayout
@@ -73,6 +77,22 @@ class AppScaleTools(object):
   MAX_RETRIES = 20
 
 
+  # The roles whose machines hold the deployment's data, which a machine image
+  # made from them would carry along.
+  STATEFUL_ROLES = frozenset(['shadow', 'db_master', 'db_slave', 'database',
+    'zookeeper'])
+
+
+  # The largest files and directories left out of an upload that a dry run
+  # lists.
+  MAX_IGNORED_REPORTED = 10
+
+
+  # The most applications that upload_apps packages and copies to the login
+  # node at the same time.
+  MAX_CONCURRENT_UPLOADS = 4
+
+
   # The location of the expect script, used to interact with ssh-copy-id
   EXPECT_SCRIPT = os.path.join(
     os.path.dirname(sys.modules['appscale.tools'].__file__),
@@ -126,7 +146,7 @@ class AppScaleTools(object):
 
     # Skip checking for -n (replication) because we don't allow the user
     # to specify it here (only allowed in run-instances).
-    additional_nodes_layout = NodeLayout(options)
+    additional_nodes_layout = NodeLayout.from_options(options)
 
     # In virtualized cluster deployments, we need to make sure that the user
     # has already set up SSH keys.
@@ -213,6 +233,90 @@ class AppScaleTools(object):
       "at {0}".format(private_key))
 
 
+  @classmethod
+  def create_image(cls, options):
+    """Makes a machine image from a node in a running cloud deployment, so
+    that later deployments can start from a machine that is already built
+    and upgraded instead of bootstrapping every node.
+
+    Args:
+      options: A Namespace that has fields for each parameter that can be
+        passed in via the command-line interface.
+    Returns:
+      A str identifying the new image, which can be used as the 'machine' of
+      an AppScalefile.
+    Raises:
+      BadConfigurationException: If the deployment doesn't run in a cloud, has
+        no node with the given index, or that node holds the deployment's
+        data.
+      AppScaleException: If the node could not be terminated once its image
+        was made.
+    """
+    infrastructure = LocalState.get_infrastructure(options.keyname)
+    if infrastructure not in InfrastructureAgentFactory.VALID_AGENTS:
+      raise BadConfigurationException("Machine images can only be made from " \
+        "cloud deployments.")
+
+    nodes = LocalState.get_local_nodes_info(options.keyname)
+    if options.node is None:
+      stateless = [index for index, node in enumerate(nodes)
+        if not cls.STATEFUL_ROLES.intersection(node['jobs'])]
+      if not stateless:
+        raise BadConfigurationException("Every node in this deployment " \
+          "holds its data, so none can be made into an image.")
+      node_index = stateless[0]
+    elif options.node >= len(nodes):
+      raise BadConfigurationException("This deployment only has {0} " \
+        "node(s).".format(len(nodes)))
+    else:
+      node_index = options.node
+    node = nodes[node_index]
+
+    stateful_roles = sorted(cls.STATEFUL_ROLES.intersection(node['jobs']))
+    if stateful_roles:
+      raise BadConfigurationException("The node at {0} runs {1}, so its " \
+        "image would hold this deployment's data. Choose a node that " \
+        "doesn't.".format(node['public_ip'], ', '.join(stateful_roles)))
+
+    agent = InfrastructureAgentFactory.create_agent(infrastructure)
+    params = agent.get_cloud_params(options.keyname)
+    if not options.test:
+      LocalState.confirm_or_abort("The node at {0} will have its secrets, " \
+        "keys and data deleted, and will be terminated once its image is " \
+        "made.".format(node['public_ip']))
+
+    # GCE only allows lowercase letters, digits and dashes in image names.
+    image_name = options.image_name or re.sub('[^a-z0-9-]', '-',
+      'appscale-{0}-{1}'.format(options.keyname,
+      datetime.datetime.now().strftime('%Y%m%d%H%M%S')).lower())[:63]
+
+    # Azure only makes images from machines that had their users and host
+    # keys removed.
+    generalize = None
+    if infrastructure == 'azure':
+      generalize = 'waagent -deprovision -force'
+
+    # The disk is unmounted first, so that scrubbing only deletes what is on
+    # the boot disk.
+    if node.get('disk'):
+      RemoteHelper.unmount_persistent_disk(node['public_ip'], options.keyname,
+        options.verbose)
+    RemoteHelper.scrub_node_for_image(node['public_ip'], options.keyname,
+      options.verbose, then_run=generalize)
+    image_id = agent.create_image(node['instance_id'], image_name, params)
+    AppScaleLogger.success("Made image {0} from the node at {1}.".format(
+      image_id, node['public_ip']))
+
+    # The deployment's key no longer logs in to the node, so it can only be
+    # terminated.
+    RemoteHelper.remove_nodes([node], options.keyname, options.verbose,
+      reachable=False)
+    LocalState.remove_local_nodes(options.keyname, [node['public_ip']])
+    AppScaleLogger.log("Removed the node at {0} from the deployment.".format(
+      node['public_ip']))
+    return image_id
+
+
   @classmethod
   def describe_instances(cls, options):
     """Queries each node in the currently running AppScale deployment and
@@ -492,7 +596,7 @@ class AppScaleTools(object):
     AppScaleLogger.remote_log_tools_state(options, my_id, "started",
       APPSCALE_VERSION)
 
-    node_layout = NodeLayout(options)
+    node_layout = NodeLayout.from_options(options)
     if not node_layout.is_valid():
       raise BadConfigurationException("There were errors with your " + \
                                       "placement strategy:\n{0}".format(str(node_layout.errors())))
@@ -647,62 +751,222 @@ class AppScaleTools(object):
     if (infrastructure in InfrastructureAgentFactory.VALID_AGENTS and
           options.terminate):
       RemoteHelper.terminate_cloud_infrastructure(options.keyname,
-        options.verbose)
+        options.verbose, options.warm_pool_size, options.warm_pool_expiry,
+        options.drain_pool)
 
 
   @classmethod
-  def upload_app(cls, options):
-    """Uploads the given App Engine application into AppScale.
+  def update_layout(cls, options):
+    """Changes the placement strategy of a running AppScale deployment,
+    applying only the differences between the running layout and the new one
+    instead of restarting every machine.
 
     Args:
       options: A Namespace that has fields for each parameter that can be
         passed in via the command-line interface.
+    Raises:
+      AppControllerException: If the AppController rejects the new roles, or
+        doesn't report every machine in the new layout.
+      BadConfigurationException: If the new placement strategy is invalid,
+        moves a role that can't be moved while AppScale is running, adds
+        roles to a machine that is already running, or removes machines or
+        roles.
+    """
+    # The layout is built from the same options that 'appscale up' used, so
+    # that it is validated the way the running one was.
+    infrastructure = LocalState.get_infrastructure(options.keyname)
+    layout_options = vars(options).copy()
+    if infrastructure in InfrastructureAgentFactory.VALID_AGENTS:
+      layout_options['infrastructure'] = infrastructure
+    node_layout = NodeLayout(layout_options)
+
+    diff = LayoutDiff(LocalState.get_local_nodes_info(options.keyname),
+      node_layout)
+    if diff.is_empty():
+      AppScaleLogger.success("The running deployment already matches the " \
+        "given placement strategy.")
+      return
+
+    for change in diff.summary():
+      AppScaleLogger.log(change)
+
+    # The AppController can't be told that machines or roles went away, so
+    # it would keep sending them work.
+    if diff.leaves or diff.roles_to_remove:
+      raise BadConfigurationException("Machines and roles can't be removed " \
+        "from a running deployment. Run 'appscale down' and 'appscale up' to " \
+        "remove them.")
+
+    roles_to_start = diff.get_roles_to_start()
+    if roles_to_start:
+      # In virtualized cluster deployments, we need to make sure that the user
+      # has already set up SSH keys on the machines that are joining.
+      if infrastructure == "xen":
+        for node in diff.joins:
+          RemoteHelper.ssh(node.public_ip, options.keyname, "ls",
+            options.verbose)
+
+      AppScaleLogger.log("Sending request to start new roles")
+      login_ip = LocalState.get_login_host(options.keyname)
+      acc = AppControllerClient(login_ip, LocalState.get_secret_key(
+        options.keyname))
+      result = acc.start_roles_on_nodes(json.dumps(roles_to_start))
+      if isinstance(result, str) and result.startswith('Error'):
+        raise AppControllerException(result)
+
+      # Record where the new roles run, so that the next reshape compares
+      # against them instead of sending the same request again.
+      num_nodes = len(diff.matches) + len(diff.joins)
+      node_info = cls.wait_for_role_info(acc, num_nodes)
+      LocalState.update_local_nodes(options.keyname, node_info)
+      if len(node_info) < num_nodes:
+        raise AppControllerException("The AppController only reported {0} " \
+          "of the {1} machines in the new placement strategy. Run " \
+          "'appscale status' to see which ones started.".format(
+          len(node_info), num_nodes))
+
+    AppScaleLogger.success("Successfully updated the placement strategy of " \
+      "this AppScale deployment.")
+
+
+  @classmethod
+  def wait_for_role_info(cls, acc, num_nodes):
+    """Waits for the AppController to report the given number of machines.
+
+    Args:
+      acc: An AppControllerClient for the head node.
+      num_nodes: An int with the number of machines to wait for.
     Returns:
-      A tuple containing the host and port where the application is serving
-        traffic from.
+      A list of dicts, as returned by get_role_info, with the last machines
+      that the AppController reported. It has fewer than num_nodes entries if
+      they didn't all start within RemoteHelper.MAX_WAIT_TIME seconds.
     """
-    if cls.TAR_GZ_REGEX.search(options.file):
-      file_location = LocalState.extract_tgz_app_to_dir(options.file,
-        options.verbose)
-      created_dir = True
-    elif cls.ZIP_REGEX.search(options.file):
-      file_location = LocalState.extract_zip_app_to_dir(options.file,
-        options.verbose)
-      created_dir = True
-    elif os.path.isdir(options.file):
-      file_location = options.file
-      created_dir = False
+    deadline = time.time() + RemoteHelper.MAX_WAIT_TIME
+    while True:
+      node_info = acc.get_role_info() or []
+      if len(node_info) >= num_nodes or time.time() >= deadline:
+        return node_info
+      AppScaleLogger.log("Waiting for {0} of {1} machines to start".format(
+        num_nodes - len(node_info), num_nodes))
+      time.sleep(cls.SLEEP_TIME)
+
+
+  @classmethod
+  def get_app_location(cls, app_file, is_verbose):
+    """Finds the directory that holds the App Engine application to upload,
+    extracting it first if it was given as an archive.
+
+    Args:
+      app_file: The location on the local filesystem of the application's
+        directory, tar.gz file, or zip file.
+      is_verbose: A bool that indicates if we should print the commands we
+        exec to extract the application to stdout.
+    Returns:
+      A tuple containing the location of the application on the local
+      filesystem, and a bool that indicates if that directory was created
+      (and should be removed once the application is uploaded).
+    Raises:
+      AppEngineConfigException: If the application is not in a tar.gz file, a
+        zip file, or a directory.
+    """
+    if cls.TAR_GZ_REGEX.search(app_file):
+      return LocalState.extract_tgz_app_to_dir(app_file, is_verbose), True
+    elif cls.ZIP_REGEX.search(app_file):
+      return LocalState.extract_zip_app_to_dir(app_file, is_verbose), True
+    elif os.path.isdir(app_file):
+      return app_file, False
     else:
       raise AppEngineConfigException('{0} is not a tar.gz file, a zip file, ' \
         'or a directory. Please try uploading either a tar.gz file, a zip ' \
-        'file, or a directory.'.format(options.file))
+        'file, or a directory.'.format(app_file))
+
+
+  @classmethod
+  def prepare_upload(cls, options, app_file):
+    """Reads the configuration of the given App Engine application, and gets it
+    ready to be copied to the login node.
+
+    Args:
+      options: A Namespace that has fields for each parameter that can be
+        passed in via the command-line interface.
+      app_file: The location on the local filesystem of the application's
+        directory, tar.gz file, or zip file.
+    Returns:
+      A dict with the application's 'file' (as given), 'app_id', 'language',
+      'location' (the directory it is in, or None if its archive is sent as
+      is), 'created_dir' (if that directory should be removed once the
+      application is copied) and 'send_archive'.
+    Raises:
+      AppEngineConfigException: If the application's configuration is not
+        valid.
+    """
+    archive = None
+    if cls.TAR_GZ_REGEX.search(app_file) or cls.ZIP_REGEX.search(app_file):
+      archive = AppArchive.open(app_file)
+
+    if archive is not None:
+      # Check the app's configuration before spending any time extracting it.
+      app_id = archive.get_app_id()
+      app_language = archive.get_app_runtime()
+
+    # Archives that are already in the form the AppController expects are
+    # sent as they are, instead of being extracted, packed again and deleted.
+    send_archive = archive is not None and archive.can_send_as_is() and \
+      not options.incremental and options.compression == AppCompression.AUTO \
+      and not options.dry_run
+    if send_archive:
+      file_location = None
+      created_dir = False
+      sdk_mismatch = app_language == 'java' and archive.is_sdk_mismatch()
+    else:
+      file_location, created_dir = cls.get_app_location(app_file,
+        options.verbose)
+      try:
+        app_id = AppEngineHelper.get_app_id_from_app_config(file_location)
+      except AppEngineConfigException as config_error:
+        AppScaleLogger.log(config_error)
+        if 'yaml' in str(config_error):
+          raise config_error
+
+        # Java App Engine users may have specified their war directory. In
+        # that case, just move up one level, back to the app's directory.
+        file_location = file_location + os.sep + ".."
+        app_id = AppEngineHelper.get_app_id_from_app_config(file_location)
+
+      app_language = AppEngineHelper.get_app_runtime_from_app_config(
+        file_location)
+      sdk_mismatch = app_language == 'java' and \
+        AppEngineHelper.is_sdk_mismatch(file_location)
 
-    try:
-      app_id = AppEngineHelper.get_app_id_from_app_config(file_location)
-    except AppEngineConfigException as config_error:
-      AppScaleLogger.log(config_error)
-      if 'yaml' in str(config_error):
-        raise config_error
-
-      # Java App Engine users may have specified their war directory. In that
-      # case, just move up one level, back to the app's directory.
-      file_location = file_location + os.sep + ".."
-      app_id = AppEngineHelper.get_app_id_from_app_config(file_location)
-
-    app_language = AppEngineHelper.get_app_runtime_from_app_config(
-      file_location)
     AppEngineHelper.validate_app_id(app_id)
+    if sdk_mismatch:
+      AppScaleLogger.warn('AppScale did not find the correct SDK jar ' +
+        'versions in your app. The current supported ' +
+        'SDK version is ' + AppEngineHelper.SUPPORTED_SDK_VERSION + '.')
 
-    if app_language == 'java':
-      if AppEngineHelper.is_sdk_mismatch(file_location):
-        AppScaleLogger.warn('AppScale did not find the correct SDK jar ' +
-          'versions in your app. The current supported ' +
-          'SDK version is ' + AppEngineHelper.SUPPORTED_SDK_VERSION + '.')
+    return {
+      'file' : app_file,
+      'app_id' : app_id,
+      'language' : app_language,
+      'location' : file_location,
+      'created_dir' : created_dir,
+      'send_archive' : send_archive
+    }
 
-    login_host = LocalState.get_login_host(options.keyname)
-    secret_key = LocalState.get_secret_key(options.keyname)
-    acc = AppControllerClient(login_host, secret_key)
 
+  @classmethod
+  def get_upload_user(cls, options, acc, login_host):
+    """Finds the user that uploaded applications will belong to, creating
+    their account if it doesn't exist yet.
+
+    Args:
+      options: A Namespace that has fields for each parameter that can be
+        passed in via the command-line interface.
+      acc: An AppControllerClient for the login node.
+      login_host: A str with the public IP address of the login node.
+    Returns:
+      A str with the user's e-mail address.
+    """
     if options.test:
       username = LocalState.DEFAULT_USER
     elif options.email:
@@ -714,28 +978,128 @@ class AppScaleTools(object):
       password = LocalState.get_password_from_stdin()
       RemoteHelper.create_user_accounts(username, password,
         login_host, options.keyname)
+    return username
 
-    app_exists = acc.does_app_exist(app_id)
-    app_admin = acc.get_app_admin(app_id)
-    if app_admin is not None and username != app_admin:
-      raise AppScaleException("The given user doesn't own this application" + \
-        ", so they can't upload an app with that application ID. Please " + \
-        "change the application ID and try again.")
 
-    if app_exists:
-      AppScaleLogger.log("Uploading new version of app {0}".format(app_id))
-    else:
-      AppScaleLogger.log("Uploading initial version of app {0}".format(app_id))
-      acc.reserve_app_id(username, app_id, app_language)
+  @classmethod
+  def send_app(cls, options, app, acc, username):
+    """Copies an application that prepare_upload got ready to the login node,
+    reserving its ID first if this is its initial version. Once it is copied,
+    the application's local copy is removed if prepare_upload made it.
 
-    # Ignore all .pyc files while tarring.
-    if app_language == 'python27':
-      AppScaleLogger.log("Ignoring .pyc files")
+    Args:
+      options: A Namespace that has fields for each parameter that can be
+        passed in via the command-line interface.
+      app: The dict that prepare_upload returned for the application.
+      acc: An AppControllerClient for the login node.
+      username: A str with the e-mail address of the application's owner.
+    Returns:
+      A bool that indicates if the application already existed, and so is
+      being replaced by a new version.
+    Raises:
+      AppScaleException: If the application belongs to another user.
+    """
+    app_id = app['app_id']
+    try:
+      app_exists = acc.does_app_exist(app_id)
+      app_admin = acc.get_app_admin(app_id)
+      if app_admin is not None and username != app_admin:
+        raise AppScaleException("The given user doesn't own this " \
+          "application, so they can't upload an app with that application " \
+          "ID. Please change the application ID and try again.")
+
+      if app_exists:
+        AppScaleLogger.log("Uploading new version of app {0}".format(app_id))
+      else:
+        AppScaleLogger.log("Uploading initial version of app {0}".format(
+          app_id))
+        acc.reserve_app_id(username, app_id, app['language'])
 
-    remote_file_path = RemoteHelper.copy_app_to_host(file_location,
-      options.keyname, options.verbose)
+      if app['send_archive']:
+        remote_file_path = RemoteHelper.copy_archive_to_host(app['file'],
+          app_id, options.keyname, options.verbose)
+      else:
+        remote_file_path = RemoteHelper.copy_app_to_host(app['location'],
+          options.keyname, options.verbose, incremental=options.incremental,
+          compression=options.compression)
+    finally:
+      if app['created_dir']:
+        shutil.rmtree(app['location'])
 
     acc.done_uploading(app_id, remote_file_path)
+    return app_exists
+
+
+  @classmethod
+  def wait_for_apps(cls, acc, login_host, app_ids, is_verbose):
+    """Waits for the given applications to start serving, polling the
+    AppController once for all of them until each reports the port it serves
+    on, and then waiting for those ports to open.
+
+    Args:
+      acc: An AppControllerClient for the login node.
+      login_host: A str with the public IP address of the login node.
+      app_ids: A list of strs naming the applications to wait for.
+      is_verbose: A bool that indicates if we should print out errors in the
+        AppController's responses.
+    Returns:
+      A dict that maps the ID of each application that started serving to
+      the port it can be reached on. Applications that never reported a port
+      are left out.
+    """
+    http_ports = {}
+    for _ in range(cls.MAX_RETRIES + 1):
+      try:
+        apps_result = json.loads(acc.get_all_stats())['apps']
+      except (KeyError, ValueError):
+        AppScaleLogger.verbose("Got json error from get_all_data result.",
+            is_verbose)
+        time.sleep(cls.SLEEP_TIME)
+        continue
+
+      for app_id in app_ids:
+        try:
+          http_port = apps_result[app_id]['http']
+        except (KeyError, TypeError):
+          continue
+        if http_port:
+          http_ports[app_id] = http_port
+
+      if len(http_ports) == len(app_ids):
+        break
+      time.sleep(cls.SLEEP_TIME)
+
+    for http_port in http_ports.values():
+      RemoteHelper.sleep_until_port_is_open(login_host, http_port, is_verbose)
+    return http_ports
+
+
+  @classmethod
+  def upload_app(cls, options):
+    """Uploads the given App Engine application into AppScale.
+
+    Args:
+      options: A Namespace that has fields for each parameter that can be
+        passed in via the command-line interface.
+    Returns:
+      A tuple containing the host and port where the application is serving
+        traffic from, or None if this was a dry run.
+    """
+    app = cls.prepare_upload(options, options.file)
+    app_id = app['app_id']
+    if options.dry_run:
+      try:
+        cls.report_ignored_files(app['location'])
+      finally:
+        if app['created_dir']:
+          shutil.rmtree(app['location'])
+      return None
+
+    login_host = LocalState.get_login_host(options.keyname)
+    secret_key = LocalState.get_secret_key(options.keyname)
+    acc = AppControllerClient(login_host, secret_key)
+    username = cls.get_upload_user(options, acc, login_host)
+    app_exists = cls.send_app(options, app, acc, username)
     acc.update([app_id])
 
     # now that we've told the AppController to start our app, find out what port
@@ -745,35 +1109,172 @@ class AppScaleTools(object):
     if app_exists:
       time.sleep(20)  # give the AppController time to restart the app
 
-    # Makes a call to the AppController to get all the stats and looks
-    # through them for the http port the app can be reached on.
-    http_port = None
-    for _ in range(cls.MAX_RETRIES + 1):
-      result = acc.get_all_stats()
-      try:
-        json_result = json.loads(result)
-        apps_result = json_result['apps']
-        current_app = apps_result[app_id]
-        http_port = current_app['http']
-        if http_port:
-          break
-        time.sleep(cls.SLEEP_TIME)
-      except (KeyError, ValueError):
-        AppScaleLogger.verbose("Got json error from get_all_data result.",
-            options.verbose)
-        time.sleep(cls.SLEEP_TIME)
+    http_port = cls.wait_for_apps(acc, login_host, [app_id],
+      options.verbose).get(app_id)
     if not http_port:
       raise AppScaleException(
         "Unable to get the serving port for the application.")
 
-    RemoteHelper.sleep_until_port_is_open(login_host, http_port, options.verbose)
     AppScaleLogger.success("Your app can be reached at the following URL: " +
       "http://{0}:{1}".format(login_host, http_port))
+    return (login_host, http_port)
 
-    if created_dir:
-      shutil.rmtree(file_location)
 
-    return (login_host, http_port)
+  @classmethod
+  def upload_apps(cls, options):
+    """Uploads several App Engine applications into AppScale at once.
+
+    Up to MAX_CONCURRENT_UPLOADS applications are packaged and copied to the
+    login node at the same time. The AppController is then told to start all
+    of the ones that were copied with a single call, and they are waited on
+    together.
+
+    Args:
+      options: A Namespace that has fields for each parameter that can be
+        passed in via the command-line interface, with the applications to
+        upload in its 'files' field.
+    Returns:
+      A dict that maps each of the given files to a tuple containing the host
+      and port where its application is serving traffic from, or to the
+      exception that kept it from being uploaded. None if this was a dry run.
+    """
+    if options.dry_run:
+      for app_file in options.files:
+        app = cls.prepare_upload(options, app_file)
+        AppScaleLogger.log("{0}:".format(app_file))
+        try:
+          cls.report_ignored_files(app['location'])
+        finally:
+          if app['created_dir']:
+            shutil.rmtree(app['location'])
+      return None
+
+    login_host = LocalState.get_login_host(options.keyname)
+    secret_key = LocalState.get_secret_key(options.keyname)
+    acc = AppControllerClient(login_host, secret_key)
+    username = cls.get_upload_user(options, acc, login_host)
+
+    # A file given more than once is only uploaded once.
+    app_files = sorted(set(options.files), key=options.files.index)
+
+    # The apps are read and extracted first, so that if two have the same ID,
+    # the one given first is the one that gets uploaded.
+    results = {}
+    prepared = cls.run_concurrently(
+      lambda app_file: cls.prepare_upload(options, app_file), app_files)
+    to_send = []
+    claimed_ids = set()
+    for app_file in app_files:
+      app = prepared[app_file]
+      if isinstance(app, Exception):
+        results[app_file] = app
+      elif app['app_id'] in claimed_ids:
+        if app['created_dir']:
+          shutil.rmtree(app['location'])
+        results[app_file] = AppScaleException("{0} has the same " \
+          "application ID as another app in this upload.".format(app_file))
+      else:
+        claimed_ids.add(app['app_id'])
+        to_send.append(app_file)
+
+    # Each copy talks to the AppController over its own connection.
+    sent = cls.run_concurrently(lambda app_file: cls.send_app(options,
+      prepared[app_file], AppControllerClient(login_host, secret_key),
+      username), to_send)
+    uploaded = []
+    for app_file in to_send:
+      if isinstance(sent[app_file], Exception):
+        results[app_file] = sent[app_file]
+      else:
+        uploaded.append(app_file)
+
+    for app_file, exception in results.iteritems():
+      AppScaleLogger.warn("Couldn't upload {0}: {1}".format(app_file,
+        exception))
+    if not uploaded:
+      return results
+
+    app_ids = [prepared[app_file]['app_id'] for app_file in uploaded]
+    acc.update(app_ids)
+    AppScaleLogger.log("Please wait for your apps to start serving.")
+    if any(sent[app_file] for app_file in uploaded):
+      time.sleep(20)  # give the AppController time to restart the apps
+
+    http_ports = cls.wait_for_apps(acc, login_host, app_ids, options.verbose)
+    for app_file in uploaded:
+      app_id = prepared[app_file]['app_id']
+      if app_id in http_ports:
+        AppScaleLogger.success("{0} can be reached at the following URL: " \
+          "http://{1}:{2}".format(app_id, login_host, http_ports[app_id]))
+        results[app_file] = (login_host, http_ports[app_id])
+      else:
+        AppScaleLogger.warn("Unable to get the serving port for {0}.".format(
+          app_id))
+        results[app_file] = AppScaleException("Unable to get the serving " \
+          "port for the application.")
+    return results
+
+
+  @classmethod
+  def run_concurrently(cls, function, items):
+    """Calls the given function on each of the given items, on up to
+    MAX_CONCURRENT_UPLOADS threads at a time.
+
+    Args:
+      function: A function that takes one of the items.
+      items: A list of the items to call the function on.
+    Returns:
+      A dict that maps each item to what the function returned for it, or to
+      the exception that it raised.
+    """
+    results = {}
+    pending = Queue.Queue()
+    for item in items:
+      pending.put(item)
+
+    def run_pending():
+      while True:
+        try:
+          item = pending.get_nowait()
+        except Queue.Empty:
+          return
+
+        try:
+          results[item] = function(item)
+        except Exception as exception:
+          results[item] = exception
+
+    threads = []
+    for _ in range(min(len(items), cls.MAX_CONCURRENT_UPLOADS)):
+      thread = threading.Thread(target=run_pending)
+      thread.start()
+      threads.append(thread)
+
+    for thread in threads:
+      thread.join()
+    return results
+
+
+  @classmethod
+  def report_ignored_files(cls, app_location):
+    """Logs how many files and bytes of the given application would be
+    uploaded, and how many its ignore rules leave out.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+    """
+    included, ignored = IgnoreRules.from_app(app_location).find_files(
+      app_location)
+    sizes = [(IgnoreRules.get_size(app_location, [path]), path)
+      for path in ignored]
+    AppScaleLogger.log("Would upload {0} files ({1} bytes)".format(
+      len(included), IgnoreRules.get_size(app_location, included)))
+    AppScaleLogger.log("Ignore rules leave out {0} files and directories, " \
+      "saving {1} bytes".format(len(ignored), sum(size for size, _ in sizes)))
+    for size, path in sorted(sizes, reverse=True)[:cls.MAX_IGNORED_REPORTED]:
+      AppScaleLogger.log("  {0} ({1} bytes)".format(path, size))
+
 
   @classmethod
   def upgrade(cls, options):
@@ -782,7 +1283,7 @@ class AppScaleTools(object):
       options: A Namespace that has fields for each parameter that can be
         passed in via the command-line interface.
     """
-    node_layout = NodeLayout(options)
+    node_layout = NodeLayout.from_options(options)
     if not node_layout.is_valid():
       raise BadConfigurationException(
         'Your ips_layout is invalid:\n{}'.format(node_layout.errors()))
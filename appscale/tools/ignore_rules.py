@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import os
+import re
+import yaml
+
+
+# AppScale-specific imports
+from custom_exceptions import AppEngineConfigException
+
+
+class IgnoreRules():
+  """IgnoreRules decides which files in an App Engine application are left out
+  when it is uploaded.
+
+  Files are left out if they match:
+  - the defaults (hidden entries at the top of the application, version
+    control directories anywhere in it, and compiled Python files),
+  - the skip_files regular expressions in the app's app.yaml, which are
+    matched against paths relative to the application, as App Engine does,
+  - the patterns in the app's .appscaleignore file, which work like the
+    ones in a .gitignore file.
+
+  When a directory is left out, nothing in it is looked at again, so big
+  directories like virtualenvs cost nothing to skip.
+  """
+
+
+  # The name of the file that holds an application's ignore patterns.
+  IGNORE_FILE = ".appscaleignore"
+
+
+  # The patterns that every upload leaves out, in .gitignore syntax.
+  DEFAULT_PATTERNS = ('/.*', '.git/', '.hg/', '.svn/', '.bzr/', 'CVS/',
+    '*.pyc')
+
+
+  def __init__(self, patterns=(), skip_files=()):
+    """Creates a new IgnoreRules.
+
+    Args:
+      patterns: A list of strs with .gitignore-style patterns, which are used
+        after the defaults.
+      skip_files: A list of strs with regular expressions that are matched
+        against the relative path of each file and directory.
+    Raises:
+      AppEngineConfigException: If one of the skip_files is not a valid
+        regular expression.
+    """
+    self.rules = []
+    for pattern in list(self.DEFAULT_PATTERNS) + list(patterns):
+      rule = self.translate(pattern)
+      if rule is not None:
+        self.rules.append(rule)
+
+    try:
+      self.skip_files = None
+      if skip_files:
+        self.skip_files = re.compile('|'.join('(?:{0})'.format(regex)
+          for regex in skip_files))
+    except re.error as error:
+      raise AppEngineConfigException("Invalid skip_files in app.yaml: " \
+        "{0}".format(error))
+
+    # Without negated patterns, whether a path matches doesn't depend on
+    # which pattern it matches, so each kind of path is checked against a
+    # single regular expression instead of one per pattern.
+    self.combined = None
+    if not any(negated for _, negated, _ in self.rules):
+      self.combined = {
+        True : self.combine([regex for regex, _, _ in self.rules]),
+        False : self.combine([regex for regex, _, dir_only in self.rules
+          if not dir_only])
+      }
+
+
+  @classmethod
+  def from_app(cls, app_location):
+    """Reads the ignore rules of the application in the given directory.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+    Returns:
+      An IgnoreRules for the application.
+    Raises:
+      AppEngineConfigException: If app.yaml is not valid YAML.
+    """
+    app_yaml = None
+    ignore_file = None
+    app_yaml_location = os.path.join(app_location, "app.yaml")
+    if os.path.isfile(app_yaml_location):
+      with open(app_yaml_location, 'r') as file_handle:
+        app_yaml = file_handle.read()
+    ignore_file_location = os.path.join(app_location, cls.IGNORE_FILE)
+    if os.path.isfile(ignore_file_location):
+      with open(ignore_file_location, 'r') as file_handle:
+        ignore_file = file_handle.read()
+    return cls.from_contents(app_yaml, ignore_file)
+
+
+  @classmethod
+  def from_contents(cls, app_yaml=None, ignore_file=None):
+    """Builds the ignore rules for an application from its files' contents.
+
+    Args:
+      app_yaml: A str with the contents of the app's app.yaml, or None if it
+        doesn't have one.
+      ignore_file: A str with the contents of the app's .appscaleignore, or
+        None if it doesn't have one.
+    Returns:
+      An IgnoreRules for the application.
+    Raises:
+      AppEngineConfigException: If app.yaml is not valid YAML.
+    """
+    skip_files = []
+    if app_yaml:
+      try:
+        config = yaml.safe_load(app_yaml)
+      except yaml.YAMLError as error:
+        raise AppEngineConfigException("Couldn't parse app.yaml: {0}".format(
+          error))
+      if isinstance(config, dict):
+        skip_files = config.get('skip_files') or []
+      if isinstance(skip_files, basestring):
+        skip_files = [skip_files]
+
+    patterns = []
+    if ignore_file:
+      patterns = ignore_file.splitlines()
+    return cls(patterns, skip_files)
+
+
+  @classmethod
+  def translate(cls, pattern):
+    """Turns a .gitignore-style pattern into a regular expression.
+
+    Args:
+      pattern: A str with the pattern.
+    Returns:
+      A tuple with the compiled regular expression, a bool that indicates if
+      the pattern is negated (starts with '!'), and a bool that indicates if
+      it only matches directories (ends with '/'). None if the line is blank
+      or a comment.
+    """
+    pattern = pattern.strip()
+    if not pattern or pattern.startswith('#'):
+      return None
+
+    negated = pattern.startswith('!')
+    if negated:
+      pattern = pattern[1:]
+    elif pattern.startswith('\\!') or pattern.startswith('\\#'):
+      pattern = pattern[1:]
+
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+
+    # Patterns with a slash before their end only match relative to the top
+    # of the application. The rest match at any depth.
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = []
+    index = 0
+    while index < len(pattern):
+      char = pattern[index]
+      if pattern.startswith('**/', index):
+        regex.append('(?:.*/)?')
+        index += 3
+        continue
+      elif pattern.startswith('**', index):
+        regex.append('.*')
+        index += 2
+        continue
+      elif char == '*':
+        regex.append('[^/]*')
+      elif char == '?':
+        regex.append('[^/]')
+      elif char == '[' and ']' in pattern[index + 2:]:
+        end = pattern.index(']', index + 2)
+        char_class = pattern[index + 1:end]
+        if char_class.startswith('!'):
+          char_class = '^' + char_class[1:]
+        regex.append('[{0}]'.format(char_class.replace('\\', '\\\\')))
+        index = end
+      elif char == '\\' and index + 1 < len(pattern):
+        index += 1
+        regex.append(re.escape(pattern[index]))
+      else:
+        regex.append(re.escape(char))
+      index += 1
+
+    prefix = '' if anchored else '(?:.*/)?'
+    return re.compile('{0}{1}\\Z'.format(prefix, ''.join(regex))), negated, \
+      dir_only
+
+
+  @classmethod
+  def combine(cls, regexes):
+    """Combines compiled regular expressions into one that matches if any of
+    them do, or None if there are none."""
+    if not regexes:
+      return None
+    return re.compile('|'.join('(?:{0})'.format(regex.pattern)
+      for regex in regexes))
+
+
+  def matches(self, path, is_dir):
+    """Decides if the given file or directory is left out, without looking at
+    the directories it is in.
+
+    Args:
+      path: A str with the path of the file or directory, relative to the
+        application, using '/' to separate directories.
+      is_dir: A bool that indicates if the path is a directory.
+    Returns:
+      True if the path is left out, and False otherwise.
+    """
+    if self.skip_files is not None and self.skip_files.match(path):
+      return True
+
+    if self.combined is not None:
+      regex = self.combined[is_dir]
+      return regex is not None and regex.match(path) is not None
+
+    # The last pattern that matches decides.
+    for regex, negated, dir_only in reversed(self.rules):
+      if dir_only and not is_dir:
+        continue
+      if regex.match(path):
+        return not negated
+    return False
+
+
+  def is_ignored(self, path, is_dir):
+    """Decides if the given file or directory is left out, either because it
+    matches or because one of the directories it is in does.
+
+    Args:
+      path: A str with the path of the file or directory, relative to the
+        application, using '/' to separate directories.
+      is_dir: A bool that indicates if the path is a directory.
+    Returns:
+      True if the path is left out, and False otherwise.
+    """
+    parts = path.split('/')
+    for depth in range(1, len(parts)):
+      if self.matches('/'.join(parts[:depth]), True):
+        return True
+    return self.matches(path, is_dir)
+
+
+  def find_files(self, app_location):
+    """Finds the files in the given application that should be uploaded,
+    following symlinks.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+    Returns:
+      A tuple of two lists of strs, with paths relative to the application.
+      The first names the files to upload. The second names the files and
+      directories that were left out.
+    """
+    included = []
+    ignored = []
+    for root, dirs, file_names in os.walk(app_location, followlinks=True):
+      relative_root = os.path.relpath(root, app_location).replace(os.sep, '/')
+      prefix = '' if relative_root == '.' else relative_root + '/'
+
+      kept_dirs = []
+      for name in dirs:
+        if self.matches(prefix + name, True):
+          ignored.append(prefix + name)
+        else:
+          kept_dirs.append(name)
+      dirs[:] = kept_dirs
+
+      for name in file_names:
+        if self.matches(prefix + name, False):
+          ignored.append(prefix + name)
+        else:
+          included.append(prefix + name)
+    return included, ignored
+
+
+  @classmethod
+  def get_size(cls, app_location, paths):
+    """Adds up the size of the given files and directories.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+      paths: A list of strs naming files and directories in the application.
+    Returns:
+      An int with the total number of bytes in them.
+    """
+    total = 0
+    for path in paths:
+      full_path = os.path.join(app_location, path)
+      if not os.path.isdir(full_path):
+        total += os.path.getsize(full_path)
+        continue
+      for root, _, file_names in os.walk(full_path, followlinks=True):
+        total += sum(os.path.getsize(os.path.join(root, name))
+          for name in file_names)
+    return total
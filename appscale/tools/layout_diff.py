@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+
+# AppScale-specific imports
+from custom_exceptions import BadConfigurationException
+from node_layout import NodeLayout
+
+
+class LayoutDiff():
+  """LayoutDiff computes the smallest set of changes that turns the placement
+  strategy of a running AppScale deployment into a new one.
+
+  The running layout comes from the node_info stored in the locations.json
+  file (as returned by the AppController's get_role_info), and the desired
+  layout is a valid NodeLayout. Nodes present in both are matched up, and the
+  difference is expressed as nodes that need to join, nodes that need to
+  leave, and roles that need to be removed from nodes that stay.
+
+  The AppController can only start roles on machines that join the
+  deployment, so a layout that adds roles to a machine that is already
+  running is rejected.
+  """
+
+
+  # The roles that decide where the deployment is reached and coordinated
+  # from, and where its master database lives. These can't be moved without
+  # restarting the deployment.
+  FIXED_ROLES = ('shadow', 'db_master')
+
+
+  def __init__(self, running_nodes, node_layout):
+    """Creates a new LayoutDiff.
+
+    Args:
+      running_nodes: A list of dicts, one per machine in the running
+        deployment, each containing its 'public_ip', 'private_ip',
+        'instance_id', and 'jobs'.
+      node_layout: A valid NodeLayout describing the desired placement.
+    Raises:
+      BadConfigurationException: If the new layout is invalid, if it moves a
+        role that can't be moved while AppScale is running, or if it adds
+        roles to a machine that is already running.
+    """
+    if not node_layout.is_valid():
+      raise BadConfigurationException("There were errors with your " \
+        "placement strategy:\n{0}".format(str(node_layout.errors())))
+
+    self.running_nodes = running_nodes
+    self.node_layout = node_layout
+
+    # Maps the public IP of each running node that is kept to the Node in the
+    # new layout that it becomes.
+    self.matches = {}
+    self.joins = []
+    self.leaves = []
+    self.roles_to_remove = {}
+
+    self.match_nodes()
+    self.compute_role_changes()
+
+
+  def match_nodes(self):
+    """Pairs up the nodes in the new layout with the running nodes.
+
+    Nodes named by IP address (virtualized clusters) are matched on that
+    address. Nodes named by ID (clouds) are matched to the running node with
+    the most roles in common, so that as few services as possible move.
+    """
+    unmatched_running = list(self.running_nodes)
+    unmatched_new = []
+
+    for node in self.node_layout.nodes:
+      running = None
+      for candidate in unmatched_running:
+        if node.public_ip in (candidate.get('public_ip'),
+          candidate.get('private_ip')):
+          running = candidate
+          break
+
+      if running is None:
+        unmatched_new.append(node)
+      else:
+        unmatched_running.remove(running)
+        self.matches[running['public_ip']] = (running, node)
+
+    # The head node always stays put, so match it up before anything else.
+    # Nodes named by an IP address that isn't running are new machines.
+    unmatched_new.sort(key=lambda node: not node.is_role('shadow'))
+    for node in unmatched_new:
+      if not NodeLayout.NODE_ID_REGEX.match(node.public_ip):
+        self.joins.append(node)
+        continue
+
+      best, best_overlap = None, 0
+      for candidate in unmatched_running:
+        if node.is_role('shadow') != ('shadow' in candidate.get('jobs', [])):
+          continue
+        overlap = len(set(node.roles) & set(candidate.get('jobs', [])))
+        if best is None or overlap > best_overlap:
+          best, best_overlap = candidate, overlap
+
+      if best is None:
+        self.joins.append(node)
+      else:
+        unmatched_running.remove(best)
+        self.matches[best['public_ip']] = (best, node)
+
+    self.leaves = unmatched_running
+
+    for node in self.joins + self.leaves:
+      if isinstance(node, dict):
+        roles = node.get('jobs', [])
+      else:
+        roles = node.roles
+      for role in self.FIXED_ROLES:
+        if role in roles:
+          raise BadConfigurationException("Cannot move the {0} role while " \
+            "AppScale is running.".format(role))
+
+
+  def compute_role_changes(self):
+    """Determines which roles are lost by the nodes that are kept in the
+    deployment.
+
+    Raises:
+      BadConfigurationException: If a kept node gains a role, or gains or
+        loses a role that can't be moved while AppScale is running.
+    """
+    for public_ip, (running, node) in sorted(self.matches.iteritems()):
+      old_roles = set(running.get('jobs', []))
+      new_roles = set(node.roles)
+
+      added = sorted(new_roles - old_roles)
+      removed = sorted(old_roles - new_roles)
+      for role in self.FIXED_ROLES:
+        if role in added or role in removed:
+          raise BadConfigurationException("Cannot move the {0} role while " \
+            "AppScale is running.".format(role))
+
+      if added:
+        raise BadConfigurationException("Cannot add roles {0} to {1}, which " \
+          "is already running. The AppController only starts roles on " \
+          "machines that join the deployment, so place them on a new " \
+          "node instead.".format(", ".join(added), public_ip))
+
+      if removed:
+        self.roles_to_remove[public_ip] = removed
+
+
+  def is_empty(self):
+    """Checks if the running deployment already matches the new layout.
+
+    Returns:
+      True if no node needs to join or leave and no roles change, False
+      otherwise.
+    """
+    return not (self.joins or self.leaves or self.roles_to_remove)
+
+
+  def get_roles_to_start(self):
+    """Builds the request that the AppController's start_roles_on_nodes
+    expects, which starts the nodes that join the deployment.
+
+    Returns:
+      A dict that maps each role the user can specify to the list of IP
+      addresses (or node IDs, for nodes yet to be spawned) that should start
+      it.
+    """
+    roles_to_nodes = {}
+    for node in self.joins:
+      for role in node.roles:
+        if role in NodeLayout.ADVANCED_FORMAT_KEYS:
+          roles_to_nodes.setdefault(role, []).append(node.public_ip)
+
+    for ips in roles_to_nodes.values():
+      ips.sort()
+    return roles_to_nodes
+
+
+  def summary(self):
+    """Describes the changes in this LayoutDiff in a human-readable form.
+
+    Returns:
+      A list of strs, one per change.
+    """
+    lines = []
+    for node in self.joins:
+      lines.append("Join {0} with roles {1}".format(node.public_ip,
+        ", ".join(sorted(node.roles))))
+    for node in self.leaves:
+      lines.append("Remove {0}".format(node['public_ip']))
+    for public_ip, roles in sorted(self.roles_to_remove.iteritems()):
+      lines.append("Remove roles {0} from {1}".format(", ".join(roles),
+        public_ip))
+    return lines
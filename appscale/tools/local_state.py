@@ -211,6 +211,10 @@ class LocalState(object):
     }
     creds.update(additional_creds)
 
+    topology = node_layout.get_topology()
+    if topology:
+      creds['zones'] = json.dumps(topology)
+
     if options.infrastructure:
       iaas_creds = {
         'infrastructure': options.infrastructure,
@@ -355,6 +359,34 @@ class LocalState(object):
     return cls.LOCAL_APPSCALE_PATH + "locations-" + keyname + ".json"
 
 
+  @classmethod
+  def get_compiled_layouts_location(cls, keyname):
+    """Determines the location where the JSON file can be found that caches
+    validated placement strategies for this deployment.
+
+    Args:
+      keyname: A str that indicates the name of the SSH keypair that
+        uniquely identifies this AppScale deployment.
+    Returns:
+      A str that indicates where the compiled layouts file can be found.
+    """
+    return cls.LOCAL_APPSCALE_PATH + "layouts-" + keyname + ".json"
+
+
+  @classmethod
+  def get_warm_pool_location(cls, keyname):
+    """Determines the location where the JSON file can be found that lists
+    the stopped instances kept around for this deployment's next start.
+
+    Args:
+      keyname: A str that indicates the name of the SSH keypair that
+        uniquely identifies this AppScale deployment.
+    Returns:
+      A str that indicates where the warm pool file can be found.
+    """
+    return cls.LOCAL_APPSCALE_PATH + "warm-pool-" + keyname + ".json"
+
+
   @classmethod
   def update_local_metadata(cls, options, db_master, head_node):
     """Writes a locations.json file to the local filesystem,
@@ -382,6 +414,13 @@ class LocalState(object):
     if infrastructure != "xen":
       appscalefile_contents['zone'] = options.zone
 
+      # The warm pool only reuses stopped instances for deployments that run
+      # the same image on the same instance type.
+      appscalefile_contents['machine'] = options.machine
+      appscalefile_contents['instance_type'] = options.instance_type
+      appscalefile_contents['use_spot_instances'] = \
+        str(options.use_spot_instances)
+
     if infrastructure == "gce":
       appscalefile_contents['project'] = options.project
 
@@ -609,6 +648,46 @@ class LocalState(object):
     return [node['public_ip'] for node in nodes]
 
 
+  @classmethod
+  def update_local_nodes(cls, keyname, node_info):
+    """Replaces the list of machines in the JSON-encoded metadata on disk,
+    for when the placement strategy of a running deployment changes.
+
+    Args:
+      keyname: The SSH keypair name that uniquely identifies this AppScale
+        deployment.
+      node_info: A list of dicts, as returned by the AppController's
+        get_role_info, one per machine in the deployment.
+    """
+    with open(cls.get_locations_json_location(keyname), 'r') as file_handle:
+      locations_json = json.loads(file_handle.read())
+
+    locations_json['node_info'] = node_info
+
+    with open(cls.get_locations_json_location(keyname), 'w') as file_handle:
+      file_handle.write(json.dumps(locations_json))
+
+
+  @classmethod
+  def remove_local_nodes(cls, keyname, public_ips):
+    """Removes the named machines from the JSON-encoded metadata on disk, for
+    when they have left the AppScale deployment.
+
+    Args:
+      keyname: The SSH keypair name that uniquely identifies this AppScale
+        deployment.
+      public_ips: A list of the public IPs or FQDNs of the machines to remove.
+    """
+    with open(cls.get_locations_json_location(keyname), 'r') as file_handle:
+      locations_json = json.loads(file_handle.read())
+
+    locations_json['node_info'] = [node for node in
+      locations_json.get('node_info', []) if node['public_ip'] not in public_ips]
+
+    with open(cls.get_locations_json_location(keyname), 'w') as file_handle:
+      file_handle.write(json.dumps(locations_json))
+
+
   @classmethod
   def get_credentials(cls, is_admin=True):
     """Queries the user for the username and password that should be set for the
@@ -853,6 +932,32 @@ class LocalState(object):
     return cls.LOCAL_APPSCALE_PATH + keyname + "-oauth2.dat"
 
 
+  @classmethod
+  def get_gce_discovery_cache_location(cls):
+    """Returns the path on the local filesystem where the documents that
+    describe Google's APIs are cached. They are the same for every deployment,
+    so they are not named after a keyname.
+
+    Returns:
+      A str that corresponds to a location on the local filesystem where the
+      discovery documents can be found.
+    """
+    return cls.LOCAL_APPSCALE_PATH + "gce-discovery.json"
+
+
+  @classmethod
+  def get_spot_price_cache_location(cls):
+    """Returns the path on the local filesystem where EC2 spot price history is
+    cached. Prices are the same for every deployment, so they are not named
+    after a keyname.
+
+    Returns:
+      A str that corresponds to a location on the local filesystem where the
+      spot price history can be found.
+    """
+    return cls.LOCAL_APPSCALE_PATH + "spot-prices.json"
+
+
   @classmethod
   def cleanup_appscale_files(cls, keyname, remove_locations=True):
     """Removes all AppScale metadata files from this machine.
@@ -865,7 +970,8 @@ class LocalState(object):
     """
     files_to_remove = [LocalState.get_secret_key_location(keyname)]
     if remove_locations:
-      files_to_remove += [LocalState.get_locations_json_location(keyname)]
+      files_to_remove += [LocalState.get_locations_json_location(keyname),
+        LocalState.get_compiled_layouts_location(keyname)]
 
     for file_to_remove in files_to_remove:
       if os.path.exists(file_to_remove):
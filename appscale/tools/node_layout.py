@@ -2,12 +2,18 @@
 
 
 # General-purpose Python library imports
+import hashlib
+import json
 import re
 import yaml
 
 
 # AppScale-specific imports
 from agents.factory import InfrastructureAgentFactory
+from appscale_logger import AppScaleLogger
+from local_state import APPSCALE_VERSION
+from local_state import LocalState
+from placement_optimizer import PlacementOptimizer
 
 
 class NodeLayout():
@@ -80,6 +86,15 @@ class NodeLayout():
   INPUT_YAML_REQUIRED = "A YAML file is required for virtualized clusters"
 
 
+  # The number of compiled placement strategies to keep per deployment.
+  MAX_COMPILED_LAYOUTS = 5
+
+
+  # The key in an ips.yaml file that maps zone (or rack) names to the nodes
+  # in them. It can be used with both simple and advanced deployments.
+  TOPOLOGY_KEY = 'zones'
+
+
   # The message to display if the user mixes advanced and simple tags in their
   # deployment.
   USED_SIMPLE_AND_ADVANCED_KEYS = "Check your node layout and make sure not " \
@@ -96,6 +111,16 @@ class NodeLayout():
         a str containing a path on the local filesystem that, when read,
         contains the YAML in question. It can also be set to None, for
         deployments when the user specifies how many VMs they wish to use.
+        If no YAML is given but the options contain 'capacities' (a dict
+        mapping node IDs to their cpu, ram, and disk), an advanced placement
+        strategy is generated from those capacities instead. The YAML may
+        also label nodes with the zone or rack they are in, via a 'zones'
+        key that maps zone names to lists of nodes. Setting
+        'zookeeper_quorum_zone' requires a majority of the ZooKeeper ensemble
+        to share a zone, which is otherwise only recommended.
+    Raises:
+      BadConfigurationException: If capacities were given, but the nodes are
+        too small to host a valid deployment.
     """
     if not isinstance(options, dict):
       options = vars(options)
@@ -109,6 +134,19 @@ class NodeLayout():
     else:
       self.input_yaml = None
 
+    self.zookeeper_quorum_zone = bool(options.get('zookeeper_quorum_zone'))
+    if self.input_yaml is None and options.get('capacities'):
+      optimizer = PlacementOptimizer(options['capacities'],
+        replication=options.get('replication'),
+        zookeeper_quorum_zone=self.zookeeper_quorum_zone)
+      self.input_yaml = optimizer.generate_layout()
+
+    # Zone labels aren't a role, so keep them apart from the roles.
+    self.topology = None
+    if self.input_yaml and self.TOPOLOGY_KEY in self.input_yaml:
+      self.input_yaml = self.input_yaml.copy()
+      self.topology = self.input_yaml.pop(self.TOPOLOGY_KEY)
+
     self.disks = options.get('disks')
     self.infrastructure = options.get('infrastructure')
     self.min_vms = options.get('min')
@@ -123,6 +161,58 @@ class NodeLayout():
 
     self.nodes = []
 
+    # Validation fills in defaults (e.g., the replication factor), so remember
+    # what this layout looked like as given.
+    self.layout_hash = self.fingerprint()
+
+
+  @classmethod
+  def from_options(cls, options):
+    """Creates a NodeLayout from the given options, reusing a previously
+    validated copy of it if the placement strategy and the options that
+    affect it haven't changed since the last command run for this deployment.
+
+    Args:
+      options: A Namespace or dict with the placement strategy and the
+        keyname of this AppScale deployment.
+    Returns:
+      A NodeLayout. Callers should still check is_valid, which is free when
+        the layout was loaded from the cache.
+    """
+    node_layout = cls(options)
+    if not isinstance(options, dict):
+      options = vars(options)
+
+    keyname = options.get('keyname')
+    if not keyname:
+      return node_layout
+
+    location = LocalState.get_compiled_layouts_location(keyname)
+    try:
+      with open(location, 'r') as file_handle:
+        compiled_layouts = json.loads(file_handle.read())
+    except (IOError, ValueError):
+      compiled_layouts = []
+
+    for compiled in compiled_layouts:
+      if node_layout.load_compiled(compiled):
+        AppScaleLogger.verbose("Using cached placement strategy {0}".format(
+          node_layout.layout_hash), options.get('verbose', False))
+        return node_layout
+
+    compiled = node_layout.to_compiled()
+    if compiled:
+      compiled_layouts = [compiled] + \
+        compiled_layouts[:cls.MAX_COMPILED_LAYOUTS - 1]
+      try:
+        with open(location, 'w') as file_handle:
+          file_handle.write(json.dumps(compiled_layouts))
+      except IOError:
+        # The cache only saves time, so don't fail if we can't write it.
+        pass
+
+    return node_layout
+
 
   def is_valid(self):
     """Determines if the current NodeLayout can be successfully used to
@@ -337,6 +427,11 @@ class NodeLayout():
     if num_of_duplicate_ips > 0:
       return self.invalid(self.DUPLICATE_IPS)
 
+    if self.topology:
+      valid, reason = self.assign_zones(nodes)
+      if not valid:
+        return self.invalid(reason)
+
     if len(nodes) == 1:
       # Singleton node should be master and app engine
       nodes[0].add_role('appengine')
@@ -373,6 +468,11 @@ class NodeLayout():
       for node in nodes:
         node.disk = self.disks.get(node.public_ip)
 
+    if self.topology:
+      valid, reason = self.is_topology_valid(nodes)
+      if not valid:
+        return self.invalid(reason)
+
     rep = self.is_database_replication_valid(nodes)
 
     if not rep['result']:
@@ -447,6 +547,11 @@ class NodeLayout():
           return self.invalid("{0} must be an IP address".format(
             node.public_ip))
 
+    if self.topology:
+      valid, reason = self.assign_zones(nodes)
+      if not valid:
+        return self.invalid(reason)
+
     master_nodes = []
     for node in nodes:
       if node.is_role('shadow'):
@@ -534,6 +639,11 @@ class NodeLayout():
       for node in nodes:
         node.disk = self.disks.get(node.public_ip)
 
+    if self.topology:
+      valid, reason = self.is_topology_valid(nodes)
+      if not valid:
+        return self.invalid(reason)
+
     rep = self.is_database_replication_valid(nodes)
     if not rep['result']:
       return rep
@@ -566,6 +676,101 @@ class NodeLayout():
     return True, ""
 
 
+  def assign_zones(self, nodes):
+    """ Labels each node with the zone that the user placed it in.
+
+    Returns:
+      A tuple of two items. The first item is a bool that indicates if every
+      node was placed in exactly one known zone, and the second item is a str
+      that indicates why the zones given were invalid (which is empty when the
+      zones are valid).
+    """
+    if not isinstance(self.topology, dict):
+      return False, "zones must map zone names to lists of nodes."
+
+    node_hash = dict((node.public_ip, node) for node in nodes)
+    for zone, zone_nodes in self.topology.iteritems():
+      if isinstance(zone_nodes, str):
+        zone_nodes = [zone_nodes]
+
+      for node_id in zone_nodes or []:
+        node = node_hash.get(node_id)
+        if node is None:
+          return False, "Zone {0} lists {1}, which has no roles.".format(zone,
+            node_id)
+        if node.zone is not None and node.zone != str(zone):
+          return False, "{0} cannot be in more than one zone.".format(node_id)
+        node.zone = str(zone)
+
+    for node in nodes:
+      if node.zone is None:
+        return False, "Please specify a zone for every node ({0} has " \
+          "none).".format(node.public_ip)
+
+    return True, ""
+
+
+  def is_topology_valid(self, nodes):
+    """ Checks that the roles are spread across zones in a way that survives
+    the loss of a zone without slowing down coordination.
+
+    Database replicas need to span more than one zone when the deployment
+    does, so that losing a zone doesn't lose every copy of the data. A
+    ZooKeeper ensemble with a majority in one zone reaches its quorum without
+    cross-zone round trips, but one spread evenly survives losing any zone,
+    so a missing majority is only a warning unless zookeeper_quorum_zone
+    was set.
+
+    Returns:
+      A tuple of two items. The first item is a bool that indicates if the
+      placement is acceptable for the given zones, and the second item is a
+      str that indicates why it isn't (which is empty when it is).
+    """
+    all_zones = set(node.zone for node in nodes)
+
+    database_zones = set()
+    database_count = 0
+    for node in nodes:
+      if node.is_role('database') or node.is_role('db_master') or \
+        node.is_role('db_slave'):
+        database_zones.add(node.zone)
+        database_count += 1
+
+    if len(all_zones) > 1 and database_count > 1 and len(database_zones) < 2:
+      return False, "Database replicas should be spread across more than " \
+        "one zone."
+
+    zookeeper_zones = {}
+    for node in nodes:
+      if node.is_role('zookeeper'):
+        zookeeper_zones[node.zone] = zookeeper_zones.get(node.zone, 0) + 1
+
+    zookeeper_count = sum(zookeeper_zones.values())
+    if zookeeper_count > 1 and \
+      max(zookeeper_zones.values()) * 2 <= zookeeper_count:
+      reason = "A majority of the zookeeper nodes should be in the same " \
+        "zone to keep quorum latency low."
+      if self.zookeeper_quorum_zone:
+        return False, reason
+      AppScaleLogger.warn(reason)
+
+    return True, ""
+
+
+  def get_topology(self):
+    """ Groups the nodes in this NodeLayout by the zone they are in.
+
+    Returns:
+      A dict that maps each zone name to a list of the public IPs (or node IDs)
+      of the nodes in it, which is empty if no zones were given.
+    """
+    topology = {}
+    for node in self.nodes:
+      if node.zone is not None:
+        topology.setdefault(node.zone, []).append(node.public_ip)
+    return topology
+
+
   def is_database_replication_valid(self, nodes):
     """Checks if the database replication factor specified is valid, setting
     it if it is not present.
@@ -680,6 +885,94 @@ class NodeLayout():
     return None
 
 
+  def fingerprint(self):
+    """ Computes a hash of the placement strategy and of the options that
+    affect how it is expanded and validated. The tools version is included,
+    since the rules that expand and validate it change between releases. The
+    hash of the layout as given to the constructor is kept in layout_hash.
+
+    Returns:
+      A str containing a hex digest that changes whenever the layout would
+      compile to a different set of nodes.
+    """
+    layout_inputs = {
+      'ips' : self.input_yaml,
+      'zones' : self.topology,
+      'disks' : self.disks,
+      'infrastructure' : self.infrastructure,
+      'min' : self.min_vms,
+      'max' : self.max_vms,
+      'replication' : self.replication,
+      'login_host' : self.login_host,
+      'table' : self.database_type,
+      'zookeeper_quorum_zone' : self.zookeeper_quorum_zone,
+      'version' : APPSCALE_VERSION
+    }
+    return hashlib.sha1(json.dumps(layout_inputs, sort_keys=True,
+      default=str)).hexdigest()
+
+
+  def to_compiled(self):
+    """ Converts this NodeLayout, once validated, to a dict that can be
+    JSON-dumped and later loaded with load_compiled to skip validation.
+
+    Returns:
+      A dict containing this layout's fingerprint and its expanded nodes, or
+      None if this NodeLayout isn't valid.
+    """
+    if not self.is_valid():
+      return None
+
+    if self.nodes and isinstance(self.nodes[0], SimpleNode):
+      layout_format = 'simple'
+    else:
+      layout_format = 'advanced'
+
+    return {
+      'fingerprint' : self.layout_hash,
+      'format' : layout_format,
+      'replication' : self.replication,
+      'min' : self.min_vms,
+      'max' : self.max_vms,
+      'nodes' : [{
+        'public_ip' : node.public_ip,
+        'cloud' : node.cloud,
+        'roles' : node.roles,
+        'disk' : node.disk,
+        'zone' : node.zone
+      } for node in self.nodes]
+    }
+
+
+  def load_compiled(self, compiled):
+    """ Restores the nodes of this NodeLayout from a dict produced by
+    to_compiled, if it was compiled from the same placement strategy.
+
+    Args:
+      compiled: A dict returned by to_compiled.
+    Returns:
+      True if the compiled layout matched and was loaded, False otherwise.
+    """
+    if self.nodes or compiled.get('fingerprint') != self.layout_hash:
+      return False
+
+    if compiled.get('format') == 'simple':
+      node_class = SimpleNode
+    else:
+      node_class = AdvancedNode
+
+    self.nodes = []
+    for compiled_node in compiled['nodes']:
+      node = node_class(compiled_node['public_ip'], compiled_node['cloud'],
+        compiled_node['roles'], compiled_node['disk'])
+      node.zone = compiled_node.get('zone')
+      self.nodes.append(node)
+    self.replication = compiled['replication']
+    self.min_vms = compiled['min']
+    self.max_vms = compiled['max']
+    return True
+
+
   def to_list(self):
     """ Converts all of the nodes (except the head node) to a format that can
     be easily JSON-dumped (a list of dicts).
@@ -712,15 +1005,27 @@ class NodeLayout():
     return { 'result' : False, 'message' : message }
 
 
-class Node():
+class Node(object):
   """Nodes are a representation of a virtual machine in an AppScale deployment.
   Callers should not use this class directly, but should instead use SimpleNode
   or AdvancedNode, depending on the deployment type.
+
+  Layouts can contain tens of thousands of Nodes, so each Node uses __slots__,
+  keeps its roles as a bitmask over NodeLayout.VALID_ROLES, and caches its JSON
+  representation until one of its fields changes.
   """
 
+  __slots__ = ('public_ip', 'private_ip', 'instance_id', 'cloud', 'disk',
+    'zone', '_role_mask', '_other_roles', '_json', '_json_key')
+
   DUMMY_INSTANCE_ID = "i-APPSCALE"
 
-  def __init__(self, public_ip, cloud, roles=[], disk=None):
+  # Maps each role the AppController recognizes to the bit that represents it
+  # in a Node's role mask.
+  ROLE_BITS = dict((role, 1 << index) for index, role in
+    enumerate(NodeLayout.VALID_ROLES))
+
+  def __init__(self, public_ip, cloud, roles=(), disk=None, zone=None):
     """Creates a new Node, representing the given id in the specified cloud.
 
 
@@ -731,16 +1036,73 @@ class Node():
       cloud: The cloud that this Node belongs to.
       roles: A list of roles that this Node will run in an AppScale deployment.
       disk: The name of the persistent disk that this node backs up data to.
+      zone: The name of the zone or rack that this node is in, if known.
     """
     self.public_ip = public_ip
     self.private_ip = public_ip
     self.instance_id = self.DUMMY_INSTANCE_ID
     self.cloud = cloud
-    self.roles = roles
     self.disk = disk
+    self.zone = zone
+    self._json = None
+    self._json_key = None
+    self.roles = roles
+
+
+  @property
+  def roles(self):
+    """A list of the roles that this Node runs, in the order they appear in
+    NodeLayout.VALID_ROLES, followed by any roles the AppController doesn't
+    recognize.
+    """
+    roles = [role for role in NodeLayout.VALID_ROLES
+      if self._role_mask & self.ROLE_BITS[role]]
+    return roles + list(self._other_roles)
+
+
+  @roles.setter
+  def roles(self, roles):
+    self._role_mask = 0
+    self._other_roles = ()
+    for role in roles:
+      self.set_role(role)
     self.expand_roles()
 
 
+  def set_role(self, role):
+    """Marks this Node as running the given role, without expanding any
+    composite roles.
+
+    Args:
+      role: A str naming the role to add.
+    """
+    bit = self.ROLE_BITS.get(role)
+    if bit:
+      self._role_mask |= bit
+    elif role not in self._other_roles:
+      self._other_roles += (role,)
+
+
+  def remove_role(self, role):
+    """Stops this Node from running the given role.
+
+    Args:
+      role: A str naming the role to remove.
+    Returns:
+      True if this Node ran the given role, False otherwise.
+    """
+    if not self.is_role(role):
+      return False
+
+    bit = self.ROLE_BITS.get(role)
+    if bit:
+      self._role_mask &= ~bit
+    else:
+      self._other_roles = tuple(other for other in self._other_roles
+        if other != role)
+    return True
+
+
   def add_db_role(self, is_master):
     """Adds a database master or slave role to this Node, depending on
     the argument given.
@@ -776,7 +1138,7 @@ class Node():
         represents several internal roles), then we automatically perform
         this conversion for the caller.
     """
-    self.roles.append(role)
+    self.set_role(role)
     self.expand_roles()
 
 
@@ -788,10 +1150,11 @@ class Node():
     Returns:
       True if this Node runs the given role, False otherwise.
     """
-    if role in self.roles:
-      return True
+    bit = self.ROLE_BITS.get(role)
+    if bit:
+      return bool(self._role_mask & bit)
     else:
-      return False
+      return role in self._other_roles
 
   
   def is_valid(self):
@@ -815,11 +1178,7 @@ class Node():
       A list of strs, each of which representing a reason why this Node cannot
       operate in an AppScale deployment.
     """
-    errors = []
-    for role in self.roles:
-      if not role in NodeLayout.VALID_ROLES:
-        errors.append("Invalid role: {0}".format(role))
-    return errors
+    return ["Invalid role: {0}".format(role) for role in self._other_roles]
 
 
   def expand_roles(self):
@@ -830,13 +1189,30 @@ class Node():
     raise NotImplementedError
 
   def to_json(self):
-    return {
-      'public_ip': self.public_ip,
-      'private_ip': self.private_ip,
-      'instance_id': self.instance_id,
-      'jobs': self.roles,
-      'disk': self.disk
-    }
+    """Converts this Node to a dict that can be JSON-dumped and sent to the
+    AppController.
+
+    The dict is built once and cached until one of this Node's fields
+    changes, and each caller gets its own copy to modify.
+
+    Returns:
+      A dict containing this Node's addresses, instance ID, roles, and disk,
+      as well as its zone if it has one.
+    """
+    key = (self.public_ip, self.private_ip, self.instance_id,
+      self._role_mask, self._other_roles, self.disk, self.zone)
+    if self._json_key != key:
+      self._json = {
+        'public_ip': self.public_ip,
+        'private_ip': self.private_ip,
+        'instance_id': self.instance_id,
+        'jobs': self.roles,
+        'disk': self.disk
+      }
+      if self.zone is not None:
+        self._json['zone'] = self.zone
+      self._json_key = key
+    return dict(self._json, jobs=list(self._json['jobs']))
 
 
 class SimpleNode(Node):
@@ -844,32 +1220,23 @@ class SimpleNode(Node):
   the roles that users can specify in simple deployments.
   """
 
+  __slots__ = ()
+
 
   def expand_roles(self):
     """Converts the 'controller' and 'servers' composite roles into the roles
     that they represent.
     """
-    if 'controller' in self.roles:
-      self.roles.remove('controller')
-      self.roles.append('shadow')
-      self.roles.append('load_balancer')
-      self.roles.append('database')
-      self.roles.append('memcache')
-      self.roles.append('login')
-      self.roles.append('zookeeper')
-      self.roles.append('taskqueue')
+    if self.remove_role('controller'):
+      for role in ('shadow', 'load_balancer', 'database', 'memcache', 'login',
+        'zookeeper', 'taskqueue'):
+        self.set_role(role)
 
     # If they specify a servers role, expand it out to
     # be database, appengine, and memcache
-    if 'servers' in self.roles:
-      self.roles.remove('servers')
-      self.roles.append('appengine')
-      self.roles.append('memcache')
-      self.roles.append('database')
-      self.roles.append('taskqueue')
-
-    # Remove any duplicate roles
-    self.roles = list(set(self.roles))
+    if self.remove_role('servers'):
+      for role in ('appengine', 'memcache', 'database', 'taskqueue'):
+        self.set_role(role)
 
 
 class AdvancedNode(Node):
@@ -877,23 +1244,21 @@ class AdvancedNode(Node):
   with the roles that users can specify in advanced deployments.
   """
 
+  __slots__ = ()
+
 
   def expand_roles(self):
     """Converts the 'master' composite role into the roles it represents, and
     adds dependencies necessary for the 'login' and 'database' roles.
     """
-    if 'master' in self.roles:
-      self.roles.remove('master')
-      self.roles.append('shadow')
-      self.roles.append('load_balancer')
+    if self.remove_role('master'):
+      self.set_role('shadow')
+      self.set_role('load_balancer')
 
-    if 'login' in self.roles:
-      self.roles.append('load_balancer')
+    if self.is_role('login'):
+      self.set_role('load_balancer')
 
     # TODO(cgb): Look into whether or not the database still needs memcache
     # support. If not, remove this addition and the validation of it above.
-    if 'database' in self.roles:
-      self.roles.append('memcache')
-
-    # Remove any duplicate roles
-    self.roles = list(set(self.roles))
+    if self.is_role('database'):
+      self.set_role('memcache')
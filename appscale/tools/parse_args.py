@@ -21,9 +21,11 @@ from agents.base_agent import BaseAgent
 from agents.ec2_agent import EC2Agent
 from agents.gce_agent import GCEAgent
 from agents.factory import InfrastructureAgentFactory
+from app_compression import AppCompression
 from custom_exceptions import BadConfigurationException
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
+from warm_pool import WarmPool
 
 
 class ParseArgs(object):
@@ -183,6 +185,12 @@ class ParseArgs(object):
         help="a YAML file dictating the placement strategy")
       self.parser.add_argument('--ips_layout',
         help="a base64-encoded YAML dictating the placement strategy")
+      self.parser.add_argument('--capacities',
+        help="a base64-encoded YAML dictating the CPU, RAM and disk of each " +
+          "node, used to generate the placement strategy")
+      self.parser.add_argument('--zookeeper_quorum_zone', action='store_true',
+        default=False,
+        help="requires a majority of the ZooKeeper nodes to share a zone")
 
       # Infrastructure-agnostic flags
       self.parser.add_argument('--disks',
@@ -333,6 +341,8 @@ class ParseArgs(object):
     elif function == "appscale-upload-app":
       self.parser.add_argument('--file',
         help="a directory containing the Google App Engine app to upload")
+      self.parser.add_argument('--files', nargs='+',
+        help="several Google App Engine apps to upload together")
       self.parser.add_argument('--keyname', '-k',
         default=self.DEFAULT_KEYNAME,
         help="the keypair name to use")
@@ -341,6 +351,17 @@ class ParseArgs(object):
         help="uses a default username and password for cloud admin")
       self.parser.add_argument('--email',
         help="the e-mail address to use as the app's admin")
+      self.parser.add_argument('--incremental', action='store_true',
+        default=False,
+        help="only sends the files that changed since the app's last upload")
+      self.parser.add_argument('--compression', default=AppCompression.AUTO,
+        help="how to compress the app on its way: gzip, pigz, zstd or none, " \
+          "optionally with a level (e.g., zstd:19), or auto to choose from " \
+          "the app's contents")
+      self.parser.add_argument('--dry-run', action='store_true',
+        default=False,
+        help="reports which files would be uploaded and how much the app's " \
+          "ignore rules leave out, without uploading anything")
     elif function == "appscale-terminate-instances":
       self.parser.add_argument('--keyname', '-k',
         default=self.DEFAULT_KEYNAME,
@@ -359,6 +380,15 @@ class ParseArgs(object):
       self.parser.add_argument('--terminate', action="store_true",
         default=False,
         help="terminate running instances (if in cloud environment)")
+      self.parser.add_argument('--warm_pool_size', type=int, default=0,
+        help="the number of instances to stop and keep for the next start, " \
+          "instead of terminating them")
+      self.parser.add_argument('--warm_pool_expiry', type=float,
+        default=WarmPool.DEFAULT_EXPIRY,
+        help="the number of hours that stopped instances are kept for")
+      self.parser.add_argument('--drain_pool', action='store_true',
+        default=False,
+        help="terminate the stopped instances kept for the next start, too")
     elif function == "appscale-remove-app":
       self.parser.add_argument('--keyname', '-k', default=self.DEFAULT_KEYNAME,
         help="the keypair name to use")
@@ -407,6 +437,48 @@ class ParseArgs(object):
       self.parser.add_argument(
         '--test', action='store_true', default=False,
         help='Skips user input when upgrading deployment')
+    elif function == "appscale-create-image":
+      self.parser.add_argument('--keyname', '-k', default=self.DEFAULT_KEYNAME,
+        help="the keypair name to use")
+      self.parser.add_argument('--EC2_ACCESS_KEY',
+        help="the access key that identifies this user in an EC2-compatible" + \
+          " service")
+      self.parser.add_argument('--EC2_SECRET_KEY',
+        help="the secret key that identifies this user in an EC2-compatible" + \
+          " service")
+      self.parser.add_argument('--EC2_URL',
+        help="a URL that identifies where an EC2-compatible service runs")
+      self.parser.add_argument('--node', type=int,
+        help="the index of the node to make the image from (the first node " \
+          "that holds no data by default)")
+      self.parser.add_argument('--image_name',
+        help="the name of the new image")
+      self.parser.add_argument(
+        '--test', action='store_true', default=False,
+        help='Skips user input when creating the image')
+    elif function == "appscale-update-layout":
+      self.parser.add_argument('--keyname', '-k', default=self.DEFAULT_KEYNAME,
+        help="the keypair name to use")
+      self.parser.add_argument('--ips',
+        help="a YAML file dictating the new placement strategy")
+      self.parser.add_argument('--ips_layout',
+        help="a base64-encoded YAML dictating the new placement strategy")
+      self.parser.add_argument('--disks',
+        help="a base64-encoded YAML dictating the PD or EBS disks in use")
+      self.parser.add_argument('--table',
+        default=self.DEFAULT_DATASTORE,
+        choices=self.ALLOWED_DATASTORES,
+        help="the datastore in use")
+      self.parser.add_argument('--replication', '--n', type=int,
+        help="the database replication factor")
+      self.parser.add_argument('--login_host',
+        help="override the provided login host with this one")
+      self.parser.add_argument('--zookeeper_quorum_zone', action='store_true',
+        default=False,
+        help="requires a majority of the ZooKeeper nodes to share a zone")
+      self.parser.add_argument(
+        '--test', action='store_true', default=False,
+        help='Skips user input when updating the placement strategy')
     else:
       raise SystemExit
 
@@ -423,10 +495,13 @@ class ParseArgs(object):
     """
     if function == "appscale-run-instances":
       self.validate_ips_flags()
+      self.validate_capacities_flag()
+      self.validate_topology_flags()
       self.validate_num_of_vms_flags()
       self.validate_infrastructure_flags()
       self.validate_environment_flags()
       self.validate_credentials()
+      self.choose_spot_zone()
       self.validate_machine_image()
       self.validate_database_flags()
       self.validate_appengine_flags()
@@ -434,15 +509,20 @@ class ParseArgs(object):
     elif function == "appscale-add-keypair":
       self.validate_ips_flags()
     elif function == "appscale-upload-app":
-      if not self.args.file:
-        raise SystemExit("Must specify --file.")
-      else:
-        self.shell_check(self.args.file)
+      if not self.args.file and not self.args.files:
+        raise SystemExit("Must specify --file or --files.")
+      elif self.args.file and self.args.files:
+        raise SystemExit("Can't specify both --file and --files.")
+      for app_file in self.args.files or [self.args.file]:
+        self.shell_check(app_file)
+      if self.args.compression != AppCompression.AUTO:
+        AppCompression.parse(self.args.compression)
     elif function == "appscale-gather-logs":
       if not self.args.location:
         self.args.location = "/tmp/{0}-logs/".format(self.args.keyname)
     elif function == "appscale-terminate-instances":
       self.validate_environment_flags()
+      self.validate_warm_pool_flags()
     elif function == "appscale-remove-app":
       if not self.args.appname:
         raise SystemExit("Must specify appname")
@@ -482,6 +562,22 @@ class ParseArgs(object):
       pass
     elif function == "appscale-upgrade":
       pass
+    elif function == "appscale-create-image":
+      self.validate_environment_flags()
+      if self.args.node is not None and self.args.node < 0:
+        raise BadConfigurationException("The node to make an image from " + \
+          "can't be negative.")
+    elif function == "appscale-update-layout":
+      if self.args.ips:
+        with open(self.args.ips, 'r') as file_handle:
+          self.args.ips = yaml.safe_load(file_handle.read())
+      elif self.args.ips_layout:
+        self.validate_ips_flags()
+      else:
+        raise BadConfigurationException("Need to specify the new placement " +
+          "strategy with --ips or --ips_layout.")
+      self.validate_disks_flag()
+      self.validate_database_flags()
     else:
       raise SystemExit
 
@@ -494,7 +590,9 @@ class ParseArgs(object):
       BadConfigurationException: If the values for the min or max
         flags are invalid.
     """
-    if self.args.ips:
+    # The number of machines comes from the placement strategy, or from the
+    # nodes it is generated for.
+    if self.args.ips or self.args.capacities:
       return
 
     # if min is not set and max is, set min == max
@@ -523,6 +621,48 @@ class ParseArgs(object):
       self.args.ips = yaml.safe_load(base64.b64decode(self.args.ips_layout))
 
 
+  def validate_capacities_flag(self):
+    """If the user wants the placement strategy generated for their nodes,
+    makes sure they gave us a dictionary mapping each node ID to a dictionary
+    of the resources it has.
+
+    Raises:
+      BadConfigurationException: If the capacities aren't in the right format,
+        or are given along with a placement strategy.
+    """
+    if not self.args.capacities:
+      return
+
+    if self.args.ips:
+      raise BadConfigurationException("Cannot specify --capacities along " +
+        "with a placement strategy.")
+
+    self.args.capacities = yaml.safe_load(base64.b64decode(
+      self.args.capacities))
+    if not isinstance(self.args.capacities, dict):
+      raise BadConfigurationException("--capacities must be a dict, but " \
+        "was a {0}".format(type(self.args.capacities)))
+
+    for node_id, capacity in self.args.capacities.iteritems():
+      if not isinstance(capacity, dict):
+        raise BadConfigurationException("The capacity of node {0} must be a " \
+          "dict, but was a {1}".format(node_id, type(capacity)))
+
+
+  def validate_topology_flags(self):
+    """Makes sure that the ZooKeeper quorum-zone rule is only asked for when
+    we know which zone each node is in.
+
+    Raises:
+      BadConfigurationException: If zookeeper_quorum_zone is given without a
+        placement strategy or capacities to label the zones.
+    """
+    if self.args.zookeeper_quorum_zone and not (self.args.ips or
+      self.args.capacities):
+      raise BadConfigurationException("--zookeeper_quorum_zone needs the " +
+        "zones of the nodes, from --ips, --ips_layout or --capacities.")
+
+
   def validate_environment_flags(self):
     """Validates flags dealing with setting environment variables.
 
@@ -548,6 +688,30 @@ class ParseArgs(object):
       os.environ['EC2_URL'] = self.args.EC2_URL
 
 
+  def validate_warm_pool_flags(self):
+    """Validates the flags that control how many stopped instances are kept
+    for the next time this deployment starts.
+
+    Raises:
+      BadConfigurationException: If the pool size or expiry is invalid.
+    """
+    if self.args.warm_pool_size < 0:
+      raise BadConfigurationException("The warm pool size can't be " + \
+        "negative.")
+
+    if self.args.warm_pool_expiry <= 0:
+      raise BadConfigurationException("The warm pool expiry must be a " + \
+        "positive number of hours.")
+
+    if self.args.drain_pool and not self.args.terminate:
+      raise BadConfigurationException("The warm pool can only be drained " + \
+        "when terminating instances.")
+
+    if self.args.drain_pool and self.args.warm_pool_size:
+      raise BadConfigurationException("Can't keep instances in the warm " + \
+        "pool while draining it.")
+
+
   def validate_infrastructure_flags(self):
     """Validates flags corresponding to cloud infrastructures.
 
@@ -614,14 +778,7 @@ class ParseArgs(object):
       raise BadConfigurationException("Can't have a max spot instance price" + \
         " if --use_spot_instances is not set.")
 
-    # If the user does want to use persistent disks, make sure they specified
-    # them in the right format, a dictionary mapping node IDs to disk names.
-    if self.args.disks:
-      self.args.disks = yaml.safe_load(base64.b64decode(self.args.disks))
-
-      if not isinstance(self.args.disks, dict):
-        raise BadConfigurationException("--disks must be a dict, but was a " \
-          "{0}".format(type(self.args.disks)))
+    self.validate_disks_flag()
 
     if not self.args.instance_type:
       raise BadConfigurationException("Cannot start a cloud instance without " \
@@ -648,6 +805,22 @@ class ParseArgs(object):
         raise BadConfigurationException("Cannot authenticate an Azure instance " \
                                         "without the Tenant ID.")
 
+  def validate_disks_flag(self):
+    """If the user does want to use persistent disks, makes sure they
+    specified them in the right format, a dictionary mapping node IDs to disk
+    names.
+
+    Raises:
+      BadConfigurationException: If the disks aren't given as a dict.
+    """
+    if self.args.disks:
+      self.args.disks = yaml.safe_load(base64.b64decode(self.args.disks))
+
+      if not isinstance(self.args.disks, dict):
+        raise BadConfigurationException("--disks must be a dict, but was a " \
+          "{0}".format(type(self.args.disks)))
+
+
   def validate_credentials(self):
     """If running over a cloud infrastructure, makes sure that all of the
     necessary credentials have been specified.
@@ -661,12 +834,44 @@ class ParseArgs(object):
     cloud_agent.assert_required_parameters(params, BaseAgent.OPERATION_RUN)
 
 
+  def choose_spot_zone(self):
+    """If the user wants spot instances on EC2 without naming an availability
+    zone, picks the zone whose spot prices suit the deployment's size best,
+    so that every node gets started there.
+    """
+    if self.args.infrastructure != 'ec2' or not self.args.use_spot_instances \
+      or self.args.zone:
+      return
+
+    if self.args.max:
+      count = self.args.max
+    elif isinstance(self.args.ips, dict):
+      nodes = set()
+      for value in self.args.ips.values():
+        if isinstance(value, list):
+          nodes.update(value)
+        elif isinstance(value, str):
+          nodes.add(value)
+      count = max(len(nodes), 1)
+    elif isinstance(self.args.capacities, dict):
+      count = max(len(self.args.capacities), 1)
+    else:
+      count = 1
+
+    cloud_agent = InfrastructureAgentFactory.create_agent(
+      self.args.infrastructure)
+    self.args.zone = cloud_agent.choose_spot_zone(
+      cloud_agent.get_params_from_args(self.args), count)
+
+
   def validate_machine_image(self):
     """Checks with the given cloud (if running in a cloud) to ensure that the
-    user-specified ami/emi exists, aborting if it does not.
+    user-specified ami/emi, zone, static IP and disks exist, aborting if any
+    of them do not.
 
     Raises:
-      BadConfigurationException: If the given machine image does not exist.
+      BadConfigurationException: If anything the deployment refers to does
+        not exist, listing every problem that was found.
     """
     if not self.args.infrastructure:
       return
@@ -675,24 +880,14 @@ class ParseArgs(object):
       self.args.infrastructure)
     params = cloud_agent.get_params_from_args(self.args)
 
-    if not cloud_agent.does_image_exist(params):
-      raise BadConfigurationException("Couldn't find the given machine image.")
-
-    if not cloud_agent.does_zone_exist(params):
-      raise BadConfigurationException("Couldn't find the given zone.")
-
-    # Make sure that if the user gives us an Elastic IP / static IP, that they
-    # actually own it.
-    if self.args.static_ip:
-      if not cloud_agent.does_address_exist(params):
-        raise BadConfigurationException("Couldn't find the given static IP.")
-
-    if not self.args.disks:
-      return
+    disks = []
+    if self.args.disks:
+      disks = self.args.disks.values()
 
-    for disk in set(self.args.disks.values()):
-      if not cloud_agent.does_disk_exist(params, disk):
-        raise BadConfigurationException("Couldn't find disk {0}".format(disk))
+    problems = cloud_agent.preflight(params,
+      check_address=bool(self.args.static_ip), disks=disks)
+    if problems:
+      raise BadConfigurationException("\n".join(problems))
 
 
   def validate_database_flags(self):
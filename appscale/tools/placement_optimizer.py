@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+
+# AppScale-specific imports
+from custom_exceptions import BadConfigurationException
+
+
+class PlacementOptimizer():
+  """PlacementOptimizer decides which roles each machine in an AppScale
+  deployment should run, based on how much CPU, memory, and disk each machine
+  has and how much of each resource every role is expected to consume.
+
+  The layout it produces is an advanced-format placement strategy (a dict
+  mapping roles to node IDs or IP addresses), so it can be handed to a
+  NodeLayout as-is.
+  """
+
+
+  # The resources that we track for each node and role. CPU is measured in
+  # cores, RAM in megabytes, and disk in gigabytes.
+  RESOURCES = ('cpu', 'ram', 'disk')
+
+
+  # The resources that each role is expected to consume. Callers can override
+  # any of these via the 'profiles' argument.
+  DEFAULT_ROLE_PROFILES = {
+    'master' : {'cpu' : 1, 'ram' : 1024, 'disk' : 10},
+    'zookeeper' : {'cpu' : 0.5, 'ram' : 512, 'disk' : 5},
+    'database' : {'cpu' : 2, 'ram' : 4096, 'disk' : 50},
+    'taskqueue' : {'cpu' : 0.5, 'ram' : 512, 'disk' : 5},
+    'search' : {'cpu' : 1, 'ram' : 1024, 'disk' : 10},
+    'appengine' : {'cpu' : 1, 'ram' : 2048, 'disk' : 10}
+  }
+
+
+  # The order in which we place roles. Stateful roles with hard count
+  # requirements go first, and appengine takes whatever capacity is left.
+  PLACEMENT_ORDER = ('master', 'database', 'zookeeper', 'taskqueue', 'search')
+
+
+  # The largest ZooKeeper ensemble we create by default. Larger ensembles
+  # only add write latency for the deployment sizes that we target.
+  MAX_DEFAULT_ZOOKEEPER_COUNT = 3
+
+
+  # The largest number of database nodes we create by default when the user
+  # hasn't told us what replication factor to use.
+  MAX_DEFAULT_DATABASE_COUNT = 3
+
+
+  def __init__(self, capacities, replication=None, profiles=None,
+    role_counts=None, zookeeper_quorum_zone=False):
+    """Creates a new PlacementOptimizer.
+
+    Args:
+      capacities: A dict that maps each node ID (node-int in clouds, an IP
+        address in virtualized clusters) to a dict containing its 'cpu', 'ram',
+        and 'disk' capacity, and optionally the 'zone' or rack it is in.
+      replication: An int that indicates how many copies of each piece of data
+        the database should keep, or None to pick one based on the number of
+        nodes.
+      profiles: A dict that maps roles to the resources they consume, used to
+        override entries in DEFAULT_ROLE_PROFILES.
+      role_counts: A dict that maps roles to the number of nodes that should
+        run them, used to override the counts we would otherwise pick.
+      zookeeper_quorum_zone: A bool that indicates if a majority of the
+        ZooKeeper ensemble should share a zone, trading the ability to lose
+        that zone for lower quorum latency. By default, ZooKeeper nodes are
+        spread across zones like database replicas.
+    Raises:
+      BadConfigurationException: If no nodes were given, or if a node is
+        missing one of the resources we track.
+    """
+    if not capacities:
+      raise BadConfigurationException("At least one node must be provided " \
+        "to place roles on.")
+
+    for node_id, capacity in capacities.iteritems():
+      for resource in self.RESOURCES:
+        if resource not in capacity:
+          raise BadConfigurationException("Node {0} does not specify its " \
+            "{1} capacity.".format(node_id, resource))
+
+    zoned_nodes = [node_id for node_id, capacity in capacities.iteritems()
+      if capacity.get('zone') is not None]
+    if zoned_nodes and len(zoned_nodes) != len(capacities):
+      raise BadConfigurationException("Either every node or no node must " \
+        "specify a zone.")
+
+    self.capacities = capacities
+    self.replication = replication
+    self.zookeeper_quorum_zone = zookeeper_quorum_zone
+
+    self.profiles = self.DEFAULT_ROLE_PROFILES.copy()
+    if profiles:
+      self.profiles.update(profiles)
+
+    self.role_counts = role_counts or {}
+
+    # Place on the biggest nodes first, breaking ties by node ID so that the
+    # same input always produces the same layout.
+    self.node_ids = sorted(capacities.keys(),
+      key=lambda node_id: (self.size_of(capacities[node_id]), node_id),
+      reverse=True)
+
+
+  def size_of(self, resources):
+    """Computes a single number that can be used to order nodes or roles by
+    how large they are.
+
+    Args:
+      resources: A dict containing 'cpu', 'ram', and 'disk' amounts.
+    Returns:
+      A tuple that sorts larger resource sets after smaller ones.
+    """
+    return tuple(resources.get(resource, 0) for resource in self.RESOURCES)
+
+
+  def get_role_count(self, role):
+    """Determines how many nodes should run the given role.
+
+    Args:
+      role: A str naming the role to count.
+    Returns:
+      An int indicating how many distinct nodes should host the role.
+    Raises:
+      BadConfigurationException: If the requested count violates the
+        replication or quorum constraints of the role.
+    """
+    num_nodes = len(self.node_ids)
+
+    if role == 'database':
+      default_count = self.replication or \
+        min(num_nodes, self.MAX_DEFAULT_DATABASE_COUNT)
+      count = self.role_counts.get(role, default_count)
+      if self.replication and count < self.replication:
+        raise BadConfigurationException("Replication factor cannot exceed # " \
+          "of databases")
+      return count
+
+    if role == 'zookeeper':
+      count = self.role_counts.get(role,
+        min(num_nodes, self.MAX_DEFAULT_ZOOKEEPER_COUNT))
+      # An even-sized ensemble tolerates no more failures than the odd-sized
+      # ensemble below it, so round down to keep a usable quorum.
+      if count % 2 == 0:
+        if role in self.role_counts:
+          raise BadConfigurationException("The number of zookeeper nodes " \
+            "must be odd to maintain a quorum.")
+        count -= 1
+      return count
+
+    if role == 'master':
+      return 1
+
+    if role == 'search':
+      return self.role_counts.get(role, 0)
+
+    return self.role_counts.get(role, 1)
+
+
+  def fits(self, remaining, role):
+    """Checks if a node with the given remaining resources can host a role.
+
+    Args:
+      remaining: A dict containing the node's unused 'cpu', 'ram', and 'disk'.
+      role: A str naming the role to check.
+    Returns:
+      True if every resource the role needs is still available, False
+      otherwise.
+    """
+    profile = self.profiles[role]
+    for resource in self.RESOURCES:
+      if remaining[resource] < profile.get(resource, 0):
+        return False
+    return True
+
+
+  def headroom(self, remaining, capacity):
+    """Computes how much of its capacity a node still has available, measured
+    by its scarcest resource.
+
+    Args:
+      remaining: A dict containing the node's unused resources.
+      capacity: A dict containing the node's total resources.
+    Returns:
+      A float between 0 and 1, where 1 means that the node is unused.
+    """
+    fractions = []
+    for resource in self.RESOURCES:
+      if capacity[resource]:
+        fractions.append(float(remaining[resource]) / capacity[resource])
+    if not fractions:
+      return 0.0
+    return min(fractions)
+
+
+  def reserve(self, remaining, role):
+    """Subtracts the resources a role consumes from a node's remaining
+    capacity.
+
+    Args:
+      remaining: A dict containing the node's unused resources, which is
+        modified in place.
+      role: A str naming the role being placed.
+    """
+    profile = self.profiles[role]
+    for resource in self.RESOURCES:
+      remaining[resource] -= profile.get(resource, 0)
+
+
+  def generate_layout(self):
+    """Bin-packs every role onto the given nodes, producing an advanced
+    placement strategy.
+
+    Roles with fixed counts are placed in PLACEMENT_ORDER, each copy on a
+    distinct node picked by placement_cost, which spreads heavy roles like
+    the database across nodes (and zones, when given). Every node that still
+    has room for appengine afterwards runs it.
+
+    Returns:
+      A dict that maps each advanced role to the node IDs that run it, which
+      can be passed to a NodeLayout as its 'ips'.
+    Raises:
+      BadConfigurationException: If the nodes do not have enough capacity to
+        satisfy the replication and quorum constraints.
+    """
+    remaining = {}
+    for node_id, capacity in self.capacities.iteritems():
+      remaining[node_id] = dict((resource, capacity[resource])
+        for resource in self.RESOURCES)
+
+    layout = {}
+    for role in self.PLACEMENT_ORDER:
+      count = self.get_role_count(role)
+      if not count:
+        continue
+
+      if count > len(self.node_ids):
+        raise BadConfigurationException("Cannot place {0} copies of {1} on " \
+          "only {2} nodes.".format(count, role, len(self.node_ids)))
+
+      candidates = [node_id for node_id in self.node_ids
+        if self.fits(remaining[node_id], role)]
+
+      # Without an explicit replication factor or count, the database only
+      # goes on the nodes that are big enough for it.
+      if role == 'database' and not self.replication and \
+        role not in self.role_counts and candidates:
+        count = min(count, len(candidates))
+
+      if len(candidates) < count:
+        raise BadConfigurationException("Only {0} nodes have enough capacity " \
+          "to run {1}, but {2} are needed.".format(len(candidates), role,
+          count))
+
+      if role == 'zookeeper' and self.zookeeper_quorum_zone:
+        quorum_zone = self.get_quorum_zone(candidates, count, layout)
+      else:
+        quorum_zone = None
+
+      chosen = []
+      for _ in xrange(count):
+        best = min([node_id for node_id in candidates if node_id not in chosen],
+          key=lambda node_id: self.placement_cost(role, node_id, chosen,
+          remaining, quorum_zone))
+        chosen.append(best)
+        self.reserve(remaining[best], role)
+
+      # NodeLayout makes the first database (and taskqueue) node the master,
+      # so keep the chosen nodes in order of size.
+      chosen = [node_id for node_id in self.node_ids if node_id in chosen]
+      if role == 'master':
+        layout[role] = chosen[0]
+      else:
+        layout[role] = chosen
+
+    appengine_nodes = []
+    for node_id in self.node_ids:
+      if self.fits(remaining[node_id], 'appengine'):
+        self.reserve(remaining[node_id], 'appengine')
+        appengine_nodes.append(node_id)
+
+    if not appengine_nodes:
+      raise BadConfigurationException("No node has enough capacity left to " \
+        "run appengine.")
+
+    layout['appengine'] = appengine_nodes
+
+    zones = {}
+    for node_id in self.node_ids:
+      zone = self.capacities[node_id].get('zone')
+      if zone is not None:
+        zones.setdefault(zone, []).append(node_id)
+    if zones:
+      # NodeLayout reads the zone labels of each node from this key.
+      layout['zones'] = zones
+
+    return layout
+
+
+  def get_quorum_zone(self, candidates, count, layout):
+    """Picks the zone that should hold a majority of the ZooKeeper ensemble.
+
+    Args:
+      candidates: A list of the nodes that have room for ZooKeeper.
+      count: The number of ZooKeeper nodes being placed.
+      layout: The layout built so far, which already names the master.
+    Returns:
+      The head node's zone if it has room for a majority of the ensemble,
+      otherwise the zone with the most candidates, or None if no zones were
+      given.
+    """
+    zone_sizes = {}
+    for node_id in candidates:
+      zone = self.capacities[node_id].get('zone')
+      zone_sizes[zone] = zone_sizes.get(zone, 0) + 1
+
+    master_zone = self.capacities[layout['master']].get('zone')
+    if zone_sizes.get(master_zone, 0) >= count / 2 + 1:
+      return master_zone
+
+    # Ties go to the zone of the biggest node, like every other placement.
+    return max(zone_sizes, key=lambda zone: (zone_sizes[zone], -min(
+      self.node_ids.index(node_id) for node_id in candidates
+      if self.capacities[node_id].get('zone') == zone)))
+
+
+  def placement_cost(self, role, node_id, chosen, remaining, quorum_zone):
+    """Ranks how good a place the given node is for another copy of a role.
+
+    Database replicas and ZooKeeper nodes prefer zones that hold no other
+    copy of the role yet, so that losing a zone doesn't lose the data or the
+    quorum. When a quorum zone is given, ZooKeeper prefers it instead, so
+    that its quorum doesn't wait on cross-zone traffic. After that, nodes
+    with the most headroom left win.
+
+    Args:
+      role: A str naming the role being placed.
+      node_id: The node to rank.
+      chosen: A list of the nodes already picked for this role.
+      remaining: A dict that maps each node to its unused resources.
+      quorum_zone: The zone that ZooKeeper nodes should be placed in, or None
+        to spread them across zones.
+    Returns:
+      A tuple that sorts better placements first.
+    """
+    zone = self.capacities[node_id].get('zone')
+    spread = 0
+    if zone is not None:
+      if role == 'zookeeper' and quorum_zone is not None:
+        spread = int(zone != quorum_zone)
+      elif role in ('database', 'zookeeper'):
+        spread = len([other for other in chosen
+          if self.capacities[other].get('zone') == zone])
+
+    headroom = self.headroom(remaining[node_id], self.capacities[node_id])
+    return (spread, -headroom, self.node_ids.index(node_id))
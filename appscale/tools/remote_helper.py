@@ -4,6 +4,7 @@
 # General-purpose Python library imports
 import getpass
 import os
+import pipes
 import re
 import socket
 import subprocess
@@ -16,6 +17,8 @@ import uuid
 
 # AppScale-specific imports
 from agents.factory import InfrastructureAgentFactory
+from app_compression import AppCompression
+from app_manifest import AppManifest
 from appcontroller_client import AppControllerClient
 from appengine_helper import AppEngineHelper
 from appscale_logger import AppScaleLogger
@@ -24,10 +27,13 @@ from custom_exceptions import AppScaleException
 from custom_exceptions import BadConfigurationException
 from custom_exceptions import ShellException
 from custom_exceptions import TimeoutException
+from ignore_rules import IgnoreRules
 from agents.gce_agent import CredentialTypes
 from agents.gce_agent import GCEAgent
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
+from teardown_engine import TeardownEngine
+from warm_pool import WarmPool
 
 
 class RemoteHelper(object):
@@ -87,6 +93,18 @@ class RemoteHelper(object):
   REMOTE_APP_DIR = "{0}/apps".format(PERSISTENT_MOUNT_POINT)
 
 
+  # The location on AppScale VMs where the files of the last version of each
+  # application uploaded incrementally are kept, along with their manifest.
+  REMOTE_APP_CACHE_DIR = "{0}/app_cache".format(PERSISTENT_MOUNT_POINT)
+
+
+  # The number of bytes that stream_to_host reads from the local command at a
+  # time, and how many seconds pass between its reports on how quickly it is
+  # sending them.
+  STREAM_CHUNK_SIZE = 64 * 1024
+  STREAM_REPORT_INTERVAL = 5
+
+
   # A regular expression that matches AppScale version numbers.
   VERSION_REGEX = "\A\d+\.\d+\.\d+\Z"
 
@@ -95,6 +113,27 @@ class RemoteHelper(object):
   CONFIG_DIR = '/etc/appscale'
 
 
+  # The files and directories that hold a deployment's secrets, keys and
+  # data, which have to be deleted from a node before it is made into an
+  # image.
+  IMAGE_SCRUB_PATHS = [
+    '{0}/secret.key'.format(CONFIG_DIR),
+    '{0}/ssh.key'.format(CONFIG_DIR),
+    '{0}/certs'.format(CONFIG_DIR),
+    '{0}/client_secrets.json'.format(CONFIG_DIR),
+    '{0}/oauth2.dat'.format(CONFIG_DIR),
+    '{0}/appcontroller-state.json'.format(CONFIG_DIR),
+    '/root/.appscale',
+    '/root/.ssh/id_rsa',
+    '/root/.ssh/id_dsa',
+    '/root/.ssh/authorized_keys',
+    REMOTE_APP_DIR,
+    REMOTE_APP_CACHE_DIR,
+    '{0}/cassandra'.format(PERSISTENT_MOUNT_POINT),
+    '{0}/zookeeper'.format(PERSISTENT_MOUNT_POINT)
+  ]
+
+
   @classmethod
   def start_all_nodes(cls, options, count):
     """ Starts all nodes in the designated public cloud.
@@ -247,9 +286,25 @@ class RemoteHelper(object):
       AppScaleLogger.log("Reusing already running instances.")
       return instance_ids, public_ips, private_ips
 
-    agent.configure_instance_security(params)
-    instance_ids, public_ips, private_ips = agent.run_instances(count=count,
-      parameters=params, security_configured=True)
+    # Restart the instances that the last deployment with this keyname left
+    # stopped before launching new ones. The pool kept the keypair and
+    # security group, so they are only set up when there is no pool.
+    pool = WarmPool(options.keyname)
+    if pool.instances and agent.CAN_STOP_INSTANCES:
+      params[agent.PARAM_REUSE_KEYNAME] = True
+      instance_ids, public_ips, private_ips = cls.start_pooled_instances(
+        agent, params, pool, count)
+    else:
+      agent.configure_instance_security(params)
+      instance_ids, public_ips, private_ips = [], [], []
+
+    if len(instance_ids) < count:
+      new_ids, new_public_ips, new_private_ips = agent.run_instances(
+        count=count - len(instance_ids), parameters=params,
+        security_configured=True)
+      instance_ids += new_ids
+      public_ips += new_public_ips
+      private_ips += new_private_ips
 
     if options.static_ip:
       agent.associate_static_ip(params, instance_ids[0], options.static_ip)
@@ -258,6 +313,45 @@ class RemoteHelper(object):
     return instance_ids, public_ips, private_ips
 
 
+  @classmethod
+  def start_pooled_instances(cls, agent, params, pool, count):
+    """Restarts stopped instances from a deployment's warm pool.
+
+    Pooled instances that don't match the new deployment's machine image and
+    instance type, or that have expired, are terminated instead.
+
+    Args:
+      agent: The infrastructure agent for the deployment's cloud.
+      params: A dict containing the parameters needed to reach the cloud.
+      pool: The deployment's WarmPool.
+      count: An int, the most instances to restart.
+    Returns:
+      A tuple of the form (instance_ids, public_ips, private_ips) for the
+      instances that were restarted, which may be empty.
+    """
+    unusable_ids = pool.remove_unusable(params[agent.PARAM_IMAGE_ID],
+      params[agent.PARAM_INSTANCE_TYPE])
+    if unusable_ids:
+      AppScaleLogger.log("Terminating {0} pooled instance(s) that can't be " \
+        "reused.".format(len(unusable_ids)))
+      terminate_params = params.copy()
+      terminate_params[agent.PARAM_INSTANCE_IDS] = unusable_ids
+      agent.terminate_instances(terminate_params)
+
+    pooled_ids = pool.take(count)
+    if not pooled_ids:
+      pool.save()
+      return [], [], []
+
+    AppScaleLogger.log("Restarting {0} instance(s) from the warm pool.".format(
+      len(pooled_ids)))
+    start_params = params.copy()
+    start_params[agent.PARAM_INSTANCE_IDS] = pooled_ids
+    started = agent.start_instances(start_params)
+    pool.save()
+    return started
+
+
   @classmethod
   def sleep_until_port_is_open(cls, host, port, is_verbose):
     """Queries the given host to see if the named port is open, and if not,
@@ -423,6 +517,117 @@ class RemoteHelper(object):
       cls.SSH_OPTIONS, source, user, host, dest), is_verbose, num_retries)
 
 
+  @classmethod
+  def stream_to_host(cls, host, keyname, command, dest, is_verbose,
+    remote_filter=None, user='root',
+    num_retries=LocalState.DEFAULT_NUM_RETRIES):
+    """Runs a command on this machine and streams what it writes to stdout
+    into a file on the named machine, over a single SSH connection, while the
+    command is still running. This overlaps producing the data (e.g.,
+    compressing an archive) with sending it, and nothing is written to the
+    local disk.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      command: A str with the local command whose output should be sent, such
+        as a tar command writing to stdout, or 'cat' on an existing archive.
+      dest: A str representing the path on the remote machine where the
+        output should be written to. It only appears once all of it arrives
+        and the command succeeds, and is left alone otherwise.
+      is_verbose: A bool that indicates if we should print the commands we
+        execute to stdout.
+      remote_filter: A str with a command on the remote machine that the
+        output is piped through before it is written, or None to write it as
+        it arrives.
+      user: A str representing the user to log in as.
+      num_retries: The number of times we should try to send the output before
+        aborting.
+    Returns:
+      An int with the number of bytes sent.
+    Raises:
+      ShellException: If, after num_retries attempts, the command or the copy
+        failed.
+    """
+    ssh_key = LocalState.get_key_path_from_name(keyname)
+    # The output is only moved into place after the local command succeeds,
+    # since the remote side can't tell a truncated stream from a whole one.
+    remote_command = "cat > {0}.part".format(dest)
+    if remote_filter:
+      remote_command = "set -o pipefail; {0} > {1}.part".format(remote_filter,
+        dest)
+    ssh_command = "ssh -F /dev/null -i {0} {1} {2}@{3} {4}".format(ssh_key,
+      cls.SSH_OPTIONS, user, host, pipes.quote(remote_command))
+
+    for tries_left in range(num_retries - 1, -1, -1):
+      AppScaleLogger.verbose("shell> {0} | {1}".format(command, ssh_command),
+        is_verbose)
+      local = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
+      remote = subprocess.Popen(ssh_command, shell=True,
+        stdin=subprocess.PIPE)
+
+      start = last_report = time.time()
+      sent = 0
+      try:
+        for chunk in iter(lambda: local.stdout.read(cls.STREAM_CHUNK_SIZE),
+          b''):
+          remote.stdin.write(chunk)
+          sent += len(chunk)
+          if time.time() - last_report >= cls.STREAM_REPORT_INTERVAL:
+            last_report = time.time()
+            AppScaleLogger.log(cls.describe_throughput(sent,
+              last_report - start))
+      except IOError:
+        # The SSH connection went away, so its exit status says why.
+        pass
+
+      if local.poll() is None:
+        local.kill()
+      local_status = local.wait()
+      if local_status == 0:
+        try:
+          remote.stdin.close()
+        except IOError:
+          pass
+      else:
+        remote.kill()
+      if remote.wait() == 0 and local_status == 0:
+        cls.ssh(host, keyname, "mv {0}.part {0}".format(dest), is_verbose,
+          user=user, num_retries=num_retries)
+        AppScaleLogger.log(cls.describe_throughput(sent, time.time() - start))
+        return sent
+
+      if tries_left:
+        AppScaleLogger.verbose("Streaming to {0} failed. Trying again " \
+          "momentarily.".format(host), is_verbose)
+        time.sleep(1)
+
+    try:
+      cls.ssh(host, keyname, "rm -f {0}.part".format(dest), is_verbose,
+        user=user, num_retries=1)
+    except ShellException:
+      # The host may be the reason streaming failed, and the partial output
+      # is overwritten by the next attempt anyway.
+      pass
+    raise ShellException("Streaming the output of '{0}' to {1}:{2} failed." \
+      .format(command, host, dest))
+
+
+  @classmethod
+  def describe_throughput(cls, sent, seconds):
+    """Describes how quickly data was sent.
+
+    Args:
+      sent: An int with the number of bytes sent.
+      seconds: A number indicating how long sending them took.
+    Returns:
+      A str with the amount of data sent and the rate it was sent at.
+    """
+    megabytes = sent / (1024.0 * 1024.0)
+    return "Sent {0:.1f} MB in {1:.1f} seconds ({2:.1f} MB/s)".format(
+      megabytes, seconds, megabytes / max(seconds, 0.001))
+
+
   @classmethod
   def scp_remote_to_local(cls, host, keyname, source, dest, is_verbose,
     user='root'):
@@ -802,13 +1007,24 @@ class RemoteHelper(object):
 
 
   @classmethod
-  def terminate_cloud_infrastructure(cls, keyname, is_verbose):
+  def terminate_cloud_infrastructure(cls, keyname, is_verbose,
+    warm_pool_size=0, warm_pool_expiry=WarmPool.DEFAULT_EXPIRY,
+    drain_pool=False):
     """Powers off all machines in the currently running AppScale deployment.
 
+    Instances in the deployment's warm pool that have expired are terminated
+    too, and once the pool is empty, the keypair and security group are
+    deleted.
+
     Args:
       keyname: The name of the SSH keypair used for this AppScale deployment.
       is_verbose: A bool that indicates if we should print the commands executed
         to stdout.
+      warm_pool_size: An int, the most stopped instances to keep for the next
+        deployment with this keyname instead of terminating them.
+      warm_pool_expiry: A number, the hours that stopped instances are kept.
+      drain_pool: A bool that indicates if every instance in the warm pool
+        should be terminated, instead of only the expired ones.
     """
     AppScaleLogger.log("About to terminate deployment and instances with "
                        "keyname {0}. Press Ctrl-C to stop.".format(keyname))
@@ -826,25 +1042,222 @@ class RemoteHelper(object):
     _, _, instance_ids = agent.describe_instances(params, pending=pending)
 
     # If using persistent disks, unmount them and detach them before we blow
-    # away the instances.
+    # away each instance, and only delete the keyname and group once they're
+    # all gone. Each step runs on every node at once.
+    engine = TeardownEngine()
     nodes = LocalState.get_local_nodes_info(keyname)
-    for node in nodes:
-      if node.get('disk'):
-        AppScaleLogger.log("Unmounting persistent disk at {0}".
-                           format(node['public_ip']))
-        cls.unmount_persistent_disk(node['public_ip'], keyname, is_verbose)
-        agent.detach_disk(params, node['disk'], node['instance_id'])
-
-    # terminate all the machines
-    AppScaleLogger.log("Terminating instances spawned with keyname {0}"
-                       .format(keyname))
-    params[agent.PARAM_INSTANCE_IDS] = instance_ids
-    agent.terminate_instances(params)
+    detach_steps = cls.add_disk_teardown_steps(engine, agent, params, nodes,
+      keyname, is_verbose)
+
+    # Expired instances leave the pool now rather than at the next start,
+    # which may never come.
+    pool = WarmPool(keyname)
+    if drain_pool:
+      leaving_ids = [instance['instance_id'] for instance in pool.instances]
+    else:
+      leaving_ids = pool.get_expired()
+    pool_steps = []
+    if leaving_ids:
+      AppScaleLogger.log("Terminating {0} instance(s) from the warm pool of " \
+        "keyname {1}".format(len(leaving_ids), keyname))
+      pool_steps.append(engine.add_step('terminate pooled instances',
+        cls.terminate_pooled_instances, (agent, params, pool, leaving_ids)))
+
+    # Spot instances can't be stopped, so they are never pooled.
+    pooled_ids = []
+    if warm_pool_size and not drain_pool and agent.CAN_STOP_INSTANCES and \
+      LocalState.get_infrastructure_option(tag='use_spot_instances',
+        keyname=keyname) != 'True':
+      pooled_ids = instance_ids[:pool.get_room(warm_pool_size)]
+
+    if pooled_ids:
+      AppScaleLogger.log("Stopping {0} instance(s) for the warm pool of " \
+        "keyname {1}".format(len(pooled_ids), keyname))
+      pool_steps.append(engine.add_step('stop instances for warm pool',
+        cls.stop_for_warm_pool,
+        (agent, params, pool, pooled_ids,
+          LocalState.get_infrastructure_option(tag='machine', keyname=keyname),
+          LocalState.get_infrastructure_option(tag='instance_type',
+            keyname=keyname), warm_pool_expiry),
+        depends_on=[step for instance_id in pooled_ids
+          for step in detach_steps.get(instance_id, [])]))
+
+    terminated_ids = [instance_id for instance_id in instance_ids
+      if instance_id not in pooled_ids]
+    if terminated_ids:
+      AppScaleLogger.log("Terminating instances spawned with keyname {0}"
+                         .format(keyname))
+    terminate_steps = cls.add_terminate_steps(engine, agent, params,
+      terminated_ids, detach_steps)
+
+    params[agent.PARAM_INSTANCE_IDS] = terminated_ids + leaving_ids
+    engine.add_step('clean up cloud state', cls.clean_up_unless_pooled,
+      (agent, params, pool), depends_on=terminate_steps + pool_steps)
+    engine.run()
+
+
+  @classmethod
+  def clean_up_unless_pooled(cls, agent, params, pool):
+    """Deletes the keypair and security group of a deployment, unless its
+    warm pool still holds instances that use them.
+
+    Args:
+      agent: The infrastructure agent for the deployment's cloud.
+      params: A dict containing the parameters needed to reach the cloud.
+      pool: The deployment's WarmPool.
+    """
+    if pool.instances:
+      AppScaleLogger.log("Keeping the keypair and security group for the " \
+        "{0} instance(s) in the warm pool.".format(len(pool.instances)))
+      return
 
-    # delete the keyname and group
     agent.cleanup_state(params)
 
 
+  @classmethod
+  def stop_for_warm_pool(cls, agent, params, pool, instance_ids, machine,
+    instance_type, expiry):
+    """Stops the given instances and adds them to a deployment's warm pool.
+    If they can't be stopped, they are terminated instead, so that they don't
+    keep running without the pool knowing about them.
+
+    Args:
+      agent: The infrastructure agent for the deployment's cloud.
+      params: A dict containing the parameters needed to reach the cloud.
+      pool: The deployment's WarmPool.
+      instance_ids: A list of the instance IDs of the machines to stop.
+      machine: A str that names the machine image the instances run.
+      instance_type: A str that names the instances' type.
+      expiry: A number, the hours that the stopped instances are kept.
+    """
+    stop_params = params.copy()
+    stop_params[agent.PARAM_INSTANCE_IDS] = instance_ids
+    try:
+      agent.stop_instances(stop_params)
+    except Exception as exception:
+      AppScaleLogger.warn("Could not stop {0} for the warm pool, so " \
+        "terminating them instead: {1}".format(', '.join(instance_ids),
+        exception))
+      agent.terminate_instances(stop_params)
+      return
+
+    pool.add(instance_ids, machine, instance_type, expiry)
+
+
+  @classmethod
+  def terminate_pooled_instances(cls, agent, params, pool, instance_ids):
+    """Terminates instances from a deployment's warm pool, removing them from
+    the pool once they are gone.
+
+    Args:
+      agent: The infrastructure agent for the deployment's cloud.
+      params: A dict containing the parameters needed to reach the cloud.
+      pool: The deployment's WarmPool.
+      instance_ids: A list of the instance IDs of the pooled machines.
+    """
+    terminate_params = params.copy()
+    terminate_params[agent.PARAM_INSTANCE_IDS] = instance_ids
+    agent.terminate_instances(terminate_params)
+    pool.remove(instance_ids)
+
+
+  @classmethod
+  def add_disk_teardown_steps(cls, engine, agent, params, nodes, keyname,
+    is_verbose, unmount=True):
+    """Adds the steps that unmount and detach the persistent disks of the given
+    nodes to a teardown.
+
+    Args:
+      engine: The TeardownEngine to add steps to.
+      agent: The infrastructure agent that can detach disks.
+      params: A dict containing the parameters needed to reach the cloud.
+      nodes: A list of dicts from the deployment's node_info.
+      keyname: The name of the SSH keypair used for this AppScale deployment.
+      is_verbose: A bool that indicates if we should print the commands executed
+        to stdout.
+      unmount: A bool that indicates if the disks still have to be unmounted
+        over SSH before they are detached.
+    Returns:
+      A dict that maps the instance ID of each node with a disk to a list of
+      the names of the steps that detach it, which that machine should only
+      be terminated after.
+    """
+    detach_steps = {}
+    for node in nodes:
+      if not node.get('disk'):
+        continue
+
+      unmount_steps = []
+      if unmount:
+        unmount_steps.append(engine.add_step(
+          'unmount disk at {0}'.format(node['public_ip']),
+          cls.unmount_persistent_disk,
+          (node['public_ip'], keyname, is_verbose)))
+      detach_steps.setdefault(node['instance_id'], []).append(engine.add_step(
+        'detach disk {0}'.format(node['disk']), agent.detach_disk,
+        (params, node['disk'], node['instance_id']),
+        depends_on=unmount_steps))
+    return detach_steps
+
+
+  @classmethod
+  def add_terminate_steps(cls, engine, agent, params, instance_ids,
+    detach_steps):
+    """Adds a step that terminates the given machines to a teardown, in a
+    single call to the cloud, once their disks have been detached. A disk
+    that can't be detached only keeps its own machine running.
+
+    Args:
+      engine: The TeardownEngine to add steps to.
+      agent: The infrastructure agent that can terminate machines.
+      params: A dict containing the parameters needed to reach the cloud.
+      instance_ids: A list of the instance IDs of the machines to terminate.
+      detach_steps: A dict that maps instance IDs to the names of the steps
+        that have to succeed before that machine is terminated, as returned
+        by add_disk_teardown_steps.
+    Returns:
+      A list of the names of the steps that terminate machines.
+    """
+    if not instance_ids:
+      return []
+
+    return [engine.add_step('terminate instances',
+      cls.terminate_detached_instances,
+      (engine, agent, params.copy(), instance_ids, detach_steps),
+      runs_after=[step for instance_id in instance_ids
+        for step in detach_steps.get(instance_id, [])])]
+
+
+  @classmethod
+  def terminate_detached_instances(cls, engine, agent, params, instance_ids,
+    detach_steps):
+    """Terminates the given machines whose disks were all detached.
+
+    Args:
+      engine: The TeardownEngine running the teardown.
+      agent: The infrastructure agent that can terminate machines.
+      params: A dict containing the parameters needed to reach the cloud.
+      instance_ids: A list of the instance IDs of the machines to terminate.
+      detach_steps: A dict that maps instance IDs to the names of the steps
+        that detach their disks.
+    Raises:
+      AppScaleException: If any machine was kept running because one of its
+        disks couldn't be detached.
+    """
+    detached_ids = [instance_id for instance_id in instance_ids
+      if all(engine.has_succeeded(step)
+        for step in detach_steps.get(instance_id, []))]
+    if detached_ids:
+      params[agent.PARAM_INSTANCE_IDS] = detached_ids
+      agent.terminate_instances(params)
+
+    kept_ids = [instance_id for instance_id in instance_ids
+      if instance_id not in detached_ids]
+    if kept_ids:
+      raise AppScaleException("Kept {0} running, since their disks could " \
+        "not be detached.".format(', '.join(kept_ids)))
+
+
   @classmethod
   def unmount_persistent_disk(cls, host, keyname, is_verbose):
     """Unmounts the persistent disk that was previously mounted on the named
@@ -926,6 +1339,50 @@ class RemoteHelper(object):
                        format(boxes_shut_down))
 
 
+  @classmethod
+  def remove_nodes(cls, nodes, keyname, is_verbose, reachable=True):
+    """Stops AppScale on the given machines and, in cloud deployments, powers
+    them off, leaving the rest of the deployment running.
+
+    Args:
+      nodes: A list of dicts from the deployment's node_info, one per machine
+        that should leave the deployment.
+      keyname: The name of the SSH keypair used for this AppScale deployment.
+      is_verbose: A bool that indicates if we should print the commands executed
+        to stdout.
+      reachable: A bool that indicates if the machines can still be logged in
+        to over SSH. Machines that can't only have their disks detached
+        before they are terminated.
+    """
+    if reachable:
+      threads = []
+      for node in nodes:
+        AppScaleLogger.log("Stopping AppScale at {0}".format(
+          node['public_ip']))
+        thread = threading.Thread(target=cls.stop_remote_appcontroller,
+          args=(node['public_ip'], keyname, is_verbose))
+        thread.start()
+        threads.append(thread)
+
+      for thread in threads:
+        thread.join()
+
+    infrastructure = LocalState.get_infrastructure(keyname)
+    if infrastructure not in InfrastructureAgentFactory.VALID_AGENTS:
+      return
+
+    agent = InfrastructureAgentFactory.create_agent(infrastructure)
+    params = agent.get_cloud_params(keyname)
+    params['IS_VERBOSE'] = is_verbose
+
+    engine = TeardownEngine()
+    detach_steps = cls.add_disk_teardown_steps(engine, agent, params, nodes,
+      keyname, is_verbose, unmount=reachable)
+    cls.add_terminate_steps(engine, agent, params,
+      [node['instance_id'] for node in nodes], detach_steps)
+    engine.run()
+
+
   @classmethod
   def stop_remote_appcontroller(cls, host, keyname, is_verbose):
     """Stops the AppController daemon on the specified host.
@@ -944,7 +1401,31 @@ class RemoteHelper(object):
 
 
   @classmethod
-  def copy_app_to_host(cls, app_location, keyname, is_verbose):
+  def scrub_node_for_image(cls, host, keyname, is_verbose, then_run=None):
+    """Stops AppScale on the given machine and deletes the deployment's
+    secrets, keys and data from it, so that none of them end up in a machine
+    image made from it.
+
+    Args:
+      host: A str naming the machine to scrub.
+      keyname: The name of the SSH keypair used for this AppScale deployment.
+      is_verbose: A bool that indicates if we should print the commands we
+        exec to stdout.
+      then_run: A str with a command to run once the machine is scrubbed.
+        It runs in the same SSH session, since the deployment's key can't log
+        in afterwards.
+    """
+    AppScaleLogger.log("Removing deployment state from {0}".format(host))
+    cls.stop_remote_appcontroller(host, keyname, is_verbose)
+    command = 'rm -rf {0}'.format(' '.join(cls.IMAGE_SCRUB_PATHS))
+    if then_run:
+      command = '{0} && {1}'.format(command, then_run)
+    cls.ssh(host, keyname, command, is_verbose)
+
+
+  @classmethod
+  def copy_app_to_host(cls, app_location, keyname, is_verbose,
+    incremental=False, compression=AppCompression.AUTO):
     """Copies the given application to a machine running the Login service
     within an AppScale deployment.
 
@@ -955,29 +1436,167 @@ class RemoteHelper(object):
         AppScale deployment.
       is_verbose: A bool that indicates if we should print the commands we exec
         to copy the app to the remote host to stdout.
+      incremental: A bool that indicates if we should only send the files that
+        changed since the application was last uploaded.
+      compression: A str naming how to compress the application on its way,
+        as accepted by AppCompression.choose.
 
     Returns:
       A str corresponding to the location on the remote filesystem where the
         application was copied to.
     """
     app_id = AppEngineHelper.get_app_id_from_app_config(app_location)
+    included, ignored = IgnoreRules.from_app(app_location).find_files(
+      app_location)
+    compression = AppCompression.choose(app_location, compression, included)
+    AppScaleLogger.log("Compressing application with {0}".format(compression))
+    if incremental:
+      return cls.copy_app_to_host_incrementally(app_location, app_id, keyname,
+        is_verbose, compression)
+
+    if ignored:
+      AppScaleLogger.log("Leaving out {0} files and directories that match " \
+        "the application's ignore rules".format(len(ignored)))
 
-    AppScaleLogger.log("Tarring application")
     rand = str(uuid.uuid4()).replace('-', '')[:8]
-    local_tarred_app = "{0}/appscale-app-{1}-{2}.tar.gz".\
-      format(tempfile.gettempdir(), app_id, rand)
-    cmd = "cd '{0}' && COPYFILE_DISABLE=1 tar -czhf {1} --exclude='*.pyc' *".\
-      format(app_location, local_tarred_app)
-    LocalState.shell(cmd, is_verbose)
+    local_file_list = "{0}/appscale-app-{1}-{2}.files".format(
+      tempfile.gettempdir(), app_id, rand)
+    # tar reads NUL-separated names verbatim, so names with backslashes,
+    # leading dashes or newlines aren't mangled or taken as options.
+    with open(local_file_list, 'w') as file_handle:
+      file_handle.write("".join(path + "\0" for path in included))
+
+    AppScaleLogger.log("Streaming application to the login node")
+    remote_app_tar = "{0}/{1}.tar.gz".format(cls.REMOTE_APP_DIR, app_id)
+    cmd = "cd '{0}' && COPYFILE_DISABLE=1 tar {1} --null -T {2}".format(
+      app_location, compression.get_tar_flags(), local_file_list)
+    try:
+      cls.stream_to_host(LocalState.get_login_host(keyname), keyname, cmd,
+        remote_app_tar, is_verbose,
+        remote_filter=compression.get_remote_filter())
+    finally:
+      os.remove(local_file_list)
+    return remote_app_tar
+
+
+  @classmethod
+  def copy_archive_to_host(cls, archive_location, app_id, keyname,
+    is_verbose):
+    """Copies an application that is already packaged the way the
+    AppController expects (see AppArchive.can_send_as_is) to a machine
+    running the Login service, without extracting or packing it again.
+
+    Args:
+      archive_location: The location on the local filesystem of the
+        application's .tar.gz file.
+      app_id: A str naming the application.
+      keyname: The name of the SSH keypair that uniquely identifies this
+        AppScale deployment.
+      is_verbose: A bool that indicates if we should print the commands we exec
+        to copy the app to the remote host to stdout.
+
+    Returns:
+      A str corresponding to the location on the remote filesystem where the
+        application was copied to.
+    """
+    AppScaleLogger.log("Streaming application archive to the login node")
+    remote_app_tar = "{0}/{1}.tar.gz".format(cls.REMOTE_APP_DIR, app_id)
+    cls.stream_to_host(LocalState.get_login_host(keyname), keyname,
+      "cat '{0}'".format(archive_location), remote_app_tar, is_verbose)
+    return remote_app_tar
 
-    AppScaleLogger.log("Copying over application")
+
+  @classmethod
+  def copy_app_to_host_incrementally(cls, app_location, app_id, keyname,
+    is_verbose, compression):
+    """Copies only the files in the given application that changed since it
+    was last uploaded to the machine running the Login service, and rebuilds
+    the application's full tarball there.
+
+    The login node keeps the files of the last version uploaded and a
+    manifest of their hashes. If the manifest is missing, every file is sent.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+      app_id: A str naming the application.
+      keyname: The name of the SSH keypair that uniquely identifies this
+        AppScale deployment.
+      is_verbose: A bool that indicates if we should print the commands we exec
+        to copy the app to the remote host to stdout.
+      compression: The AppCompression to send the changed files with.
+
+    Returns:
+      A str corresponding to the location on the remote filesystem where the
+        application's tarball was rebuilt.
+    """
+    login_host = LocalState.get_login_host(keyname)
+    cache_dir = "{0}/{1}".format(cls.REMOTE_APP_CACHE_DIR, app_id)
+    files_dir = "{0}/files".format(cache_dir)
+    remote_manifest = "{0}/{1}".format(cache_dir, AppManifest.FILE_NAME)
+    remote_file_list = "{0}/files.list".format(cache_dir)
     remote_app_tar = "{0}/{1}.tar.gz".format(cls.REMOTE_APP_DIR, app_id)
-    cls.scp(LocalState.get_login_host(keyname), keyname, local_tarred_app,
-            remote_app_tar, is_verbose)
 
-    AppScaleLogger.verbose("Removing local copy of tarred application",
-                           is_verbose)
-    os.remove(local_tarred_app)
+    AppScaleLogger.log("Comparing application with its last upload")
+    manifest = AppManifest.from_directory(app_location)
+    previous = AppManifest.from_json(cls.ssh(login_host, keyname,
+      "cat {0} 2>/dev/null || true".format(remote_manifest), is_verbose))
+    changed, removed = manifest.diff(previous)
+    AppScaleLogger.log("Sending {0} of {1} files ({2} of {3} bytes)".format(
+      len(changed), len(manifest.files), manifest.get_size(changed),
+      manifest.get_size()))
+
+    rand = str(uuid.uuid4()).replace('-', '')[:8]
+    local_prefix = "{0}/appscale-app-{1}-{2}".format(tempfile.gettempdir(),
+      app_id, rand)
+    local_file_list = local_prefix + ".files"
+    local_manifest = local_prefix + ".manifest"
+    local_full_list = local_prefix + ".list"
+    with open(local_file_list, 'w') as file_handle:
+      file_handle.write("".join(path + "\0" for path in changed))
+    with open(local_manifest, 'w') as file_handle:
+      file_handle.write(manifest.to_json())
+    # The full tarball is rebuilt from the manifest's files instead of a shell
+    # glob, which would take names starting with a dash as options and leave a
+    # literal '*' when the application has no files.
+    with open(local_full_list, 'w') as file_handle:
+      file_handle.write("".join(path + "\0" for path in
+        sorted(manifest.files)))
+
+    try:
+      cls.ssh(login_host, keyname, "mkdir -p {0}".format(cache_dir),
+        is_verbose)
+      remote_delta = "{0}/delta.tar.gz".format(cache_dir)
+      cmd = "cd '{0}' && COPYFILE_DISABLE=1 tar {1} --null -T {2}".format(
+        app_location, compression.get_tar_flags(), local_file_list)
+      cls.stream_to_host(login_host, keyname, cmd, remote_delta, is_verbose,
+        remote_filter=compression.get_remote_filter())
+      cls.scp(login_host, keyname, local_manifest, remote_manifest + ".new",
+        is_verbose)
+      cls.scp(login_host, keyname, local_full_list, remote_file_list,
+        is_verbose)
+    finally:
+      for path in (local_file_list, local_manifest, local_full_list):
+        os.remove(path)
+
+    # The old manifest is removed first, so that if rebuilding fails partway,
+    # the next upload sends every file again.
+    commands = ["set -e", "rm -f {0}".format(remote_manifest)]
+    if not previous.files:
+      commands.append("rm -rf {0}".format(files_dir))
+    commands.append("mkdir -p {0} && cd {0}".format(files_dir))
+    commands.extend("rm -f -- {0}".format(pipes.quote(path))
+      for path in removed)
+    commands.extend([
+      "find . -mindepth 1 -type d -empty -delete",
+      "tar -xzf {0} && rm -f {0}".format(remote_delta),
+      "tar -czf {0}.tmp --null -T {1} && mv {0}.tmp {0}".format(
+        remote_app_tar, remote_file_list),
+      "rm -f {0}".format(remote_file_list),
+      "mv {0}.new {0}".format(remote_manifest)
+    ])
+    AppScaleLogger.log("Rebuilding application on the login node")
+    cls.ssh(login_host, keyname, "\n".join(commands), is_verbose)
     return remote_app_tar
 
 
@@ -66,11 +66,15 @@ def main():
       sys.exit(1)
   elif command == "deploy":
     try:
-      if len(sys.argv) != 3:
-        cprint("Usage: appscale deploy <path to your app>", 'red')
+      if len(sys.argv) < 3:
+        cprint("Usage: appscale deploy <path to your app> " \
+          "[<path to another app> ...]", 'red')
         sys.exit(1)
 
-      appscale.deploy(sys.argv[2])
+      results = appscale.deploy(*sys.argv[2:])
+      if isinstance(results, dict) and not all(isinstance(result, tuple)
+        for result in results.values()):
+        sys.exit(1)
     except Exception as exception:
       LocalState.generate_crash_log(exception, traceback.format_exc())
       sys.exit(1)
@@ -147,22 +151,31 @@ def main():
     cprint("Warning: clean has been deprecated. Please use 'down --clean'.", 'red')
     sys.exit(1)
   elif command == "down":
-    if len(sys.argv) > 4:
-      cprint("Usage: appscale down [--clean][--terminate]", 'red')
+    if len(sys.argv) > 5:
+      cprint("Usage: appscale down [--clean][--terminate][--drain-pool]", 'red')
       sys.exit(1)
     to_clean = False
     to_terminate = False
+    to_drain_pool = False
     for index in range(2, len(sys.argv)):
       if sys.argv[index] == "--terminate":
         to_terminate = True
       elif sys.argv[index] == "--clean":
         to_clean = True
+      elif sys.argv[index] == "--drain-pool":
+        to_drain_pool = True
       else:
-        cprint("Usage: appscale down [--clean][--terminate]", 'red')
+        cprint("Usage: appscale down [--clean][--terminate][--drain-pool]",
+          'red')
         sys.exit(1)
 
+    if to_drain_pool and not to_terminate:
+      cprint("Usage: appscale down --terminate --drain-pool", 'red')
+      sys.exit(1)
+
     try:
-      appscale.down(clean=to_clean, terminate=to_terminate)
+      appscale.down(clean=to_clean, terminate=to_terminate,
+        drain_pool=to_drain_pool)
     except Exception as exception:
       LocalState.generate_crash_log(exception, traceback.format_exc())
       sys.exit(1)
@@ -191,6 +204,21 @@ def main():
   elif command in ["--version", "-v"]:
     print APPSCALE_VERSION
     sys.exit(0)
+  elif command == "reshape":
+    try:
+      appscale.reshape()
+    except Exception as exception:
+      LocalState.generate_crash_log(exception, traceback.format_exc())
+      sys.exit(1)
+  elif command == "bake":
+    try:
+      if len(sys.argv) < 3:
+        appscale.bake()
+      else:
+        appscale.bake(int(sys.argv[2]))
+    except Exception as exception:
+      LocalState.generate_crash_log(exception, traceback.format_exc())
+      sys.exit(1)
   elif command == "upgrade":
     try:
         appscale.upgrade()
@@ -17,7 +17,13 @@ def main():
   """ Excecute appscale-upload-app script. """
   options = ParseArgs(sys.argv[1:], "appscale-upload-app").args
   try:
-    AppScaleTools.upload_app(options)
+    if options.files:
+      results = AppScaleTools.upload_apps(options)
+      if results and not all(isinstance(result, tuple)
+        for result in results.values()):
+        sys.exit(1)
+    else:
+      AppScaleTools.upload_app(options)
     sys.exit(0)
   except Exception, e:
     LocalState.generate_crash_log(e, traceback.format_exc())
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import Queue
+import threading
+
+
+# AppScale-specific imports
+from appscale_logger import AppScaleLogger
+from custom_exceptions import BadConfigurationException
+
+
+class TeardownEngine():
+  """TeardownEngine runs the steps needed to take down (part of) an AppScale
+  deployment, such as unmounting disks, detaching them, terminating machines,
+  and deleting firewalls.
+
+  Each step names the steps it depends on. The engine groups steps into
+  levels, where every step in a level only depends on steps in earlier
+  levels, and runs all of the steps in a level concurrently. A step can also
+  just run after other steps, and check which of them succeeded itself.
+  """
+
+
+  # The largest number of steps that we run at the same time. Most steps make
+  # one SSH connection or cloud API call and then wait on it.
+  MAX_CONCURRENT_STEPS = 20
+
+
+  def __init__(self, max_concurrent_steps=MAX_CONCURRENT_STEPS):
+    """Creates a new TeardownEngine with no steps.
+
+    Args:
+      max_concurrent_steps: An int that indicates how many steps may run at
+        the same time.
+    """
+    self.max_concurrent_steps = max_concurrent_steps
+    self.steps = {}
+    self.dependencies = {}
+    self.predecessors = {}
+    self.succeeded = set()
+
+    # Steps are kept in the order they were added, so that levels (and the
+    # progress we log) are ordered the same way every time.
+    self.step_names = []
+
+
+  def add_step(self, name, function, args=(), depends_on=(), runs_after=()):
+    """Adds a step to the teardown.
+
+    Args:
+      name: A str that uniquely identifies this step.
+      function: The function to call to run this step.
+      args: A tuple of arguments to pass to the function.
+      depends_on: A list of the names of steps that have to succeed before
+        this step can run.
+      runs_after: A list of the names of steps that have to finish before
+        this step runs, whether or not they succeed.
+    Returns:
+      The name of the step, so that it can be passed to later steps.
+    Raises:
+      BadConfigurationException: If a step with the same name was already
+        added.
+    """
+    if name in self.steps:
+      raise BadConfigurationException("The teardown step {0} was added " \
+        "twice.".format(name))
+
+    self.steps[name] = (function, tuple(args))
+    self.dependencies[name] = list(depends_on)
+    self.predecessors[name] = list(depends_on) + list(runs_after)
+    self.step_names.append(name)
+    return name
+
+
+  def has_succeeded(self, name):
+    """Checks if the named step has run without failing.
+
+    Args:
+      name: A str naming the step.
+    Returns:
+      True if the step finished without raising an exception, and False if
+      it failed, was skipped, or hasn't run yet.
+    """
+    return name in self.succeeded
+
+
+  def get_levels(self):
+    """Groups the steps in this teardown into levels that can run in order.
+
+    Returns:
+      A list of lists of step names. Every step only depends on steps in the
+      levels before its own.
+    Raises:
+      BadConfigurationException: If a step depends on a step that was never
+        added, or if the dependencies contain a cycle.
+    """
+    for name in self.step_names:
+      for dependency in self.predecessors[name]:
+        if dependency not in self.steps:
+          raise BadConfigurationException("The teardown step {0} depends on " \
+            "the unknown step {1}.".format(name, dependency))
+
+    levels = []
+    placed = set()
+    remaining = list(self.step_names)
+    while remaining:
+      level = [name for name in remaining
+        if all(dependency in placed for dependency in self.predecessors[name])]
+      if not level:
+        raise BadConfigurationException("The teardown steps {0} depend on " \
+          "each other.".format(', '.join(remaining)))
+
+      levels.append(level)
+      placed.update(level)
+      remaining = [name for name in remaining if name not in placed]
+
+    return levels
+
+
+  def run(self):
+    """Runs every step in this teardown, one level at a time.
+
+    A step that fails doesn't stop the teardown, but the steps that depend on
+    it (directly or not) are skipped, since they can't be done safely.
+
+    Raises:
+      BadConfigurationException: If the steps' dependencies are invalid.
+      Exception: The exception raised by the first step that failed, once
+        every step that could run has finished.
+    """
+    levels = self.get_levels()
+    total = len(self.step_names)
+    progress = {'finished' : 0}
+    failures = {}
+    skipped = set()
+
+    for level in levels:
+      runnable = []
+      for name in level:
+        blocked_by = [dependency for dependency in self.dependencies[name]
+          if dependency in failures or dependency in skipped]
+        if blocked_by:
+          AppScaleLogger.warn("Skipping {0}, since {1} did not finish." \
+            .format(name, ', '.join(blocked_by)))
+          skipped.add(name)
+        else:
+          runnable.append(name)
+
+      self.run_level(runnable, total, progress, failures)
+
+    if not failures:
+      return
+
+    AppScaleLogger.warn("{0} of {1} teardown steps failed and {2} were " \
+      "skipped.".format(len(failures), total, len(skipped)))
+    failed_steps = [name for name in self.step_names if name in failures]
+    for name in failed_steps:
+      AppScaleLogger.warn("{0} failed: {1}".format(name, failures[name]))
+
+    # Callers handle the same errors that they did before the teardown ran
+    # concurrently, so pass along the first one.
+    raise failures[failed_steps[0]]
+
+
+  def run_level(self, names, total, progress, failures):
+    """Runs the given steps concurrently, waiting for all of them to finish.
+
+    Args:
+      names: A list of the names of the steps to run.
+      total: The number of steps in the whole teardown, used to report
+        progress.
+      progress: A dict whose 'finished' key counts the steps that have
+        finished so far, which is updated in place.
+      failures: A dict that maps the name of each step that failed to the
+        exception it raised, which is updated in place.
+    """
+    if not names:
+      return
+
+    step_queue = Queue.Queue()
+    for name in names:
+      step_queue.put(name)
+
+    lock = threading.Lock()
+    threads = []
+    for _ in range(min(len(names), self.max_concurrent_steps)):
+      thread = threading.Thread(target=self.run_steps,
+        args=(step_queue, total, progress, failures, lock))
+      thread.start()
+      threads.append(thread)
+
+    for thread in threads:
+      thread.join()
+
+
+  def run_steps(self, step_queue, total, progress, failures, lock):
+    """Runs steps from the given queue until it is empty.
+
+    Args:
+      step_queue: A Queue.Queue of the names of steps left to run.
+      total: The number of steps in the whole teardown.
+      progress: A dict whose 'finished' key counts the finished steps.
+      failures: A dict that maps failed steps to the exceptions they raised.
+      lock: A threading.Lock that guards progress and failures.
+    """
+    while True:
+      try:
+        name = step_queue.get_nowait()
+      except Queue.Empty:
+        return
+
+      function, args = self.steps[name]
+      error = None
+      try:
+        function(*args)
+      except Exception as exception:
+        error = exception
+
+      with lock:
+        progress['finished'] += 1
+        if error is None:
+          self.succeeded.add(name)
+          status = 'done'
+        else:
+          failures[name] = error
+          status = 'failed'
+        AppScaleLogger.log("[{0}/{1}] {2}: {3}".format(progress['finished'],
+          total, name, status))
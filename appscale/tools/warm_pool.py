@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import json
+import os
+import threading
+import time
+
+
+# AppScale-specific imports
+from local_state import LocalState
+
+
+class WarmPool():
+  """WarmPool keeps track of the stopped instances that a cloud deployment
+  left behind when it was taken down, so that the next time it starts with the
+  same keyname it can restart them instead of waiting for new ones to boot.
+
+  The pool is stored in a JSON file named after the keyname. Each instance
+  records the machine image and instance type it was started with, since only
+  instances that match the new deployment can be reused, and when it stops
+  being worth keeping. Teardown steps that run at once can add instances to
+  and remove them from the same pool.
+  """
+
+
+  # The number of hours that a stopped instance is kept in the pool when the
+  # deployment doesn't say otherwise.
+  DEFAULT_EXPIRY = 24
+
+
+  def __init__(self, keyname):
+    """Creates a new WarmPool, reading the instances already in it.
+
+    Args:
+      keyname: A str that names the SSH keypair that uniquely identifies the
+        AppScale deployment whose pool this is.
+    """
+    self.keyname = keyname
+    self.location = LocalState.get_warm_pool_location(keyname)
+    self.instances = self.read()
+    self.lock = threading.Lock()
+
+
+  def read(self):
+    """Reads the instances in this pool from the local filesystem.
+
+    Returns:
+      A list of dicts, one per instance in the pool. The list is empty if this
+      deployment has no pool.
+    """
+    if not os.path.exists(self.location):
+      return []
+
+    with open(self.location, 'r') as file_handle:
+      return json.loads(file_handle.read()).get('instances', [])
+
+
+  def save(self):
+    """Writes the instances in this pool to the local filesystem, removing the
+    file once the pool is empty.
+    """
+    if not self.instances:
+      if os.path.exists(self.location):
+        os.remove(self.location)
+      return
+
+    with open(self.location, 'w') as file_handle:
+      file_handle.write(json.dumps({'instances' : self.instances}))
+
+
+  def get_room(self, size):
+    """Determines how many more instances fit in this pool. Expired instances
+    don't take up room, since they are on their way out.
+
+    Args:
+      size: An int that indicates the most instances the pool can hold.
+    Returns:
+      An int with the number of instances that can still be added.
+    """
+    expired_ids = self.get_expired()
+    return max(size - len(self.instances) + len(expired_ids), 0)
+
+
+  def get_expired(self):
+    """Finds the instances in this pool that have been kept for too long.
+
+    Returns:
+      A list of strs naming the expired instances, which callers should
+      terminate and then remove.
+    """
+    now = time.time()
+    return [instance['instance_id'] for instance in self.instances
+      if instance['expires_at'] <= now]
+
+
+  def add(self, instance_ids, machine, instance_type,
+    expiry=DEFAULT_EXPIRY):
+    """Adds stopped instances to this pool and saves it.
+
+    Args:
+      instance_ids: A list of strs that name the instances that were stopped.
+      machine: A str that names the machine image the instances run.
+      instance_type: A str that names the instances' type.
+      expiry: A number that indicates how many hours the instances are kept.
+    """
+    now = time.time()
+    with self.lock:
+      for instance_id in instance_ids:
+        self.instances.append({
+          'instance_id' : instance_id,
+          'machine' : machine,
+          'instance_type' : instance_type,
+          'expires_at' : now + expiry * 60 * 60
+        })
+      self.save()
+
+
+  def remove(self, instance_ids):
+    """Removes the given instances from this pool and saves it.
+
+    Args:
+      instance_ids: A list of strs that name the instances that were
+        terminated.
+    """
+    with self.lock:
+      self.instances = [instance for instance in self.instances
+        if instance['instance_id'] not in instance_ids]
+      self.save()
+
+
+  def remove_unusable(self, machine, instance_type):
+    """Removes the instances that can't be reused by a deployment with the
+    given machine image and instance type, or that have expired.
+
+    Args:
+      machine: A str that names the machine image the deployment runs.
+      instance_type: A str that names the deployment's instance type.
+    Returns:
+      A list of strs naming the instances that were removed, which callers
+      should terminate.
+    """
+    now = time.time()
+    usable = []
+    unusable = []
+    for instance in self.instances:
+      if instance['machine'] == machine and \
+        instance['instance_type'] == instance_type and \
+        instance['expires_at'] > now:
+        usable.append(instance)
+      else:
+        unusable.append(instance['instance_id'])
+
+    self.instances = usable
+    return unusable
+
+
+  def take(self, count):
+    """Removes up to the given number of instances from this pool.
+
+    Args:
+      count: An int that indicates how many instances are needed.
+    Returns:
+      A list of strs naming the instances that were removed, which callers
+      should restart.
+    """
+    taken = self.instances[:count]
+    self.instances = self.instances[count:]
+    return [instance['instance_id'] for instance in taken]
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+""" Measures how long each way of compressing applications takes to pack
+typical Python, Go and Java applications, how big the archives are, and how
+long they would take to send over links of different speeds.
+
+Uploads stream the archive while it is being packed, and the login node
+gzips archives that arrive with another codec as they come in, so an
+upload takes about as long as the slowest of those three steps.
+
+This isn't part of the unit test suite. Run it with 'rake benchmark' or:
+
+  python test/benchmark_compression.py [megabits_per_second ...]
+"""
+
+
+# General-purpose Python library imports
+from distutils.spawn import find_executable
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Make the local copy of the tools importable when run from a checkout.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+# AppScale imports, the library that we're benchmarking here
+from appscale.tools.app_compression import AppCompression
+
+
+# The link speeds, in megabits per second, that we estimate transfer times
+# for when none are given on the command line.
+DEFAULT_LINK_SPEEDS = (10, 100, 1000)
+
+
+# The compressions that we benchmark, when their programs are installed.
+COMPRESSIONS = ('gzip', 'pigz', 'zstd:3', 'zstd:19', 'none')
+
+
+# Words that generated source files are made of, so that they compress about
+# as well as real code does.
+WORDS = ('def', 'return', 'self', 'import', 'if', 'else', 'for', 'in',
+  'func', 'err', 'nil', 'public', 'static', 'void', 'String', 'int', '(',
+  ')', '{', '}', '=', '==', 'request', 'response', 'user', 'app', 'value')
+
+
+def write_source(path, size, rand):
+  """ Writes a file that looks like source code.
+
+  Args:
+    path: A str naming the file to write.
+    size: An int with the approximate number of bytes to write.
+    rand: The random.Random to pick words with.
+  """
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  lines = []
+  written = 0
+  while written < size:
+    line = "  " * rand.randint(0, 4) + " ".join(rand.choice(WORDS)
+      for _ in range(rand.randint(3, 12)))
+    lines.append(line)
+    written += len(line) + 1
+  with open(path, 'w') as file_handle:
+    file_handle.write("\n".join(lines))
+
+
+def write_binary(path, size):
+  """ Writes a file of random bytes, which stands in for content that is
+  already compressed, such as jars and images.
+
+  Args:
+    path: A str naming the file to write.
+    size: An int with the number of bytes to write.
+  """
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  with open(path, 'wb') as file_handle:
+    file_handle.write(os.urandom(size))
+
+
+def make_app(kind):
+  """ Generates an application that is typical of its runtime.
+
+  Args:
+    kind: A str naming the runtime: 'python', 'go' or 'java'.
+  Returns:
+    A str with the location of the application on the local filesystem.
+  """
+  rand = random.Random(0)
+  app_dir = tempfile.mkdtemp()
+  write_source(os.path.join(app_dir, 'app.yaml'), 200, rand)
+
+  if kind == 'python':
+    # Application code and the libraries it vendors.
+    for index in range(2000):
+      write_source(os.path.join(app_dir, 'lib', 'package{0}'.format(
+        index / 50), 'module{0}.py'.format(index)), 4096, rand)
+  elif kind == 'go':
+    # Source and vendored dependencies, plus a few static images.
+    for index in range(1500):
+      write_source(os.path.join(app_dir, 'vendor', 'dep{0}'.format(
+        index / 30), 'file{0}.go'.format(index)), 6144, rand)
+    for index in range(10):
+      write_binary(os.path.join(app_dir, 'static', 'image{0}.png'.format(
+        index)), 200 * 1024)
+  else:
+    # Compiled classes and the jars the application depends on.
+    for index in range(500):
+      write_source(os.path.join(app_dir, 'war', 'WEB-INF', 'classes',
+        'Class{0}.class'.format(index)), 4096, rand)
+    for index in range(25):
+      write_binary(os.path.join(app_dir, 'war', 'WEB-INF', 'lib',
+        'library{0}.jar'.format(index)), 1024 * 1024)
+
+  return app_dir
+
+
+def benchmark(app_dir, compression, link_speeds):
+  """ Packs the given application with the given compression, printing how
+  long that and each step of its upload would take.
+
+  Args:
+    app_dir: A str with the location of the application to pack.
+    compression: The AppCompression to pack the application with.
+    link_speeds: A list of ints with the link speeds, in megabits per second,
+      to estimate transfer times for.
+  """
+  archive = tempfile.NamedTemporaryFile()
+  start = time.time()
+  subprocess.check_call("cd '{0}' && tar {1} --exclude='*.pyc' *".format(
+    app_dir, compression.get_tar_flags()), shell=True, stdout=archive)
+  pack_time = time.time() - start
+  size = os.path.getsize(archive.name)
+
+  # Time what the login node does to the archive as it arrives.
+  remote_time = 0
+  if compression.get_remote_filter():
+    start = time.time()
+    subprocess.check_call("{0} < {1} > /dev/null".format(
+      compression.get_remote_filter(), archive.name), shell=True)
+    remote_time = time.time() - start
+  archive.close()
+
+  transfers = []
+  for speed in link_speeds:
+    transfer_time = size * 8 / (speed * 1000.0 * 1000.0)
+    transfers.append("{0} Mbps {1:.2f}s (upload {2:.2f}s)".format(speed,
+      transfer_time, max(pack_time, transfer_time, remote_time)))
+
+  print "  {0:8} {1:6.1f} MB, pack {2:.2f}s, login node {3:.2f}s, " \
+    "{4}".format(compression, size / (1024.0 * 1024.0), pack_time,
+    remote_time, ", ".join(transfers))
+
+
+if __name__ == "__main__":
+  link_speeds = [int(speed) for speed in sys.argv[1:]] or DEFAULT_LINK_SPEEDS
+  for kind in ('python', 'go', 'java'):
+    app_dir = make_app(kind)
+    try:
+      print "{0} app (auto chooses {1}):".format(kind,
+        AppCompression.choose(app_dir))
+      for spec in COMPRESSIONS:
+        compression = AppCompression.parse(spec)
+        if compression.codec == 'none' or find_executable(compression.codec):
+          benchmark(app_dir, compression, link_speeds)
+    finally:
+      shutil.rmtree(app_dir)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+""" Measures how long it takes, and how much memory it costs, to build and
+serialize NodeLayouts with many nodes.
+
+This isn't part of the unit test suite. Run it with 'rake benchmark' or:
+
+  python test/benchmark_node_layout.py [num_nodes ...]
+"""
+
+
+# General-purpose Python library imports
+import os
+import resource
+import sys
+import time
+
+
+# Make the local copy of the tools importable when run from a checkout.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+# AppScale import, the library that we're benchmarking here
+from appscale.tools.node_layout import NodeLayout
+
+
+# The layout sizes that we benchmark when none are given on the command line.
+DEFAULT_SIZES = (1000, 10000, 50000)
+
+
+def generate_layout(num_nodes):
+  """ Generates an advanced placement strategy for a cloud deployment.
+
+  Args:
+    num_nodes: An int indicating how many nodes the layout should contain.
+  Returns:
+    A dict mapping roles to node IDs.
+  """
+  node_ids = ['node-{0}'.format(index) for index in xrange(1, num_nodes + 1)]
+  num_databases = max(1, num_nodes / 10)
+  return {
+    'master' : node_ids[0],
+    'zookeeper' : node_ids[1:4] or node_ids[:1],
+    'database' : node_ids[:num_databases],
+    'appengine' : node_ids[num_databases:] or node_ids[:1]
+  }
+
+
+def max_rss_mb():
+  """ Returns the peak resident set size of this process, in megabytes. """
+  usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    # ru_maxrss is in bytes on OS X and in kilobytes on Linux.
+    return usage / (1024.0 * 1024.0)
+  return usage / 1024.0
+
+
+def benchmark(num_nodes):
+  """ Builds, validates, queries and serializes a layout of the given size,
+  printing how long each step took.
+
+  Args:
+    num_nodes: An int indicating how many nodes the layout should contain.
+  """
+  layout_yaml = generate_layout(num_nodes)
+  rss_before = max_rss_mb()
+
+  start = time.time()
+  layout = NodeLayout({'infrastructure' : 'ec2', 'ips' : layout_yaml,
+    'table' : 'cassandra'})
+  if not layout.is_valid():
+    raise SystemExit(layout.errors())
+  validated = time.time()
+
+  for node in layout.nodes:
+    node.is_role('appengine')
+    node.is_role('db_slave')
+  queried = time.time()
+
+  layout.to_list()
+  serialized = time.time()
+  layout.to_list()
+  reserialized = time.time()
+
+  print "{0} nodes: validate {1:.3f}s, 2 role queries/node {2:.3f}s, " \
+    "to_list {3:.3f}s, cached to_list {4:.3f}s, peak RSS +{5:.1f} MB".format(
+    num_nodes, validated - start, queried - validated, serialized - queried,
+    reserialized - serialized, max_rss_mb() - rss_before)
+
+
+if __name__ == "__main__":
+  sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+  for size in sizes:
+    benchmark(size)
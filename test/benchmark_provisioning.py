@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+""" Measures how long each infrastructure agent takes to start and terminate
+deployments of different sizes, and how many API calls it makes doing so,
+against the offline cloud emulators in cloud_emulator.py.
+
+This isn't part of the unit test suite. Run it with 'rake benchmark' or:
+
+  python test/benchmark_provisioning.py [num_vms ...]
+"""
+
+
+# General-purpose Python library imports
+import os
+import sys
+import time
+
+
+# Make the local copy of the tools importable when run from a checkout.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+# AppScale imports, the libraries that we're benchmarking here
+from appscale.tools.agents.azure_agent import AzureAgent
+from appscale.tools.agents.ec2_agent import EC2Agent
+from appscale.tools.agents.gce_agent import GCEAgent
+from appscale.tools.appscale_logger import AppScaleLogger
+from cloud_emulator import AzureEmulator
+from cloud_emulator import EC2Emulator
+from cloud_emulator import GCEEmulator
+
+
+# The deployment sizes that we benchmark when none are given on the command
+# line.
+DEFAULT_SIZES = (1, 10, 100, 1000)
+
+
+# The agent to benchmark with each emulator.
+CLOUDS = (
+  ('ec2', EC2Agent, EC2Emulator),
+  ('gce', GCEAgent, GCEEmulator),
+  ('azure', AzureAgent, AzureEmulator)
+)
+
+
+def benchmark(name, agent_class, emulator_class, num_vms):
+  """ Starts and then terminates a deployment of the given size, printing
+  how long each took and how many API calls were made.
+
+  Args:
+    name: A str naming the cloud being benchmarked.
+    agent_class: The infrastructure agent class to benchmark.
+    emulator_class: The CloudEmulator class that stands in for the cloud.
+    num_vms: An int indicating how many VMs to start.
+  """
+  emulator = emulator_class(boot_latency=60, boot_jitter=0.25)
+  parameters = emulator.get_parameters()
+  wall_start = time.time()
+
+  with emulator.installed():
+    agent = agent_class()
+    start = emulator.clock.elapsed()
+    instance_ids, _, _ = agent.run_instances(num_vms, parameters, True)
+    started = emulator.clock.elapsed()
+    start_calls = sum(emulator.calls.values())
+
+    parameters[agent.PARAM_INSTANCE_IDS] = instance_ids
+    agent.terminate_instances(parameters)
+    terminated = emulator.clock.elapsed()
+
+  print "{0} {1} VMs: start {2:.0f}s ({3} calls), terminate {4:.0f}s " \
+    "({5} calls), {6:.2f}s wall clock".format(name, num_vms, started - start,
+    start_calls, terminated - started,
+    sum(emulator.calls.values()) - start_calls, time.time() - wall_start)
+
+
+if __name__ == "__main__":
+  # Only report the benchmark's results.
+  AppScaleLogger.log = classmethod(lambda cls, message: None)
+  AppScaleLogger.verbose = classmethod(lambda cls, message, is_verbose: None)
+
+  sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+  for name, agent_class, emulator_class in CLOUDS:
+    for size in sizes:
+      benchmark(name, agent_class, emulator_class, size)
@@ -0,0 +1,1069 @@
+#!/usr/bin/env python
+""" Emulates the parts of the EC2, Google Compute Engine and Azure APIs that
+the AppScale Tools' infrastructure agents call, so that their provisioning
+and polling code can be tested and benchmarked offline.
+
+Each emulator keeps simulated instances that boot after a configurable
+latency, can throttle API calls, and can fail launches or named API calls on
+purpose. Time runs faster than the wall clock (see ScaledClock), so a
+deployment that would take minutes in a real cloud takes milliseconds here.
+
+Typical use:
+
+  emulator = EC2Emulator(boot_latency=60)
+  with emulator.installed():
+    EC2Agent().run_instances(10, emulator.get_parameters(), True)
+  print emulator.calls
+"""
+
+
+# General-purpose Python library imports
+import contextlib
+import itertools
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+
+# Make the local copy of the tools importable when run from a checkout.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+# Third party libraries
+from apiclient import errors
+import boto.ec2
+from boto.exception import EC2ResponseError
+from boto.resultset import ResultSet
+import httplib2
+from msrestazure.azure_exceptions import CloudError
+
+
+# AppScale-specific imports
+from appscale.tools.agents import azure_agent
+from appscale.tools.agents.azure_agent import AzureAgent
+from appscale.tools.agents.base_agent import BaseAgent
+from appscale.tools.agents.ec2_agent import EC2Agent
+from appscale.tools.agents.gce_agent import GCEAgent
+from appscale.tools.local_state import LocalState
+
+
+# The real clock functions, kept before any emulator replaces them.
+REAL_TIME = time.time
+REAL_SLEEP = time.sleep
+
+
+class ScaledClock(object):
+  """ ScaledClock stands in for time.time and time.sleep, running time
+  'speedup' times faster than the wall clock.
+
+  Every thread sleeps for a scaled-down amount of real time, so concurrent
+  pollers see the same amount of time pass that they would in a real cloud.
+  """
+
+
+  def __init__(self, speedup):
+    """ Creates a new ScaledClock, starting at the current time.
+
+    Args:
+      speedup: A number indicating how many emulated seconds pass for each
+        real one.
+    """
+    self.speedup = float(speedup)
+    self.real_start = REAL_TIME()
+
+
+  def time(self):
+    """ Returns the emulated number of seconds since the epoch. """
+    return self.real_start + (REAL_TIME() - self.real_start) * self.speedup
+
+
+  def sleep(self, seconds):
+    """ Sleeps for the given number of emulated seconds. """
+    REAL_SLEEP(seconds / self.speedup)
+
+
+  def elapsed(self):
+    """ Returns the number of emulated seconds since this clock started. """
+    return self.time() - self.real_start
+
+
+class CloudEmulator(object):
+  """ CloudEmulator holds what every cloud's emulator shares: simulated
+  instances, the clock, API call accounting, throttling and failures.
+  """
+
+
+  # The number of emulated seconds an instance takes to shut down.
+  TERMINATE_LATENCY = 10
+
+  # The keyname and group that get_parameters uses.
+  KEYNAME = 'bookey'
+  GROUP = 'bazgroup'
+
+
+  def __init__(self, boot_latency=60, boot_jitter=0.0, api_rate=None,
+    launch_failure_rate=0.0, speedup=1000, seed=0):
+    """ Creates a new CloudEmulator with no instances.
+
+    Args:
+      boot_latency: The number of emulated seconds instances take to boot.
+      boot_jitter: A fraction that each instance's boot latency can randomly
+        vary by.
+      api_rate: The number of API calls allowed per emulated second, or None
+        to never throttle calls.
+      launch_failure_rate: The fraction of instances that fail to boot.
+      speedup: How many times faster than the wall clock emulated time runs.
+      seed: The seed for the random numbers behind jitter and failures, so
+        that runs are repeatable.
+    """
+    self.boot_latency = boot_latency
+    self.boot_jitter = boot_jitter
+    self.api_rate = api_rate
+    self.launch_failure_rate = launch_failure_rate
+    self.clock = ScaledClock(speedup)
+    self.random = random.Random(seed)
+    self.lock = threading.RLock()
+
+    self.machines = {}
+    self.calls = {}
+    self.throttled_calls = 0
+    self.injected_failures = {}
+    self.injected_throttles = {}
+    self.ids = itertools.count(1)
+
+    self.throttle_window = None
+    self.throttle_count = 0
+
+
+  def fail_next(self, call, count=1, throttled=False):
+    """ Makes the next calls to the named API fail.
+
+    Args:
+      call: A str naming the API call (e.g., 'run_instances').
+      count: The number of calls to fail.
+      throttled: A bool indicating if the calls fail as if they were
+        throttled.
+    """
+    with self.lock:
+      failures = self.injected_throttles if throttled \
+        else self.injected_failures
+      failures[call] = failures.get(call, 0) + count
+
+
+  def record_call(self, call):
+    """ Counts a call to the named API, failing it if it was throttled or set
+    up to fail.
+
+    Args:
+      call: A str naming the API call.
+    Raises:
+      The cloud's exception (see make_error), if the call fails.
+    """
+    with self.lock:
+      self.calls[call] = self.calls.get(call, 0) + 1
+
+      if self.api_rate is not None:
+        window = int(self.clock.time())
+        if window != self.throttle_window:
+          self.throttle_window = window
+          self.throttle_count = 0
+        self.throttle_count += 1
+        if self.throttle_count > self.api_rate:
+          self.throttled_calls += 1
+          raise self.make_error(call, throttled=True)
+
+      if self.injected_throttles.get(call):
+        self.injected_throttles[call] -= 1
+        self.throttled_calls += 1
+        raise self.make_error(call, throttled=True)
+
+      if self.injected_failures.get(call):
+        self.injected_failures[call] -= 1
+        raise self.make_error(call, throttled=False)
+
+
+  def make_error(self, call, throttled):
+    """ Builds the exception the cloud raises when a call fails.
+
+    Args:
+      call: A str naming the API call that failed.
+      throttled: A bool indicating if the call failed because of throttling.
+    Returns:
+      An Exception.
+    """
+    raise NotImplementedError()
+
+
+  def launch(self, name, **fields):
+    """ Starts a simulated instance.
+
+    Args:
+      name: A str that uniquely identifies the instance.
+      fields: Anything else to store about the instance.
+    Returns:
+      A dict describing the instance.
+    """
+    with self.lock:
+      index = next(self.ids)
+      latency = self.boot_latency * (1 + self.random.uniform(
+        -self.boot_jitter, self.boot_jitter))
+      instance = {
+        'name' : name,
+        'launched_at' : self.clock.time(),
+        'ready_at' : self.clock.time() + latency,
+        'terminated_at' : None,
+        'stopped_at' : None,
+        'fails' : self.random.random() < self.launch_failure_rate,
+        'public_ip' : '203.0.{0}.{1}'.format(index / 256 % 256, index % 256),
+        'private_ip' : '10.1.{0}.{1}'.format(index / 256 % 256, index % 256)
+      }
+      instance.update(fields)
+      self.machines[name] = instance
+      return instance
+
+
+  def terminate(self, name):
+    """ Starts shutting down a simulated instance. """
+    with self.lock:
+      instance = self.machines[name]
+      if instance['terminated_at'] is None:
+        instance['terminated_at'] = self.clock.time()
+
+
+  def stop(self, name):
+    """ Starts stopping a simulated instance, keeping it to start later. """
+    with self.lock:
+      instance = self.machines[name]
+      if instance['stopped_at'] is None:
+        instance['stopped_at'] = self.clock.time()
+
+
+  def restart(self, name, latency):
+    """ Starts a stopped instance again, which gets a new public IP.
+
+    Args:
+      name: A str that identifies the instance.
+      latency: The number of emulated seconds the instance takes to boot.
+    """
+    with self.lock:
+      instance = self.machines[name]
+      index = next(self.ids)
+      instance['stopped_at'] = None
+      instance['ready_at'] = self.clock.time() + latency
+      instance['public_ip'] = '203.0.{0}.{1}'.format(index / 256 % 256,
+        index % 256)
+
+
+  def get_state(self, instance):
+    """ Determines which state a simulated instance is in right now.
+
+    Args:
+      instance: A dict describing the instance.
+    Returns:
+      One of 'pending', 'running', 'failed', 'stopping', 'stopped',
+      'shutting-down' or 'terminated'.
+    """
+    now = self.clock.time()
+    if instance['terminated_at'] is not None:
+      if now - instance['terminated_at'] >= self.TERMINATE_LATENCY:
+        return 'terminated'
+      return 'shutting-down'
+    if instance['stopped_at'] is not None:
+      if now - instance['stopped_at'] >= self.TERMINATE_LATENCY:
+        return 'stopped'
+      return 'stopping'
+    if now < instance['ready_at']:
+      return 'pending'
+    if instance['fails']:
+      return 'failed'
+    return 'running'
+
+
+  def get_parameters(self):
+    """ Builds the parameters that this cloud's agent needs to start and
+    terminate instances in the emulator.
+
+    Returns:
+      A dict of agent parameters.
+    """
+    raise NotImplementedError()
+
+
+  def install(self):
+    """ Points the infrastructure agents at this emulator.
+
+    Returns:
+      A list of (object, attribute, original value) tuples to restore.
+    """
+    return [(time, 'time', time.time), (time, 'sleep', time.sleep)]
+
+
+  def uninstall(self):
+    """ Cleans up anything install created, besides the attributes it
+    replaced. """
+    pass
+
+
+  @contextlib.contextmanager
+  def installed(self):
+    """ Points the infrastructure agents (and the time module) at this
+    emulator until the with block exits.
+    """
+    BaseAgent.clear_client_cache()
+    patches = self.install()
+    time.time = self.clock.time
+    time.sleep = self.clock.sleep
+    try:
+      yield self
+    finally:
+      for owner, attribute, original in reversed(patches):
+        setattr(owner, attribute, original)
+      self.uninstall()
+      BaseAgent.clear_client_cache()
+
+
+class EmulatedObject(object):
+  """ EmulatedObject stands in for the objects that cloud libraries return,
+  exposing each keyword argument as an attribute.
+  """
+
+
+  def __init__(self, **fields):
+    self.__dict__.update(fields)
+
+
+class EC2Emulator(CloudEmulator):
+  """ EC2Emulator emulates a boto EC2Connection. """
+
+
+  def __init__(self, visibility_delay=2, restart_latency=20, **kwargs):
+    """ Creates a new EC2Emulator.
+
+    Args:
+      visibility_delay: The number of emulated seconds before a new instance
+        can be described by ID, like EC2's eventual consistency.
+      restart_latency: The number of emulated seconds that stopped instances
+        take to boot again.
+      kwargs: The arguments CloudEmulator accepts.
+    """
+    CloudEmulator.__init__(self, **kwargs)
+    self.visibility_delay = visibility_delay
+    self.restart_latency = restart_latency
+    self.key_pairs = set()
+    self.security_groups = {}
+
+
+  def make_error(self, call, throttled):
+    if throttled:
+      error = EC2ResponseError(503, 'Service Unavailable')
+      error.error_code = 'RequestLimitExceeded'
+    else:
+      error = EC2ResponseError(500, 'Internal Server Error')
+      error.error_code = 'InternalError'
+    error.error_message = '{0} failed'.format(call)
+    return error
+
+
+  def get_parameters(self):
+    return {
+      EC2Agent.PARAM_CREDENTIALS : {'EC2_ACCESS_KEY' : 'emulated',
+        'EC2_SECRET_KEY' : 'emulated'},
+      EC2Agent.PARAM_GROUP : self.GROUP,
+      EC2Agent.PARAM_IMAGE_ID : 'ami-ABCDEFG',
+      EC2Agent.PARAM_INSTANCE_TYPE : 'm3.medium',
+      EC2Agent.PARAM_KEYNAME : self.KEYNAME,
+      EC2Agent.PARAM_REGION : 'my-zone-1',
+      EC2Agent.PARAM_SPOT : False,
+      EC2Agent.PARAM_SPOT_PRICE : None,
+      EC2Agent.PARAM_ZONE : 'my-zone-1b'
+    }
+
+
+  def install(self):
+    patches = CloudEmulator.install(self)
+    patches.append((boto.ec2, 'connect_to_region', boto.ec2.connect_to_region))
+    boto.ec2.connect_to_region = lambda *args, **kwargs: self
+    return patches
+
+
+  def get_state(self, instance):
+    # EC2 shows instances that fail to boot as terminated.
+    state = CloudEmulator.get_state(self, instance)
+    if state == 'failed':
+      return 'terminated'
+    return state
+
+
+  def make_instance(self, instance):
+    state = self.get_state(instance)
+    running = state == 'running'
+    return EmulatedObject(id=instance['name'], state=state,
+      key_name=instance['key_name'], groups=instance['groups'],
+      ip_address=instance['public_ip'] if running else None,
+      private_ip_address=instance['private_ip'] if running else None)
+
+
+  def get_all_reservations(self, instance_ids=None, filters=None,
+    max_results=None, next_token=None):
+    self.record_call('get_all_reservations')
+    filters = filters or {}
+    with self.lock:
+      if instance_ids:
+        now = self.clock.time()
+        for instance_id in instance_ids:
+          instance = self.machines.get(instance_id)
+          if not instance or now - instance['launched_at'] < \
+            self.visibility_delay:
+            error = EC2ResponseError(400, 'Bad Request')
+            error.error_code = 'InvalidInstanceID.NotFound'
+            error.error_message = 'No instance {0}'.format(instance_id)
+            raise error
+        candidates = [self.machines[instance_id]
+          for instance_id in instance_ids]
+      else:
+        candidates = sorted(self.machines.values(),
+          key=lambda instance: instance['name'])
+
+      matches = []
+      for instance in candidates:
+        described = self.make_instance(instance)
+        if 'key-name' in filters and \
+          described.key_name != filters['key-name']:
+          continue
+        if 'instance-state-name' in filters and \
+          described.state not in filters['instance-state-name']:
+          continue
+        if 'instance.group-name' in filters and \
+          filters['instance.group-name'] not in described.groups:
+          continue
+        matches.append(described)
+
+    start = int(next_token or 0)
+    end = len(matches)
+    if max_results:
+      end = min(start + max_results, end)
+
+    page = ResultSet()
+    for described in matches[start:end]:
+      page.append(EmulatedObject(instances=[described]))
+    page.next_token = str(end) if end < len(matches) else None
+    return page
+
+
+  def run_instances(self, image_id, min_count=1, max_count=1, key_name=None,
+    security_groups=None, instance_type=None, placement=None):
+    self.record_call('run_instances')
+    instances = []
+    for _ in range(max_count):
+      name = 'i-{0:08x}'.format(self.random.getrandbits(32))
+      instance = self.launch(name, key_name=key_name,
+        groups=security_groups or [])
+      instances.append(self.make_instance(instance))
+    return EmulatedObject(instances=instances)
+
+
+  def request_spot_instances(self, price, image_id, key_name=None,
+    security_groups=None, instance_type=None, count=1, placement=None):
+    self.record_call('request_spot_instances')
+    for _ in range(count):
+      name = 'i-{0:08x}'.format(self.random.getrandbits(32))
+      self.launch(name, key_name=key_name, groups=security_groups or [])
+    return [EmulatedObject(id='sir-{0}'.format(index))
+      for index in range(count)]
+
+
+  def terminate_instances(self, instance_ids):
+    self.record_call('terminate_instances')
+    for instance_id in instance_ids:
+      self.terminate(instance_id)
+    return instance_ids
+
+
+  def stop_instances(self, instance_ids):
+    self.record_call('stop_instances')
+    for instance_id in instance_ids:
+      self.stop(instance_id)
+    return instance_ids
+
+
+  def start_instances(self, instance_ids):
+    self.record_call('start_instances')
+    for instance_id in instance_ids:
+      self.restart(instance_id, self.restart_latency)
+    return instance_ids
+
+
+  def get_key_pair(self, keyname):
+    self.record_call('get_key_pair')
+    if keyname in self.key_pairs:
+      return EmulatedObject(name=keyname)
+    return None
+
+
+  def create_key_pair(self, keyname):
+    self.record_call('create_key_pair')
+    self.key_pairs.add(keyname)
+    return EmulatedObject(name=keyname, material='emulated key')
+
+
+  def delete_key_pair(self, keyname):
+    self.record_call('delete_key_pair')
+    self.key_pairs.discard(keyname)
+
+
+  def get_all_security_groups(self, groupnames=None, filters=None):
+    self.record_call('get_all_security_groups')
+    if filters and 'group-name' in filters:
+      return [EmulatedObject(name=group, rules=self.security_groups[group])
+        for group in [filters['group-name']] if group in self.security_groups]
+    if groupnames:
+      if isinstance(groupnames, str):
+        groupnames = [groupnames]
+      for group in groupnames:
+        if group not in self.security_groups:
+          raise self.make_error('get_all_security_groups', throttled=False)
+    else:
+      groupnames = sorted(self.security_groups)
+    return [EmulatedObject(name=group, rules=self.security_groups[group])
+      for group in groupnames]
+
+
+  def create_security_group(self, group, description):
+    self.record_call('create_security_group')
+    self.security_groups.setdefault(group, [])
+
+
+  def get_status(self, action, params, verb='GET'):
+    self.record_call(action)
+    if action != 'AuthorizeSecurityGroupIngress':
+      raise NotImplementedError(action)
+
+    group = params['GroupName']
+    if group not in self.security_groups:
+      raise self.make_error(action, throttled=False)
+
+    index = 1
+    while 'IpPermissions.{0}.IpProtocol'.format(index) in params:
+      prefix = 'IpPermissions.{0}.'.format(index)
+      self.security_groups[group].append(EmulatedObject(
+        from_port=params[prefix + 'FromPort'],
+        to_port=params[prefix + 'ToPort'],
+        ip_protocol=params[prefix + 'IpProtocol']))
+      index += 1
+    return True
+
+
+  def delete_security_group(self, group):
+    self.record_call('delete_security_group')
+    with self.lock:
+      for instance in self.machines.values():
+        if group in instance['groups'] and \
+          self.get_state(instance) != 'terminated':
+          raise self.make_error('delete_security_group', throttled=False)
+      self.security_groups.pop(group, None)
+    return True
+
+
+  def get_all_zones(self, zone=None):
+    self.record_call('get_all_zones')
+    return [EmulatedObject(name=zone)]
+
+
+  def get_image(self, image_id):
+    self.record_call('get_image')
+    return EmulatedObject(id=image_id)
+
+
+class GCERequest(object):
+  """ GCERequest stands in for an apiclient HttpRequest, calling the
+  emulator when it is executed. """
+
+
+  def __init__(self, emulator, call, function, kwargs):
+    self.emulator = emulator
+    self.call = call
+    self.function = function
+    self.kwargs = kwargs
+    self.methodId = 'compute.' + call
+
+
+  def execute(self, http=None):
+    self.emulator.record_call(self.call)
+    return self.function(**self.kwargs)
+
+
+class GCEBatch(object):
+  """ GCEBatch stands in for an apiclient BatchHttpRequest. Each batch counts
+  as a single API call, and each request in it is run as its own. """
+
+
+  def __init__(self, emulator, callback):
+    self.emulator = emulator
+    self.callback = callback
+    self.requests = []
+
+
+  def add(self, request, request_id=None):
+    self.requests.append((request_id, request))
+
+
+  def execute(self, http=None):
+    self.emulator.record_call('batch')
+    for request_id, request in self.requests:
+      try:
+        response, exception = request.execute(http), None
+      except errors.HttpError as error:
+        response, exception = None, error
+      self.callback(request_id, response, exception)
+
+
+class GCEResource(object):
+  """ GCEResource stands in for one of the collections (e.g., instances()) of
+  an apiclient discovery.Resource, building a GCERequest for each method.
+  """
+
+
+  def __init__(self, emulator, collection):
+    self.emulator = emulator
+    self.collection = collection
+
+
+  def __getattr__(self, method):
+    function = getattr(self.emulator, '{0}_{1}'.format(self.collection,
+      method))
+    call = '{0}.{1}'.format(self.collection, method)
+    return lambda **kwargs: GCERequest(self.emulator, call, function, kwargs)
+
+
+class GCEEmulator(CloudEmulator):
+  """ GCEEmulator emulates an apiclient discovery.Resource for Google Compute
+  Engine, along with credentials that can sign requests for it. """
+
+
+  # The number of emulated seconds that disk, network and firewall
+  # operations take.
+  OPERATION_LATENCY = 5
+
+  # The collections of the Compute Engine API that are emulated.
+  COLLECTIONS = ('disks', 'firewalls', 'globalOperations', 'images',
+    'instances', 'networks', 'projects', 'zoneOperations', 'zones')
+
+
+  def __init__(self, **kwargs):
+    CloudEmulator.__init__(self, **kwargs)
+    self.operations = {}
+    self.disk_names = set()
+    self.network_names = set()
+    self.firewall_names = set()
+    self.project_metadata = []
+    self.access_token = None
+
+
+  def make_error(self, call, throttled):
+    if throttled:
+      response = httplib2.Response({'status' : 403})
+      content = '{"error": {"errors": [{"reason": "rateLimitExceeded"}]}}'
+    else:
+      response = httplib2.Response({'status' : 500})
+      content = '{"error": {"errors": [{"reason": "backendError"}]}}'
+    return errors.HttpError(response, content, uri=call)
+
+
+  def not_found(self, name):
+    return errors.HttpError(httplib2.Response({'status' : 404}),
+      '{{"error": {{"message": "{0} was not found"}}}}'.format(name))
+
+
+  def get_parameters(self):
+    return {
+      GCEAgent.PARAM_GROUP : self.GROUP,
+      GCEAgent.PARAM_IMAGE_ID : 'appscale-image',
+      GCEAgent.PARAM_INSTANCE_TYPE : 'n1-standard-1',
+      GCEAgent.PARAM_KEYNAME : self.KEYNAME,
+      GCEAgent.PARAM_PROJECT : 'appscale-project',
+      GCEAgent.PARAM_VERBOSE : False,
+      GCEAgent.PARAM_ZONE : 'my-zone-1b'
+    }
+
+
+  def install(self):
+    patches = CloudEmulator.install(self)
+    patches.append((GCEAgent, 'build_connection', GCEAgent.build_connection))
+    GCEAgent.build_connection = lambda agent, *args: (self, self)
+    return patches
+
+
+  # Credentials
+
+  def authorize(self, http):
+    return http
+
+
+  # discovery.Resource
+
+  def __getattr__(self, collection):
+    if collection not in self.COLLECTIONS:
+      raise AttributeError(collection)
+    return lambda: GCEResource(self, collection)
+
+
+  def new_batch_http_request(self, callback=None):
+    return GCEBatch(self, callback)
+
+
+  def start_operation(self, target, zone=None, latency=OPERATION_LATENCY,
+    fails=False):
+    with self.lock:
+      name = 'operation-{0}'.format(next(self.ids))
+      operation = {'name' : name, 'targetLink' : target,
+        'done_at' : self.clock.time() + latency, 'fails' : fails}
+      if zone:
+        operation['zone'] = 'zones/{0}'.format(zone)
+      self.operations[name] = operation
+      return self.describe_operation(operation)
+
+
+  def describe_operation(self, operation):
+    described = {'name' : operation['name'],
+      'targetLink' : operation['targetLink'], 'status' : 'PENDING'}
+    if 'zone' in operation:
+      described['zone'] = operation['zone']
+    if self.clock.time() >= operation['done_at']:
+      described['status'] = 'DONE'
+      if operation['fails']:
+        described['error'] = {'errors' : [{'message' : '{0} could not be ' \
+          'created'.format(operation['targetLink'])}]}
+    return described
+
+
+  def get_operation(self, operation):
+    with self.lock:
+      if operation not in self.operations:
+        raise self.not_found(operation)
+      return self.describe_operation(self.operations[operation])
+
+
+  def zoneOperations_get(self, project, operation, zone):
+    return self.get_operation(operation)
+
+
+  def globalOperations_get(self, project, operation):
+    return self.get_operation(operation)
+
+
+  def disks_insert(self, project, zone, body, sourceImage=None):
+    with self.lock:
+      self.disk_names.add(body['name'])
+    return self.start_operation(body['name'], zone=zone)
+
+
+  def disks_delete(self, project, zone, disk):
+    with self.lock:
+      if disk not in self.disk_names:
+        raise self.not_found(disk)
+      self.disk_names.discard(disk)
+    return self.start_operation(disk, zone=zone)
+
+
+  def instances_insert(self, project, zone, body):
+    instance = self.launch(body['name'], zone=zone)
+    return self.start_operation(body['name'], zone=zone,
+      latency=self.OPERATION_LATENCY, fails=instance['fails'])
+
+
+  def instances_delete(self, project, zone, instance):
+    if instance not in self.machines:
+      raise self.not_found(instance)
+    self.terminate(instance)
+    return self.start_operation(instance, zone=zone,
+      latency=self.TERMINATE_LATENCY)
+
+
+  def instances_list(self, project, zone, filter=None):
+    group = None
+    if filter and filter.startswith('name eq '):
+      group = filter[len('name eq '):].rstrip('.*')
+
+    statuses = {'pending' : 'PROVISIONING', 'running' : 'RUNNING',
+      'shutting-down' : 'STOPPING'}
+    items = []
+    with self.lock:
+      for name in sorted(self.machines):
+        instance = self.machines[name]
+        state = self.get_state(instance)
+        if state not in statuses or (group and not name.startswith(group)):
+          continue
+        items.append({'name' : name, 'status' : statuses[state],
+          'networkInterfaces' : [{'networkIP' : instance['private_ip'],
+            'accessConfigs' : [{'natIP' : instance['public_ip']}]}]})
+
+    if not items:
+      return {}
+    return {'items' : items}
+
+
+  def projects_get(self, project):
+    return {'name' : project,
+      'commonInstanceMetadata' : {'items' : list(self.project_metadata)}}
+
+
+  def projects_setCommonInstanceMetadata(self, project, body):
+    self.project_metadata = list(body['items'])
+    return self.start_operation(project)
+
+
+  def networks_get(self, project, network):
+    if network not in self.network_names:
+      raise self.not_found(network)
+    return {'name' : network}
+
+
+  def networks_insert(self, project, body):
+    self.network_names.add(body['name'])
+    return self.start_operation(body['name'])
+
+
+  def networks_delete(self, project, network):
+    self.network_names.discard(network)
+    return self.start_operation(network)
+
+
+  def firewalls_get(self, project, firewall):
+    if firewall not in self.firewall_names:
+      raise self.not_found(firewall)
+    return {'name' : firewall}
+
+
+  def firewalls_insert(self, project, body):
+    if body['network'] not in self.network_names:
+      raise self.not_found(body['network'])
+    self.firewall_names.add(body['name'])
+    return self.start_operation(body['name'])
+
+
+  def firewalls_delete(self, project, firewall):
+    self.firewall_names.discard(firewall)
+    return self.start_operation(firewall)
+
+
+  def zones_get(self, project, zone):
+    return {'name' : zone}
+
+
+  def images_get(self, project, image):
+    return {'name' : image}
+
+
+class AzurePoller(object):
+  """ AzurePoller stands in for an AzureOperationPoller. """
+
+
+  def __init__(self, emulator, done_at, result=None):
+    self.emulator = emulator
+    self.done_at = done_at
+    self.value = result
+
+
+  def done(self):
+    return self.emulator.clock.time() >= self.done_at
+
+
+  def result(self, timeout=None):
+    while not self.done():
+      self.emulator.clock.sleep(1)
+    return self.value
+
+
+class AzureOperations(object):
+  """ AzureOperations stands in for one operations group (e.g.,
+  virtual_machines) of an Azure management client. """
+
+
+  def __init__(self, emulator, kind):
+    self.emulator = emulator
+    self.kind = kind
+
+
+  def __getattr__(self, method):
+    function = getattr(self.emulator, '{0}_{1}'.format(self.kind, method))
+    call = '{0}.{1}'.format(self.kind, method)
+
+    def call_emulator(*args, **kwargs):
+      self.emulator.record_call(call)
+      return function(*args, **kwargs)
+
+    return call_emulator
+
+
+class AzureEmulator(CloudEmulator):
+  """ AzureEmulator emulates the Network and Compute Management clients. """
+
+
+  # The number of emulated seconds that network resources take to create or
+  # delete.
+  OPERATION_LATENCY = 3
+
+
+  def __init__(self, **kwargs):
+    CloudEmulator.__init__(self, **kwargs)
+    self.resources = {'public_ip_addresses' : {}, 'network_interfaces' : {},
+      'virtual_networks' : {}}
+    self.network_interfaces = AzureOperations(self, 'network_interfaces')
+    self.public_ip_addresses = AzureOperations(self, 'public_ip_addresses')
+    self.virtual_networks = AzureOperations(self, 'virtual_networks')
+    self.subnets = AzureOperations(self, 'subnets')
+    self.virtual_machines = AzureOperations(self, 'virtual_machines')
+
+
+  def make_error(self, call, throttled):
+    if throttled:
+      response = EmulatedObject(status_code=429, reason='Too Many Requests',
+        headers={'Retry-After' : '1'}, text='', json=lambda: {})
+    else:
+      response = EmulatedObject(status_code=500, reason='Internal Error',
+        headers={}, text='', json=lambda: {})
+    return CloudError(response, error='{0} failed'.format(call))
+
+
+  def get_parameters(self):
+    return {
+      AzureAgent.PARAM_GROUP : self.GROUP,
+      AzureAgent.PARAM_IMAGE_ID : 'https://appscale/image.vhd',
+      AzureAgent.PARAM_INSTANCE_TYPE : 'Standard_A3',
+      AzureAgent.PARAM_KEYNAME : self.KEYNAME,
+      AzureAgent.PARAM_RESOURCE_GROUP : 'appscalegroup',
+      AzureAgent.PARAM_STORAGE_ACCOUNT : 'appscalestorage',
+      AzureAgent.PARAM_SUBSCRIBER_ID : 'subscription',
+      AzureAgent.PARAM_VERBOSE : False,
+      AzureAgent.PARAM_ZONE : 'westus'
+    }
+
+
+  def install(self):
+    patches = CloudEmulator.install(self)
+
+    # Azure VMs are created with the deployment's public SSH key.
+    self.key_directory = tempfile.mkdtemp()
+    with open(os.path.join(self.key_directory, self.KEYNAME + '.pub'), 'w') \
+      as key_file:
+      key_file.write('ssh-rsa emulated')
+    patches.append((LocalState, 'LOCAL_APPSCALE_PATH',
+      LocalState.LOCAL_APPSCALE_PATH))
+    LocalState.LOCAL_APPSCALE_PATH = self.key_directory + os.sep
+
+    for name in ('NetworkManagementClient', 'ComputeManagementClient'):
+      patches.append((azure_agent, name, getattr(azure_agent, name)))
+      setattr(azure_agent, name, lambda *args: self)
+    patches.append((AzureAgent, 'open_connection',
+      AzureAgent.open_connection))
+    AzureAgent.open_connection = lambda agent, parameters: self
+    return patches
+
+
+  def uninstall(self):
+    shutil.rmtree(self.key_directory)
+
+
+  def finish_later(self, result=None):
+    return AzurePoller(self, self.clock.time() + self.OPERATION_LATENCY,
+      result)
+
+
+  def create_or_update(self, kind, name, resource):
+    with self.lock:
+      self.resources[kind][name] = EmulatedObject(name=name,
+        id='/{0}/{1}'.format(kind, name), resource=resource)
+    return self.finish_later()
+
+
+  def list_resources(self, kind):
+    with self.lock:
+      return [self.resources[kind][name]
+        for name in sorted(self.resources[kind])]
+
+
+  def delete_resource(self, kind, name):
+    with self.lock:
+      self.resources[kind].pop(name, None)
+    return self.finish_later()
+
+
+  def virtual_networks_create_or_update(self, group, name, network):
+    return self.create_or_update('virtual_networks', name, network)
+
+
+  def virtual_networks_list(self, group):
+    return self.list_resources('virtual_networks')
+
+
+  def virtual_networks_delete(self, group, name):
+    return self.delete_resource('virtual_networks', name)
+
+
+  def subnets_get(self, group, network, subnet):
+    return EmulatedObject(name=subnet, id='/subnets/{0}'.format(subnet))
+
+
+  def public_ip_addresses_create_or_update(self, group, name, address):
+    return self.create_or_update('public_ip_addresses', name, address)
+
+
+  def public_ip_addresses_get(self, group, name):
+    with self.lock:
+      address = self.resources['public_ip_addresses'][name]
+      instance = self.machines.get(name)
+      ip_address = None
+      if instance and self.get_state(instance) == 'running':
+        ip_address = instance['public_ip']
+      return EmulatedObject(name=name, id=address.id, ip_address=ip_address)
+
+
+  def public_ip_addresses_list(self, group):
+    return [self.public_ip_addresses_get(group, address.name)
+      for address in self.list_resources('public_ip_addresses')]
+
+
+  def public_ip_addresses_delete(self, group, name):
+    return self.delete_resource('public_ip_addresses', name)
+
+
+  def network_interfaces_create_or_update(self, group, name, interface):
+    return self.create_or_update('network_interfaces', name, interface)
+
+
+  def network_interfaces_get(self, group, name):
+    return self.resources['network_interfaces'][name]
+
+
+  def network_interfaces_list(self, group):
+    interfaces = []
+    for interface in self.list_resources('network_interfaces'):
+      instance = self.machines.get(interface.name)
+      private_ip = instance['private_ip'] if instance else None
+      interfaces.append(EmulatedObject(name=interface.name, id=interface.id,
+        ip_configurations=[EmulatedObject(private_ip_address=private_ip)]))
+    return interfaces
+
+
+  def network_interfaces_delete(self, group, name):
+    return self.delete_resource('network_interfaces', name)
+
+
+  def virtual_machines_create_or_update(self, group, name, machine):
+    self.launch(name)
+    return self.finish_later()
+
+
+  def virtual_machines_list(self, group):
+    with self.lock:
+      return [EmulatedObject(name=name) for name in sorted(self.machines)
+        if self.get_state(self.machines[name]) in ('pending', 'running')]
+
+
+  def virtual_machines_delete(self, group, name):
+    self.terminate(name)
+    return AzurePoller(self, self.clock.time() + self.TERMINATE_LATENCY)
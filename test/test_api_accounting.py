@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import time
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.agents.api_accounting import APICallStats
+from appscale.tools.agents.api_accounting import MeteredClient
+from appscale.tools.agents.api_accounting import TokenBucket
+from appscale.tools.agents.base_agent import BaseAgent
+
+
+class FakeOperations(object):
+  def get(self, name):
+    return name
+
+
+class TestAPIAccounting(unittest.TestCase):
+
+
+  def test_token_bucket_waits_once_burst_is_used(self):
+    flexmock(time).should_receive('time').and_return(100.0)
+    flexmock(time).should_receive('sleep').with_args(0.5).once()
+    bucket = TokenBucket(rate=2, burst=2)
+
+    self.assertEquals(0, bucket.acquire())
+    self.assertEquals(0, bucket.acquire())
+    self.assertEquals(0.5, bucket.acquire())
+
+
+  def test_stats_summarize_calls_since_snapshot(self):
+    stats = APICallStats()
+    stats.record('describe_instances', 1.0)
+    snapshot = stats.snapshot()
+
+    stats.record('run_instances', 2.0)
+    stats.record('describe_instances', 0.5, throttled=True)
+    stats.record('describe_instances', 1.5)
+
+    self.assertEquals("Made 3 API calls (1 throttled) taking 4.0 seconds: "
+      "describe_instances x2 (1.00s avg), run_instances x1 (2.00s avg)",
+      APICallStats.summarize(stats.since(snapshot)))
+    self.assertEquals("Made no API calls.",
+      APICallStats.summarize(stats.since(stats.snapshot())))
+
+
+  def test_metered_client_names_operations_groups(self):
+    client = flexmock(virtual_machines=FakeOperations(), region='us-east-1')
+    agent = flexmock(BaseAgent())
+    agent.should_receive('call_api').with_args('virtual_machines.get',
+      object, 'vm1').and_return('vm1').once()
+
+    metered = MeteredClient(agent, client)
+    self.assertEquals('us-east-1', metered.region)
+    self.assertEquals('vm1', metered.virtual_machines.get('vm1'))
+
+
+  def test_call_api_retries_throttled_calls(self):
+    flexmock(time).should_receive('sleep').with_args(3.0).once()
+    agent = BaseAgent()
+    flexmock(agent).should_receive('is_throttled').and_return(True)
+    flexmock(agent).should_receive('get_retry_after').and_return(3.0)
+    snapshot = agent.get_api_call_stats().snapshot()
+
+    function = flexmock()
+    function.should_receive('call').and_raise(ValueError).and_return('done')
+    self.assertEquals('done', agent.call_api('call', function.call))
+    count, _, throttled = agent.get_api_call_stats().since(snapshot)['call']
+    self.assertEquals((2, 1), (count, throttled))
+
+
+  def test_call_api_gives_up_on_other_errors(self):
+    agent = BaseAgent()
+    function = flexmock()
+    function.should_receive('call').and_raise(ValueError).once()
+    self.assertRaises(ValueError, agent.call_api, 'call', function.call)
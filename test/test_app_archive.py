@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.app_archive import AppArchive
+from appscale.tools.custom_exceptions import AppEngineConfigException
+
+
+class TestAppArchive(unittest.TestCase):
+
+
+  APP_YAML = "application: baz\nruntime: python27\n"
+
+
+  def setUp(self):
+    self.archive_dir = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.archive_dir)
+
+
+  def make_tar_gz(self, files):
+    location = os.path.join(self.archive_dir, 'app.tar.gz')
+    with tarfile.open(location, 'w:gz') as archive:
+      for name, contents in files.items():
+        path = os.path.join(self.archive_dir, 'contents')
+        with open(path, 'w') as file_handle:
+          file_handle.write(contents)
+        archive.add(path, arcname=name)
+    return location
+
+
+  def test_app_at_the_top_is_sent_as_is(self):
+    archive = AppArchive.open(self.make_tar_gz({
+      './app.yaml' : self.APP_YAML,
+      './main.py' : 'print "hello"'
+    }))
+    self.assertEquals('baz', archive.get_app_id())
+    self.assertEquals('python27', archive.get_app_runtime())
+    self.assertTrue(archive.can_send_as_is())
+
+
+  def test_app_in_a_directory_is_packed_again(self):
+    archive = AppArchive.open(self.make_tar_gz({
+      'baz/app.yaml' : self.APP_YAML,
+      '.DS_Store' : ''
+    }))
+    self.assertEquals('baz/', archive.root)
+    self.assertEquals('baz', archive.get_app_id())
+    self.assertFalse(archive.can_send_as_is())
+
+
+  def test_pyc_files_and_unsafe_paths_are_packed_again(self):
+    self.assertFalse(AppArchive.open(self.make_tar_gz({
+      'app.yaml' : self.APP_YAML,
+      'main.pyc' : ''
+    })).can_send_as_is())
+    self.assertFalse(AppArchive.open(self.make_tar_gz({
+      'app.yaml' : self.APP_YAML,
+      '../evil.py' : ''
+    })).can_send_as_is())
+
+
+  def test_files_the_ignore_rules_leave_out_are_packed_again(self):
+    self.assertFalse(AppArchive.open(self.make_tar_gz({
+      'app.yaml' : self.APP_YAML,
+      'lib/.git/HEAD' : ''
+    })).can_send_as_is())
+    self.assertFalse(AppArchive.open(self.make_tar_gz({
+      'app.yaml' : self.APP_YAML,
+      '.appscaleignore' : 'build/\n',
+      'build/out.js' : ''
+    })).can_send_as_is())
+    self.assertTrue(AppArchive.open(self.make_tar_gz({
+      'app.yaml' : self.APP_YAML,
+      'lib/util.py' : ''
+    })).can_send_as_is())
+
+
+  def test_java_app_in_a_zip(self):
+    location = os.path.join(self.archive_dir, 'app.zip')
+    with zipfile.ZipFile(location, 'w') as archive:
+      archive.writestr('war/WEB-INF/appengine-web.xml',
+        '<appengine-web-app><application>javaapp</application>' \
+        '</appengine-web-app>')
+      archive.writestr('war/WEB-INF/lib/appengine-api-1.0-sdk-1.7.3.jar', '')
+
+    archive = AppArchive.open(location)
+    self.assertEquals('javaapp', archive.get_app_id())
+    self.assertEquals('java', archive.get_app_runtime())
+    self.assertTrue(archive.is_sdk_mismatch())
+    self.assertFalse(archive.can_send_as_is())
+
+
+  def test_missing_config_and_unreadable_archives(self):
+    archive = AppArchive.open(self.make_tar_gz({'main.py' : ''}))
+    self.assertRaises(AppEngineConfigException, archive.get_app_id)
+
+    location = os.path.join(self.archive_dir, 'broken.tar.gz')
+    with open(location, 'w') as file_handle:
+      file_handle.write('not an archive')
+    self.assertEquals(None, AppArchive.open(location))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import os
+import shutil
+import tempfile
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools import app_compression
+from appscale.tools.app_compression import AppCompression
+from appscale.tools.custom_exceptions import BadConfigurationException
+
+
+class TestAppCompression(unittest.TestCase):
+
+
+  def setUp(self):
+    self.app_dir = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.app_dir)
+
+
+  def write_file(self, name, contents):
+    with open(os.path.join(self.app_dir, name), 'wb') as file_handle:
+      file_handle.write(contents)
+
+
+  def test_parse(self):
+    self.assertEquals('zstd:19', str(AppCompression.parse('zstd:19')))
+    self.assertEquals('pigz:6', str(AppCompression.parse('pigz')))
+    self.assertEquals('none', str(AppCompression.parse('none')))
+    for spec in ['bzip2', 'gzip:10', 'zstd:fast', 'none:1']:
+      self.assertRaises(BadConfigurationException, AppCompression.parse, spec)
+
+
+  def test_auto_skips_compressing_compressed_content(self):
+    self.write_file('app.yaml', 'application: baz\n')
+    self.write_file('lib.jar', os.urandom(256 * 1024))
+    self.assertEquals('none', AppCompression.choose(self.app_dir).codec)
+
+
+  def test_auto_only_samples_files_that_are_sent(self):
+    self.write_file('main.py', 'print "hello world"\n' * 10000)
+    self.write_file('lib.jar', os.urandom(1024 * 1024))
+    self.write_file('.appscaleignore', 'lib.jar\n')
+    flexmock(app_compression).should_receive('find_executable') \
+      .and_return(None)
+    self.assertEquals('gzip', AppCompression.choose(self.app_dir).codec)
+
+    # Callers that already know which files are sent pass them in.
+    self.assertEquals('none', AppCompression.choose(self.app_dir,
+      files=['lib.jar']).codec)
+
+
+  def test_auto_uses_parallel_gzip_when_installed(self):
+    self.write_file('main.py', 'print "hello world"\n' * 10000)
+    flexmock(app_compression).should_receive('find_executable') \
+      .with_args('pigz').and_return('/usr/bin/pigz').and_return(None)
+
+    self.assertEquals('pigz', AppCompression.choose(self.app_dir).codec)
+    self.assertEquals('gzip', AppCompression.choose(self.app_dir).codec)
+
+
+  def test_chosen_codec_must_be_installed(self):
+    flexmock(app_compression).should_receive('find_executable') \
+      .with_args('zstd').and_return(None)
+    self.assertRaises(BadConfigurationException, AppCompression.choose,
+      self.app_dir, 'zstd:19')
+
+
+  def test_login_node_always_gets_gzip(self):
+    self.assertEquals("-czhf -", AppCompression('gzip').get_tar_flags())
+    self.assertEquals(None, AppCompression('gzip').get_remote_filter())
+    self.assertEquals("-chf - --use-compress-program='pigz -9'",
+      AppCompression('pigz', 9).get_tar_flags())
+    self.assertEquals(None, AppCompression('pigz').get_remote_filter())
+    self.assertEquals("-chf - --use-compress-program='zstd -19 -T0'",
+      AppCompression('zstd', 19).get_tar_flags())
+    self.assertEquals("zstd -dc | gzip -1",
+      AppCompression('zstd').get_remote_filter())
+    self.assertEquals(("-chf -", "gzip -1"), (
+      AppCompression('none').get_tar_flags(),
+      AppCompression('none').get_remote_filter()))
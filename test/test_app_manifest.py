@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import os
+import shutil
+import tempfile
+import unittest
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.app_manifest import AppManifest
+
+
+class TestAppManifest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.app_dir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(self.app_dir, 'lib'))
+    os.mkdir(os.path.join(self.app_dir, '.git'))
+    for name in ['app.yaml', 'main.py', 'main.pyc', '.hidden',
+      os.path.join('lib', 'util.py'), os.path.join('lib', '.keep'),
+      os.path.join('.git', 'HEAD')]:
+      with open(os.path.join(self.app_dir, name), 'w') as file_handle:
+        file_handle.write(name)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.app_dir)
+
+
+  def test_manifest_matches_what_gets_tarred(self):
+    manifest = AppManifest.from_directory(self.app_dir)
+    self.assertEquals(['app.yaml', 'lib/.keep', 'lib/util.py', 'main.py'],
+      sorted(manifest.files))
+    self.assertEquals(len('main.py'), manifest.files['main.py']['size'])
+
+
+  def test_diff_finds_changed_and_removed_files(self):
+    previous = AppManifest.from_json(
+      AppManifest.from_directory(self.app_dir).to_json())
+
+    os.remove(os.path.join(self.app_dir, 'app.yaml'))
+    with open(os.path.join(self.app_dir, 'main.py'), 'w') as file_handle:
+      file_handle.write('changed')
+    with open(os.path.join(self.app_dir, 'new.py'), 'w') as file_handle:
+      file_handle.write('new')
+
+    manifest = AppManifest.from_directory(self.app_dir)
+    self.assertEquals((['main.py', 'new.py'], ['app.yaml']),
+      manifest.diff(previous))
+    self.assertEquals(len('changed') + len('new'),
+      manifest.get_size(['main.py', 'new.py']))
+
+
+  def test_missing_manifest_sends_everything(self):
+    manifest = AppManifest.from_directory(self.app_dir)
+    changed, removed = manifest.diff(AppManifest.from_json(''))
+    self.assertEquals(sorted(manifest.files), changed)
+    self.assertEquals([], removed)
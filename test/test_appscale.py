@@ -8,6 +8,7 @@ import re
 import shutil
 import subprocess
 import sys
+import tempfile
 import unittest
 import yaml
 
@@ -18,6 +19,7 @@ from flexmock import flexmock
 
 
 # AppScale import, the library that we're testing here
+from appscale.tools.agents.base_agent import BaseAgent
 from appscale.tools.agents.ec2_agent import EC2Agent
 from appscale.tools.appscale import AppScale
 from appscale.tools.appscale_tools import AppScaleTools
@@ -32,9 +34,16 @@ class TestAppScale(unittest.TestCase):
 
 
   def setUp(self):
+    # don't reuse cloud connections that earlier tests mocked out
+    BaseAgent.clear_client_cache()
+
     os.environ['EC2_ACCESS_KEY'] = ''
     os.environ['EC2_SECRET_KEY'] = ''
 
+    # don't cache compiled placement strategies in the user's ~/.appscale
+    flexmock(LocalState).should_receive('get_compiled_layouts_location') \
+      .and_return('/dev/null/layouts.json')
+
   
   def tearDown(self):
     os.environ['EC2_ACCESS_KEY'] = ''
@@ -251,7 +260,7 @@ class TestAppScale(unittest.TestCase):
 
     # finally, pretend that our ec2 zone and image exists
     fake_ec2 = flexmock(name="fake_ec2")
-    fake_ec2.should_receive('get_all_instances')
+    fake_ec2.should_receive('get_all_reservations')
 
     fake_ec2.should_receive('get_all_zones').with_args('my-zone-1b') \
       .and_return('anything')
@@ -268,6 +277,50 @@ class TestAppScale(unittest.TestCase):
     appscale.up()
 
 
+  def testUpWithCapacities(self):
+    # calling 'appscale up' with the nodes' capacities instead of min and max
+    # should hand them to appscale-run-instances
+    appscale = AppScale()
+    capacities = {
+      'node-1' : {'cpu' : 4, 'ram' : 16384, 'disk' : 100},
+      'node-2' : {'cpu' : 2, 'ram' : 8192, 'disk' : 50}
+    }
+    contents = {
+      'infrastructure' : 'ec2',
+      'instance_type' : 'm3.medium',
+      'machine' : 'ami-ABCDEFG',
+      'keyname' : 'bookey',
+      'group' : 'boogroup',
+      'capacities' : capacities,
+      'zone' : 'my-zone-1b'
+    }
+    self.addMockForAppScalefile(appscale, yaml.dump(contents))
+
+    flexmock(os.path)
+    os.path.should_call('exists')
+    os.path.should_receive('exists').with_args(
+      '/boo/' + appscale.APPSCALEFILE).and_return(True)
+
+    for credential in EC2Agent.REQUIRED_CREDENTIALS:
+      os.environ[credential] = "baz"
+
+    fake_ec2 = flexmock(name="fake_ec2")
+    fake_ec2.should_receive('get_all_reservations')
+    fake_ec2.should_receive('get_all_zones').with_args('my-zone-1b') \
+      .and_return('anything')
+    fake_ec2.should_receive('get_image').with_args('ami-ABCDEFG') \
+      .and_return()
+    flexmock(boto.ec2)
+    boto.ec2.should_receive('connect_to_region').with_args('my-zone-1',
+      aws_access_key_id='baz', aws_secret_access_key='baz').and_return(fake_ec2)
+
+    received = []
+    flexmock(AppScaleTools).should_receive('run_instances') \
+      .replace_with(received.append).once()
+    appscale.up()
+    self.assertEquals(capacities, received[0].capacities)
+
+
   def testUpWithEC2EnvironmentVariables(self):
     # if the user wants us to use their EC2 credentials when running AppScale,
     # we should make sure they get set
@@ -297,7 +350,7 @@ class TestAppScale(unittest.TestCase):
 
     # finally, pretend that our ec2 zone/image to use exist
     fake_ec2 = flexmock(name="fake_ec2")
-    fake_ec2.should_receive('get_all_instances')
+    fake_ec2.should_receive('get_all_reservations')
 
     fake_ec2.should_receive('get_all_zones').with_args('my-zone-1b') \
       .and_return('anything')
@@ -475,6 +528,32 @@ class TestAppScale(unittest.TestCase):
     self.assertEquals(fake_port, port)
 
 
+  def testDeployMultipleAppsWithCloudAppScalefile(self):
+    # calling 'appscale deploy app1 app2' should upload both apps in one
+    # 'appscale-upload-app --files' call
+    appscale = AppScale()
+    contents = {
+      'infrastructure' : 'ec2',
+      'machine' : 'ami-ABCDEFG',
+      'keyname' : 'bookey',
+      'group' : 'boogroup',
+      'min' : 1,
+      'max' : 1
+    }
+    self.addMockForAppScalefile(appscale, yaml.dump(contents))
+
+    results = {
+      '/bar/app1' : ('fake_host', 8080),
+      '/bar/app2' : ('fake_host', 8081)
+    }
+    flexmock(AppScaleTools)
+    AppScaleTools.should_receive('upload_app').never()
+    AppScaleTools.should_receive('upload_apps').replace_with(
+      lambda options: results if options.files == ['/bar/app1', '/bar/app2'] \
+        else None)
+    self.assertEquals(results, appscale.deploy('/bar/app1', '/bar/app2'))
+
+
   def testUndeployWithNoAppScalefile(self):
     # calling 'appscale undeploy' with no AppScalefile in the local
     # directory should throw up and die
@@ -750,6 +829,83 @@ class TestAppScale(unittest.TestCase):
     appscale.set('key', 'value')
 
 
+  def testBakeSetsMachineInAppScalefile(self):
+    # calling 'appscale bake' should make an image from the given node and
+    # point the AppScalefile's machine at it, keeping everything else
+    appscale = AppScale()
+    contents = "# Start nodes from this image.\n" \
+      "machine : 'ami-ABCDEFG'\n" \
+      "infrastructure : 'ec2'\n" \
+      "keyname : 'bookey'\n"
+
+    appscalefile = tempfile.NamedTemporaryFile(delete=False)
+    appscalefile.write(contents)
+    appscalefile.close()
+    self.addCleanup(os.remove, appscalefile.name)
+    flexmock(appscale).should_receive('get_appscalefile_location')\
+      .and_return(appscalefile.name)
+
+    flexmock(AppScaleTools).should_receive('create_image')\
+      .and_return('ami-BAKED').once()
+
+    self.assertEquals('ami-BAKED', appscale.bake(2))
+    with open(appscalefile.name) as file_handle:
+      self.assertEquals(contents.replace('ami-ABCDEFG', 'ami-BAKED'),
+        file_handle.read())
+
+
+  def testReshapeWithNoIpsLayout(self):
+    # calling 'appscale reshape' without an ips_layout in the AppScalefile
+    # has nothing to apply, so it should throw up and die
+    appscale = AppScale()
+    contents = {
+      'infrastructure' : 'ec2',
+      'machine' : 'ami-ABCDEFG',
+      'keyname' : 'bookey',
+      'min' : 1,
+      'max' : 1
+    }
+    self.addMockForAppScalefile(appscale, yaml.dump(contents))
+    flexmock(AppScaleTools).should_receive('update_layout').never()
+    self.assertRaises(BadConfigurationException, appscale.reshape)
+
+
+  def testReshapeWithIpsLayout(self):
+    # calling 'appscale reshape' should hand the AppScalefile's ips_layout
+    # and keyname to appscale-update-layout
+    appscale = AppScale()
+    ips_layout = {
+      'master' : '192.168.1.1',
+      'database' : ['192.168.1.1'],
+      'appengine' : ['192.168.1.2', '192.168.1.4']
+    }
+    contents = {
+      'ips_layout' : ips_layout,
+      'keyname' : 'bookey',
+      'table' : 'cassandra',
+      'n' : 1,
+      'login_host' : 'www.booscale.com',
+      'disks' : {'192.168.1.1' : 'vol-ABCDEFG'},
+      'zookeeper_quorum_zone' : True,
+      'test' : True
+    }
+    self.addMockForAppScalefile(appscale, yaml.dump(contents))
+
+    received = []
+    flexmock(AppScaleTools).should_receive('update_layout') \
+      .replace_with(received.append).once()
+    appscale.reshape()
+
+    self.assertEquals('bookey', received[0].keyname)
+    self.assertEquals(ips_layout, received[0].ips)
+    self.assertEquals('cassandra', received[0].table)
+    self.assertEquals(1, received[0].replication)
+    self.assertEquals('www.booscale.com', received[0].login_host)
+    self.assertEquals({'192.168.1.1' : 'vol-ABCDEFG'}, received[0].disks)
+    self.assertTrue(received[0].zookeeper_quorum_zone)
+    self.assertTrue(received[0].test)
+
+
   def testDownWithNoAppScalefile(self):
     # calling 'appscale down' with no AppScalefile in the local
     # directory should throw up and die
@@ -784,6 +940,34 @@ class TestAppScale(unittest.TestCase):
     appscale.down()
 
 
+  def testDownWithDrainPool(self):
+    # calling 'appscale down --terminate --drain-pool' should terminate the
+    # warm pool instead of refilling it
+    appscale = AppScale()
+    contents = {
+      'infrastructure' : 'ec2',
+      'machine' : 'ami-ABCDEFG',
+      'keyname' : 'bookey',
+      'group' : 'boogroup',
+      'min' : 1,
+      'max' : 1,
+      'warm_pool_size' : 2,
+      'test' : True
+    }
+    self.addMockForAppScalefile(appscale, yaml.dump(contents))
+    flexmock(LocalState).should_receive('get_infrastructure').and_return('ec2')
+    flexmock(LocalState).should_receive('are_disks_used').and_return(False)
+    flexmock(LocalState).should_receive('cleanup_appscale_files')
+
+    received = []
+    flexmock(AppScaleTools).should_receive('terminate_instances') \
+      .replace_with(received.append).once()
+    appscale.down(terminate=True, drain_pool=True)
+
+    self.assertTrue(received[0].drain_pool)
+    self.assertEquals(0, received[0].warm_pool_size)
+
+
   def testDownWithEC2EnvironmentVariables(self):
     # if the user wants us to use their EC2 credentials when running AppScale,
     # we should make sure they get set
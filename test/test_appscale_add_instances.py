@@ -37,6 +37,10 @@ class TestAppScaleAddInstances(unittest.TestCase):
     flexmock(AppScaleLogger)
     AppScaleLogger.should_receive('log').and_return()
 
+    # don't cache compiled placement strategies in the user's ~/.appscale
+    flexmock(LocalState).should_receive('get_compiled_layouts_location') \
+      .and_return('/dev/null/layouts.json')
+
     # mock out all sleeping
     flexmock(time)
     time.should_receive('sleep').and_return()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import json
+import tempfile
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.agents.ec2_agent import EC2Agent
+from appscale.tools.appscale_logger import AppScaleLogger
+from appscale.tools.appscale_tools import AppScaleTools
+from appscale.tools.custom_exceptions import BadConfigurationException
+from appscale.tools.local_state import LocalState
+from appscale.tools.parse_args import ParseArgs
+from appscale.tools.remote_helper import RemoteHelper
+
+
+class TestAppScaleCreateImage(unittest.TestCase):
+
+
+  def setUp(self):
+    self.keyname = "boobazblargfoo"
+    self.function = "appscale-create-image"
+
+    flexmock(AppScaleLogger)
+    AppScaleLogger.should_receive('log').and_return()
+    AppScaleLogger.should_receive('success').and_return()
+    AppScaleLogger.should_receive('warn').and_return()
+
+    self.head_node = {
+      'public_ip' : '192.168.1.1',
+      'private_ip' : '10.0.0.1',
+      'instance_id' : 'i-HEAD',
+      'jobs' : ['load_balancer', 'taskqueue_master', 'zookeeper', 'db_master',
+        'taskqueue', 'shadow', 'login'],
+      'disk' : None
+    }
+    self.database_node = {
+      'public_ip' : '192.168.1.2',
+      'private_ip' : '10.0.0.2',
+      'instance_id' : 'i-DATABASE',
+      'jobs' : ['db_slave', 'zookeeper'],
+      'disk' : None
+    }
+    self.appengine_node = {
+      'public_ip' : '192.168.1.3',
+      'private_ip' : '10.0.0.3',
+      'instance_id' : 'i-APPENGINE',
+      'jobs' : ['memcache', 'taskqueue_slave', 'appengine'],
+      'disk' : None
+    }
+
+    self.locations_json = tempfile.NamedTemporaryFile()
+    self.write_locations([self.head_node, self.database_node,
+      self.appengine_node])
+    flexmock(LocalState).should_receive('get_locations_json_location') \
+      .with_args(self.keyname).and_return(self.locations_json.name)
+
+    fake_agent = flexmock(EC2Agent)
+    fake_agent.should_receive('get_cloud_params').and_return({})
+    self.scrubbed = []
+    flexmock(RemoteHelper).should_receive('scrub_node_for_image') \
+      .replace_with(lambda host, keyname, verbose, then_run=None:
+        self.scrubbed.append(host))
+    self.terminated = []
+    fake_agent.should_receive('terminate_instances').replace_with(
+      lambda params: self.terminated.extend(
+        params[EC2Agent.PARAM_INSTANCE_IDS]))
+
+
+  def write_locations(self, nodes):
+    self.locations_json.seek(0)
+    self.locations_json.truncate()
+    self.locations_json.write(json.dumps({
+      'node_info' : nodes,
+      'infrastructure_info' : {'infrastructure' : 'ec2', 'group' : 'bazgroup'}
+    }))
+    self.locations_json.flush()
+
+
+  def get_options(self, argv):
+    return ParseArgs(["--keyname", self.keyname] + argv, self.function).args
+
+
+  def test_defaults_to_the_first_node_without_data(self):
+    flexmock(EC2Agent).should_receive('create_image').with_args('i-APPENGINE',
+      str, dict).and_return('ami-BAKED').once()
+    self.assertEquals('ami-BAKED', AppScaleTools.create_image(
+      self.get_options(["--test"])))
+    self.assertEquals(['192.168.1.3'], self.scrubbed)
+
+    # The scrubbed node can't rejoin, so it leaves the deployment.
+    self.assertEquals(['i-APPENGINE'], self.terminated)
+    self.assertEquals([self.head_node, self.database_node],
+      LocalState.get_local_nodes_info(self.keyname))
+
+
+  def test_refuses_nodes_that_hold_data(self):
+    flexmock(EC2Agent).should_receive('create_image').never()
+    for index in ["0", "1"]:
+      self.assertRaises(BadConfigurationException, AppScaleTools.create_image,
+        self.get_options(["--test", "--node", index]))
+
+    self.write_locations([self.head_node, self.database_node])
+    self.assertRaises(BadConfigurationException, AppScaleTools.create_image,
+      self.get_options(["--test"]))
+    self.assertEquals([], self.scrubbed)
+
+
+  def test_detaches_the_disk_of_the_node(self):
+    self.appengine_node['disk'] = 'vol-APPENGINE'
+    self.write_locations([self.head_node, self.database_node,
+      self.appengine_node])
+    flexmock(RemoteHelper).should_receive('unmount_persistent_disk') \
+      .with_args('192.168.1.3', self.keyname, False).once()
+    flexmock(EC2Agent).should_receive('create_image').and_return('ami-BAKED')
+    flexmock(EC2Agent).should_receive('detach_disk').with_args(dict,
+      'vol-APPENGINE', 'i-APPENGINE').once()
+
+    AppScaleTools.create_image(self.get_options(["--test"]))
+    self.assertEquals(['i-APPENGINE'], self.terminated)
+
+
+  def test_confirms_before_terminating_the_node(self):
+    confirmations = []
+    flexmock(LocalState).should_receive('confirm_or_abort') \
+      .replace_with(confirmations.append)
+    flexmock(EC2Agent).should_receive('create_image').and_return('ami-BAKED')
+
+    AppScaleTools.create_image(self.get_options(["--node", "2"]))
+    self.assertEquals(1, len(confirmations))
+    self.assertTrue('terminated' in confirmations[0])
+    self.assertEquals(['192.168.1.3'], self.scrubbed)
+
@@ -14,6 +14,7 @@ from flexmock import flexmock
 
 
 # AppScale import, the library that we're testing here
+from appscale.tools.agents.base_agent import BaseAgent
 from appscale.tools.agents.ec2_agent import EC2Agent
 from appscale.tools.appscale_logger import AppScaleLogger
 from appscale.tools.parse_args import ParseArgs
@@ -22,6 +23,9 @@ from appscale.tools.parse_args import ParseArgs
 class TestAppScaleLogger(unittest.TestCase):
 
   def setUp(self):
+    # don't reuse cloud connections that earlier tests mocked out
+    BaseAgent.clear_client_cache()
+
     # mock out printing to stdout
     builtins = flexmock(sys.modules['__builtin__'])
     builtins.should_receive('print').and_return()
@@ -32,7 +36,7 @@ class TestAppScaleLogger(unittest.TestCase):
 
     # pretend that our credentials are valid.
     fake_ec2 = flexmock(name="fake_ec2")
-    fake_ec2.should_receive('get_all_instances')
+    fake_ec2.should_receive('get_all_reservations')
 
     # Also pretend that the availability zone we want to use exists.
     fake_ec2.should_receive('get_all_zones').with_args('my-zone-1b') \
@@ -62,6 +66,7 @@ class TestAppScaleLogger(unittest.TestCase):
       "admin_user" : None,
       "appengine" : 1,
       "autoscale" : True,
+      "capacities" : None,
       "client_secrets" : None,
       "disks" : None,
       "min" : 1,
@@ -90,6 +95,7 @@ class TestAppScaleLogger(unittest.TestCase):
       "verbose" : False,
       "version" : False,
       "zone" : "my-zone-1b",
+      "zookeeper_quorum_zone" : False,
       "azure_subscription_id" : None,
       "azure_app_id" : None,
       "azure_app_secret_key" : None,
@@ -7,6 +7,7 @@ import httplib
 import json
 import os
 import re
+import shutil
 import socket
 import sys
 import tempfile
@@ -23,6 +24,7 @@ import SOAPpy
 
 
 # AppScale import, the library that we're testing here
+from appscale.tools.agents.base_agent import BaseAgent
 from appscale.tools.agents.ec2_agent import EC2Agent
 from appscale.tools.appcontroller_client import AppControllerClient
 from appscale.tools.appscale_logger import AppScaleLogger
@@ -38,6 +40,13 @@ class TestAppScaleRunInstances(unittest.TestCase):
 
 
   def setUp(self):
+    # don't reuse cloud connections that earlier tests mocked out
+    BaseAgent.clear_client_cache()
+
+    # don't cache compiled placement strategies in the user's ~/.appscale
+    flexmock(LocalState).should_receive('get_compiled_layouts_location') \
+      .and_return('/dev/null/layouts.json')
+
     self.keyname = "boobazblargfoo"
     self.group = "bazgroup"
     self.function = "appscale-run-instances"
@@ -139,14 +148,9 @@ group: {1}
     self.fake_ec2.should_receive('get_key_pair').with_args(self.keyname) \
       .and_return(None)
 
-    # next, assume there are no security groups up at first, but then it gets
-    # created.
-    udp_rule = flexmock(from_port=1, to_port=65535, ip_protocol='udp')
-    tcp_rule = flexmock(from_port=1, to_port=65535, ip_protocol='tcp')
-    icmp_rule = flexmock(from_port=-1, to_port=-1, ip_protocol='icmp')
-    group = flexmock(name=self.group, rules=[tcp_rule, udp_rule, icmp_rule])
-    self.fake_ec2.should_receive('get_all_security_groups').with_args().and_return([])
-    self.fake_ec2.should_receive('get_all_security_groups').with_args(self.group).and_return([group])
+    # next, assume there are no security groups up at first
+    self.fake_ec2.should_receive('get_all_security_groups').with_args(
+      filters={'group-name' : self.group}).and_return([])
 
 
     # mock out creating the keypair
@@ -159,12 +163,8 @@ group: {1}
     # and the same for the security group
     self.fake_ec2.should_receive('create_security_group').with_args(self.group,
       str).and_return()
-    self.fake_ec2.should_receive('authorize_security_group').with_args(self.group,
-      from_port=1, to_port=65535, ip_protocol='udp', cidr_ip='0.0.0.0/0')
-    self.fake_ec2.should_receive('authorize_security_group').with_args(self.group,
-      from_port=1, to_port=65535, ip_protocol='tcp', cidr_ip='0.0.0.0/0')
-    self.fake_ec2.should_receive('authorize_security_group').with_args(self.group,
-      from_port=-1, to_port=-1, ip_protocol='icmp', cidr_ip='0.0.0.0/0')
+    self.fake_ec2.should_receive('get_status').with_args(
+      'AuthorizeSecurityGroupIngress', dict, verb='POST').and_return(True)
 
     # assume that there are no instances running initially, and that the
     # instance we spawn starts as pending, then becomes running
@@ -181,7 +181,7 @@ group: {1}
     running_reservation = flexmock(name='running_reservation',
       instances=[running_instance])
 
-    self.fake_ec2.should_receive('get_all_instances').and_return(no_instances) \
+    self.fake_ec2.should_receive('get_all_reservations').and_return(no_instances) \
       .and_return(no_instances).and_return(pending_reservation) \
       .and_return(running_reservation)
 
@@ -444,12 +444,18 @@ appengine:  1.2.3.4
 
     self.setup_ec2_mocks()
 
-    # slip in some fake spot instance info
-    fake_entry = flexmock(name='fake_entry', price=1)
+    # slip in some fake spot instance info, caching it in a temporary
+    # directory instead of ~/.appscale
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    flexmock(LocalState).should_receive('get_spot_price_cache_location')\
+      .and_return(os.path.join(cache_dir, 'spot-prices.json'))
+    fake_entry = flexmock(name='fake_entry', price=1.1,
+      timestamp=time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()))
     self.fake_ec2.should_receive('get_spot_price_history').with_args(
       start_time=str, end_time=str,
       product_description='Linux/UNIX', instance_type='m3.medium',
-      availability_zone='my-zone-1b').and_return([fake_entry])
+      availability_zone='my-zone-1b', next_token=None).and_return([fake_entry])
 
     # also mock out acquiring a spot instance
     self.fake_ec2.should_receive('request_spot_instances').with_args('1.1',
@@ -577,7 +583,7 @@ appengine:  1.2.3.4
     running_reservation = flexmock(name='running_reservation',
       instances=[running_instance])
 
-    self.fake_ec2.should_receive('get_all_instances').and_return(no_instances) \
+    self.fake_ec2.should_receive('get_all_reservations').and_return(no_instances) \
       .and_return(no_instances) \
       .and_return(no_instances).and_return(pending_reservation) \
       .and_return(running_reservation)
@@ -25,6 +25,7 @@ import SOAPpy
 
 
 # AppScale import, the library that we're testing here
+from appscale.tools.agents.base_agent import BaseAgent
 from appscale.tools.agents.ec2_agent import EC2Agent
 from appscale.tools.agents.gce_agent import CredentialTypes
 from appscale.tools.agents.gce_agent import GCEAgent
@@ -40,6 +41,9 @@ class TestAppScaleTerminateInstances(unittest.TestCase):
 
 
   def setUp(self):
+    # don't reuse cloud connections that earlier tests mocked out
+    BaseAgent.clear_client_cache()
+
     self.keyname = "boobazblargfoo"
     self.group = "bazboogroup"
     self.function = "appscale-terminate-instances"
@@ -264,7 +268,7 @@ class TestAppScaleTerminateInstances(unittest.TestCase):
     fake_reservation_terminated = flexmock(name='fake_reservation', instances=[fake_one_terminated,
       fake_two_terminated, fake_three_terminated])
 
-    fake_ec2.should_receive('get_all_instances').and_return(fake_reservation_running) \
+    fake_ec2.should_receive('get_all_reservations').and_return(fake_reservation_running) \
       .and_return(fake_reservation_terminated)
 
     flexmock(boto.ec2)
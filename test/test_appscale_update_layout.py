@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import base64
+import json
+import tempfile
+import time
+import unittest
+import yaml
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.appcontroller_client import AppControllerClient
+from appscale.tools.appscale_logger import AppScaleLogger
+from appscale.tools.appscale_tools import AppScaleTools
+from appscale.tools.custom_exceptions import AppControllerException
+from appscale.tools.custom_exceptions import BadConfigurationException
+from appscale.tools.local_state import LocalState
+from appscale.tools.parse_args import ParseArgs
+from appscale.tools.remote_helper import RemoteHelper
+
+
+class TestAppScaleUpdateLayout(unittest.TestCase):
+
+
+  def setUp(self):
+    self.keyname = "boobazblargfoo"
+    self.function = "appscale-update-layout"
+
+    flexmock(AppScaleLogger)
+    AppScaleLogger.should_receive('log').and_return()
+    AppScaleLogger.should_receive('success').and_return()
+    AppScaleLogger.should_receive('warn').and_return()
+    flexmock(time).should_receive('sleep').and_return()
+
+    self.head_node = {
+      'public_ip' : '192.168.1.1',
+      'private_ip' : '10.0.0.1',
+      'instance_id' : 'i-APPSCALE',
+      'jobs' : ['load_balancer', 'taskqueue_master', 'zookeeper', 'db_master',
+        'taskqueue', 'shadow', 'login'],
+      'disk' : None
+    }
+    self.appengine_node = {
+      'public_ip' : '192.168.1.2',
+      'private_ip' : '10.0.0.2',
+      'instance_id' : 'i-APPSCALE',
+      'jobs' : ['memcache', 'taskqueue_slave', 'appengine'],
+      'disk' : None
+    }
+    self.search_node = {
+      'public_ip' : '192.168.1.3',
+      'private_ip' : '10.0.0.3',
+      'instance_id' : 'i-APPSCALE',
+      'jobs' : ['search'],
+      'disk' : None
+    }
+    self.joining_node = {
+      'public_ip' : '192.168.1.4',
+      'private_ip' : '10.0.0.4',
+      'instance_id' : 'i-APPSCALE',
+      'jobs' : ['memcache', 'taskqueue_slave', 'appengine'],
+      'disk' : None
+    }
+
+    # A locations.json for a running virtualized cluster deployment.
+    self.locations_json = tempfile.NamedTemporaryFile()
+    self.locations_json.write(json.dumps({
+      'node_info' : [self.head_node, self.appengine_node, self.search_node],
+      'infrastructure_info' : {'infrastructure' : 'xen', 'group' : 'bazgroup'}
+    }))
+    self.locations_json.flush()
+
+    local_state = flexmock(LocalState)
+    local_state.should_receive('get_locations_json_location') \
+      .with_args(self.keyname).and_return(self.locations_json.name)
+    local_state.should_receive('get_secret_key').and_return('the secret')
+    flexmock(RemoteHelper).should_receive('ssh').and_return()
+
+
+  def get_options(self, ips_layout, extra_args=()):
+    return ParseArgs([
+      "--keyname", self.keyname,
+      "--ips_layout", base64.b64encode(yaml.dump(ips_layout)),
+      "--test"
+    ] + list(extra_args), self.function).args
+
+
+  def test_update_layout_persists_new_layout(self):
+    ips_layout = {
+      'master' : '192.168.1.1',
+      'database' : ['192.168.1.1'],
+      'appengine' : ['192.168.1.2', '192.168.1.4'],
+      'search' : ['192.168.1.3']
+    }
+
+    fake_appcontroller = flexmock(AppControllerClient)
+    fake_appcontroller.should_receive('start_roles_on_nodes').with_args(
+      json.dumps({'appengine' : ['192.168.1.4'],
+        'memcache' : ['192.168.1.4']})).and_return('OK').once()
+
+    # The joining node shows up on the second poll.
+    fake_appcontroller.should_receive('get_role_info') \
+      .and_return([self.head_node, self.appengine_node, self.search_node]) \
+      .and_return([self.head_node, self.appengine_node, self.search_node,
+        self.joining_node])
+
+    AppScaleTools.update_layout(self.get_options(ips_layout))
+    self.assertEquals([self.head_node, self.appengine_node, self.search_node,
+      self.joining_node], LocalState.get_local_nodes_info(self.keyname))
+
+    # Running it again finds nothing to change, so no roles are started twice.
+    AppScaleTools.update_layout(self.get_options(ips_layout))
+
+
+  def test_update_layout_reports_machines_that_never_start(self):
+    ips_layout = {
+      'master' : '192.168.1.1',
+      'database' : ['192.168.1.1'],
+      'appengine' : ['192.168.1.2', '192.168.1.4'],
+      'search' : ['192.168.1.3']
+    }
+    fake_appcontroller = flexmock(AppControllerClient)
+    fake_appcontroller.should_receive('start_roles_on_nodes').and_return('OK')
+    fake_appcontroller.should_receive('get_role_info').and_return(
+      [self.head_node, self.appengine_node, self.search_node])
+    flexmock(time).should_receive('time').and_return(0).and_return(
+      RemoteHelper.MAX_WAIT_TIME)
+
+    self.assertRaises(AppControllerException, AppScaleTools.update_layout,
+      self.get_options(ips_layout))
+
+
+  def test_update_layout_rejects_roles_on_running_machines(self):
+    ips_layout = {
+      'master' : '192.168.1.1',
+      'database' : ['192.168.1.1'],
+      'appengine' : ['192.168.1.2'],
+      'search' : ['192.168.1.2']
+    }
+    flexmock(AppControllerClient).should_receive('start_roles_on_nodes') \
+      .never()
+    self.assertRaises(BadConfigurationException, AppScaleTools.update_layout,
+      self.get_options(ips_layout))
+
+
+  def test_update_layout_refuses_to_remove_machines_or_roles(self):
+    flexmock(AppControllerClient).should_receive('start_roles_on_nodes') \
+      .never()
+
+    # The search machine is left out.
+    self.assertRaises(BadConfigurationException, AppScaleTools.update_layout,
+      self.get_options({
+        'master' : '192.168.1.1',
+        'database' : ['192.168.1.1'],
+        'appengine' : ['192.168.1.2']
+      }))
+
+    # All machines stay, but memcache moves off the appengine machine.
+    self.assertRaises(BadConfigurationException, AppScaleTools.update_layout,
+      self.get_options({
+        'master' : '192.168.1.1',
+        'database' : ['192.168.1.1'],
+        'appengine' : ['192.168.1.2', '192.168.1.4'],
+        'memcache' : ['192.168.1.4'],
+        'search' : ['192.168.1.3']
+      }))
+    self.assertEquals([self.head_node, self.appengine_node, self.search_node],
+      LocalState.get_local_nodes_info(self.keyname))
+
+
+  def test_update_layout_validates_the_deployment_options(self):
+    ips_layout = {
+      'master' : '192.168.1.1',
+      'database' : ['192.168.1.1'],
+      'appengine' : ['192.168.1.2', '192.168.1.4'],
+      'search' : ['192.168.1.3']
+    }
+    flexmock(AppControllerClient).should_receive('start_roles_on_nodes') \
+      .never()
+
+    # One database machine can't hold two replicas.
+    self.assertRaises(BadConfigurationException, AppScaleTools.update_layout,
+      self.get_options(ips_layout, ["--replication", "2"]))
@@ -10,6 +10,7 @@ import shutil
 import socket
 import subprocess
 import sys
+import tarfile
 import tempfile
 import time
 import unittest
@@ -23,6 +24,7 @@ import SOAPpy
 
 
 # AppScale import, the library that we're testing here
+from appscale.tools.appcontroller_client import AppControllerClient
 from appscale.tools.appengine_helper import AppEngineHelper
 from appscale.tools.appscale_logger import AppScaleLogger
 from appscale.tools.appscale_tools import AppScaleTools
@@ -30,6 +32,7 @@ from appscale.tools.custom_exceptions import AppEngineConfigException
 from appscale.tools.custom_exceptions import AppScaleException
 from appscale.tools.local_state import LocalState
 from appscale.tools.parse_args import ParseArgs
+from appscale.tools.remote_helper import RemoteHelper
 
 
 class TestAppScaleUploadApp(unittest.TestCase):
@@ -369,20 +372,10 @@ class TestAppScaleUploadApp(unittest.TestCase):
       shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
       .and_return(self.success)
 
-    # and mock out tarring and copying the app
-    subprocess.should_receive('Popen').with_args(re.compile('tar -czhf'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/tmp/appscale-app-baz.tar.gz'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # as well as removing the tar'ed app once we're done copying it
-    flexmock(os)
-    os.should_receive('remove').with_args('/tmp/appscale-app-baz-1234.tar.gz') \
-      .and_return()
+    # and mock out streaming the app to the login node
+    flexmock(RemoteHelper).should_receive('stream_to_host').with_args('public1',
+      self.keyname, re.compile("tar -c.* --null -T "),
+      '/opt/appscale/apps/baz.tar.gz', False, remote_filter=None).once()
 
     # and slap in a mock that says the app comes up after waiting for it
     # three times
@@ -566,19 +559,10 @@ class TestAppScaleUploadApp(unittest.TestCase):
       .with_args(re.compile('^ssh'), False, 5, stdin=re.compile('^mkdir -p')) \
       .and_return()
 
-    # and mock out tarring and copying the app
-    local_state.should_receive('shell') \
-      .with_args(re.compile('tar -czhf'), False) \
-      .and_return()
-
-    local_state.should_receive('shell') \
-      .with_args(re.compile('/tmp/appscale-app-baz.tar.gz'), False, 5) \
-      .and_return()
-
-    # as well as removing the tar'ed app once we're done copying it
-    flexmock(os)
-    os.should_receive('remove').with_args('/tmp/appscale-app-baz-1234.tar.gz') \
-      .and_return()
+    # and mock out streaming the app to the login node
+    flexmock(RemoteHelper).should_receive('stream_to_host').with_args('public1',
+      self.keyname, re.compile("tar -c.* --null -T "),
+      '/opt/appscale/apps/baz.tar.gz', False, remote_filter=None).once()
 
     # and slap in a mock that says the app comes up after waiting for it
     # three times
@@ -685,20 +669,10 @@ class TestAppScaleUploadApp(unittest.TestCase):
       shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
       .and_return(self.success)
 
-    # and mock out tarring and copying the app
-    subprocess.should_receive('Popen').with_args(re.compile('tar -czhf'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/tmp/appscale-app-baz.tar.gz'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # as well as removing the tar'ed app once we're done copying it
-    flexmock(os)
-    os.should_receive('remove').with_args('/tmp/appscale-app-baz-1234.tar.gz') \
-      .and_return()
+    # and mock out streaming the app to the login node
+    flexmock(RemoteHelper).should_receive('stream_to_host').with_args('public1',
+      self.keyname, re.compile("tar -c.* --null -T "),
+      '/opt/appscale/apps/baz.tar.gz', False, remote_filter=None).once()
 
     # and slap in a mock that says the app comes up after waiting for it
     # three times
@@ -817,20 +791,12 @@ class TestAppScaleUploadApp(unittest.TestCase):
       .with_args(re.compile('^ssh'), False, 5, stdin=re.compile('^mkdir -p')) \
       .and_return()
 
-    # and mock out tarring and copying the app
-    local_state.should_receive('shell') \
-      .with_args(re.compile('tar -czhf'), False) \
-      .and_return()
-
-    local_state.should_receive('shell') \
-      .with_args(re.compile('/tmp/appscale-app-baz.tar.gz'), False, 5) \
-      .and_return()
+    # and mock out streaming the app to the login node
+    flexmock(RemoteHelper).should_receive('stream_to_host').with_args('public1',
+      self.keyname, re.compile("tar -c.* --null -T "),
+      '/opt/appscale/apps/baz.tar.gz', False, remote_filter=None).once()
 
-    # as well as removing the tar'ed app once we're done copying it
     flexmock(os)
-    os.should_receive('remove').with_args('/tmp/appscale-app-baz-1234.tar.gz') \
-      .and_return()
-
     os.should_receive('listdir').and_return(['app.yaml','index.py'])
 
     # and slap in a mock that says the app comes up after waiting for it
@@ -852,6 +818,126 @@ class TestAppScaleUploadApp(unittest.TestCase):
     self.assertEquals(8080, port)
 
 
+  def test_upload_tar_gz_app_is_sent_as_is(self):
+    # An archive with the app at its top can go to the login node without
+    # being extracted and packed again.
+    archive_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, archive_dir)
+    app_yaml = os.path.join(archive_dir, 'app.yaml')
+    with open(app_yaml, 'w') as file_handle:
+      file_handle.write(yaml.dump({'application' : 'baz',
+        'runtime' : 'python27'}))
+    archive_location = os.path.join(archive_dir, 'baz.tar.gz')
+    with tarfile.open(archive_location, 'w:gz') as archive:
+      archive.add(app_yaml, arcname='app.yaml')
+
+    local_state = flexmock(LocalState)
+    local_state.should_receive('get_login_host').and_return('public1')
+    local_state.should_receive('get_secret_key').and_return('the secret')
+    local_state.should_receive('extract_tgz_app_to_dir').never()
+
+    fake_appcontroller = flexmock(AppControllerClient)
+    fake_appcontroller.should_receive('does_user_exist').and_return(True)
+    fake_appcontroller.should_receive('does_app_exist').and_return(False)
+    fake_appcontroller.should_receive('get_app_admin').and_return(None)
+    fake_appcontroller.should_receive('reserve_app_id').with_args(
+      LocalState.DEFAULT_USER, 'baz', 'python27').once()
+    fake_appcontroller.should_receive('done_uploading').with_args('baz',
+      '/opt/appscale/apps/baz.tar.gz').once()
+    fake_appcontroller.should_receive('update').with_args(['baz']).once()
+    fake_appcontroller.should_receive('get_all_stats').and_return(json.dumps(
+      {'apps' : {'baz' : {'http' : 8080}}}))
+
+    remote_helper = flexmock(RemoteHelper)
+    remote_helper.should_receive('stream_to_host').with_args('public1',
+      self.keyname, "cat '{0}'".format(archive_location),
+      '/opt/appscale/apps/baz.tar.gz', False).once()
+    remote_helper.should_receive('copy_app_to_host').never()
+    remote_helper.should_receive('sleep_until_port_is_open').and_return()
+
+    argv = [
+      "--keyname", self.keyname,
+      "--file", archive_location,
+      "--test"
+    ]
+    options = ParseArgs(argv, self.function).args
+    self.assertEquals(('public1', 8080), AppScaleTools.upload_app(options))
+
+
+  def test_dry_run_reports_ignored_files_without_uploading(self):
+    app_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, app_dir)
+    os.makedirs(os.path.join(app_dir, 'node_modules', 'left-pad'))
+    for name, contents in [('app.yaml', yaml.dump({'application' : 'baz',
+      'runtime' : 'python27'})), ('.appscaleignore', 'node_modules/\n'),
+      (os.path.join('node_modules', 'left-pad', 'index.js'), 'x' * 100)]:
+      with open(os.path.join(app_dir, name), 'w') as file_handle:
+        file_handle.write(contents)
+
+    flexmock(LocalState).should_receive('get_login_host').never()
+    flexmock(RemoteHelper).should_receive('stream_to_host').never()
+    AppScaleLogger.should_receive('log').with_args(
+      re.compile("Would upload 1 files")).once()
+    AppScaleLogger.should_receive('log').with_args(
+      "Ignore rules leave out 2 files and directories, saving 114 bytes").once()
+
+    argv = [
+      "--keyname", self.keyname,
+      "--file", app_dir,
+      "--dry-run"
+    ]
+    options = ParseArgs(argv, self.function).args
+    self.assertEquals(None, AppScaleTools.upload_app(options))
+
+
+  def test_upload_several_apps_together(self):
+    app_dirs = []
+    for app_id in ['foo', 'bar', 'foo']:
+      app_dir = tempfile.mkdtemp()
+      self.addCleanup(shutil.rmtree, app_dir)
+      with open(os.path.join(app_dir, 'app.yaml'), 'w') as file_handle:
+        file_handle.write(yaml.dump({'application' : app_id,
+          'runtime' : 'python27'}))
+      app_dirs.append(app_dir)
+
+    local_state = flexmock(LocalState)
+    local_state.should_receive('get_login_host').and_return('public1')
+    local_state.should_receive('get_secret_key').and_return('the secret')
+
+    # Both apps are reserved and copied, but the AppController is only told
+    # to start them, and asked where they serve, once for both.
+    fake_appcontroller = flexmock(AppControllerClient)
+    fake_appcontroller.should_receive('does_user_exist').and_return(True)
+    fake_appcontroller.should_receive('does_app_exist').and_return(False)
+    fake_appcontroller.should_receive('get_app_admin').and_return(None)
+    fake_appcontroller.should_receive('reserve_app_id').twice()
+    fake_appcontroller.should_receive('done_uploading').twice()
+    fake_appcontroller.should_receive('update').with_args(['foo', 'bar']) \
+      .once()
+    fake_appcontroller.should_receive('get_all_stats').and_return(json.dumps(
+      {'apps' : {'foo' : {'http' : 8080}, 'bar' : {'http' : None}}})) \
+      .and_return(json.dumps(
+      {'apps' : {'foo' : {'http' : 8080}, 'bar' : {'http' : 8081}}}))
+
+    remote_helper = flexmock(RemoteHelper)
+    remote_helper.should_receive('copy_app_to_host').replace_with(
+      lambda app_location, *args, **kwargs: '/opt/appscale/apps/app.tar.gz')
+    remote_helper.should_receive('sleep_until_port_is_open').twice()
+
+    argv = [
+      "--keyname", self.keyname,
+      "--files", app_dirs[0], app_dirs[1], app_dirs[2],
+      "--test"
+    ]
+    options = ParseArgs(argv, self.function).args
+    results = AppScaleTools.upload_apps(options)
+
+    # The third app has the same ID as the first, so it isn't uploaded.
+    self.assertEquals(('public1', 8080), results[app_dirs[0]])
+    self.assertEquals(('public1', 8081), results[app_dirs[1]])
+    self.assertIsInstance(results[app_dirs[2]], AppScaleException)
+
+
   def test_upload_php_app_successfully(self):
     app_dir = '/tmp/appscale-app-1234'
 
@@ -950,20 +1036,12 @@ class TestAppScaleUploadApp(unittest.TestCase):
       .with_args(re.compile('^ssh'), False, 5, stdin=re.compile('^mkdir -p')) \
       .and_return()
 
-    # and mock out tarring and copying the app
-    local_state.should_receive('shell') \
-      .with_args(re.compile('tar -czf'), False) \
-      .and_return()
-
-    local_state.should_receive('shell') \
-      .with_args(re.compile('/tmp/appscale-app-baz.tar.gz'), False, 5) \
-      .and_return()
+    # and mock out streaming the app to the login node
+    flexmock(RemoteHelper).should_receive('stream_to_host').with_args('public1',
+      self.keyname, re.compile("tar -c.* --null -T "),
+      '/opt/appscale/apps/baz.tar.gz', False, remote_filter=None).once()
 
-    # as well as removing the tar'ed app once we're done copying it
     flexmock(os)
-    os.should_receive('remove').with_args('/tmp/appscale-app-baz-1234.tar.gz') \
-      .and_return()
-
     os.should_receive('listdir').and_return(['app.yaml','index.py'])
 
     # and slap in a mock that says the app comes up after waiting for it
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import sys
+import time
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.agents import azure_agent
+from appscale.tools.agents.azure_agent import AzureAgent
+from appscale.tools.agents.base_agent import AgentRuntimeException
+from appscale.tools.agents.base_agent import BaseAgent
+from appscale.tools.appscale_logger import AppScaleLogger
+from appscale.tools.local_state import LocalState
+
+
+class TestAzureAgent(unittest.TestCase):
+
+
+  def setUp(self):
+    BaseAgent.clear_client_cache()
+    self.agent = AzureAgent()
+    self.params = {
+      AzureAgent.PARAM_GROUP : 'bazgroup',
+      AzureAgent.PARAM_RESOURCE_GROUP : 'appscalegroup',
+      AzureAgent.PARAM_SUBSCRIBER_ID : 'subscription',
+      AzureAgent.PARAM_VERBOSE : False
+    }
+
+    flexmock(AppScaleLogger).should_receive('log').and_return()
+    flexmock(AppScaleLogger).should_receive('warn').and_return()
+    flexmock(time).should_receive('sleep').and_return()
+
+    fake_interfaces = flexmock(name='fake_interfaces')
+    fake_interfaces.should_receive('get').and_return(flexmock(id='nic-id'))
+    self.network_client = flexmock(network_interfaces=fake_interfaces)
+    flexmock(azure_agent).should_receive('NetworkManagementClient')\
+      .and_return(self.network_client)
+
+    flexmock(self.agent).should_receive('open_connection').and_return(
+      flexmock(name='fake_credentials'))
+    flexmock(self.agent).should_receive('create_virtual_network')\
+      .and_return(flexmock(name='fake_subnet'))
+    flexmock(self.agent).should_receive('create_network_interface')\
+      .and_return()
+
+
+  def test_run_instances_creates_every_vm(self):
+    flexmock(self.agent).should_receive('create_virtual_machine')\
+      .times(12).and_return()
+    flexmock(self.agent).should_receive('describe_instances').and_return(
+      (['public1'], ['private1'], ['vm1']))
+
+    self.assertEquals((['vm1'], ['public1'], ['private1']),
+      self.agent.run_instances(12, self.params, True))
+
+
+  def test_run_instances_reports_each_failure(self):
+    flexmock(self.agent).should_receive('create_virtual_machine')\
+      .and_raise(AgentRuntimeException, 'no public IP')\
+      .and_return().and_raise(AgentRuntimeException, 'no public IP')
+    flexmock(self.agent).should_receive('describe_instances').never()
+    flexmock(AppScaleLogger).should_receive('warn').times(2)
+
+    # Every VM is deleted, including the one that started.
+    vm_names = []
+    flexmock(self.agent).should_receive('delete_virtual_machines').replace_with(
+      lambda credentials, params, names: vm_names.extend(names)).once()
+
+    self.assertRaises(AgentRuntimeException, self.agent.run_instances, 3,
+      self.params, True)
+    self.assertEquals(3, len(set(vm_names)))
+
+
+  def test_create_virtual_machine_stops_at_deadline(self):
+    fake_ips = flexmock(name='fake_ips')
+    fake_ips.should_receive('get').and_return(flexmock(ip_address=None))
+    self.network_client.public_ip_addresses = fake_ips
+
+    fake_vms = flexmock(name='fake_vms')
+    fake_vms.should_receive('create_or_update').and_return()
+    flexmock(azure_agent).should_receive('ComputeManagementClient')\
+      .and_return(flexmock(virtual_machines=fake_vms))
+
+    params = dict(self.params)
+    params.update({
+      AzureAgent.PARAM_INSTANCE_TYPE : 'Standard_A3',
+      AzureAgent.PARAM_IMAGE_ID : 'https://appscale/image.vhd',
+      AzureAgent.PARAM_KEYNAME : 'bookey',
+      AzureAgent.PARAM_STORAGE_ACCOUNT : 'appscalestorage',
+      AzureAgent.PARAM_ZONE : 'westus'
+    })
+
+    fake_key = flexmock(name='fake_key', read=lambda: 'ssh-rsa key')
+    fake_key.should_receive('__enter__').and_return(fake_key)
+    fake_key.should_receive('__exit__').and_return()
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_call('open')  # set the fall-through
+    builtins.should_receive('open').with_args(
+      LocalState.LOCAL_APPSCALE_PATH + 'bookey.pub', 'r').and_return(fake_key)
+
+    self.assertRaises(AgentRuntimeException,
+      self.agent.create_virtual_machine, flexmock(), self.network_client,
+      'nic-id', params, 'vm1', time.time() - 1)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import time
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.agents.base_agent import BaseAgent
+
+
+class TestBaseAgent(unittest.TestCase):
+
+
+  def setUp(self):
+    self.agent = BaseAgent()
+    self.sleeps = []
+    flexmock(time).should_receive('sleep').replace_with(self.sleeps.append)
+
+
+  def test_poll_backs_off_until_done(self):
+    results = iter([None, None, None, None, None, None, 'done'])
+    finished, result = self.agent.poll(lambda: next(results), timeout=None)
+
+    self.assertEquals((True, 'done'), (finished, result))
+    self.assertEquals(6, len(self.sleeps))
+
+    # Each delay is within the jitter of 1, 2, 4, 8, 16, then capped at 20.
+    for expected, actual in zip([1, 2, 4, 8, 16, 20], self.sleeps):
+      self.assertTrue(expected * (1 - BaseAgent.POLL_JITTER) <= actual <=
+        expected * (1 + BaseAgent.POLL_JITTER))
+
+
+  def test_poll_gives_up_at_deadline(self):
+    finished, result = self.agent.poll(lambda: 'running', timeout=0,
+      done=lambda state: state == 'stopped')
+    self.assertEquals((False, 'running'), (finished, result))
+    self.assertEquals([], self.sleeps)
+
+
+  def test_poll_can_wait_before_first_check(self):
+    self.agent.poll(lambda: True, timeout=None, wait_first=True)
+    self.assertEquals(1, len(self.sleeps))
+
+
+  def test_poll_all_only_checks_pending_operations(self):
+    checked = []
+
+    def check(pending):
+      checked.append(sorted(pending.keys()))
+      if len(checked) == 1:
+        return {'a' : 'done-a'}
+      return {'b' : 'done-b'}
+
+    finished, pending = self.agent.poll_all({'a' : 1, 'b' : 2}, check,
+      timeout=None)
+    self.assertEquals({'a' : 'done-a', 'b' : 'done-b'}, finished)
+    self.assertEquals({}, pending)
+    self.assertEquals([['a', 'b'], ['b']], checked)
+
+
+  def test_poll_all_returns_unfinished_operations(self):
+    finished, pending = self.agent.poll_all({'a' : 1}, lambda pending: {},
+      timeout=0)
+    self.assertEquals({}, finished)
+    self.assertEquals({'a' : 1}, pending)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import unittest
+
+
+# Third party libraries
+from boto.exception import EC2ResponseError
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.agents.azure_agent import AzureAgent
+from appscale.tools.agents.base_agent import AgentRuntimeException
+from appscale.tools.agents.ec2_agent import EC2Agent
+from appscale.tools.agents.gce_agent import GCEAgent
+from appscale.tools.appscale_logger import AppScaleLogger
+from cloud_emulator import AzureEmulator
+from cloud_emulator import EC2Emulator
+from cloud_emulator import GCEEmulator
+
+
+# How many times faster than the wall clock the emulators run. Much faster
+# than this and the time that threads spend waiting on each other adds up to
+# enough emulated time to trip the agents' timeouts.
+SPEEDUP = 1000
+
+
+class TestCloudEmulator(unittest.TestCase):
+
+
+  def setUp(self):
+    flexmock(AppScaleLogger).should_receive('log').and_return()
+    flexmock(AppScaleLogger).should_receive('warn').and_return()
+    flexmock(AppScaleLogger).should_receive('verbose').and_return()
+
+
+  def run_and_terminate(self, agent, emulator, count):
+    parameters = emulator.get_parameters()
+    with emulator.installed():
+      instance_ids, public_ips, private_ips = agent.run_instances(count,
+        parameters, True)
+      self.assertEquals(count, len(instance_ids))
+      self.assertEquals(count, len(set(public_ips)))
+      self.assertEquals(count, len(set(private_ips)))
+
+      parameters[agent.PARAM_INSTANCE_IDS] = instance_ids
+      agent.terminate_instances(parameters)
+
+      # Azure leaves network interfaces and public IPs behind until the
+      # deployment's state is cleaned up, so only check the instances.
+      _, _, instance_ids = agent.describe_instances(parameters)
+      self.assertEquals([], instance_ids)
+
+
+  def test_ec2_run_and_terminate(self):
+    emulator = EC2Emulator(boot_jitter=0.5, speedup=SPEEDUP)
+    self.run_and_terminate(EC2Agent(), emulator, 20)
+    self.assertEquals(1, emulator.calls['run_instances'])
+
+
+  def test_gce_run_and_terminate(self):
+    emulator = GCEEmulator(boot_jitter=0.5, speedup=SPEEDUP)
+    self.run_and_terminate(GCEAgent(), emulator, 20)
+    self.assertEquals(20, emulator.calls['instances.insert'])
+
+
+  def test_azure_run_and_terminate(self):
+    emulator = AzureEmulator(boot_jitter=0.5, speedup=SPEEDUP)
+    self.run_and_terminate(AzureAgent(), emulator, 12)
+    self.assertEquals(12, emulator.calls['virtual_machines.create_or_update'])
+
+
+  def test_gce_reports_instances_that_fail_to_start(self):
+    emulator = GCEEmulator(launch_failure_rate=1.0, speedup=SPEEDUP)
+    with emulator.installed():
+      self.assertRaises(AgentRuntimeException, GCEAgent().run_instances, 3,
+        emulator.get_parameters(), True)
+
+    # The boot disks of the instances that failed are deleted.
+    self.assertEquals(set(), emulator.disk_names)
+
+
+  def test_azure_terminates_only_the_given_vms(self):
+    emulator = AzureEmulator(speedup=SPEEDUP)
+    agent = AzureAgent()
+    parameters = emulator.get_parameters()
+    with emulator.installed():
+      instance_ids, _, _ = agent.run_instances(3, parameters, True)
+      parameters[agent.PARAM_INSTANCE_IDS] = instance_ids[:1]
+      agent.terminate_instances(parameters)
+
+      _, _, running_ids = agent.describe_instances(parameters)
+      self.assertEquals(sorted(instance_ids[1:]), sorted(running_ids))
+
+
+  def test_azure_deletes_vms_when_one_fails_to_start(self):
+    emulator = AzureEmulator(speedup=SPEEDUP)
+    emulator.fail_next('virtual_machines.create_or_update')
+    with emulator.installed():
+      self.assertRaises(AgentRuntimeException, AzureAgent().run_instances, 3,
+        emulator.get_parameters(), True)
+
+    self.assertEquals(2, len(emulator.machines))
+    for instance in emulator.machines.values():
+      self.assertIsNotNone(instance['terminated_at'])
+    self.assertEquals({}, emulator.resources['network_interfaces'])
+    self.assertEquals({}, emulator.resources['public_ip_addresses'])
+
+
+  def test_injected_failures(self):
+    emulator = EC2Emulator(speedup=SPEEDUP)
+    emulator.fail_next('run_instances')
+    with emulator.installed():
+      self.assertRaises(AgentRuntimeException, EC2Agent().run_instances, 1,
+        emulator.get_parameters(), True)
+
+      # Only the next call fails.
+      EC2Agent().run_instances(1, emulator.get_parameters(), True)
+
+
+  def test_throttling(self):
+    emulator = EC2Emulator(api_rate=2, speedup=1)
+    for _ in range(2):
+      emulator.get_all_zones('my-zone-1b')
+    self.assertRaises(EC2ResponseError, emulator.get_all_zones, 'my-zone-1b')
+    self.assertEquals(1, emulator.throttled_calls)
+
+
+  def test_agents_retry_throttled_calls(self):
+    # Whether the rate limit is hit depends on how fast this machine makes
+    # the calls, so the first call that each agent makes to create instances
+    # is always throttled too. GCE sends every insert in one batch, so its
+    # rate lets a whole batch through; otherwise the last insert in the batch
+    # can run out of retries.
+    for agent, emulator, count, call in [
+      (EC2Agent(), EC2Emulator(api_rate=2, speedup=SPEEDUP), 5,
+        'run_instances'),
+      (GCEAgent(), GCEEmulator(api_rate=5, speedup=SPEEDUP), 5,
+        'instances.insert'),
+      (AzureAgent(), AzureEmulator(api_rate=2, speedup=SPEEDUP), 3,
+        'virtual_machines.create_or_update')]:
+      emulator.fail_next(call, throttled=True)
+      snapshot = agent.get_api_call_stats().snapshot()
+      self.run_and_terminate(agent, emulator, count)
+
+      calls = agent.get_api_call_stats().since(snapshot)
+      self.assertLess(0, emulator.throttled_calls)
+      self.assertEquals(emulator.throttled_calls,
+        sum(throttled for _, _, throttled in calls.values()))
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+# Third party libraries
+import boto.ec2
+from boto.exception import EC2ResponseError
+from boto.resultset import ResultSet
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.agents.base_agent import AgentRuntimeException
+from appscale.tools.agents.base_agent import BaseAgent
+from appscale.tools.agents.ec2_agent import EC2Agent
+from appscale.tools.agents.ec2_agent import EC2Instance
+from appscale.tools.agents.ec2_agent import SpotPriceCache
+from appscale.tools.appscale_logger import AppScaleLogger
+from appscale.tools.local_state import LocalState
+
+
+class TestEC2Agent(unittest.TestCase):
+
+
+  # The parameters of the request that adds every AppScale security group
+  # rule at once.
+  ALL_RULES = {'GroupName' : 'bazgroup',
+    'IpPermissions.1.IpProtocol' : 'udp',
+    'IpPermissions.1.FromPort' : 1,
+    'IpPermissions.1.ToPort' : 65535,
+    'IpPermissions.1.IpRanges.1.CidrIp' : '0.0.0.0/0',
+    'IpPermissions.2.IpProtocol' : 'tcp',
+    'IpPermissions.2.FromPort' : 1,
+    'IpPermissions.2.ToPort' : 65535,
+    'IpPermissions.2.IpRanges.1.CidrIp' : '0.0.0.0/0',
+    'IpPermissions.3.IpProtocol' : 'icmp',
+    'IpPermissions.3.FromPort' : -1,
+    'IpPermissions.3.ToPort' : -1,
+    'IpPermissions.3.IpRanges.1.CidrIp' : '0.0.0.0/0'}
+
+
+  def setUp(self):
+    BaseAgent.clear_client_cache()
+    self.agent = EC2Agent()
+    self.params = {
+      EC2Agent.PARAM_CREDENTIALS : {'EC2_ACCESS_KEY' : 'baz',
+        'EC2_SECRET_KEY' : 'baz'},
+      EC2Agent.PARAM_GROUP : 'bazgroup',
+      EC2Agent.PARAM_IMAGE_ID : 'ami-ABCDEFG',
+      EC2Agent.PARAM_INSTANCE_TYPE : 'm3.medium',
+      EC2Agent.PARAM_KEYNAME : 'bookey',
+      EC2Agent.PARAM_REGION : 'my-zone-1',
+      EC2Agent.PARAM_SPOT : False,
+      EC2Agent.PARAM_ZONE : 'my-zone-1b'
+    }
+
+    flexmock(AppScaleLogger).should_receive('log').and_return()
+    flexmock(AppScaleLogger).should_receive('warn').and_return()
+    flexmock(time).should_receive('sleep').and_return()
+
+    self.fake_ec2 = flexmock(name='fake_ec2')
+    flexmock(boto.ec2).should_receive('connect_to_region').and_return(
+      self.fake_ec2)
+
+    self.cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.cache_dir)
+    self.cache_location = os.path.join(self.cache_dir, 'spot-prices.json')
+    flexmock(LocalState).should_receive('get_spot_price_cache_location')\
+      .and_return(self.cache_location)
+
+
+  def make_instance(self, instance_id, state='running', key_name='bookey'):
+    return flexmock(id=instance_id, state=state, key_name=key_name,
+      ip_address='public-' + instance_id,
+      private_ip_address='private-' + instance_id)
+
+
+  def make_page(self, instances, next_token=None):
+    page = ResultSet()
+    page.append(flexmock(instances=instances))
+    page.next_token = next_token
+    return page
+
+
+  def make_prices(self, prices, next_token=None):
+    page = ResultSet()
+    now = time.time()
+    for index, price in enumerate(prices):
+      page.append(flexmock(price=price, timestamp=time.strftime(
+        '%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(now - 60 * (index + 1)))))
+    page.next_token = next_token
+    return page
+
+
+  def test_describe_instances_filters_and_follows_pages(self):
+    filters = {
+      'key-name' : 'bookey',
+      'instance-state-name' : ['running', 'pending'],
+      'instance.group-name' : 'bazgroup'
+    }
+    self.fake_ec2.should_receive('get_all_reservations').with_args(
+      instance_ids=None, filters=filters,
+      max_results=EC2Agent.DESCRIBE_INSTANCES_PAGE_SIZE, next_token=None)\
+      .and_return(self.make_page([self.make_instance('i-ONE')], 'page2'))
+
+    # A cloud that ignores the filters can still send back other instances.
+    self.fake_ec2.should_receive('get_all_reservations').with_args(
+      instance_ids=None, filters=filters,
+      max_results=EC2Agent.DESCRIBE_INSTANCES_PAGE_SIZE, next_token='page2')\
+      .and_return(self.make_page([self.make_instance('i-TWO', 'pending'),
+        self.make_instance('i-THREE', key_name='otherkey')]))
+
+    self.assertEquals((['public-i-ONE', 'public-i-TWO'],
+      ['private-i-ONE', 'private-i-TWO'], ['i-ONE', 'i-TWO']),
+      self.agent.describe_instances(self.params, pending=True))
+
+
+  def test_find_instances_returns_records(self):
+    self.fake_ec2.should_receive('get_all_reservations').and_return(
+      self.make_page([self.make_instance('i-ONE')]))
+
+    instances = self.agent.find_instances(self.fake_ec2, 'bookey',
+      ['running'], instance_ids=['i-ONE'])
+    self.assertEquals(1, len(instances))
+    self.assertTrue(isinstance(instances[0], EC2Instance))
+    self.assertEquals('i-ONE', instances[0].instance_id)
+    self.assertEquals('public-i-ONE', instances[0].public_ip)
+
+
+  def test_run_instances_polls_launched_instances(self):
+    launched_filters = {'key-name' : 'bookey',
+      'instance-state-name' : ['running']}
+
+    # No terminated instances use our keyname, and none are running yet.
+    self.fake_ec2.should_receive('get_all_reservations').with_args(
+      instance_ids=None, filters=dict, max_results=int, next_token=None)\
+      .and_return(self.make_page([]))
+
+    self.fake_ec2.should_receive('run_instances').and_return(flexmock(
+      instances=[flexmock(id='i-ONE'), flexmock(id='i-TWO')]))
+
+    # EC2 doesn't know about new instances right away, and then only
+    # describes the instances we just started.
+    not_found = EC2ResponseError(400, 'Bad Request')
+    not_found.error_code = 'InvalidInstanceID.NotFound'
+    self.fake_ec2.should_receive('get_all_reservations').with_args(
+      instance_ids=['i-ONE', 'i-TWO'], filters=launched_filters,
+      max_results=None, next_token=None).and_raise(not_found)\
+      .and_return(self.make_page([self.make_instance('i-ONE')]))\
+      .and_return(self.make_page([self.make_instance('i-ONE'),
+        self.make_instance('i-TWO')]))
+
+    self.assertEquals((['i-ONE', 'i-TWO'], ['public-i-ONE', 'public-i-TWO'],
+      ['private-i-ONE', 'private-i-TWO']),
+      self.agent.run_instances(2, self.params, True))
+
+
+  def test_create_image_waits_until_available(self):
+    self.fake_ec2.should_receive('create_image').with_args('i-ONE',
+      'baked').and_return('ami-BAKED')
+
+    # EC2 doesn't know about new images right away.
+    not_found = EC2ResponseError(400, 'Bad Request')
+    not_found.error_code = 'InvalidAMIID.NotFound'
+    self.fake_ec2.should_receive('get_image').with_args('ami-BAKED')\
+      .and_raise(not_found)\
+      .and_return(flexmock(state='pending'))\
+      .and_return(flexmock(state='available'))
+
+    self.assertEquals('ami-BAKED', self.agent.create_image('i-ONE', 'baked',
+      self.params))
+
+
+  def test_create_image_fails_when_image_fails(self):
+    self.fake_ec2.should_receive('create_image').and_return('ami-BAKED')
+    self.fake_ec2.should_receive('get_image').and_return(flexmock(
+      state='failed'))
+    self.assertRaises(AgentRuntimeException, self.agent.create_image, 'i-ONE',
+      'baked', self.params)
+
+
+  def test_security_group_rules_are_added_in_one_request(self):
+    self.fake_ec2.should_receive('create_security_group').with_args(
+      'bazgroup', str).once()
+    self.fake_ec2.should_receive('get_status').with_args(
+      'AuthorizeSecurityGroupIngress', self.ALL_RULES,
+      verb='POST').and_return(True).once()
+    self.fake_ec2.should_receive('get_all_security_groups').never()
+
+    self.agent.ensure_security_group(self.params, 'bazgroup',
+      EC2Agent.SECURITY_GROUP_RULES)
+
+
+  def test_security_group_only_gets_missing_rules(self):
+    duplicate = EC2ResponseError(400, 'Bad Request')
+    duplicate.error_code = 'InvalidGroup.Duplicate'
+    self.fake_ec2.should_receive('create_security_group').and_raise(
+      duplicate)
+
+    # The group already allows TCP traffic, so EC2 refuses to add it again.
+    already_allowed = EC2ResponseError(400, 'Bad Request')
+    already_allowed.error_code = 'InvalidPermission.Duplicate'
+    self.fake_ec2.should_receive('get_status').with_args(
+      'AuthorizeSecurityGroupIngress', self.ALL_RULES, verb='POST').and_raise(already_allowed).once()
+    self.fake_ec2.should_receive('get_all_security_groups').and_return([
+      flexmock(rules=[flexmock(ip_protocol='tcp', from_port='1',
+        to_port='65535')])])
+    self.fake_ec2.should_receive('get_status').with_args(
+      'AuthorizeSecurityGroupIngress', {'GroupName' : 'bazgroup',
+        'IpPermissions.1.IpProtocol' : 'udp',
+        'IpPermissions.1.FromPort' : 1,
+        'IpPermissions.1.ToPort' : 65535,
+        'IpPermissions.1.IpRanges.1.CidrIp' : '0.0.0.0/0',
+        'IpPermissions.2.IpProtocol' : 'icmp',
+        'IpPermissions.2.FromPort' : -1,
+        'IpPermissions.2.ToPort' : -1,
+        'IpPermissions.2.IpRanges.1.CidrIp' : '0.0.0.0/0'},
+      verb='POST').and_return(True).once()
+
+    self.agent.ensure_security_group(self.params, 'bazgroup',
+      EC2Agent.SECURITY_GROUP_RULES)
+
+
+  def test_spot_prices_are_cached_and_refreshed_incrementally(self):
+    self.fake_ec2.should_receive('get_spot_price_history').with_args(
+      start_time=str, end_time=str, product_description='Linux/UNIX',
+      instance_type='m3.medium', availability_zone='my-zone-1b',
+      next_token=None).and_return(self.make_prices([0.1, 0.2], 'page2'))\
+      .and_return(self.make_prices([0.5])).times(2)
+    self.fake_ec2.should_receive('get_spot_price_history').with_args(
+      start_time=str, end_time=str, product_description='Linux/UNIX',
+      instance_type='m3.medium', availability_zone='my-zone-1b',
+      next_token='page2').and_return(self.make_prices([0.3, 0.4])).once()
+
+    cache = SpotPriceCache(self.cache_location)
+    self.assertEquals([0.1, 0.2, 0.3, 0.4], sorted(cache.get_prices(
+      self.fake_ec2, 'm3.medium', 'my-zone-1b')))
+
+    # Another deployment reads the prices from disk without asking EC2.
+    cache = SpotPriceCache(self.cache_location)
+    self.assertEquals(4, len(cache.get_prices(self.fake_ec2, 'm3.medium',
+      'my-zone-1b')))
+
+    # Once the cache is stale, only newer prices are fetched and added.
+    now = time.time()
+    flexmock(time).should_receive('time').and_return(
+      now + SpotPriceCache.REFRESH_INTERVAL + 1)
+    self.assertEquals([0.1, 0.2, 0.3, 0.4, 0.5], sorted(cache.get_prices(
+      self.fake_ec2, 'm3.medium', 'my-zone-1b')))
+
+
+  def test_spot_bid_is_a_percentile(self):
+    self.fake_ec2.should_receive('get_spot_price_history').and_return(
+      self.make_prices([0.1] * 9 + [5.0]))
+    self.assertEquals(0.1, self.agent.get_optimal_spot_price(self.fake_ec2,
+      'm3.medium', 'my-zone-1b'))
+
+
+  def test_empty_spot_history_fails_clearly(self):
+    self.fake_ec2.should_receive('get_spot_price_history').and_return(
+      self.make_prices([]))
+    self.assertRaises(AgentRuntimeException,
+      self.agent.get_optimal_spot_price, self.fake_ec2, 'm3.medium',
+      'my-zone-1b')
+
+
+  def test_recommend_spot_placement_prefers_stable_zones(self):
+    histories = {
+      ('my-zone-1a', 'm3.medium') : [0.05] * 5 + [0.5] * 5,
+      ('my-zone-1a', 'm3.large') : [0.3] * 10,
+      ('my-zone-1b', 'm3.medium') : [0.1] * 10,
+      ('my-zone-1b', 'm3.large') : []
+    }
+    for (zone, instance_type), prices in histories.iteritems():
+      self.fake_ec2.should_receive('get_spot_price_history').with_args(
+        start_time=str, end_time=str, product_description='Linux/UNIX',
+        instance_type=instance_type, availability_zone=zone,
+        next_token=None).and_return(self.make_prices(prices))
+
+    # The swings in my-zone-1a's m3.medium prices rule it out.
+    self.assertEquals(('my-zone-1b', 'm3.medium', 0.1),
+      self.agent.recommend_spot_placement(self.fake_ec2,
+      ['m3.medium', 'm3.large'], ['my-zone-1a', 'my-zone-1b'], 10))
+
+
+  def test_choose_spot_zone_picks_from_the_region(self):
+    histories = {
+      'my-zone-1a' : [0.05] * 5 + [0.5] * 5,
+      'my-zone-1b' : [0.1] * 10
+    }
+    for zone, prices in histories.iteritems():
+      self.fake_ec2.should_receive('get_spot_price_history').with_args(
+        start_time=str, end_time=str, product_description='Linux/UNIX',
+        instance_type='m3.medium', availability_zone=zone,
+        next_token=None).and_return(self.make_prices(prices))
+    self.fake_ec2.should_receive('get_all_zones').with_args().and_return(
+      [flexmock(name=zone) for zone in sorted(histories)])
+
+    self.assertEquals('my-zone-1b', self.agent.choose_spot_zone(self.params,
+      10))
+
+
+  def test_spot_prices_older_than_a_week_are_pruned(self):
+    now = time.time()
+    week = SpotPriceCache.HISTORY_DAYS * 24 * 60 * 60
+    with open(self.cache_location, 'w') as file_handle:
+      file_handle.write(json.dumps({
+        'my-zone-1b/m3.medium' : {'fetched_until' : now,
+          'prices' : [[now - week - 60, 5.0], [now - 60, 0.1], [now, 0.2]]},
+        'my-zone-1b/m3.large' : {'fetched_until' : now - week - 60,
+          'prices' : [[now - week - 60, 0.3]]}
+      }))
+
+    # The cache is fresh, so EC2 isn't asked, but the old price still goes.
+    self.fake_ec2.should_receive('get_spot_price_history').never()
+    cache = SpotPriceCache(self.cache_location)
+    self.assertEquals([0.1, 0.2], cache.get_prices(self.fake_ec2,
+      'm3.medium', 'my-zone-1b'))
+
+    # Refreshing any history drops the ones nobody refreshed in a week.
+    self.fake_ec2.should_receive('get_spot_price_history').and_return(
+      self.make_prices([0.4]))
+    cache.get_prices(self.fake_ec2, 'm3.xlarge', 'my-zone-1b')
+    self.assertEquals(['my-zone-1b/m3.medium', 'my-zone-1b/m3.xlarge'],
+      sorted(SpotPriceCache(self.cache_location).histories))
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+# Third party libraries
+from apiclient import discovery
+from flexmock import flexmock
+import httplib2
+from oauth2client.service_account import ServiceAccountCredentials
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.agents.base_agent import AgentRuntimeException
+from appscale.tools.agents.base_agent import BaseAgent
+from appscale.tools.agents.gce_agent import CredentialTypes
+from appscale.tools.agents.gce_agent import DiscoveryDocumentCache
+from appscale.tools.agents.gce_agent import GCEAgent
+from appscale.tools.appscale_logger import AppScaleLogger
+from appscale.tools.local_state import LocalState
+from cloud_emulator import GCEEmulator
+
+
+class FakeBatch():
+  """ FakeBatch stands in for an apiclient BatchHttpRequest, passing the
+  response of each request it holds to the batch's callback. """
+
+
+  def __init__(self, gce, callback):
+    self.gce = gce
+    self.callback = callback
+    self.requests = []
+
+
+  def add(self, request, request_id=None):
+    self.requests.append((request_id, request))
+
+
+  def execute(self, http=None):
+    self.gce.batches.append(len(self.requests))
+    for request_id, request in self.requests:
+      response, exception = request
+      self.callback(request_id, response, exception)
+
+
+class FakeGCE():
+  """ FakeGCE stands in for a GCE connection, starting operations that finish
+  on their first poll and failing to create the disks named in 'bad_disks'.
+  Operations named 'fail-*' fail, and those named 'slow-*' never finish. """
+
+
+  def __init__(self, bad_disks=(), bad_instances=()):
+    self.bad_disks = bad_disks
+    self.bad_instances = bad_instances
+    self.batches = []
+    self.disks_created = 0
+    self.instances_created = 0
+    self.deleted = []
+
+
+  def new_batch_http_request(self, callback=None):
+    return FakeBatch(self, callback)
+
+
+  def disks(self):
+    return flexmock(insert=self.insert_disk, delete=self.delete_disk)
+
+
+  def instances(self):
+    return flexmock(insert=self.insert_instance, delete=self.delete_instance)
+
+
+  def delete_instance(self, project, zone, instance):
+    self.deleted.append(instance)
+    return {'status' : 'PENDING', 'name' : 'delete-' + instance,
+      'zone' : zone}, None
+
+
+  def zoneOperations(self):
+    return flexmock(get=self.get_operation)
+
+
+  def globalOperations(self):
+    return flexmock(get=lambda project, operation: self.get_operation(project,
+      operation, None))
+
+
+  def insert_disk(self, project, zone, body, sourceImage):
+    index = self.disks_created
+    self.disks_created += 1
+    if index in self.bad_disks:
+      return {'status' : 'PENDING', 'name' : 'fail-' + body['name'],
+        'zone' : zone}, None
+    return {'status' : 'PENDING', 'name' : body['name'], 'zone' : zone}, None
+
+
+  def delete_disk(self, project, zone, disk):
+    self.deleted.append(disk)
+    return {'status' : 'PENDING', 'name' : 'delete-' + disk, 'zone' : zone}, \
+      None
+
+
+  def insert_instance(self, project, body, zone):
+    index = self.instances_created
+    self.instances_created += 1
+    if index in self.bad_instances:
+      return {'status' : 'PENDING', 'name' : 'fail-' + body['name'],
+        'zone' : zone}, None
+    return {'status' : 'DONE', 'name' : body['name']}, None
+
+
+  def get_operation(self, project, operation, zone):
+    if operation.startswith('fail-'):
+      return {'status' : 'DONE', 'name' : operation,
+        'error' : {'errors' : [{'message' : 'quota exceeded'}]}}, None
+    if operation.startswith('slow-'):
+      return {'status' : 'RUNNING', 'name' : operation}, None
+    return {'status' : 'DONE', 'name' : operation}, None
+
+
+class TestGCEAgent(unittest.TestCase):
+
+
+  def setUp(self):
+    BaseAgent.clear_client_cache()
+    self.agent = GCEAgent()
+    self.params = {
+      GCEAgent.PARAM_GROUP : 'bazgroup',
+      GCEAgent.PARAM_IMAGE_ID : 'appscale-image',
+      GCEAgent.PARAM_INSTANCE_TYPE : 'n1-standard-1',
+      GCEAgent.PARAM_KEYNAME : 'bookey',
+      GCEAgent.PARAM_PROJECT : 'appscale-project',
+      GCEAgent.PARAM_VERBOSE : False,
+      GCEAgent.PARAM_ZONE : 'my-zone-1b'
+    }
+
+    flexmock(AppScaleLogger).should_receive('log').and_return()
+    flexmock(AppScaleLogger).should_receive('warn').and_return()
+    flexmock(time).should_receive('sleep').and_return()
+
+    fake_credentials = flexmock(name='fake_credentials')
+    fake_credentials.should_receive('authorize').and_return(
+      flexmock(name='fake_authorized_http'))
+    flexmock(httplib2).should_receive('Http').and_return(
+      flexmock(name='fake_http'))
+    self.fake_credentials = fake_credentials
+
+
+  def test_run_instances_batches_every_machine(self):
+    fake_gce = FakeGCE()
+    flexmock(self.agent).should_receive('open_connection').and_return(
+      (fake_gce, self.fake_credentials))
+
+    new_ids = ['bazgroup-{0}'.format(index) for index in range(5)]
+    new_public = ['public{0}'.format(index) for index in range(5)]
+    new_private = ['private{0}'.format(index) for index in range(5)]
+    flexmock(self.agent).should_receive('describe_instances').and_return(
+      ([], [], [])).and_return((new_public, new_private, new_ids))
+
+    instance_ids, public_ips, private_ips = self.agent.run_instances(5,
+      self.params, True)
+
+    self.assertEquals(new_ids, instance_ids)
+    self.assertEquals(new_public, public_ips)
+    self.assertEquals(new_private, private_ips)
+
+    # One batch creates the disks, one polls them, and one creates the
+    # instances, which are already done.
+    self.assertEquals([5, 5, 5], fake_gce.batches)
+
+
+  def test_run_instances_reports_each_failure(self):
+    fake_gce = FakeGCE(bad_disks=(1, 3))
+    flexmock(self.agent).should_receive('open_connection').and_return(
+      (fake_gce, self.fake_credentials))
+    flexmock(self.agent).should_receive('describe_instances').and_return(
+      ([], [], []))
+
+    flexmock(AppScaleLogger).should_receive('warn').with_args(
+      str).times(2)
+    self.assertRaises(AgentRuntimeException, self.agent.run_instances, 4,
+      self.params, True)
+
+    # No instances are created once a disk fails, and the two disks that
+    # were created are deleted.
+    self.assertEquals([4, 4, 2, 2], fake_gce.batches)
+    self.assertEquals(0, fake_gce.instances_created)
+    self.assertEquals(2, len(fake_gce.deleted))
+
+
+  def test_run_instances_deletes_what_it_created_on_failure(self):
+    fake_gce = FakeGCE(bad_instances=(0,))
+    flexmock(self.agent).should_receive('open_connection').and_return(
+      (fake_gce, self.fake_credentials))
+    flexmock(self.agent).should_receive('describe_instances').and_return(
+      ([], [], []))
+
+    self.assertRaises(AgentRuntimeException, self.agent.run_instances, 4,
+      self.params, True)
+
+    # The three instances that started are deleted first, and then the disks
+    # of every instance, including the one that failed to start.
+    instances, disks = fake_gce.deleted[:3], fake_gce.deleted[3:]
+    self.assertEquals(3, len(set(instances)))
+    self.assertEquals(4, len(set(disks)))
+    self.assertFalse(set(instances) & set(disks))
+
+
+  def test_terminate_instances_deletes_in_one_batch(self):
+    fake_gce = FakeGCE()
+    flexmock(self.agent).should_receive('open_connection').and_return(
+      (fake_gce, self.fake_credentials))
+
+    self.params[GCEAgent.PARAM_INSTANCE_IDS] = ['bazgroup-{0}'.format(index)
+      for index in range(3)]
+    self.agent.terminate_instances(self.params)
+
+    # One batch deletes the instances, and one polls the deletions.
+    self.assertEquals([3, 3], fake_gce.batches)
+
+
+  def test_zone_and_global_operations_are_polled_together(self):
+    fake_gce = FakeGCE()
+    operations = {
+      'network' : {'status' : 'PENDING', 'name' : 'network'},
+      'disk' : {'status' : 'PENDING', 'name' : 'disk', 'zone' : 'my-zone-1b'}
+    }
+    self.assertEquals({}, self.agent.wait_for_operations(fake_gce, None,
+      operations, 'appscale-project'))
+    self.assertEquals([2], fake_gce.batches)
+
+
+  def test_waiting_stops_at_the_first_failure(self):
+    fake_gce = FakeGCE()
+    operations = {
+      'firewall' : {'status' : 'PENDING', 'name' : 'fail-firewall'},
+      'network' : {'status' : 'PENDING', 'name' : 'slow-network'}
+    }
+    failures = self.agent.wait_for_operations(fake_gce, None, operations,
+      'appscale-project', stop_on_failure=True)
+
+    self.assertEquals('quota exceeded', failures['firewall'])
+    self.assertIn('slow-network', failures['network'])
+    self.assertEquals([2], fake_gce.batches)
+
+
+  def test_configure_instance_security_batches_requests(self):
+    appscale_path = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, appscale_path)
+    self.addCleanup(setattr, LocalState, 'LOCAL_APPSCALE_PATH',
+      LocalState.LOCAL_APPSCALE_PATH)
+    LocalState.LOCAL_APPSCALE_PATH = appscale_path + os.sep
+
+    def generate_rsa_key(keyname, is_verbose):
+      with open(LocalState.LOCAL_APPSCALE_PATH + keyname + '.pub', 'w') as \
+        file_handle:
+        file_handle.write('ssh-rsa public-key')
+    flexmock(LocalState).should_receive('generate_rsa_key').replace_with(
+      generate_rsa_key)
+
+    emulator = GCEEmulator(speedup=1000)
+    with emulator.installed():
+      self.assertTrue(self.agent.configure_instance_security(
+        emulator.get_parameters()))
+
+    self.assertEquals(set([emulator.GROUP]), emulator.network_names)
+    self.assertEquals(set([emulator.GROUP]), emulator.firewall_names)
+    self.assertIn('root:ssh-rsa public-key', emulator.project_metadata[0]['value'])
+
+    # Everything is looked up and created once.
+    for call in ['projects.get', 'networks.get', 'firewalls.get',
+      'projects.setCommonInstanceMetadata', 'networks.insert',
+      'firewalls.insert']:
+      self.assertEquals(1, emulator.calls[call])
+
+
+  def test_open_connection_is_cached(self):
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+    flexmock(LocalState).should_receive('get_gce_discovery_cache_location')\
+      .and_return(os.path.join(temp_dir, 'gce-discovery.json'))
+
+    self.params[GCEAgent.PARAM_SECRETS] = '/boo/secrets.json'
+    flexmock(GCEAgent).should_receive('get_secrets_type')\
+      .and_return(CredentialTypes.SERVICE)
+    fake_credentials = flexmock(access_token='token',
+      access_token_expired=False)
+    flexmock(ServiceAccountCredentials)\
+      .should_receive('from_json_keyfile_name').once()\
+      .and_return(fake_credentials)
+    fake_gce = flexmock(name='fake_gce')
+    flexmock(discovery).should_receive('build')\
+      .with_args('compute', GCEAgent.API_VERSION, cache=DiscoveryDocumentCache)\
+      .once().and_return(fake_gce)
+
+    self.assertEquals((fake_gce, fake_credentials),
+      self.agent.open_connection(self.params))
+    self.assertEquals((fake_gce, fake_credentials),
+      GCEAgent().open_connection(self.params))
+
+    # Only expired tokens get refreshed.
+    fake_credentials.access_token_expired = True
+    fake_credentials.should_receive('refresh').once()
+    self.agent.open_connection(self.params)
+
+
+  def test_discovery_document_cache(self):
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+    cache = DiscoveryDocumentCache(os.path.join(temp_dir, 'discovery.json'))
+
+    self.assertEquals(None, cache.get('https://compute'))
+    cache.set('https://compute', '{"kind": "discovery"}')
+    self.assertEquals('{"kind": "discovery"}', cache.get('https://compute'))
+    self.assertEquals(['discovery.json'], os.listdir(temp_dir))
+
+    # Documents older than MAX_AGE are fetched again.
+    expired = time.time() + DiscoveryDocumentCache.MAX_AGE + 1
+    flexmock(time).should_receive('time').and_return(expired)
+    self.assertEquals(None, cache.get('https://compute'))
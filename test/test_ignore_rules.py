@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import os
+import shutil
+import tempfile
+import unittest
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.custom_exceptions import AppEngineConfigException
+from appscale.tools.ignore_rules import IgnoreRules
+
+
+class TestIgnoreRules(unittest.TestCase):
+
+
+  def setUp(self):
+    self.app_dir = tempfile.mkdtemp()
+    for name in ['app.yaml', 'main.py', 'main.pyc', '.hidden', 'notes.txt~',
+      'lib/util.py', 'lib/.keep', 'lib/.git/HEAD', '.git/HEAD',
+      'node_modules/left-pad/index.js', 'static/css/site.css',
+      'static/tmp/cache.bin']:
+      path = os.path.join(self.app_dir, *name.split('/'))
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      with open(path, 'w') as file_handle:
+        file_handle.write(name)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.app_dir)
+
+
+  def write(self, name, contents):
+    with open(os.path.join(self.app_dir, name), 'w') as file_handle:
+      file_handle.write(contents)
+
+
+  def test_defaults_leave_out_hidden_entries_vcs_and_pyc_files(self):
+    included, ignored = IgnoreRules.from_app(self.app_dir).find_files(
+      self.app_dir)
+    self.assertEquals(['app.yaml', 'lib/.keep', 'lib/util.py', 'main.py',
+      'node_modules/left-pad/index.js', 'notes.txt~', 'static/css/site.css',
+      'static/tmp/cache.bin'], sorted(included))
+    self.assertEquals(['.git', '.hidden', 'lib/.git', 'main.pyc'],
+      sorted(ignored))
+
+
+  def test_skip_files_are_regexes_on_the_relative_path(self):
+    self.write('app.yaml', "application: baz\nskip_files:\n" \
+      "- ^(.*/)?.*~$\n- ^static/tmp$\n")
+    included, ignored = IgnoreRules.from_app(self.app_dir).find_files(
+      self.app_dir)
+    self.assertNotIn('notes.txt~', included)
+    self.assertIn('static/tmp', ignored)
+    self.assertIn('static/css/site.css', included)
+
+
+  def test_single_skip_files_regex(self):
+    rules = IgnoreRules.from_contents("skip_files: ^lib/.*$\n")
+    self.assertTrue(rules.matches('lib/util.py', False))
+    self.assertFalse(rules.matches('main.py', False))
+
+
+  def test_invalid_skip_files_raise(self):
+    self.assertRaises(AppEngineConfigException, IgnoreRules.from_contents,
+      "skip_files:\n- '(unclosed'\n")
+
+
+  def test_appscaleignore_uses_gitignore_semantics(self):
+    self.write(IgnoreRules.IGNORE_FILE, "# Dependencies\nnode_modules/\n" \
+      "/static/**/*.bin\n*.py\n!main.py\n")
+    included, ignored = IgnoreRules.from_app(self.app_dir).find_files(
+      self.app_dir)
+    self.assertEquals(['app.yaml', 'lib/.keep', 'main.py', 'notes.txt~',
+      'static/css/site.css'], sorted(included))
+    self.assertIn('node_modules', ignored)
+    self.assertIn('lib/util.py', ignored)
+
+
+  def test_translate(self):
+    rules = IgnoreRules(['build/', '/docs', 'a/**/b', '*.tmp', 'file[0-9].txt',
+      r'\#literal'])
+    self.assertTrue(rules.matches('src/build', True))
+    self.assertFalse(rules.matches('src/build', False))
+    self.assertTrue(rules.matches('docs', True))
+    self.assertFalse(rules.matches('src/docs', True))
+    self.assertTrue(rules.matches('a/b', False))
+    self.assertTrue(rules.matches('a/x/y/b', False))
+    self.assertTrue(rules.matches('deep/down/x.tmp', False))
+    self.assertFalse(rules.matches('x.tmp.keep', False))
+    self.assertTrue(rules.matches('file7.txt', False))
+    self.assertFalse(rules.matches('filex.txt', False))
+    self.assertTrue(rules.matches('#literal', False))
+
+
+  def test_is_ignored_looks_at_parent_directories(self):
+    rules = IgnoreRules(['build/'])
+    self.assertTrue(rules.is_ignored('build/out/app.js', False))
+    self.assertTrue(rules.is_ignored('.git/HEAD', False))
+    self.assertFalse(rules.is_ignored('src/app.js', False))
+
+
+  def test_get_size_counts_directories(self):
+    size = IgnoreRules.get_size(self.app_dir, ['.git', 'main.pyc'])
+    self.assertEquals(len('.git/HEAD') + len('main.pyc'), size)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import unittest
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.custom_exceptions import BadConfigurationException
+from appscale.tools.layout_diff import LayoutDiff
+from appscale.tools.node_layout import NodeLayout
+
+
+class TestLayoutDiff(unittest.TestCase):
+
+
+  def setUp(self):
+    self.ip_1 = '192.168.1.1'
+    self.ip_2 = '192.168.1.2'
+    self.ip_3 = '192.168.1.3'
+
+    # The node_info of a running deployment, as the AppController's
+    # get_role_info reports it and locations.json stores it.
+    self.running_nodes = [
+      {
+        'public_ip' : self.ip_1,
+        'private_ip' : '10.0.0.1',
+        'instance_id' : 'i-APPSCALE1',
+        'jobs' : ['load_balancer', 'taskqueue_master', 'zookeeper',
+          'db_master', 'taskqueue', 'shadow', 'login'],
+        'disk' : None
+      },
+      {
+        'public_ip' : self.ip_2,
+        'private_ip' : '10.0.0.2',
+        'instance_id' : 'i-APPSCALE2',
+        'jobs' : ['memcache', 'taskqueue_slave', 'appengine'],
+        'disk' : None
+      }
+    ]
+
+
+  def test_same_layout_is_empty(self):
+    layout = NodeLayout({'ips' : {
+      'master' : self.ip_1,
+      'database' : [self.ip_1],
+      'appengine' : [self.ip_2]
+    }})
+    diff = LayoutDiff(self.running_nodes, layout)
+    self.assertTrue(diff.is_empty())
+    self.assertEquals({}, diff.get_roles_to_start())
+
+
+  def test_join(self):
+    layout = NodeLayout({'ips' : {
+      'master' : self.ip_1,
+      'database' : [self.ip_1],
+      'appengine' : [self.ip_2, self.ip_3]
+    }})
+    diff = LayoutDiff(self.running_nodes, layout)
+
+    self.assertEquals([self.ip_3], [node.public_ip for node in diff.joins])
+    self.assertEquals([], diff.leaves)
+    self.assertEquals({}, diff.roles_to_remove)
+    self.assertEquals({'appengine' : [self.ip_3], 'memcache' : [self.ip_3]},
+      diff.get_roles_to_start())
+
+
+  def test_adding_roles_to_a_running_node_is_rejected(self):
+    layout = NodeLayout({'ips' : {
+      'master' : self.ip_1,
+      'database' : [self.ip_1],
+      'appengine' : [self.ip_2],
+      'search' : [self.ip_2]
+    }})
+    self.assertRaises(BadConfigurationException, LayoutDiff,
+      self.running_nodes, layout)
+
+
+  def test_leave_and_remove_role(self):
+    running_nodes = self.running_nodes + [{
+      'public_ip' : self.ip_3,
+      'private_ip' : '10.0.0.3',
+      'instance_id' : 'i-APPSCALE3',
+      'jobs' : ['memcache', 'taskqueue_slave', 'appengine', 'search'],
+      'disk' : None
+    }]
+    layout = NodeLayout({'ips' : {
+      'master' : self.ip_1,
+      'database' : [self.ip_1],
+      'appengine' : [self.ip_2]
+    }})
+    diff = LayoutDiff(running_nodes, layout)
+    self.assertEquals([self.ip_3], [node['public_ip'] for node in diff.leaves])
+    self.assertEquals({}, diff.roles_to_remove)
+
+    layout = NodeLayout({'ips' : {
+      'master' : self.ip_1,
+      'database' : [self.ip_1],
+      'appengine' : [self.ip_2, self.ip_3]
+    }})
+    diff = LayoutDiff(running_nodes, layout)
+    self.assertEquals([], diff.leaves)
+    self.assertEquals({self.ip_3 : ['search']}, diff.roles_to_remove)
+
+
+  def test_cloud_nodes_matched_by_roles(self):
+    layout = NodeLayout({'infrastructure' : 'ec2', 'ips' : {
+      'master' : 'node-1',
+      'database' : ['node-1'],
+      'appengine' : ['node-2']
+    }})
+    diff = LayoutDiff(self.running_nodes, layout)
+    self.assertTrue(diff.is_empty())
+
+
+  def test_moving_master_is_rejected(self):
+    layout = NodeLayout({'ips' : {
+      'master' : self.ip_3,
+      'database' : [self.ip_1],
+      'appengine' : [self.ip_2]
+    }})
+    self.assertRaises(BadConfigurationException, LayoutDiff,
+      self.running_nodes, layout)
+
+
+  def test_moving_db_master_is_rejected(self):
+    self.running_nodes[0]['jobs'].remove('db_master')
+    self.running_nodes[1]['jobs'].append('db_master')
+    layout = NodeLayout({'ips' : {
+      'master' : self.ip_1,
+      'database' : [self.ip_1],
+      'appengine' : [self.ip_2]
+    }})
+    self.assertRaises(BadConfigurationException, LayoutDiff,
+      self.running_nodes, layout)
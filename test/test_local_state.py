@@ -136,6 +136,25 @@ class TestLocalState(unittest.TestCase):
     self.assertEquals(expected, actual)
 
 
+  def test_generate_deployment_params_with_zones(self):
+    options = flexmock(name='options', table='cassandra', keyname='boo',
+      appengine='1', autoscale=False, replication=None, infrastructure=None,
+      verbose=False, user_commands=[], flower_password="abc",
+      max_memory=ParseArgs.DEFAULT_MAX_MEMORY)
+    node_layout = NodeLayout({
+      'table' : 'cassandra',
+      'ips' : {
+        'controller' : '192.168.1.1',
+        'servers' : ['192.168.1.2'],
+        'zones' : {'rack-a' : ['192.168.1.1'], 'rack-b' : ['192.168.1.2']}
+      }
+    })
+
+    actual = LocalState.generate_deployment_params(options, node_layout, {})
+    self.assertEquals({'rack-a' : ['192.168.1.1'], 'rack-b' : ['192.168.1.2']},
+      json.loads(actual['zones']))
+
+
   def test_obscure_dict(self):
     # make sure that EC2 credentials get filtered correctly
     creds = {
@@ -192,7 +211,9 @@ class TestLocalState(unittest.TestCase):
       .and_return(flexmock(write=lambda *args: None))
 
     options = flexmock(name='options', table='cassandra', infrastructure='ec2',
-      keyname='booscale', group='boogroup', zone='my-zone-1b')
+      keyname='booscale', group='boogroup', zone='my-zone-1b',
+      machine='ami-ABCDEFG', instance_type='m3.medium',
+      use_spot_instances=False)
     node_layout = NodeLayout(options={
       'min' : 1,
       'max' : 1,
@@ -335,3 +356,34 @@ class TestLocalState(unittest.TestCase):
       and_return(True)
     actual_key_path = LocalState.get_key_path_from_name(keyname)
     self.assertEquals(etc_appscale_key_file_path, actual_key_path)
+
+
+  def test_update_and_remove_local_nodes(self):
+    locations_json = tempfile.NamedTemporaryFile()
+    locations_json.write(json.dumps({
+      'node_info' : [
+        {'public_ip' : 'public1', 'private_ip' : 'private1',
+         'instance_id' : 'i-1', 'jobs' : ['shadow', 'login']}
+      ],
+      'infrastructure_info' : {'infrastructure' : 'ec2', 'group' : 'bazgroup'}
+    }))
+    locations_json.flush()
+    flexmock(LocalState).should_receive('get_locations_json_location') \
+      .with_args(self.keyname).and_return(locations_json.name)
+
+    node_info = [
+      {'public_ip' : 'public1', 'private_ip' : 'private1',
+       'instance_id' : 'i-1', 'jobs' : ['shadow', 'login']},
+      {'public_ip' : 'public2', 'private_ip' : 'private2',
+       'instance_id' : 'i-2', 'jobs' : ['appengine', 'memcache']},
+      {'public_ip' : 'public3', 'private_ip' : 'private3',
+       'instance_id' : 'i-3', 'jobs' : ['search']}
+    ]
+    LocalState.update_local_nodes(self.keyname, node_info)
+    self.assertEquals(node_info, LocalState.get_local_nodes_info(self.keyname))
+
+    LocalState.remove_local_nodes(self.keyname, ['public2', 'public3'])
+    self.assertEquals(node_info[:1],
+      LocalState.get_local_nodes_info(self.keyname))
+    self.assertEquals('bazgroup', LocalState.get_infrastructure_option(
+      tag='group', keyname=self.keyname))
@@ -3,6 +3,8 @@
 
 # General-purpose Python library imports
 import os
+import shutil
+import tempfile
 import unittest
 
 
@@ -14,6 +16,8 @@ from flexmock import flexmock
 # AppScale import, the library that we're testing here
 from appscale.tools.agents.ec2_agent import EC2Agent
 from appscale.tools.appscale_logger import AppScaleLogger
+from appscale.tools import node_layout
+from appscale.tools.local_state import LocalState
 from appscale.tools.node_layout import NodeLayout
 
 
@@ -230,3 +234,172 @@ class TestNodeLayout(unittest.TestCase):
     self.assertEquals(True, layout.is_valid())
     self.assertEquals('disk_number_one', layout.head_node().disk)
     self.assertEquals('disk_number_two', layout.other_nodes()[0].disk)
+
+
+  def test_node_roles_are_compact(self):
+    # composite roles should be expanded, and the node shouldn't carry a
+    # per-instance dict around
+    input_yaml = {
+      'controller' : self.ip_1,
+      'servers' : [self.ip_2]
+    }
+    options = self.default_options.copy()
+    options['ips'] = input_yaml
+    layout = NodeLayout(options)
+    self.assertEquals(True, layout.is_valid())
+
+    head_node = layout.head_node()
+    self.assertFalse(hasattr(head_node, '__dict__'))
+    self.assertTrue(head_node.is_role('shadow'))
+    self.assertTrue(head_node.is_role('db_master'))
+    self.assertFalse(head_node.is_role('controller'))
+    self.assertFalse(head_node.is_role('appengine'))
+    self.assertEquals(len(set(head_node.roles)), len(head_node.roles))
+
+
+  def test_node_json_is_cached_until_changed(self):
+    input_yaml = {
+      'controller' : self.ip_1,
+      'servers' : [self.ip_2]
+    }
+    options = self.default_options.copy()
+    options['ips'] = input_yaml
+    layout = NodeLayout(options)
+    self.assertEquals(True, layout.is_valid())
+
+    node = layout.other_nodes()[0]
+    first = node.to_json()
+    self.assertEquals(first, node.to_json())
+
+    # Changing the returned dict leaves the Node's JSON alone.
+    first['jobs'].append('search')
+    first['disk'] = 'vol-12345'
+    self.assertFalse('search' in node.to_json()['jobs'])
+    self.assertEquals(None, node.to_json()['disk'])
+
+    node.public_ip = self.ip_3
+    node.add_role('search')
+    second = node.to_json()
+    self.assertEquals(self.ip_3, second['public_ip'])
+    self.assertTrue('search' in second['jobs'])
+
+
+  def test_compiled_layout_round_trip(self):
+    options = self.default_options.copy()
+    options['ips'] = {
+      'master' : self.ip_1,
+      'database' : [self.ip_1, self.ip_2],
+      'appengine' : [self.ip_2]
+    }
+    layout = NodeLayout(options)
+    compiled = layout.to_compiled()
+    self.assertNotEquals(None, compiled)
+
+    # A fresh layout from the same options loads without revalidating.
+    cached_layout = NodeLayout(options)
+    self.assertEquals(True, cached_layout.load_compiled(compiled))
+    self.assertEquals(layout.to_list(), cached_layout.to_list())
+    self.assertEquals(2, cached_layout.replication)
+
+    # Changing an option that affects the layout invalidates the cache.
+    for key, value in [('login_host', 'www.booscale.com'), ('table', 'hbase')]:
+      changed_options = options.copy()
+      changed_options[key] = value
+      self.assertEquals(False,
+        NodeLayout(changed_options).load_compiled(compiled))
+
+    # So does upgrading the tools, which may validate layouts differently.
+    flexmock(node_layout).should_receive('APPSCALE_VERSION').and_return('9.9.9')
+    self.assertEquals(False, NodeLayout(options).load_compiled(compiled))
+
+
+  def test_from_options_uses_cache_file(self):
+    cache_dir = tempfile.mkdtemp()
+    flexmock(LocalState).should_receive('get_compiled_layouts_location') \
+      .and_return(os.path.join(cache_dir, 'layouts.json'))
+
+    options = self.default_options.copy()
+    options['keyname'] = 'bookey'
+    options['ips'] = {'controller' : self.ip_1, 'servers' : [self.ip_2]}
+    try:
+      layout = NodeLayout.from_options(options)
+      self.assertEquals(True, layout.is_valid())
+
+      flexmock(NodeLayout).should_receive('is_valid_simple_format').never()
+      cached_layout = NodeLayout.from_options(options)
+      self.assertEquals(layout.to_list(), cached_layout.to_list())
+    finally:
+      shutil.rmtree(cache_dir)
+
+
+  def test_zones_are_assigned_and_serialized(self):
+    options = self.default_options.copy()
+    options['ips'] = {
+      'master' : self.ip_1,
+      'database' : [self.ip_1, self.ip_2, self.ip_3],
+      'zookeeper' : [self.ip_1, self.ip_2, self.ip_4],
+      'appengine' : [self.ip_4],
+      'zones' : {
+        'rack-a' : [self.ip_1, self.ip_2],
+        'rack-b' : [self.ip_3, self.ip_4]
+      }
+    }
+    layout = NodeLayout(options)
+    self.assertEquals(True, layout.is_valid())
+    self.assertEquals('rack-a', layout.head_node().zone)
+    self.assertEquals({
+      'rack-a' : [self.ip_1, self.ip_2],
+      'rack-b' : [self.ip_3, self.ip_4]
+    }, dict((zone, sorted(ips)) for zone, ips in
+      layout.get_topology().iteritems()))
+
+    for node in layout.to_list():
+      self.assertTrue(node['zone'] in ('rack-a', 'rack-b'))
+
+
+  def test_zones_must_cover_every_node_once(self):
+    options = self.default_options.copy()
+    options['ips'] = {
+      'controller' : self.ip_1,
+      'servers' : [self.ip_2],
+      'zones' : {'rack-a' : [self.ip_1]}
+    }
+    self.assertEquals(False, NodeLayout(options).is_valid())
+
+    options['ips'] = {
+      'controller' : self.ip_1,
+      'servers' : [self.ip_2],
+      'zones' : {'rack-a' : [self.ip_1, self.ip_2], 'rack-b' : [self.ip_2]}
+    }
+    self.assertEquals(False, NodeLayout(options).is_valid())
+
+
+  def test_zones_spread_databases_and_prefer_local_zookeeper_quorum(self):
+    # all database replicas in one zone can't survive losing that zone
+    options = self.default_options.copy()
+    options['ips'] = {
+      'master' : self.ip_1,
+      'database' : [self.ip_1, self.ip_2],
+      'appengine' : [self.ip_3],
+      'zones' : {'rack-a' : [self.ip_1, self.ip_2], 'rack-b' : [self.ip_3]}
+    }
+    self.assertEquals(False, NodeLayout(options).is_valid())
+
+    # a zookeeper ensemble with no majority in any zone is slow to agree,
+    # but survives losing a zone, so it is only rejected when asked to be
+    flexmock(AppScaleLogger).should_receive('warn').once()
+    options['ips'] = {
+      'master' : self.ip_1,
+      'database' : [self.ip_1, self.ip_2],
+      'zookeeper' : [self.ip_1, self.ip_2, self.ip_3],
+      'appengine' : [self.ip_3],
+      'zones' : {
+        'rack-a' : [self.ip_1],
+        'rack-b' : [self.ip_2],
+        'rack-c' : [self.ip_3]
+      }
+    }
+    self.assertEquals(True, NodeLayout(options).is_valid())
+
+    options['zookeeper_quorum_zone'] = True
+    self.assertEquals(False, NodeLayout(options).is_valid())
@@ -4,6 +4,9 @@
 # General-purpose Python library imports
 import base64
 import os
+import shutil
+import tempfile
+import time
 import unittest
 import yaml
 
@@ -15,10 +18,12 @@ from flexmock import flexmock
 
 # AppScale import, the library that we're testing here
 from appscale.tools.agents.base_agent import AgentConfigurationException
+from appscale.tools.agents.base_agent import BaseAgent
 from appscale.tools.agents.ec2_agent import EC2Agent
 from appscale.tools.agents.euca_agent import EucalyptusAgent
 from appscale.tools.appscale_logger import AppScaleLogger
 from appscale.tools.custom_exceptions import BadConfigurationException
+from appscale.tools.local_state import LocalState
 from appscale.tools.parse_args import ParseArgs
 
 
@@ -26,6 +31,9 @@ class TestParseArgs(unittest.TestCase):
   
 
   def setUp(self):
+    # don't reuse cloud connections that earlier tests mocked out
+    BaseAgent.clear_client_cache()
+
     self.cloud_argv = ['--min', '1', '--max', '1', '--group', 'blargscale',
       '--infrastructure', 'ec2', '--instance_type', 'm3.medium',
       '--machine', 'ami-ABCDEFG', '--zone', 'my-zone-1b']
@@ -45,7 +53,7 @@ class TestParseArgs(unittest.TestCase):
 
     # pretend that our credentials are valid.
     fake_ec2 = flexmock(name="fake_ec2")
-    fake_ec2.should_receive('get_all_instances')
+    fake_ec2.should_receive('get_all_reservations')
 
     # similarly, pretend that our image does exist in EC2
     # and Euca
@@ -74,9 +82,16 @@ class TestParseArgs(unittest.TestCase):
     fake_ec2.should_receive('get_all_addresses').with_args('BAD.IP.ADDRESS') \
       .and_raise(boto.exception.EC2ResponseError, 'baz', 'baz')
 
-    fake_price = flexmock(name='fake_price', price=1.00)
+    # Cache spot prices in a temporary directory instead of ~/.appscale.
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    flexmock(LocalState).should_receive('get_spot_price_cache_location')\
+      .and_return(os.path.join(cache_dir, 'spot-prices.json'))
+    fake_price = flexmock(name='fake_price', price=1.00,
+      timestamp=time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()))
     fake_ec2.should_receive('get_spot_price_history').and_return([fake_price])
 
+    self.fake_ec2 = fake_ec2
     flexmock(boto)
     flexmock(boto.ec2)
     boto.ec2.should_receive('connect_to_region').with_args('my-zone-1',
@@ -263,7 +278,7 @@ class TestParseArgs(unittest.TestCase):
   def test_failure_when_ami_doesnt_exist(self):
     # mock out boto calls to EC2 and put in that the image doesn't exist
     fake_ec2 = flexmock(name="fake_ec2")
-    fake_ec2.should_receive('get_all_instances')
+    fake_ec2.should_receive('get_all_reservations')
     fake_ec2.should_receive('get_image').with_args('ami-ABCDEFG') \
       .and_raise(boto.exception.EC2ResponseError, '', '')
 
@@ -339,6 +354,18 @@ class TestParseArgs(unittest.TestCase):
     self.assertEquals(True, actual.use_spot_instances)
 
 
+  def test_spot_instances_without_zone_get_one_picked(self):
+    self.fake_ec2.should_receive('get_all_zones').with_args().and_return(
+      [flexmock(name='my-zone-1b')])
+    boto.ec2.should_receive('connect_to_region').with_args(
+      EC2Agent.DEFAULT_REGION, aws_access_key_id='baz',
+      aws_secret_access_key='baz').and_return(self.fake_ec2)
+
+    ec2_argv = self.cloud_argv[:-2] + ['--use_spot_instances']
+    actual = ParseArgs(ec2_argv, self.function).args
+    self.assertEquals('my-zone-1b', actual.zone)
+
+
   def test_max_spot_instance_price_flag(self):
     # if the user wants to use spot instances, that only works on ec2, so
     # abort if they're running on euca
@@ -422,6 +449,37 @@ class TestParseArgs(unittest.TestCase):
     self.assertEquals("http://boo.baz", os.environ['EC2_URL'])
 
 
+  def test_drain_pool_flag(self):
+    function = "appscale-terminate-instances"
+    self.assertEquals(False, ParseArgs([], function).args.drain_pool)
+    self.assertEquals(True, ParseArgs(["--terminate", "--drain_pool"],
+      function).args.drain_pool)
+
+    # the pool can only be drained while terminating, and not refilled
+    self.assertRaises(BadConfigurationException, ParseArgs, ["--drain_pool"],
+      function)
+    self.assertRaises(BadConfigurationException, ParseArgs, ["--terminate",
+      "--drain_pool", "--warm_pool_size", "2"], function)
+
+
+  def test_create_image_node_flag(self):
+    function = "appscale-create-image"
+    self.assertEquals(None, ParseArgs([], function).args.node)
+    self.assertEquals(3, ParseArgs(["--node", "3"], function).args.node)
+    self.assertRaises(BadConfigurationException, ParseArgs, ["--node", "-1"],
+      function)
+
+
+  def test_upload_app_compression_flag(self):
+    function = "appscale-upload-app"
+    argv = ["--file", "/tmp/app"]
+    self.assertEquals('auto', ParseArgs(argv, function).args.compression)
+    self.assertEquals('zstd:19', ParseArgs(argv + ["--compression",
+      "zstd:19"], function).args.compression)
+    self.assertRaises(BadConfigurationException, ParseArgs,
+      argv + ["--compression", "bzip2"], function)
+
+
   def test_disks_flag(self):
     # specifying a EBS mount or PD mount is only valid for EC2/Euca/GCE, so
     # fail on a cluster deployment.
@@ -449,6 +507,90 @@ public1 : vol-ABCDEFG
     self.assertEquals(disks, actual.disks)
 
 
+  def test_capacities_flag(self):
+    capacities = {
+      'node-1' : {'cpu' : 4, 'ram' : 16384, 'disk' : 100},
+      'node-2' : {'cpu' : 2, 'ram' : 8192, 'disk' : 50}
+    }
+    argv = ['--infrastructure', 'ec2', '--instance_type', 'm3.medium',
+      '--machine', 'ami-ABCDEFG', '--zone', 'my-zone-1b', '--group',
+      'blargscale']
+
+    # capacities stand in for min and max, and are decoded for us
+    actual = ParseArgs(argv + ["--capacities",
+      base64.b64encode(yaml.dump(capacities))], self.function).args
+    self.assertEquals(capacities, actual.capacities)
+
+    # they have to map node IDs to dicts
+    for bad_capacities in [['node-1'], {'node-1' : 4}]:
+      self.assertRaises(BadConfigurationException, ParseArgs, argv + [
+        "--capacities", base64.b64encode(yaml.dump(bad_capacities))],
+        self.function)
+
+    # and can't be given along with a placement strategy
+    ips_layout = base64.b64encode(yaml.dump({'master' : 'node-1',
+      'appengine' : 'node-2', 'database' : 'node-2'}))
+    self.assertRaises(BadConfigurationException, ParseArgs, argv + [
+      "--capacities", base64.b64encode(yaml.dump(capacities)),
+      "--ips_layout", ips_layout], self.function)
+
+
+  def test_zookeeper_quorum_zone_flag(self):
+    # the rule is off unless asked for
+    actual = ParseArgs(self.cluster_argv, self.function).args
+    self.assertEquals(False, actual.zookeeper_quorum_zone)
+
+    actual = ParseArgs(self.cluster_argv + ["--zookeeper_quorum_zone"],
+      self.function).args
+    self.assertEquals(True, actual.zookeeper_quorum_zone)
+
+    # without a placement strategy or capacities, no node has a zone
+    self.assertRaises(BadConfigurationException, ParseArgs,
+      self.cloud_argv + ["--zookeeper_quorum_zone"], self.function)
+
+
+  def test_update_layout_flags(self):
+    ips_layout = base64.b64encode(yaml.dump({
+      'master' : '192.168.1.1',
+      'appengine' : ['192.168.1.2']
+    }))
+    argv = ["--keyname", "bookey", "--ips_layout", ips_layout]
+    function = "appscale-update-layout"
+
+    # the layout options default to the ones 'appscale up' uses
+    actual = ParseArgs(argv, function).args
+    self.assertEquals(ParseArgs.DEFAULT_DATASTORE, actual.table)
+    self.assertEquals(None, actual.replication)
+    self.assertEquals(None, actual.disks)
+    self.assertEquals(False, actual.zookeeper_quorum_zone)
+
+    disks = base64.b64encode(yaml.dump({'192.168.1.2' : 'vol-ABCDEFG'}))
+    actual = ParseArgs(argv + ["--disks", disks, "--n", "1"], function).args
+    self.assertEquals({'192.168.1.2' : 'vol-ABCDEFG'}, actual.disks)
+    self.assertEquals(1, actual.replication)
+
+    bad_disks = base64.b64encode(yaml.dump(['vol-ABCDEFG']))
+    self.assertRaises(BadConfigurationException, ParseArgs,
+      argv + ["--disks", bad_disks], function)
+    self.assertRaises(BadConfigurationException, ParseArgs,
+      argv + ["--replication", "0"], function)
+
+
+  def test_cloud_preflight_reports_every_problem(self):
+    self.fake_ec2.should_receive('get_all_volumes').with_args(
+      ['vol-MISSING']).and_raise(boto.exception.EC2ResponseError, 'baz', 'baz')
+
+    disks = {'public1' : 'vol-ABCDEFG', 'public2' : 'vol-MISSING'}
+    argv = self.cloud_argv[:] + ["--static_ip", "BAD.IP.ADDRESS", "--disks",
+      base64.b64encode(yaml.dump(disks))]
+    try:
+      ParseArgs(argv, self.function)
+      self.fail("Expected a BadConfigurationException")
+    except BadConfigurationException as exception:
+      self.assertEquals(["Couldn't find the given static IP.",
+        "Couldn't find disk vol-MISSING"], str(exception).split("\n"))
+
+
   def test_zone_flag(self):
     # Specifying an availability zone is only valid for EC2/Euca/GCE, so
     # fail on a cluster deployment.
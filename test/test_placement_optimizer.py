@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import unittest
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.custom_exceptions import BadConfigurationException
+from appscale.tools.node_layout import NodeLayout
+from appscale.tools.placement_optimizer import PlacementOptimizer
+
+
+class TestPlacementOptimizer(unittest.TestCase):
+
+
+  def setUp(self):
+    self.large = {'cpu' : 8, 'ram' : 16384, 'disk' : 200}
+    self.small = {'cpu' : 2, 'ram' : 4096, 'disk' : 40}
+
+
+  def test_single_large_node_runs_everything(self):
+    optimizer = PlacementOptimizer({'192.168.1.1' : self.large})
+    layout = optimizer.generate_layout()
+    self.assertEquals('192.168.1.1', layout['master'])
+    self.assertEquals(['192.168.1.1'], layout['database'])
+    self.assertEquals(['192.168.1.1'], layout['zookeeper'])
+    self.assertEquals(['192.168.1.1'], layout['appengine'])
+
+
+  def test_database_kept_off_undersized_appengine_nodes(self):
+    capacities = {
+      'node-1' : self.large,
+      'node-2' : self.large,
+      'node-3' : self.large,
+      'node-4' : self.small,
+      'node-5' : self.small
+    }
+    optimizer = PlacementOptimizer(capacities, replication=3)
+    layout = optimizer.generate_layout()
+
+    self.assertEquals(3, len(layout['database']))
+    self.assertTrue('node-4' not in layout['database'])
+    self.assertTrue('node-5' not in layout['database'])
+    self.assertTrue('node-4' in layout['appengine'])
+    self.assertTrue('node-5' in layout['appengine'])
+    self.assertEquals(1, len(layout['zookeeper']) % 2)
+
+
+  def test_not_enough_capacity_for_replication(self):
+    capacities = {
+      'node-1' : self.large,
+      'node-2' : self.small,
+      'node-3' : self.small
+    }
+    optimizer = PlacementOptimizer(capacities, replication=3)
+    self.assertRaises(BadConfigurationException, optimizer.generate_layout)
+
+
+  def test_even_zookeeper_count_rejected(self):
+    capacities = {'node-1' : self.large, 'node-2' : self.large}
+    optimizer = PlacementOptimizer(capacities, role_counts={'zookeeper' : 2})
+    self.assertRaises(BadConfigurationException, optimizer.generate_layout)
+
+
+  def test_missing_resource_rejected(self):
+    self.assertRaises(BadConfigurationException, PlacementOptimizer,
+      {'node-1' : {'cpu' : 4, 'ram' : 8192}})
+
+
+  def test_node_layout_accepts_capacities(self):
+    capacities = {
+      '192.168.1.1' : self.large,
+      '192.168.1.2' : self.large,
+      '192.168.1.3' : self.small
+    }
+    layout = NodeLayout({'table' : 'cassandra', 'capacities' : capacities})
+    self.assertEquals(True, layout.is_valid())
+    self.assertEquals(2, layout.replication_factor())
+    self.assertNotEquals(None, layout.head_node())
+    self.assertNotEquals(None, layout.db_master())
+
+
+  def test_zones_spread_databases_and_zookeeper(self):
+    capacities = {}
+    for index, zone in enumerate(['a', 'a', 'a', 'b', 'b', 'c']):
+      capacity = self.large.copy()
+      capacity['zone'] = zone
+      capacities['node-{0}'.format(index + 1)] = capacity
+
+    layout = PlacementOptimizer(capacities, replication=3).generate_layout()
+    for role in ['database', 'zookeeper']:
+      self.assertEquals(set(['a', 'b', 'c']), set(capacities[node]['zone']
+        for node in layout[role]))
+
+    node_layout = NodeLayout({'infrastructure' : 'ec2', 'ips' : layout})
+    self.assertEquals(True, node_layout.is_valid())
+
+
+  def test_zones_spread_databases_and_group_zookeeper(self):
+    capacities = {}
+    for index, zone in enumerate(['a', 'a', 'a', 'b', 'b', 'c']):
+      capacity = self.large.copy()
+      capacity['zone'] = zone
+      capacities['node-{0}'.format(index + 1)] = capacity
+
+    optimizer = PlacementOptimizer(capacities, replication=3,
+      zookeeper_quorum_zone=True)
+    layout = optimizer.generate_layout()
+
+    database_zones = set(capacities[node]['zone']
+      for node in layout['database'])
+    self.assertEquals(set(['a', 'b', 'c']), database_zones)
+
+    # node-6 is the master, but zone c has no room for a zookeeper majority
+    self.assertEquals('node-6', layout['master'])
+    zookeeper_zones = [capacities[node]['zone'] for node in layout['zookeeper']]
+    self.assertEquals(['a', 'a', 'a'], zookeeper_zones)
+
+    node_layout = NodeLayout({'infrastructure' : 'ec2', 'ips' : layout,
+      'zookeeper_quorum_zone' : True})
+    self.assertEquals(True, node_layout.is_valid())
+    self.assertEquals(3, len(node_layout.get_topology()))
+
+
+  def test_zones_on_some_nodes_rejected(self):
+    capacity = self.large.copy()
+    capacity['zone'] = 'a'
+    self.assertRaises(BadConfigurationException, PlacementOptimizer,
+      {'node-1' : capacity, 'node-2' : self.large})
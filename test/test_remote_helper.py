@@ -4,6 +4,8 @@
 import json
 import os
 import re
+import shlex
+import shutil
 import socket
 import subprocess
 import sys
@@ -19,6 +21,8 @@ import SOAPpy
 
 
 # AppScale import, the library that we're testing here
+from appscale.tools.agents.base_agent import BaseAgent
+from appscale.tools.app_manifest import AppManifest
 from appscale.tools.agents.euca_agent import EucalyptusAgent
 from appscale.tools.agents import factory
 from appscale.tools.agents.gce_agent import CredentialTypes
@@ -26,6 +30,7 @@ from appscale.tools.agents.gce_agent import GCEAgent
 from appscale.tools.appcontroller_client import AppControllerClient
 from appscale.tools.appscale_logger import AppScaleLogger
 from appscale.tools.custom_exceptions import BadConfigurationException
+from appscale.tools.custom_exceptions import ShellException
 from appscale.tools.local_state import LocalState
 from appscale.tools.node_layout import NodeLayout
 from appscale.tools.node_layout import SimpleNode
@@ -44,6 +49,9 @@ class TestRemoteHelper(unittest.TestCase):
 
 
   def setUp(self):
+    # don't reuse cloud connections that earlier tests mocked out
+    BaseAgent.clear_client_cache()
+
     # mock out all logging, since it clutters our output
     flexmock(AppScaleLogger)
     AppScaleLogger.should_receive('log').and_return()
@@ -120,19 +128,15 @@ class TestRemoteHelper(unittest.TestCase):
     flexmock(os)
     os.should_receive('chmod').with_args(ssh_key_location, 0600).and_return()
 
-    # next, assume there are no security groups up at first, but then it gets
-    # created.
-    udp_rule = flexmock(from_port=1, to_port=65535, ip_protocol='udp')
-    tcp_rule = flexmock(from_port=1, to_port=65535, ip_protocol='tcp')
-    icmp_rule = flexmock(from_port=-1, to_port=-1, ip_protocol='icmp')
-    group = flexmock(name='boogroup', rules=[tcp_rule, udp_rule, icmp_rule])
-    fake_ec2.should_receive('get_all_security_groups').with_args().and_return([])
-    fake_ec2.should_receive('get_all_security_groups').with_args('boogroup').and_return([group])
+    # next, assume there are no security groups up at first
+    fake_ec2.should_receive('get_all_security_groups').with_args(
+      filters={'group-name' : 'boogroup'}).and_return([])
 
     # and then assume we can create and open our security group fine
     fake_ec2.should_receive('create_security_group').with_args('boogroup',
       'AppScale security group').and_return()
-    fake_ec2.should_receive('authorize_security_group').and_return()
+    fake_ec2.should_receive('get_status').with_args(
+      'AuthorizeSecurityGroupIngress', dict, verb='POST').and_return(True)
 
     # next, add in mocks for run_instances
     # the first time around, let's say that no machines are running
@@ -145,7 +149,7 @@ class TestRemoteHelper(unittest.TestCase):
       id='i-12345678', ip_address='1.2.3.4', private_ip_address='1.2.3.4')
     fake_running_reservation = flexmock(instances=fake_running_instance)
 
-    fake_ec2.should_receive('get_all_instances').and_return([]) \
+    fake_ec2.should_receive('get_all_reservations').and_return([]) \
       .and_return([]) \
       .and_return([fake_pending_reservation]) \
       .and_return([fake_running_reservation])
@@ -389,6 +393,24 @@ class TestRemoteHelper(unittest.TestCase):
     RemoteHelper.start_remote_appcontroller('public1', 'bookey', False)
 
 
+  def test_scrub_node_for_image(self):
+    commands = []
+    flexmock(RemoteHelper).should_receive('ssh').replace_with(
+      lambda host, keyname, command, verbose: commands.append(command))
+
+    RemoteHelper.scrub_node_for_image('public1', 'bookey', False,
+      then_run='waagent -deprovision -force')
+    self.assertEquals('ruby /root/appscale/AppController/terminate.rb',
+      commands[0])
+    for path in ['/etc/appscale/secret.key', '/etc/appscale/certs',
+        '/root/.appscale', '/root/.ssh/id_rsa', '/root/.ssh/authorized_keys',
+        '/opt/appscale/cassandra', '/opt/appscale/zookeeper']:
+      self.assertTrue(path in commands[1].split())
+
+    # The deployment's key can't log in once authorized_keys is gone.
+    self.assertTrue(commands[1].endswith('&& waagent -deprovision -force'))
+
+
   def test_copy_local_metadata(self):
     # Assume the locations files were copied successfully.
     local_state = flexmock(LocalState)
@@ -499,3 +521,179 @@ class TestRemoteHelper(unittest.TestCase):
       .and_return(fake_soap)
 
     RemoteHelper.wait_for_machines_to_finish_loading('public1', 'bookey')
+
+
+  def test_copy_app_to_host_incrementally(self):
+    app_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, app_dir)
+    for name, contents in [('app.yaml', 'application: baz\n'),
+      ('main.py', 'print "new"\n'), ('-static.css', 'body {}\n')]:
+      with open(os.path.join(app_dir, name), 'w') as file_handle:
+        file_handle.write(contents)
+
+    # The login node already has app.yaml and an older main.py, as well as a
+    # file that the new version removed.
+    previous = AppManifest.from_directory(app_dir)
+    previous.files['main.py'] = {'hash' : 'old', 'size' : 1}
+    previous.files['old file.py'] = {'hash' : 'gone', 'size' : 1}
+    del previous.files['-static.css']
+
+    flexmock(LocalState).should_receive('get_login_host').and_return('public1')
+    commands = []
+    def fake_ssh(host, keyname, command, is_verbose):
+      commands.append(command)
+      if command.startswith('cat '):
+        return previous.to_json()
+    flexmock(RemoteHelper).should_receive('ssh').replace_with(fake_ssh)
+
+    tarred_files = []
+    def fake_stream(host, keyname, command, dest, is_verbose,
+      remote_filter):
+      file_list = re.search('--null -T (\\S+)', command).group(1)
+      with open(file_list) as file_handle:
+        tarred_files.extend(file_handle.read().split('\0')[:-1])
+      # tar has to take names that start with a dash as files.
+      subprocess.check_call(command + ' > /dev/null', shell=True)
+    flexmock(RemoteHelper).should_receive('stream_to_host').replace_with(
+      fake_stream)
+    copied = {}
+    def fake_scp(host, keyname, source, dest, is_verbose):
+      with open(source) as file_handle:
+        copied[dest] = file_handle.read()
+    flexmock(RemoteHelper).should_receive('scp').replace_with(fake_scp)
+
+    self.assertEquals('/opt/appscale/apps/baz.tar.gz',
+      RemoteHelper.copy_app_to_host(app_dir, 'bookey', False,
+      incremental=True))
+    self.assertEquals(['-static.css', 'main.py'], sorted(tarred_files))
+    self.assertIn("rm -f -- 'old file.py'", commands[-1])
+    self.assertNotIn('rm -rf', commands[-1])
+
+    # The full tarball is rebuilt from the manifest's file names, not a glob.
+    file_list = '/opt/appscale/app_cache/baz/files.list'
+    self.assertEquals('-static.css\0app.yaml\0main.py\0', copied[file_list])
+    self.assertIn('tar -czf /opt/appscale/apps/baz.tar.gz.tmp --null -T ' +
+      file_list, commands[-1])
+
+
+  def test_stream_to_host_pipes_output_over_ssh(self):
+    dest_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, dest_dir)
+    dest = os.path.join(dest_dir, 'baz.tar.gz')
+
+    # Stand in for ssh with a local shell that runs the remote command.
+    popen = subprocess.Popen
+    def fake_popen(command, **kwargs):
+      if command.startswith('ssh '):
+        command = shlex.split(command.split('root@public1 ', 1)[1])[0]
+      return popen(command, **kwargs)
+    flexmock(subprocess).should_receive('Popen').replace_with(fake_popen)
+    flexmock(RemoteHelper).should_receive('ssh').replace_with(
+      lambda host, keyname, command, is_verbose, user, num_retries:
+      subprocess.check_call(command, shell=True))
+    flexmock(RemoteHelper).should_receive('describe_throughput').and_return(
+      '')
+
+    sent = RemoteHelper.stream_to_host('public1', 'bookey',
+      'printf "app contents"', dest, False)
+    self.assertEquals(len('app contents'), sent)
+    with open(dest) as file_handle:
+      self.assertEquals('app contents', file_handle.read())
+    self.assertFalse(os.path.exists(dest + '.part'))
+
+    # A command that fails partway through leaves the old file in place.
+    self.assertRaises(ShellException, RemoteHelper.stream_to_host, 'public1',
+      'bookey', 'printf "truncated"; false', dest, False, num_retries=2)
+    with open(dest) as file_handle:
+      self.assertEquals('app contents', file_handle.read())
+    self.assertFalse(os.path.exists(dest + '.part'))
+
+
+  def test_remove_nodes(self):
+    nodes = [
+      {
+        'public_ip' : 'public2',
+        'private_ip' : 'private2',
+        'instance_id' : 'i-22222222',
+        'jobs' : ['memcache', 'taskqueue_slave', 'appengine'],
+        'disk' : None
+      },
+      {
+        'public_ip' : 'public3',
+        'private_ip' : 'private3',
+        'instance_id' : 'i-33333333',
+        'jobs' : ['database'],
+        'disk' : 'vol-33333333'
+      }
+    ]
+    remote_helper = flexmock(RemoteHelper)
+    remote_helper.should_receive('stop_remote_appcontroller') \
+      .with_args('public2', 'bookey', False).twice()
+    remote_helper.should_receive('stop_remote_appcontroller') \
+      .with_args('public3', 'bookey', False).twice()
+    remote_helper.should_receive('unmount_persistent_disk') \
+      .with_args('public3', 'bookey', False).once()
+
+    # Machines in a virtualized cluster are left running.
+    flexmock(LocalState).should_receive('get_infrastructure') \
+      .and_return('xen').and_return('ec2')
+    flexmock(factory.InfrastructureAgentFactory).should_receive('create_agent') \
+      .with_args('ec2').once().and_return(self.fake_agent())
+    RemoteHelper.remove_nodes(nodes, 'bookey', False)
+    self.assertEquals([], self.terminate_calls)
+
+    RemoteHelper.remove_nodes(nodes, 'bookey', False)
+    self.assertEquals([('vol-33333333', 'i-33333333')], self.detached_disks)
+    # Both machines are terminated with a single call.
+    self.assertEquals([['i-22222222', 'i-33333333']], self.terminate_calls)
+
+
+  def test_remove_nodes_terminates_each_node_after_its_own_disk(self):
+    nodes = [
+      {
+        'public_ip' : 'public2',
+        'private_ip' : 'private2',
+        'instance_id' : 'i-22222222',
+        'jobs' : ['memcache', 'taskqueue_slave', 'appengine'],
+        'disk' : None
+      },
+      {
+        'public_ip' : 'public3',
+        'private_ip' : 'private3',
+        'instance_id' : 'i-33333333',
+        'jobs' : ['database'],
+        'disk' : 'vol-33333333'
+      }
+    ]
+    flexmock(RemoteHelper).should_receive('stop_remote_appcontroller')
+    flexmock(RemoteHelper).should_receive('unmount_persistent_disk')
+    flexmock(AppScaleLogger).should_receive('warn')
+    flexmock(LocalState).should_receive('get_infrastructure') \
+      .and_return('ec2')
+    fake_agent = self.fake_agent()
+    flexmock(factory.InfrastructureAgentFactory).should_receive('create_agent') \
+      .and_return(fake_agent)
+
+    # The node whose disk can't be detached keeps running, but the other
+    # node is still terminated.
+    fake_agent.should_receive('detach_disk').and_raise(
+      BadConfigurationException, 'volume is busy')
+    self.assertRaises(BadConfigurationException, RemoteHelper.remove_nodes,
+      nodes, 'bookey', False)
+    self.assertEquals([['i-22222222']], self.terminate_calls)
+
+
+  def fake_agent(self):
+    self.detached_disks = []
+    self.terminate_calls = []
+
+    fake_agent = flexmock(PARAM_INSTANCE_IDS='instance_ids')
+    fake_agent.should_receive('get_cloud_params').with_args('bookey') \
+      .and_return({})
+    fake_agent.should_receive('detach_disk').replace_with(
+      lambda params, disk, instance_id: self.detached_disks.append(
+        (disk, instance_id)))
+    fake_agent.should_receive('terminate_instances').replace_with(
+      lambda params: self.terminate_calls.append(params['instance_ids']))
+    fake_agent.should_receive('cleanup_state')
+    return fake_agent
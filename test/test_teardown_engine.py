@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import threading
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.appscale_logger import AppScaleLogger
+from appscale.tools.custom_exceptions import BadConfigurationException
+from appscale.tools.custom_exceptions import ShellException
+from appscale.tools.teardown_engine import TeardownEngine
+
+
+class TestTeardownEngine(unittest.TestCase):
+
+
+  def setUp(self):
+    flexmock(AppScaleLogger).should_receive('log').and_return()
+    flexmock(AppScaleLogger).should_receive('warn').and_return()
+    self.engine = TeardownEngine()
+    self.calls = []
+
+
+  def record(self, name):
+    self.calls.append(name)
+
+
+  def fail(self, name):
+    self.calls.append(name)
+    raise ShellException('could not ' + name)
+
+
+  def test_levels_follow_dependencies(self):
+    for node in ['a', 'b']:
+      self.engine.add_step('unmount ' + node, self.record)
+      self.engine.add_step('detach ' + node, self.record,
+        depends_on=['unmount ' + node])
+    self.engine.add_step('terminate', self.record,
+      depends_on=['detach a', 'detach b'])
+    self.engine.add_step('cleanup', self.record, depends_on=['terminate'])
+
+    self.assertEquals([['unmount a', 'unmount b'], ['detach a', 'detach b'],
+      ['terminate'], ['cleanup']], self.engine.get_levels())
+
+
+  def test_invalid_dependencies_rejected(self):
+    self.engine.add_step('terminate', self.record, depends_on=['detach'])
+    self.assertRaises(BadConfigurationException, self.engine.get_levels)
+
+    engine = TeardownEngine()
+    engine.add_step('a', self.record, depends_on=['b'])
+    engine.add_step('b', self.record, depends_on=['a'])
+    self.assertRaises(BadConfigurationException, engine.get_levels)
+
+    self.assertRaises(BadConfigurationException, engine.add_step, 'a',
+      self.record)
+
+
+  def test_steps_in_a_level_run_concurrently(self):
+    # Each step waits for the other one, so they only finish if both run at
+    # the same time.
+    barrier = {'count' : 0, 'lock' : threading.Condition()}
+
+    def wait_for_other_step(name):
+      with barrier['lock']:
+        barrier['count'] += 1
+        barrier['lock'].notify_all()
+        while barrier['count'] < 2:
+          barrier['lock'].wait(5)
+      self.record(name)
+
+    self.engine.add_step('detach a', wait_for_other_step, ('detach a',))
+    self.engine.add_step('detach b', wait_for_other_step, ('detach b',))
+    self.engine.add_step('terminate', self.record, ('terminate',),
+      depends_on=['detach a', 'detach b'])
+    self.engine.run()
+
+    self.assertEquals(set(['detach a', 'detach b']), set(self.calls[:2]))
+    self.assertEquals('terminate', self.calls[2])
+
+
+  def test_failed_step_skips_only_its_dependents(self):
+    self.engine.add_step('detach a', self.fail, ('detach a',))
+    self.engine.add_step('detach b', self.record, ('detach b',))
+    self.engine.add_step('terminate a', self.record, ('terminate a',),
+      depends_on=['detach a'])
+    self.engine.add_step('terminate b', self.record, ('terminate b',),
+      depends_on=['detach b'])
+
+    self.assertRaises(ShellException, self.engine.run)
+    self.assertEquals(['detach a', 'detach b', 'terminate b'],
+      sorted(self.calls))
+
+
+  def test_step_can_run_after_failed_steps(self):
+    self.engine.add_step('detach a', self.fail, ('detach a',))
+    self.engine.add_step('detach b', self.record, ('detach b',))
+    self.engine.add_step('terminate', lambda: self.record([name
+      for name in ['detach a', 'detach b'] if self.engine.has_succeeded(name)]),
+      runs_after=['detach a', 'detach b'])
+
+    self.assertEquals([['detach a', 'detach b'], ['terminate']],
+      self.engine.get_levels())
+    self.assertRaises(ShellException, self.engine.run)
+    self.assertEquals(['detach b'], self.calls[-1])
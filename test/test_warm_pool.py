@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+
+# General-purpose Python library imports
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+from appscale.tools.appscale_logger import AppScaleLogger
+from appscale.tools.local_state import LocalState
+from appscale.tools.remote_helper import RemoteHelper
+from appscale.tools.warm_pool import WarmPool
+from cloud_emulator import EC2Emulator
+
+
+class TestWarmPool(unittest.TestCase):
+
+
+  def setUp(self):
+    flexmock(AppScaleLogger).should_receive('log').and_return()
+    flexmock(AppScaleLogger).should_receive('warn').and_return()
+    flexmock(AppScaleLogger).should_receive('verbose').and_return()
+
+    self.appscale_path = LocalState.LOCAL_APPSCALE_PATH
+    LocalState.LOCAL_APPSCALE_PATH = tempfile.mkdtemp() + os.sep
+
+    for credential in ['EC2_ACCESS_KEY', 'EC2_SECRET_KEY']:
+      os.environ[credential] = 'baz'
+
+    self.emulator = EC2Emulator(speedup=1000)
+    self.options = argparse.Namespace(infrastructure='ec2',
+      group=EC2Emulator.GROUP, keyname=EC2Emulator.KEYNAME,
+      machine='ami-ABCDEFG', instance_type='m3.medium', zone='my-zone-1b',
+      use_spot_instances=False, static_ip=None, verbose=False)
+
+
+  def tearDown(self):
+    shutil.rmtree(LocalState.LOCAL_APPSCALE_PATH)
+    LocalState.LOCAL_APPSCALE_PATH = self.appscale_path
+
+
+  def write_locations(self):
+    with open(LocalState.get_locations_json_location(EC2Emulator.KEYNAME),
+      'w') as file_handle:
+      file_handle.write(json.dumps({'node_info' : [], 'infrastructure_info' : {
+        'infrastructure' : 'ec2',
+        'group' : self.options.group,
+        'zone' : self.options.zone,
+        'machine' : self.options.machine,
+        'instance_type' : self.options.instance_type,
+        'use_spot_instances' : 'False'
+      }}))
+
+
+  def get_states(self, instance_ids):
+    return [self.emulator.get_state(self.emulator.machines[instance_id])
+      for instance_id in instance_ids]
+
+
+  def test_pool_only_returns_matching_instances(self):
+    pool = WarmPool('bookey')
+    pool.add(['i-1', 'i-2'], 'ami-ABCDEFG', 'm3.medium')
+    pool.add(['i-3'], 'ami-OLD', 'm3.medium')
+    pool.add(['i-4'], 'ami-ABCDEFG', 'm3.medium', expiry=-1)
+
+    pool = WarmPool('bookey')
+    self.assertEquals(0, pool.get_room(3))
+    self.assertEquals(['i-3', 'i-4'], pool.remove_unusable('ami-ABCDEFG',
+      'm3.medium'))
+    self.assertEquals(['i-1'], pool.take(1))
+    pool.save()
+
+    pool = WarmPool('bookey')
+    self.assertEquals(['i-2'], pool.take(5))
+    pool.save()
+    self.assertFalse(os.path.exists(LocalState.get_warm_pool_location(
+      'bookey')))
+
+
+  def test_down_and_up_restarts_pooled_instances(self):
+    with self.emulator.installed():
+      instance_ids, _, _ = RemoteHelper.spawn_nodes_in_cloud(self.options,
+        count=3)
+      self.write_locations()
+      RemoteHelper.terminate_cloud_infrastructure(EC2Emulator.KEYNAME, False,
+        warm_pool_size=2)
+
+      self.assertEquals(['stopped', 'stopped', 'terminated'],
+        sorted(self.get_states(instance_ids)))
+      pooled_ids = [instance['instance_id']
+        for instance in WarmPool('bookey').instances]
+      self.assertEquals(['stopped', 'stopped'], self.get_states(pooled_ids))
+
+      # The pooled instances still need their keypair and security group.
+      self.assertIn(EC2Emulator.KEYNAME, self.emulator.key_pairs)
+
+      new_ids, public_ips, _ = RemoteHelper.spawn_nodes_in_cloud(self.options,
+        count=3)
+
+    self.assertEquals(pooled_ids, new_ids[:2])
+    self.assertNotIn(new_ids[2], instance_ids)
+    self.assertEquals(3, len(set(public_ips)))
+    self.assertEquals(1, self.emulator.calls['start_instances'])
+    self.assertEquals(1, self.emulator.calls['create_key_pair'])
+    self.assertEquals([], WarmPool('bookey').instances)
+
+
+  def test_unusable_pooled_instances_are_terminated(self):
+    with self.emulator.installed():
+      instance_ids, _, _ = RemoteHelper.spawn_nodes_in_cloud(self.options,
+        count=2)
+      self.write_locations()
+      RemoteHelper.terminate_cloud_infrastructure(EC2Emulator.KEYNAME, False,
+        warm_pool_size=2)
+
+      self.options.machine = 'ami-NEWIMAGE'
+      new_ids, _, _ = RemoteHelper.spawn_nodes_in_cloud(self.options, count=2)
+
+      self.assertEquals(['terminated', 'terminated'],
+        self.get_states(instance_ids))
+
+    self.assertFalse(set(instance_ids) & set(new_ids))
+    self.assertNotIn('start_instances', self.emulator.calls)
+
+    # The new instances use the keypair and security group that the pool kept.
+    self.assertEquals(1, self.emulator.calls['create_key_pair'])
+    self.assertEquals([], WarmPool('bookey').instances)
+
+
+  def test_down_terminates_expired_pooled_instances(self):
+    with self.emulator.installed():
+      instance_ids, _, _ = RemoteHelper.spawn_nodes_in_cloud(self.options,
+        count=2)
+      self.write_locations()
+      RemoteHelper.terminate_cloud_infrastructure(EC2Emulator.KEYNAME, False,
+        warm_pool_size=2, warm_pool_expiry=0.01)
+      self.assertIn(EC2Emulator.KEYNAME, self.emulator.key_pairs)
+
+      # Once the pool expires, the next down terminates it, even though no
+      # deployment started in between, and cleans up the keypair.
+      self.emulator.clock.sleep(60)
+      RemoteHelper.terminate_cloud_infrastructure(EC2Emulator.KEYNAME, False,
+        warm_pool_size=2)
+      self.assertEquals(['terminated', 'terminated'],
+        self.get_states(instance_ids))
+
+    self.assertEquals([], WarmPool('bookey').instances)
+    self.assertNotIn(EC2Emulator.KEYNAME, self.emulator.key_pairs)
+
+
+  def test_drain_pool_terminates_every_pooled_instance(self):
+    with self.emulator.installed():
+      instance_ids, _, _ = RemoteHelper.spawn_nodes_in_cloud(self.options,
+        count=3)
+      self.write_locations()
+      RemoteHelper.terminate_cloud_infrastructure(EC2Emulator.KEYNAME, False,
+        warm_pool_size=2)
+      RemoteHelper.terminate_cloud_infrastructure(EC2Emulator.KEYNAME, False,
+        drain_pool=True)
+      self.assertEquals(['terminated'] * 3, self.get_states(instance_ids))
+
+    self.assertEquals([], WarmPool('bookey').instances)
+    self.assertNotIn(EC2Emulator.KEYNAME, self.emulator.key_pairs)
+
+
+  def test_instances_that_cannot_be_stopped_are_terminated(self):
+    self.emulator.fail_next('stop_instances')
+    with self.emulator.installed():
+      instance_ids, _, _ = RemoteHelper.spawn_nodes_in_cloud(self.options,
+        count=2)
+      self.write_locations()
+      RemoteHelper.terminate_cloud_infrastructure(EC2Emulator.KEYNAME, False,
+        warm_pool_size=2)
+      self.assertEquals(['terminated', 'terminated'],
+        self.get_states(instance_ids))
+
+    self.assertEquals([], WarmPool('bookey').instances)
+    self.assertNotIn(EC2Emulator.KEYNAME, self.emulator.key_pairs)